@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Бенчмарк профилей коллекции Qdrant (COLLECTION_PROFILES из init_qdrant_collection.py)
+
+Для каждого профиля создает временную коллекцию через init_collection, загружает
+одни и те же векторы (синтетические кластеры или выборку из рабочей коллекции)
+и сообщает:
+  - recall@k относительно точного поиска (перебор в numpy по исходным векторам);
+  - p50/p95 задержки запроса с параметрами поиска профиля;
+  - время построения (загрузка + ожидание индексации);
+  - объем RAM и диска: оценка по размерам векторов, квантованных векторов и
+    графа HNSW; в локальном режиме - также фактический размер каталога.
+
+По умолчанию коллекции создаются в локальном режиме qdrant_client (каталог во
+временной папке, без сервера). Локальный режим не строит HNSW и не использует
+квантование - это поиск перебором, поэтому recall там всегда 1, а профили
+различаются только объемом и временем загрузки. Сравнение recall и задержек
+HNSW/квантования - с --server (QDRANT_HOST, QDRANT_PORT, QDRANT_API_KEY).
+На сервере порог индексации профиля (indexing_threshold=50000 КБ - около 8 тыс.
+векторов размерности 1536 на сегмент) заменяется на --indexing-threshold, иначе
+при нескольких тысячах точек HNSW не строится вовсе и замеряется перебор;
+запросы начинаются, когда indexed_vectors_count достигает числа точек.
+
+Запуск: python bench_collection_profiles.py --points 10000 --queries 200
+        python bench_collection_profiles.py --server --points 100000 --profiles default,binary-quantized
+        python bench_collection_profiles.py --server --sample-collection documents --json profiles.json
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+
+import numpy as np
+from qdrant_client import QdrantClient
+from qdrant_client.http import models
+
+from init_qdrant_collection import COLLECTION_PROFILES, init_collection
+
+# Байт на вектор в квантованном виде относительно float32
+QUANTIZED_FRACTION = {"int8": 1 / 4, "binary": 1 / 32, "product": 1 / 16, None: 0}
+
+
+def parse_args():
+    """Парсер аргументов командной строки"""
+    parser = argparse.ArgumentParser(description='Бенчмарк профилей коллекции Qdrant')
+    parser.add_argument('--profiles', type=str, default='all',
+                        help=f'Профили через запятую или all ({", ".join(COLLECTION_PROFILES)})')
+    parser.add_argument('--points', type=int, default=10000, help='Векторов в коллекции (default: 10000)')
+    parser.add_argument('--queries', type=int, default=200, help='Число запросов (default: 200)')
+    parser.add_argument('--k', type=int, default=10, help='Глубина recall@k (default: 10)')
+    parser.add_argument('--dim', type=int, default=1536, help='Размерность синтетических векторов (default: 1536)')
+    parser.add_argument('--clusters', type=int, default=64, help='Кластеров в синтетических данных (default: 64)')
+    parser.add_argument('--sample-collection', type=str, default=None,
+                        help='Брать векторы из этой коллекции на сервере вместо синтетических')
+    parser.add_argument('--server', action='store_true', help='Временные коллекции на QDRANT_HOST вместо локального режима')
+    parser.add_argument('--batch-size', type=int, default=256, help='Точек в одном upsert (default: 256)')
+    parser.add_argument('--indexing-threshold', type=int, default=10,
+                        help='Порог индексации сегмента в КБ для --server (default: 10 - HNSW для всех точек)')
+    parser.add_argument('--json', type=str, default=None, help='Сохранить результаты в JSON-файл')
+    return parser.parse_args()
+
+
+def server_client():
+    return QdrantClient(
+        host=os.environ.get('QDRANT_HOST', 'localhost'),
+        port=int(os.environ.get('QDRANT_PORT', '6333')),
+        api_key=os.environ.get('QDRANT_API_KEY'),
+        timeout=300,
+        https=False
+    )
+
+
+def normalize(vectors):
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def synthetic_vectors(count, dim, clusters, seed=42):
+    """Векторы вокруг случайных центров (похоже на эмбеддинги тематических документов)"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, count)
+    noise = rng.standard_normal((count, dim)).astype(np.float32)
+    return normalize(centers[labels] + 0.8 * noise)
+
+
+def sampled_vectors(client, collection_name, count):
+    """До count плотных векторов из рабочей коллекции"""
+    vectors = []
+    offset = None
+    while len(vectors) < count:
+        points, offset = client.scroll(collection_name, limit=min(1000, count - len(vectors)),
+                                       offset=offset, with_payload=False, with_vectors=True)
+        for point in points:
+            vector = point.vector.get("") if isinstance(point.vector, dict) else point.vector
+            if vector:
+                vectors.append(vector)
+        if offset is None:
+            break
+    return normalize(np.asarray(vectors, dtype=np.float32))
+
+
+def exact_neighbours(corpus, queries, k):
+    """Номера k ближайших по косинусу для каждого запроса (векторы нормализованы)"""
+    scores = queries @ corpus.T
+    top = np.argpartition(-scores, k, axis=1)[:, :k]
+    return [set(row) for row in top]
+
+
+def estimate_footprint(profile, count, dim):
+    """Оценка (RAM, диск) в байтах: векторы, квантованные векторы, граф HNSW"""
+    vectors = count * dim * 4
+    quantized = vectors * QUANTIZED_FRACTION[profile["quantization"]]
+    # Нулевой уровень HNSW - до 2m связей по 4 байта, верхние уровни - около 10% сверху
+    graph = count * profile["hnsw"]["m"] * 2 * 4 * 1.1
+    ram = 0
+    if not profile["on_disk"]:
+        ram += vectors
+    if quantized and (profile["always_ram"] or not profile["on_disk"]):
+        ram += quantized
+    if not profile["hnsw"]["on_disk"]:
+        ram += graph
+    return ram, vectors + quantized + graph
+
+
+def directory_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total
+
+
+def wait_for_index(client, collection_name, points, timeout=1800):
+    """Ждет окончания оптимизаций на сервере и HNSW для всех points векторов"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        info = client.get_collection(collection_name)
+        if info.status == models.CollectionStatus.GREEN and (info.indexed_vectors_count or 0) >= points:
+            return info
+        time.sleep(0.5)
+    info = client.get_collection(collection_name)
+    print(f"  ⚠️ Индексация {collection_name} не завершилась за {timeout} с: "
+          f"проиндексировано {info.indexed_vectors_count or 0} из {points}, результаты смешивают HNSW и перебор")
+    return info
+
+
+def search_params(profile):
+    search = profile["search"]
+    quantization = None
+    if profile["quantization"]:
+        quantization = models.QuantizationSearchParams(rescore=search.get("rescore", True),
+                                                       oversampling=search.get("oversampling"))
+    return models.SearchParams(hnsw_ef=search.get("hnsw_ef"), quantization=quantization)
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))] if ordered else 0.0
+
+
+def bench_profile(name, client, corpus, queries, truth, args, storage_root=None):
+    profile = COLLECTION_PROFILES[name]
+    collection_name = f"bench_profile_{name.replace('-', '_')}"
+    start = time.perf_counter()
+    if not init_collection(client, collection_name, recreate=True, sparse=False, profile=name, vector_size=corpus.shape[1]):
+        raise RuntimeError(f"не удалось создать коллекцию {collection_name}")
+    if args.server:
+        # Порог профиля рассчитан на рабочий объем: на выборке бенчмарка HNSW не был бы построен
+        client.update_collection(collection_name, optimizer_config=models.OptimizersConfigDiff(
+            indexing_threshold=args.indexing_threshold))
+    for offset in range(0, len(corpus), args.batch_size):
+        batch = corpus[offset:offset + args.batch_size]
+        client.upsert(collection_name, points=models.Batch(
+            ids=list(range(offset, offset + len(batch))), vectors=batch.tolist()))
+    info = wait_for_index(client, collection_name, len(corpus)) if args.server else client.get_collection(collection_name)
+    build_seconds = time.perf_counter() - start
+
+    params = search_params(profile)
+    latencies = []
+    found = 0
+    for query, expected in zip(queries, truth):
+        query_start = time.perf_counter()
+        response = client.query_points(collection_name, query=query.tolist(), limit=args.k, search_params=params)
+        latencies.append((time.perf_counter() - query_start) * 1000)
+        found += len(expected & {point.id for point in response.points})
+
+    ram, disk = estimate_footprint(profile, len(corpus), corpus.shape[1])
+    result = {
+        "profile": name,
+        "recall": found / (len(queries) * args.k),
+        "p50_ms": percentile(latencies, 0.5),
+        "p95_ms": percentile(latencies, 0.95),
+        "build_s": build_seconds,
+        "indexed_vectors": info.indexed_vectors_count,
+        "ram_mb_estimate": ram / 2**20,
+        "disk_mb_estimate": disk / 2**20,
+        "disk_mb_measured": directory_size(storage_root) / 2**20 if storage_root else None,
+    }
+    client.delete_collection(collection_name)
+    return result
+
+
+def main():
+    args = parse_args()
+    names = list(COLLECTION_PROFILES) if args.profiles == 'all' else [name.strip() for name in args.profiles.split(',')]
+    unknown = [name for name in names if name not in COLLECTION_PROFILES]
+    if unknown:
+        print(f"❌ Неизвестные профили: {', '.join(unknown)}")
+        sys.exit(1)
+
+    if args.sample_collection:
+        sample = sampled_vectors(server_client(), args.sample_collection, args.points + args.queries)
+        if len(sample) <= args.queries:
+            print(f"❌ В коллекции {args.sample_collection} слишком мало векторов: {len(sample)}")
+            sys.exit(1)
+        corpus, queries = sample[args.queries:], sample[:args.queries]
+        source = f"выборка из {args.sample_collection}"
+    else:
+        data = synthetic_vectors(args.points + args.queries, args.dim, args.clusters)
+        corpus, queries = data[args.queries:], data[:args.queries]
+        source = f"синтетические, {args.clusters} кластеров"
+    truth = exact_neighbours(corpus, queries, args.k)
+    print(f"Векторы: {len(corpus)} x {corpus.shape[1]} ({source}), запросов {len(queries)}, "
+          f"{'сервер' if args.server else 'локальный режим'}")
+    if not args.server:
+        print("⚠️ Локальный режим не строит HNSW и не квантует: recall = 1, задержка - полный перебор. "
+              "Для сравнения профилей по recall/задержке запускайте с --server.")
+
+    results = []
+    for name in names:
+        print(f"-> {name}: {COLLECTION_PROFILES[name]['description']}")
+        if args.server:
+            results.append(bench_profile(name, server_client(), corpus, queries, truth, args))
+            continue
+        root = tempfile.mkdtemp(prefix="bench_profile_")
+        try:
+            client = QdrantClient(path=root)
+            results.append(bench_profile(name, client, corpus, queries, truth, args, storage_root=root))
+            client.close()
+        finally:
+            shutil.rmtree(root, ignore_errors=True)
+
+    print(f"\n{'профиль':<18} {'recall@' + str(args.k):>9} {'p50, мс':>8} {'p95, мс':>8} {'сборка, с':>10} "
+          f"{'HNSW':>7} {'RAM, МБ*':>9} {'диск, МБ*':>10} {'диск, МБ':>9}")
+    for result in results:
+        measured = f"{result['disk_mb_measured']:.1f}" if result["disk_mb_measured"] is not None else "-"
+        print(f"{result['profile']:<18} {result['recall']:>9.3f} {result['p50_ms']:>8.2f} {result['p95_ms']:>8.2f} "
+              f"{result['build_s']:>10.1f} {result['indexed_vectors'] or 0:>7} {result['ram_mb_estimate']:>9.1f} "
+              f"{result['disk_mb_estimate']:>10.1f} {measured:>9}")
+    print("* оценка по размерам векторов, квантования и графа HNSW")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"points": len(corpus), "dim": int(corpus.shape[1]), "queries": len(queries), "k": args.k,
+                       "server": args.server, "source": source, "results": results}, f, ensure_ascii=False, indent=2)
+        print(f"✅ Результаты сохранены в {args.json}")
+
+
+if __name__ == "__main__":
+    main()
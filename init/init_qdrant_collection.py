@@ -5,6 +5,9 @@
 Скрипт для инициализации коллекции в Qdrant
 Создает коллекцию с оптимальными параметрами для хранения векторов документов
 Используется OpenAI text-embedding-3-small с размерностью 1536
+
+Параметры хранения, HNSW и квантования задаются профилем (--profile, см.
+COLLECTION_PROFILES); сравнение профилей - init/bench_collection_profiles.py
 """
 
 import os
@@ -16,17 +19,71 @@ from qdrant_client import QdrantClient
 from qdrant_client.http import models
 from qdrant_client.http.exceptions import UnexpectedResponse
 
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('/home/makrushin/rag-project/logs/qdrant_init.log'),
-        logging.StreamHandler()
-    ]
-)
+LOG_FILE = os.environ.get('QDRANT_INIT_LOG', '/home/makrushin/rag-project/logs/qdrant_init.log')
 logger = logging.getLogger('qdrant_init')
 
+# Профили коллекции. "default" - исходная конфигурация: векторы, индекс и payload
+# на диске, INT8 без always_ram. "search" - параметры поиска, с которыми профиль
+# рассчитан работать (используются бенчмарком).
+COLLECTION_PROFILES = {
+    "default": {
+        "description": "Векторы, HNSW и payload на диске, INT8 на диске (исходная конфигурация)",
+        "on_disk": True,
+        "quantization": "int8",
+        "always_ram": False,
+        "hnsw": {"m": 16, "ef_construct": 100, "full_scan_threshold": 10000, "on_disk": True},
+        "on_disk_payload": True,
+        "search": {"hnsw_ef": 128, "rescore": True, "oversampling": 2.0},
+    },
+    "ram-heavy": {
+        "description": "Все в RAM, плотный граф (m=32), INT8 в RAM - минимальная задержка",
+        "on_disk": False,
+        "quantization": "int8",
+        "always_ram": True,
+        "hnsw": {"m": 32, "ef_construct": 200, "full_scan_threshold": 10000, "on_disk": False},
+        "on_disk_payload": False,
+        "search": {"hnsw_ef": 128, "rescore": True, "oversampling": 1.5},
+    },
+    "disk-lean": {
+        "description": "Векторы, HNSW и payload на диске без квантования - минимум RAM",
+        "on_disk": True,
+        "quantization": None,
+        "always_ram": False,
+        "hnsw": {"m": 16, "ef_construct": 100, "full_scan_threshold": 10000, "on_disk": True},
+        "on_disk_payload": True,
+        "search": {"hnsw_ef": 128},
+    },
+    "binary-quantized": {
+        "description": "Бинарное квантование в RAM (32x), векторы на диске для rescore",
+        "on_disk": True,
+        "quantization": "binary",
+        "always_ram": True,
+        "hnsw": {"m": 16, "ef_construct": 100, "full_scan_threshold": 10000, "on_disk": False},
+        "on_disk_payload": True,
+        "search": {"hnsw_ef": 128, "rescore": True, "oversampling": 3.0},
+    },
+    "product-quantized": {
+        "description": "Product quantization x16 в RAM, векторы на диске для rescore",
+        "on_disk": True,
+        "quantization": "product",
+        "always_ram": True,
+        "hnsw": {"m": 16, "ef_construct": 100, "full_scan_threshold": 10000, "on_disk": False},
+        "on_disk_payload": True,
+        "search": {"hnsw_ef": 128, "rescore": True, "oversampling": 2.0},
+    },
+}
+
+def setup_logging():
+    """Лог в консоль и в LOG_FILE (QDRANT_INIT_LOG), если его каталог существует"""
+    handlers = [logging.StreamHandler()]
+    if os.path.isdir(os.path.dirname(LOG_FILE) or '.'):
+        handlers.append(logging.FileHandler(LOG_FILE))
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        handlers=handlers
+    )
+
 def parse_args():
     """Парсер аргументов командной строки"""
     parser = argparse.ArgumentParser(description='Инициализация коллекции Qdrant')
@@ -40,9 +97,80 @@ def parse_args():
                         help='API-ключ для Qdrant (берется из переменной окружения QDRANT_API_KEY, если не указан)')
     parser.add_argument('--recreate', action='store_true', 
                         help='Пересоздать коллекцию, если она уже существует')
+    parser.add_argument('--no-sparse', action='store_true',
+                        help='Не создавать sparse-вектор bm25 для гибридного поиска')
+    parser.add_argument('--profile', type=str, choices=sorted(COLLECTION_PROFILES), default='default',
+                        help='Профиль хранения и квантования (default: default)')
     return parser.parse_args()
 
-def init_collection(client, collection_name, recreate=False):
+def quantization_config(profile):
+    """Конфигурация квантования профиля (None - без квантования)"""
+    kind = profile["quantization"]
+    if kind == "int8":
+        return models.ScalarQuantization(
+            scalar=models.ScalarQuantizationConfig(
+                type=models.ScalarType.INT8,
+                quantile=0.99,
+                always_ram=profile["always_ram"]
+            )
+        )
+    if kind == "binary":
+        return models.BinaryQuantization(
+            binary=models.BinaryQuantizationConfig(always_ram=profile["always_ram"])
+        )
+    if kind == "product":
+        return models.ProductQuantization(
+            product=models.ProductQuantizationConfig(
+                compression=models.CompressionRatio.X16,
+                always_ram=profile["always_ram"]
+            )
+        )
+    return None
+
+def collection_config(profile_name="default", sparse=True, vector_size=1536):
+    """
+    Аргументы create_collection для профиля
+
+    Args:
+        profile_name: Имя профиля из COLLECTION_PROFILES
+        sparse: Добавить именованный sparse-вектор bm25 (гибридный поиск)
+        vector_size: Размерность векторов
+
+    Returns:
+        dict: Именованные аргументы для client.create_collection
+    """
+    profile = COLLECTION_PROFILES[profile_name]
+    return dict(
+        # Используем Cosine для метрики расстояния
+        vectors_config=models.VectorParams(
+            size=vector_size,
+            distance=models.Distance.COSINE,
+            on_disk=profile["on_disk"],
+            quantization_config=quantization_config(profile)
+        ),
+        hnsw_config=models.HnswConfigDiff(
+            m=profile["hnsw"]["m"],                        # Число исходящих связей в графе
+            ef_construct=profile["hnsw"]["ef_construct"],  # Размер динамического списка для построения индекса
+            full_scan_threshold=profile["hnsw"]["full_scan_threshold"],  # Порог для полного сканирования
+            max_indexing_threads=4,     # Ограничиваем потоки индексации
+            on_disk=profile["hnsw"]["on_disk"],
+        ),
+        optimizers_config=models.OptimizersConfigDiff(
+            indexing_threshold=50000,     # Увеличиваем порог индексации
+            memmap_threshold=50000,       # Порог для использования mmap
+            vacuum_min_vector_number=1000  # Минимальное число векторов для очистки
+        ),
+        # BM25-веса чанков (scripts/sparse_vectors.py); IDF считает Qdrant при запросе
+        sparse_vectors_config={
+            "bm25": models.SparseVectorParams(
+                index=models.SparseIndexParams(on_disk=True),
+                modifier=models.Modifier.IDF
+            )
+        } if sparse else None,
+        on_disk_payload=profile["on_disk_payload"]
+    )
+
+def init_collection(client, collection_name, recreate=False, sparse=True, profile="default", vector_size=1536):
     """
     Инициализация коллекции в Qdrant с оптимальными параметрами
     
@@ -50,6 +178,9 @@ def init_collection(client, collection_name, recreate=False):
         client: QdrantClient instance
         collection_name: Название коллекции
         recreate: Пересоздать коллекцию, если она существует
+        sparse: Добавить именованный sparse-вектор bm25 (гибридный поиск)
+        profile: Профиль хранения и квантования из COLLECTION_PROFILES
+        vector_size: Размерность векторов
     
     Returns:
         bool: True, если коллекция успешно создана или уже существует
@@ -67,44 +198,12 @@ def init_collection(client, collection_name, recreate=False):
                 logger.info(f"Коллекция {collection_name} уже существует, пропускаем инициализацию")
                 return True
         
-        # Создаем коллекцию с оптимальными параметрами
-        logger.info(f"Создаем коллекцию {collection_name}...")
-        
-        # Создаем схему для векторов из OpenAI text-embedding-3-small (1536D)
-        # Используем Cosine для метрики расстояния
-        # Включаем Scalar Quantization для экономии RAM
-        # Настраиваем HNSW параметры: m=16, ef_construct=100, ef_search=64
+        # Создаем коллекцию с параметрами профиля
+        logger.info(f"Создаем коллекцию {collection_name} (профиль {profile})...")
         client.create_collection(
             collection_name=collection_name,
-            vectors_config=models.VectorParams(
-                size=1536,  # Размерность OpenAI text-embedding-3-small
-                distance=models.Distance.COSINE,
-                on_disk=True,  # Хранение векторов на диске для экономии RAM
-                # Scalar Quantization для сжатия векторов
-                quantization_config=models.ScalarQuantization(
-                    scalar=models.ScalarQuantizationConfig(
-                        type=models.ScalarType.INT8,
-                        quantile=0.99,
-                        always_ram=False
-                    )
-                )
-            ),
-            hnsw_config=models.HnswConfigDiff(
-                m=16,               # Число исходящих связей в графе
-                ef_construct=100,   # Размер динамического списка для построения индекса
-                # ef_runtime удален, так как не поддерживается
-                full_scan_threshold=10000,  # Порог для полного сканирования
-                max_indexing_threads=4,     # Ограничиваем потоки индексации
-                on_disk=True,       # Хранение индекса на диске
-            ),
-            optimizers_config=models.OptimizersConfigDiff(
-                indexing_threshold=50000,     # Увеличиваем порог индексации
-                memmap_threshold=50000,       # Порог для использования mmap
-                vacuum_min_vector_number=1000  # Минимальное число векторов для очистки
-            ),
-            on_disk_payload=True  # Храним метаданные на диске для экономии RAM
+            **collection_config(profile, sparse, vector_size)
         )
-        
         # Создаем индексы для метаданных для ускорения фильтрации
         logger.info("Создаем индексы для метаданных...")
         client.create_payload_index(
@@ -131,6 +230,19 @@ def init_collection(client, collection_name, recreate=False):
             field_schema=models.PayloadSchemaType.DATETIME
         )
         
+        # Индексы для инкрементального обновления документа (scripts/vector_index.py)
+        client.create_payload_index(
+            collection_name=collection_name,
+            field_name="gdrive_id",
+            field_schema=models.PayloadSchemaType.KEYWORD
+        )
+        
+        client.create_payload_index(
+            collection_name=collection_name,
+            field_name="chunk_index",
+            field_schema=models.PayloadSchemaType.INTEGER
+        )
+        
         logger.info(f"Коллекция {collection_name} успешно создана с оптимальными настройками")
         return True
         
@@ -144,6 +256,7 @@ def init_collection(client, collection_name, recreate=False):
 def main():
     """Основная функция скрипта"""
     args = parse_args()
+    setup_logging()
     
     # Получаем API-ключ из аргументов или переменной окружения
     api_key = args.api_key or os.environ.get('QDRANT_API_KEY')
@@ -167,7 +280,8 @@ def main():
         logger.info("Подключение к Qdrant успешно установлено")
         
         # Инициализируем коллекцию
-        result = init_collection(client, args.collection, args.recreate)
+        result = init_collection(client, args.collection, args.recreate, sparse=not args.no_sparse,
+                                 profile=args.profile)
         
         if result:
             logger.info("Инициализация коллекции успешно завершена")
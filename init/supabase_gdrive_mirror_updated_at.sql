@@ -0,0 +1,22 @@
+-- Файл: init/supabase_gdrive_mirror_updated_at.sql
+--
+-- Описание:
+-- Колонка gdrive_mirror.updated_at для инкрементальной сверки локального
+-- снимка (scripts/mirror_snapshot.py, DB_SNAPSHOT=true). Значение ставится
+-- при вставке (default now()) и при каждом обновлении, в том числе upsert
+-- с ON CONFLICT DO UPDATE (триггер moddatetime).
+-- Выполнить один раз в SQL Editor Supabase. Повторный запуск безопасен.
+
+alter table public.gdrive_mirror
+    add column if not exists updated_at timestamptz not null default now();
+
+create extension if not exists moddatetime schema extensions;
+
+drop trigger if exists gdrive_mirror_set_updated_at on public.gdrive_mirror;
+create trigger gdrive_mirror_set_updated_at
+    before update on public.gdrive_mirror
+    for each row execute procedure extensions.moddatetime(updated_at);
+
+-- Сверка читает строки с updated_at >= водяного знака в порядке gdrive_id
+create index if not exists gdrive_mirror_updated_at_idx
+    on public.gdrive_mirror (updated_at, gdrive_id);
@@ -0,0 +1,74 @@
+# Файл: scripts/bench_chunker.py
+#
+# Описание:
+# Микробенчмарк потокового чанкера (chunk_text.iter_chunks) на больших
+# документах: сгенерированный RU/EN текст заданного объема (по умолчанию
+# 50 МБ, как file_system.max_file_size_mb) разбивается целиком одним
+# разделом и постранично. По времени на 1/10, 1/2 и полном объеме видно,
+# что время растет линейно.
+#
+# Запуск: python bench_chunker.py --mb 50 --chunk-size 1000 --overlap 200
+
+import time
+import random
+import argparse
+
+from chunk_text import iter_chunks
+
+WORDS = (
+    "документ договор отчет поставка оплата сторона срок период приложение согласно пункт "
+    "agreement report delivery payment party term period annex according clause section"
+).split()
+
+
+def parse_args():
+    """Парсер аргументов командной строки"""
+    parser = argparse.ArgumentParser(description='Бенчмарк потокового чанкера')
+    parser.add_argument('--mb', type=float, default=50, help='Объем текста, МБ (default: 50)')
+    parser.add_argument('--chunk-size', type=int, default=1000, help='Размер чанка (default: 1000)')
+    parser.add_argument('--overlap', type=int, default=200, help='Перекрытие (default: 200)')
+    parser.add_argument('--page-chars', type=int, default=3000, help='Символов на страницу (default: 3000)')
+    return parser.parse_args()
+
+
+def generate_text(chars: int, seed: int = 42) -> str:
+    """Текст из предложений и абзацев заданной длины."""
+    rng = random.Random(seed)
+    parts = []
+    length = 0
+    while length < chars:
+        sentence = " ".join(rng.choice(WORDS) for _ in range(rng.randint(5, 30))).capitalize() + rng.choice(".!?")
+        sentence += "\n\n" if rng.random() < 0.15 else " "
+        parts.append(sentence)
+        length += len(sentence)
+    return "".join(parts)[:chars]
+
+
+def run(label: str, sections, chars: int, chunk_size: int, overlap: int):
+    start = time.perf_counter()
+    count = 0
+    for _ in iter_chunks(sections, chunk_size, overlap):
+        count += 1
+    elapsed = time.perf_counter() - start
+    megabytes = chars / 1024 / 1024
+    print(f"{label:<36} {elapsed:8.3f} с  ({count:,} чанков, {megabytes / elapsed:6.1f} МБ/с, "
+          f"{elapsed / megabytes * 1000:6.1f} мс/МБ)")
+
+
+def main():
+    args = parse_args()
+    total_chars = int(args.mb * 1024 * 1024)
+    print(f"Генерация текста {args.mb} МБ...")
+    text = generate_text(total_chars)
+
+    for fraction in (0.1, 0.5, 1.0):
+        chars = int(total_chars * fraction)
+        part = text[:chars]
+        run(f"Один раздел, {chars / 1024 / 1024:.1f} МБ", [{"text": part, "number": 1}], chars, args.chunk_size, args.overlap)
+        pages = ({"text": part[offset:offset + args.page_chars], "number": number}
+                 for number, offset in enumerate(range(0, chars, args.page_chars), start=1))
+        run(f"Постранично, {chars / 1024 / 1024:.1f} МБ", pages, chars, args.chunk_size, args.overlap)
+
+
+if __name__ == "__main__":
+    main()
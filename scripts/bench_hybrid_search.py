@@ -0,0 +1,209 @@
+# Файл: scripts/bench_hybrid_search.py
+#
+# Описание:
+# Офлайн-бенчмарк релевантности и задержки режимов поиска dense / sparse /
+# hybrid (RetrievalService) на сгенерированном RU/EN корпусе с известными
+# ответами. Два набора запросов:
+#   - identifiers: точные номера и коды ("ДП-2024/117", "INV-58213");
+#   - keywords: три редких слова из нужного чанка, русские - в других
+#     словоформах ("накладных" при "накладная" в тексте).
+# Для каждого режима и набора - recall@k, MRR@k и p50/p95 задержки.
+# Кэши сервиса отключены, чтобы мерить сам поиск.
+#
+# С провайдером stub (по умолчанию) плотные векторы не несут смысла - это
+# нижняя граница для dense; для реальных цифр запускайте с --provider openai.
+# По умолчанию коллекция создается в локальном режиме qdrant_client (":memory:",
+# поиск перебором); с --server - во временной коллекции на QDRANT_HOST:QDRANT_PORT.
+#
+# Запуск: python bench_hybrid_search.py --chunks 3000 --queries 200 --k 10
+
+import os
+import time
+import random
+import asyncio
+import argparse
+from typing import Dict, Any, List, Tuple
+
+from qdrant_client.http import models
+
+from embedding_service import OpenAIEmbeddingProvider, StubEmbeddingProvider
+from qdrant_writer import build_point
+from retrieval_service import RetrievalService, create_async_qdrant_client, SEARCH_MODES
+from sparse_vectors import SPARSE_VECTOR_NAME, create_bm25_encoder
+
+BENCH_COLLECTION = "bench_hybrid_search"
+
+# Основы и окончания для генерации словоформ
+RU_NOUNS = [
+    ("договор", ["", "а", "у", "ом", "е", "ы", "ов", "ам"]), ("поставк", ["а", "и", "е", "у", "ой", "ам", "ами"]),
+    ("оплат", ["а", "ы", "е", "у", "ой"]), ("счет", ["", "а", "у", "ом", "е", "ов"]), ("отчет", ["", "а", "у", "ом", "ы", "ов"]),
+    ("аренд", ["а", "ы", "е", "у", "ой"]), ("сотрудник", ["", "а", "у", "ом", "и", "ов"]), ("проект", ["", "а", "у", "ом", "ы", "ов"]),
+    ("смет", ["а", "ы", "е", "у", "ой"]), ("налог", ["", "а", "у", "ом", "и", "ов"]), ("склад", ["", "а", "у", "ом", "ы", "ов"]),
+    ("претензи", ["я", "и", "ю", "ей", "й"]), ("накладн", ["ая", "ой", "ую", "ые", "ых"]), ("гаранти", ["я", "и", "ю", "ей", "й"]),
+    ("ремонт", ["", "а", "у", "ом", "ы", "ов"]), ("закупк", ["а", "и", "е", "у", "ой"]), ("лиценз", ["ия", "ии", "ию", "ией"]),
+    ("командировк", ["а", "и", "е", "у", "ой"]), ("отпуск", ["", "а", "у", "ом", "и", "ов"]), ("бюджет", ["", "а", "у", "ом", "ы", "ов"]),
+]
+EN_WORDS = ["contract", "invoice", "payment", "delivery", "warehouse", "budget", "audit", "license", "warranty", "lease",
+            "repair", "purchase", "employee", "schedule", "report", "project", "tax", "claim", "shipment", "approval"]
+SURNAMES = ["Петров", "Сидорова", "Кузнецов", "Смирнова", "Волков", "Johnson", "Miller", "Anderson", "Зайцев", "Орлова"]
+RU_ENDINGS = ["а", "ы", "е", "у", "ой", "ам", "ами", "ах"]
+RU_SYLLABLES = ["ка", "ро", "ле", "ми", "на", "ту", "вер", "дан", "гор", "сол", "пра", "сте", "бро", "лин", "мар", "зем"]
+EN_SYLLABLES = ["ka", "ro", "len", "mi", "nor", "tu", "ver", "dan", "gor", "sol", "pra", "ste", "bro", "lin", "mar", "zem"]
+
+
+def parse_args():
+    """Парсер аргументов командной строки"""
+    parser = argparse.ArgumentParser(description='Бенчмарк гибридного поиска (dense + BM25)')
+    parser.add_argument('--chunks', type=int, default=3000, help='Чанков в корпусе (default: 3000)')
+    parser.add_argument('--queries', type=int, default=200, help='Запросов в каждом наборе (default: 200)')
+    parser.add_argument('--k', type=int, default=10, help='Глубина recall@k / MRR@k (default: 10)')
+    parser.add_argument('--provider', choices=['stub', 'openai'], default='stub', help='Провайдер эмбеддингов (default: stub)')
+    parser.add_argument('--model', type=str, default='text-embedding-ada-002', help='Модель для --provider openai')
+    parser.add_argument('--dim', type=int, default=256, help='Размерность для stub (default: 256)')
+    parser.add_argument('--server', action='store_true', help='Временная коллекция на QDRANT_HOST вместо :memory:')
+    return parser.parse_args()
+
+
+def make_rare_stems(rng: random.Random, count: int) -> List[Tuple[str, bool]]:
+    """Редкие основы (псевдослова): (основа, русская ли)."""
+    stems = set()
+    while len(stems) < count:
+        russian = rng.random() < 0.7
+        syllables = RU_SYLLABLES if russian else EN_SYLLABLES
+        stems.add(("".join(rng.choice(syllables) for _ in range(rng.randint(2, 3))) + ("т" if russian else "x"), russian))
+    return sorted(stems)
+
+
+def inflect(rng: random.Random, stem: str, russian: bool) -> str:
+    return stem + rng.choice(RU_ENDINGS) if russian else stem + rng.choice(["", "s"])
+
+
+def word(rng: random.Random) -> str:
+    if rng.random() < 0.3:
+        return rng.choice(EN_WORDS)
+    stem, endings = rng.choice(RU_NOUNS)
+    return stem + rng.choice(endings)
+
+
+def identifier(rng: random.Random) -> str:
+    kind = rng.randrange(3)
+    if kind == 0:
+        return f"ДП-{rng.randint(2019, 2026)}/{rng.randint(1, 999)}"
+    if kind == 1:
+        return f"INV-{rng.randint(10000, 99999)}"
+    return f"АКТ_{rng.randint(100, 9999)}"
+
+
+def generate_corpus(count: int, seed: int = 42) -> Tuple[List[Dict[str, Any]], List[Tuple[str, str]]]:
+    """
+    Чанки (частые слова + несколько редких основ) и пары (идентификатор, id чанка).
+    У чанка в "rare" - его редкие основы для запросов keywords.
+    """
+    rng = random.Random(seed)
+    rare_stems = make_rare_stems(rng, max(50, count * 2))
+    chunks = []
+    identifiers = []
+    for number in range(count):
+        words = [word(rng) for _ in range(rng.randint(60, 120))]
+        rare = rng.sample(rare_stems, 5)
+        for stem, russian in rare:
+            words.insert(rng.randrange(len(words)), inflect(rng, stem, russian))
+        chunk_id = f"doc{number}"
+        if rng.random() < 0.4:
+            code = identifier(rng)
+            words.insert(rng.randrange(len(words)), f"№ {code}")
+            identifiers.append((code, chunk_id))
+        if rng.random() < 0.2:
+            surname = rng.choice(SURNAMES) + f" {rng.choice('АБВГДЕЖЗИК')}."
+            words.insert(rng.randrange(len(words)), surname)
+        chunks.append({"id": chunk_id, "text": " ".join(words), "rare": rare})
+    return chunks, identifiers
+
+
+def keyword_query(rng: random.Random, chunk: Dict[str, Any]) -> str:
+    """Три редкие основы чанка в случайных словоформах и одно частое слово."""
+    words = [inflect(rng, stem, russian) for stem, russian in rng.sample(chunk["rare"], 3)]
+    words.insert(rng.randrange(4), word(rng))
+    return " ".join(words)
+
+
+async def build_collection(client, chunks: List[Dict[str, Any]], provider, dim: int):
+    if await client.collection_exists(BENCH_COLLECTION):
+        await client.delete_collection(BENCH_COLLECTION)
+    await client.create_collection(
+        BENCH_COLLECTION,
+        vectors_config=models.VectorParams(size=dim, distance=models.Distance.COSINE),
+        sparse_vectors_config={SPARSE_VECTOR_NAME: models.SparseVectorParams(modifier=models.Modifier.IDF)}
+    )
+    bm25 = create_bm25_encoder()
+    for start in range(0, len(chunks), 256):
+        batch = chunks[start:start + 256]
+        vectors = provider.embed([chunk["text"] for chunk in batch])
+        points = [build_point({"gdrive_id": chunk["id"], "path": f"bench/{chunk['id']}.pdf"},
+                              {"chunk_index": 0, "text": chunk["text"]}, vector, bm25.encode_document(chunk["text"]))
+                  for chunk, vector in zip(batch, vectors)]
+        await client.upsert(BENCH_COLLECTION, points=points)
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))] if ordered else 0.0
+
+
+async def evaluate(service: RetrievalService, queries: List[Tuple[str, str]], mode: str, k: int) -> Dict[str, float]:
+    hits = 0
+    reciprocal_rank = 0.0
+    latencies = []
+    for query, target in queries:
+        start = time.perf_counter()
+        response = await service.search(query, limit=k, mode=mode)
+        latencies.append((time.perf_counter() - start) * 1000)
+        ranked = [result["gdrive_id"] for result in response["results"]]
+        if target in ranked:
+            hits += 1
+            reciprocal_rank += 1 / (ranked.index(target) + 1)
+    return {"recall": hits / len(queries), "mrr": reciprocal_rank / len(queries),
+            "p50": percentile(latencies, 0.5), "p95": percentile(latencies, 0.95)}
+
+
+async def main_async(args):
+    if args.provider == "openai":
+        provider = OpenAIEmbeddingProvider(args.model, 1536)
+        dim = 1536
+    else:
+        provider = StubEmbeddingProvider(args.dim)
+        dim = args.dim
+
+    chunks, identifiers = generate_corpus(args.chunks)
+    rng = random.Random(7)
+    query_sets = {
+        "identifiers": rng.sample(identifiers, min(args.queries, len(identifiers))),
+        "keywords": [(keyword_query(rng, chunk), chunk["id"]) for chunk in rng.sample(chunks, min(args.queries, len(chunks)))],
+    }
+
+    client = create_async_qdrant_client(None if args.server else ":memory:")
+    print(f"Корпус: {len(chunks)} чанков, провайдер {args.provider}, {'сервер' if args.server else 'локальный :memory:'}")
+    start = time.perf_counter()
+    await build_collection(client, chunks, provider, dim)
+    print(f"  Индексация: {time.perf_counter() - start:.1f} с")
+
+    service = RetrievalService(client, BENCH_COLLECTION, provider, max_limit=args.k,
+                               query_cache_size=0, result_cache_size=0, generation_path=os.devnull)
+    try:
+        print(f"\n{'набор':<12} {'режим':<7} {'recall@' + str(args.k):>10} {'MRR@' + str(args.k):>8} {'p50, мс':>9} {'p95, мс':>9}")
+        for name, queries in query_sets.items():
+            for mode in SEARCH_MODES:
+                metrics = await evaluate(service, queries, mode, args.k)
+                print(f"{name:<12} {mode:<7} {metrics['recall']:>10.3f} {metrics['mrr']:>8.3f} "
+                      f"{metrics['p50']:>9.2f} {metrics['p95']:>9.2f}")
+    finally:
+        await client.delete_collection(BENCH_COLLECTION)
+        await client.close()
+
+
+def main():
+    asyncio.run(main_async(parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+# Файл: scripts/bench_qdrant_writer.py
+#
+# Описание:
+# Бенчмарк пакетной записи в Qdrant (qdrant_writer.QdrantWriter) в точках/с
+# для нескольких значений parallel. По умолчанию используется локальный режим
+# qdrant_client (":memory:") - сервер не нужен; с --server пишет во временную
+# коллекцию на QDRANT_HOST:QDRANT_PORT (с --grpc - по gRPC) и удаляет ее.
+# Последний прогон повторяет запись тех же точек и проверяет, что число точек
+# в коллекции не изменилось (ID детерминированы, повтор идемпотентен).
+#
+# Запуск: python bench_qdrant_writer.py --points 20000 --dim 1536 --parallel 1 4 8
+
+import time
+import random
+import argparse
+
+from qdrant_client.http import models
+
+from qdrant_writer import QdrantWriter, build_point, create_qdrant_client
+
+BENCH_COLLECTION = "bench_qdrant_writer"
+
+
+def parse_args():
+    """Парсер аргументов командной строки"""
+    parser = argparse.ArgumentParser(description='Бенчмарк пакетной записи в Qdrant')
+    parser.add_argument('--points', type=int, default=20000, help='Число точек (default: 20000)')
+    parser.add_argument('--dim', type=int, default=1536, help='Размерность векторов (default: 1536)')
+    parser.add_argument('--batch-size', type=int, default=256, help='Точек в пакете (default: 256)')
+    parser.add_argument('--parallel', type=int, nargs='+', default=[1, 4, 8], help='Значения parallel (default: 1 4 8)')
+    parser.add_argument('--chunks-per-file', type=int, default=20, help='Чанков на документ (default: 20)')
+    parser.add_argument('--server', action='store_true', help='Писать в Qdrant из QDRANT_HOST/QDRANT_PORT, а не в :memory:')
+    parser.add_argument('--grpc', action='store_true', help='Использовать gRPC (только с --server)')
+    parser.add_argument('--no-bulk', action='store_true', help='Не отключать индексацию на время загрузки')
+    return parser.parse_args()
+
+
+def generate_points(count: int, dim: int, chunks_per_file: int, seed: int = 42):
+    rng = random.Random(seed)
+    for number in range(count):
+        file_data = {
+            "gdrive_id": f"bench{number // chunks_per_file:07d}",
+            "path": f"bench/doc{number // chunks_per_file}.pdf",
+            "version": 1,
+        }
+        chunk = {"chunk_index": number % chunks_per_file, "text": f"Чанк {number}"}
+        yield build_point(file_data, chunk, [rng.random() for _ in range(dim)])
+
+
+def recreate_collection(client, dim: int):
+    if client.collection_exists(BENCH_COLLECTION):
+        client.delete_collection(BENCH_COLLECTION)
+    client.create_collection(
+        collection_name=BENCH_COLLECTION,
+        vectors_config=models.VectorParams(size=dim, distance=models.Distance.COSINE)
+    )
+
+
+def run(client, args, parallel: int) -> float:
+    recreate_collection(client, args.dim)
+    points = list(generate_points(args.points, args.dim, args.chunks_per_file))
+    writer = QdrantWriter(client, BENCH_COLLECTION, batch_size=args.batch_size, parallel=parallel)
+
+    start = time.perf_counter()
+    if args.no_bulk:
+        writer.upsert_points(points)
+    else:
+        with writer.bulk_load():
+            writer.upsert_points(points)
+    elapsed = time.perf_counter() - start
+    speed = args.points / elapsed
+    print(f"parallel={parallel:<3} {elapsed:8.2f} с  {speed:10,.0f} точек/с")
+    return speed
+
+
+def main():
+    args = parse_args()
+    client = create_qdrant_client(None if args.server else ":memory:", prefer_grpc=args.grpc)
+    mode = ("gRPC" if args.grpc else "REST") if args.server else "локальный :memory:"
+    print(f"Запись {args.points} точек размерности {args.dim}, пакет {args.batch_size}, режим: {mode}")
+
+    try:
+        for parallel in args.parallel:
+            run(client, args, parallel)
+
+        # Повторная запись тех же точек не должна добавлять новые
+        writer = QdrantWriter(client, BENCH_COLLECTION, batch_size=args.batch_size, parallel=max(args.parallel))
+        writer.upsert_points(generate_points(args.points, args.dim, args.chunks_per_file))
+        count = client.count(BENCH_COLLECTION, exact=True).count
+        if count == args.points:
+            print(f"✅ Повторная запись идемпотентна: в коллекции {count} точек.")
+        else:
+            print(f"❌ После повторной записи в коллекции {count} точек вместо {args.points}.")
+    finally:
+        if client.collection_exists(BENCH_COLLECTION):
+            client.delete_collection(BENCH_COLLECTION)
+
+
+if __name__ == "__main__":
+    main()
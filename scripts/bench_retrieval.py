@@ -0,0 +1,165 @@
+# Файл: scripts/bench_retrieval.py
+#
+# Описание:
+# Генератор нагрузки для API поиска: N запросов с заданной параллельностью,
+# отчет по задержкам (p50/p95/p99/max), пропускной способности и доле
+# ответов из кэша; с --target-p95-ms - проверка целевого p95.
+#
+# - По умолчанию обращается к работающему API (--url, токен API_TOKEN).
+# - С --in-process запускает RetrievalService в этом же процессе на локальной
+#   коллекции qdrant_client (":memory:") со сгенерированными точками и
+#   stub-эмбеддингами - без сервера, сети и ключей. У точек есть и
+#   sparse-вектор BM25, поэтому режим hybrid по умолчанию не сводится к dense.
+# Доля повторов запросов (--unique-queries) определяет попадания в кэши.
+#
+# Запуск: python bench_retrieval.py --url http://localhost:8000 --requests 2000 --concurrency 32
+#         python bench_retrieval.py --in-process --points 20000 --requests 2000
+
+import os
+import time
+import random
+import asyncio
+import argparse
+from typing import Dict, Any, List
+
+WORDS = (
+    "договор поставка оплата отчет налог аренда сотрудник проект смета счет акт "
+    "contract invoice report payment lease budget project schedule audit tax"
+).split()
+
+
+def parse_args():
+    """Парсер аргументов командной строки"""
+    parser = argparse.ArgumentParser(description='Нагрузочный тест API поиска')
+    parser.add_argument('--url', type=str, default="http://localhost:8000", help='Адрес API (default: http://localhost:8000)')
+    parser.add_argument('--in-process', action='store_true', help='Сервис в этом процессе на коллекции :memory:')
+    parser.add_argument('--points', type=int, default=20000, help='Точек в коллекции для --in-process (default: 20000)')
+    parser.add_argument('--dim', type=int, default=256, help='Размерность векторов для --in-process (default: 256)')
+    parser.add_argument('--requests', type=int, default=2000, help='Число запросов (default: 2000)')
+    parser.add_argument('--concurrency', type=int, default=32, help='Одновременных запросов (default: 32)')
+    parser.add_argument('--unique-queries', type=int, default=500, help='Разных текстов запросов (default: 500)')
+    parser.add_argument('--limit', type=int, default=10, help='Результатов на запрос (default: 10)')
+    parser.add_argument('--hnsw-ef', type=int, default=None, help='hnsw_ef в запросе')
+    parser.add_argument('--filter-type', type=str, default=None, help='Фильтр по file_type (например, pdf)')
+    parser.add_argument('--target-p95-ms', type=float, default=None, help='Целевой p95, мс')
+    return parser.parse_args()
+
+
+def make_queries(count: int, seed: int = 7) -> List[str]:
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 6))) for _ in range(count)]
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+async def build_in_process_service(args):
+    """RetrievalService на коллекции :memory: с args.points случайными точками (dense + BM25)."""
+    from qdrant_client.http import models
+    from embedding_service import StubEmbeddingProvider
+    from qdrant_writer import build_point
+    from retrieval_service import RetrievalService, create_async_qdrant_client
+    from sparse_vectors import SPARSE_VECTOR_NAME, create_bm25_encoder
+
+    client = create_async_qdrant_client(":memory:")
+    await client.create_collection(
+        "bench",
+        vectors_config=models.VectorParams(size=args.dim, distance=models.Distance.COSINE),
+        sparse_vectors_config={SPARSE_VECTOR_NAME: models.SparseVectorParams(modifier=models.Modifier.IDF)}
+    )
+    provider = StubEmbeddingProvider(args.dim)
+    bm25 = create_bm25_encoder()
+    rng = random.Random(42)
+    points = []
+    for number in range(args.points):
+        text = " ".join(rng.choice(WORDS) for _ in range(20))
+        file_data = {"gdrive_id": f"doc{number // 10}", "path": f"bench/doc{number // 10}.{rng.choice(['pdf', 'docx'])}",
+                     "gdrive_modified_time": "2026-01-01T00:00:00Z"}
+        points.append(build_point(file_data, {"chunk_index": number % 10, "text": text}, [rng.gauss(0, 1) for _ in range(args.dim)],
+                                  bm25.encode_document(text)))
+    for start in range(0, len(points), 1000):
+        await client.upsert("bench", points=points[start:start + 1000])
+    return RetrievalService(client, "bench", provider, generation_path=os.devnull)
+
+
+async def run_load(args, call) -> Dict[str, Any]:
+    queries = make_queries(args.unique_queries)
+    rng = random.Random(11)
+    order = [rng.choice(queries) for _ in range(args.requests)]
+    latencies: List[float] = []
+    errors = 0
+    cached = 0
+    position = 0
+
+    async def worker():
+        nonlocal errors, cached, position
+        while position < len(order):
+            query = order[position]
+            position += 1
+            start = time.perf_counter()
+            try:
+                response = await call(query)
+                cached += bool(response.get("cached"))
+                latencies.append((time.perf_counter() - start) * 1000)
+            except Exception as e:
+                errors += 1
+                if errors <= 3:
+                    print(f"  ❌ Ошибка запроса: {e}")
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - start
+    return {"latencies": latencies, "errors": errors, "cached": cached, "elapsed": elapsed}
+
+
+async def main_async(args):
+    filters = {"file_type": args.filter_type} if args.filter_type else None
+    if args.in_process:
+        service = await build_in_process_service(args)
+
+        async def call(query: str):
+            return await service.search(query, limit=args.limit, filters=filters, hnsw_ef=args.hnsw_ef)
+        mode = f"в процессе, {args.points} точек, режим {service.mode}"
+    else:
+        import httpx
+        token = os.getenv("API_TOKEN")
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        http = httpx.AsyncClient(base_url=args.url, limits=limits, timeout=30,
+                                 headers={"Authorization": f"Bearer {token}"} if token else None)
+
+        async def call(query: str):
+            body = {"query": query, "limit": args.limit, "filters": filters, "hnsw_ef": args.hnsw_ef}
+            response = await http.post("/search", json=body)
+            response.raise_for_status()
+            return response.json()
+        mode = args.url
+
+    print(f"Нагрузка: {args.requests} запросов, параллельно {args.concurrency}, разных текстов {args.unique_queries} ({mode})")
+    result = await run_load(args, call)
+    latencies = result["latencies"]
+    print(f"  Пропускная способность: {len(latencies) / result['elapsed']:,.0f} запросов/с, ошибок {result['errors']}, "
+          f"из кэша {result['cached']} ({result['cached'] / max(1, len(latencies)) * 100:.1f}%)")
+    p95 = percentile(latencies, 0.95)
+    print(f"  Задержка, мс: p50 {percentile(latencies, 0.5):.2f}, p95 {p95:.2f}, "
+          f"p99 {percentile(latencies, 0.99):.2f}, max {max(latencies, default=0):.2f}")
+    if args.in_process:
+        print(f"  Кэши: {service.get_stats()}")
+    else:
+        await http.aclose()
+    if args.target_p95_ms is not None:
+        if p95 <= args.target_p95_ms:
+            print(f"✅ p95 {p95:.2f} мс в пределах цели {args.target_p95_ms} мс.")
+        else:
+            print(f"❌ p95 {p95:.2f} мс больше цели {args.target_p95_ms} мс.")
+
+
+def main():
+    asyncio.run(main_async(parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+# Файл: scripts/bench_server_scan.py
+#
+# Описание:
+# Бенчмарк сканеров локальной директории: os.walk (get_metadata_from_server)
+# против os.scandir + пул потоков (get_metadata_from_server_fast) без кэша
+# и с прогретым кэшем. Дерево файлов генерируется во временной директории.
+#
+# Запуск: python bench_server_scan.py --files 20000 --depth 4 --fanout 6
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import contextlib
+import io
+
+import get_server_methadata
+
+
+def parse_args():
+    """Парсер аргументов командной строки"""
+    parser = argparse.ArgumentParser(description='Бенчмарк сканирования локальной директории')
+    parser.add_argument('--files', type=int, default=20000, help='Число файлов (default: 20000)')
+    parser.add_argument('--depth', type=int, default=4, help='Глубина дерева (default: 4)')
+    parser.add_argument('--fanout', type=int, default=6, help='Поддиректорий на уровень (default: 6)')
+    parser.add_argument('--workers', type=int, default=8, help='Потоков для быстрого сканера (default: 8)')
+    parser.add_argument('--path', type=str, default=None,
+                        help='Сканировать существующую директорию вместо сгенерированной')
+    return parser.parse_args()
+
+
+def generate_tree(root: str, files: int, depth: int, fanout: int):
+    """Создает дерево директорий и равномерно раскладывает по нему пустые файлы."""
+    directories = [root]
+    level = [root]
+    for _ in range(depth):
+        next_level = []
+        for parent in level:
+            for i in range(fanout):
+                path = os.path.join(parent, f"dir{i}")
+                os.mkdir(path)
+                next_level.append(path)
+        directories.extend(next_level)
+        level = next_level
+    for i in range(files):
+        with open(os.path.join(directories[i % len(directories)], f"file{i}.pdf"), "wb") as f:
+            f.write(b"x" * (i % 1024))
+    return len(directories)
+
+
+def timed(label: str, func, *args, **kwargs):
+    # Подавляем вывод сканеров, чтобы он не искажал замер
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+    print(f"{label:<32} {elapsed:8.3f} с  ({len(result)} файлов, {len(result) / elapsed:,.0f} файлов/с)")
+    return result
+
+
+def main():
+    args = parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        root = args.path
+        if root is None:
+            root = os.path.join(tmp, "tree")
+            os.mkdir(root)
+            dirs = generate_tree(root, args.files, args.depth, args.fanout)
+            print(f"Сгенерировано: {args.files} файлов в {dirs} директориях")
+        cache_path = os.path.join(tmp, "scan_cache.json")
+
+        baseline = timed("os.walk", get_server_methadata.get_metadata_from_server, root)
+        cold = timed("scandir + потоки (без кэша)", get_server_methadata.get_metadata_from_server_fast,
+                     root, args.workers, cache_path)
+        warm = timed("scandir + потоки (с кэшем)", get_server_methadata.get_metadata_from_server_fast,
+                     root, args.workers, cache_path)
+
+        if not (baseline == cold == warm):
+            print("❌ Результаты сканеров различаются!")
+            sys.exit(1)
+        print("✅ Результаты сканеров совпадают.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,367 @@
+# Файл: scripts/bench_sync_scale.py
+#
+# Описание:
+# Бенчмарк этапов синхронизации на синтетических данных нашего масштаба
+# (около 158 тыс. файлов / 138 ГБ, глубокие деревья папок) без сети:
+# - Drive: FakeDriveService с настраиваемым деревом (файлы, глубина, ветвление),
+#   размером страницы, задержкой каждого вызова API и квотой (троттлинг
+#   403/429 сверх --quota-per-second или --max-concurrent-requests);
+# - gdrive_mirror: FakeSupabaseClient в памяти с состоянием "прошлого запуска"
+#   (часть файлов новые, изменены, перемещены, в переименованной папке, удалены);
+# - локальная директория: сгенерированное дерево разреженных файлов
+#   (размер как в БД, место на диске почти не занимается).
+#
+# Стадии: scan_drive (GDriveScanner), read_mirror (SupabaseClient),
+# plan (get_file_lists), execute (исполнители clone_files), scan_local
+# (get_server_methadata, холодный и с кэшем), verify_plan (сервер vs БД).
+# Для каждой стадии - время, вызовы API Drive, запросы к БД, пиковый RSS
+# процесса и пропускная способность. С --json результаты сохраняются для
+# сравнения между релизами: --compare <прошлый.json> печатает разницу и
+# завершается с кодом 1, если стадия стала медленнее больше чем на --tolerance.
+#
+# Время read_mirror включает стоимость самого FakeSupabaseClient (фильтр и
+# сортировка в памяти на каждую страницу) - сравнивайте его только между релизами.
+#
+# Запуск: python bench_sync_scale.py --files 20000 --json bench.json
+#         python bench_sync_scale.py --preset prod --scan-workers 8 --latency-ms 20 --json prod.json
+#         python bench_sync_scale.py --compare prod.json --json prod_new.json --preset prod
+#         python bench_sync_scale.py --scan-workers 16 --latency-ms 20 --quota-per-second 300 --max-concurrent-requests 8
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import resource
+import tempfile
+import contextlib
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional, Tuple
+
+import clone_files
+import get_file_lists
+import get_server_methadata
+from db_client import SupabaseClient
+from fake_services import FakeDriveService, FakeSupabaseClient, build_drive_tree
+from get_gdrive_methadata import GDriveScanner
+from rate_governor import RateGovernor
+from source_providers import SourceProvider
+
+PRESETS = {
+    # Рабочий масштаб: 158 тыс. файлов, 138 ГБ, 21845 папок
+    "prod": {"files": 158000, "depth": 7, "fanout": 4, "avg_size_kb": 870},
+}
+
+
+def parse_args():
+    """Парсер аргументов командной строки"""
+    parser = argparse.ArgumentParser(description='Бенчмарк этапов синхронизации на синтетических данных')
+    parser.add_argument('--preset', choices=sorted(PRESETS), default=None, help='Готовый масштаб (prod)')
+    parser.add_argument('--files', type=int, default=20000, help='Файлов в Drive (default: 20000)')
+    parser.add_argument('--depth', type=int, default=5, help='Глубина дерева папок (default: 5)')
+    parser.add_argument('--fanout', type=int, default=4, help='Подпапок на уровень (default: 4)')
+    parser.add_argument('--avg-size-kb', type=int, default=870, help='Средний размер файла, КБ (default: 870)')
+    parser.add_argument('--page-size', type=int, default=1000, help='Элементов на страницу files.list (default: 1000)')
+    parser.add_argument('--latency-ms', type=float, default=0, help='Задержка каждого вызова Drive API, мс (default: 0)')
+    parser.add_argument('--scan-workers', type=int, default=8, help='Потоков сканирования Drive (default: 8)')
+    parser.add_argument('--folders-per-query', type=int, default=1, help='Папок в одном запросе (default: 1)')
+    parser.add_argument('--quota-per-second', type=float, default=None, help='Квота фейкового Drive, запросов в секунду')
+    parser.add_argument('--max-concurrent-requests', type=int, default=None, help='Квота фейкового Drive на одновременные запросы')
+    parser.add_argument('--drive-rate', type=float, default=RateGovernor.DEFAULT_RATE,
+                        help=f'DRIVE_RATE_LIMIT регулятора, запросов в секунду (default: {RateGovernor.DEFAULT_RATE:g})')
+    parser.add_argument('--drive-max-concurrency', type=int, default=RateGovernor.DEFAULT_MAX_CONCURRENCY,
+                        help=f'DRIVE_MAX_CONCURRENCY регулятора (default: {RateGovernor.DEFAULT_MAX_CONCURRENCY})')
+    parser.add_argument('--download-workers', type=int, default=8, help='DOWNLOAD_WORKERS исполнителей (default: 8)')
+    parser.add_argument('--download-latency-ms', type=float, default=0, help='Задержка "скачивания" файла, мс (default: 0)')
+    parser.add_argument('--server-scan-workers', type=int, default=8, help='Потоков сканирования диска (default: 8)')
+    parser.add_argument('--new', type=float, default=0.01, help='Доля новых файлов (default: 0.01)')
+    parser.add_argument('--changed', type=float, default=0.01, help='Доля измененных файлов (default: 0.01)')
+    parser.add_argument('--moved', type=float, default=0.01, help='Доля переименованных файлов (default: 0.01)')
+    parser.add_argument('--deleted', type=float, default=0.01, help='Доля удаленных файлов (default: 0.01)')
+    parser.add_argument('--renamed-folders', type=int, default=1, help='Переименованных папок второго уровня (default: 1)')
+    parser.add_argument('--seed', type=int, default=42, help='Seed генератора (default: 42)')
+    parser.add_argument('--json', type=str, default=None, help='Сохранить результаты в JSON-файл')
+    parser.add_argument('--compare', type=str, default=None, help='JSON прошлого прогона для сравнения')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Допустимое замедление стадии (default: 0.25)')
+    args = parser.parse_args()
+    if args.preset:
+        for key, value in PRESETS[args.preset].items():
+            setattr(args, key, value)
+    return args
+
+
+def rss_mb() -> Tuple[float, float]:
+    """(текущий, пиковый) RSS процесса в МБ."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # на Linux - в КБ
+    current = peak
+    try:
+        with open("/proc/self/statm") as f:
+            current = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError):
+        pass
+    return current, peak
+
+
+class SyntheticProvider(SourceProvider):
+    """Источник для исполнителей: "скачивание" создает разреженный файл размера из записи."""
+    name = "bench"
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.fetched = 0
+
+    def fetch_file(self, file_data: Dict[str, Any], local_root: str) -> Tuple[bool, Optional[str]]:
+        if self.latency:
+            time.sleep(self.latency)
+        write_sparse(os.path.join(local_root, file_data['path']), file_data.get('size_bytes') or 0)
+        self.fetched += 1
+        return True, None
+
+
+def write_sparse(path: str, size: int):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.truncate(size)
+
+
+def mirror_record(file: Dict[str, Any], path: str) -> Dict[str, Any]:
+    """Запись gdrive_mirror в формате GDriveScanner._build_file_record."""
+    return {
+        "gdrive_id": file["id"],
+        "name": file["name"],
+        "path": path,
+        "md5_checksum": file.get("md5Checksum"),
+        "version": file.get("version"),
+        "mime_type": file.get("mimeType"),
+        "web_view_link": None,
+        "gdrive_created_time": file.get("createdTime"),
+        "gdrive_modified_time": file.get("modifiedTime"),
+        "size_bytes": int(file.get("size", 0)),
+        "status": "SYNCED",
+    }
+
+
+def build_previous_state(generated: List[Dict[str, Any]], args) -> Tuple[List[Dict[str, Any]], Dict[str, int]]:
+    """
+    Записи gdrive_mirror "прошлого запуска": от текущего дерева отличаются
+    на заданные доли новых, измененных, переименованных и удаленных файлов
+    и на переименованные папки второго уровня.
+    """
+    rng = random.Random(args.seed + 1)
+    records = [mirror_record(item["file"], item["path"]) for item in generated]
+    expected = {"create": 0, "update": 0, "move": 0, "delete": 0, "dir_moves": 0}
+
+    # Переименованные папки: в БД файлы лежат под старым именем
+    second_level = sorted({os.sep.join(record["path"].split(os.sep)[:2]) for record in records
+                           if record["path"].count(os.sep) >= 2})
+    renamed = rng.sample(second_level, min(args.renamed_folders, len(second_level)))
+    in_renamed = set()
+    for folder in renamed:
+        old_folder = folder + "_old"
+        for index, record in enumerate(records):
+            if record["path"].startswith(folder + os.sep):
+                record["path"] = old_folder + record["path"][len(folder):]
+                in_renamed.add(index)
+        expected["dir_moves"] += 1
+
+    candidates = [index for index in range(len(records)) if index not in in_renamed]
+    rng.shuffle(candidates)
+    take = lambda fraction: [candidates.pop() for _ in range(min(len(candidates), int(len(records) * fraction)))]
+    new_indexes = set(take(args.new))
+    for index in take(args.changed):
+        records[index]["md5_checksum"] = f"old-{records[index]['md5_checksum']}"
+        expected["update"] += 1
+    for index in take(args.moved):
+        directory, name = os.path.split(records[index]["path"])
+        records[index]["path"] = os.path.join(directory, f"old_{name}")
+        expected["move"] += 1
+    expected["create"] = len(new_indexes)
+    previous = [record for index, record in enumerate(records) if index not in new_indexes]
+
+    # Удаленные - рядом с файлами вне переименованных папок, иначе папка уже не
+    # переносится целиком и план распадается на перемещения подпапок
+    outside = [index for index in range(len(records)) if index not in in_renamed and index not in new_indexes]
+    deleted_count = int(len(records) * args.deleted)
+    for i in range(deleted_count):
+        template = records[rng.choice(outside)]
+        previous.append({**template, "gdrive_id": f"deleted{i}", "name": f"deleted{i}.pdf",
+                         "path": os.path.join(os.path.dirname(template["path"]), f"deleted{i}.pdf")})
+    expected["delete"] = deleted_count
+    return previous, expected
+
+
+class StageRecorder:
+    """Замеры стадий: время, вызовы API, запросы к БД, RSS, пропускная способность."""
+
+    def __init__(self, drive: FakeDriveService, supabase: FakeSupabaseClient):
+        self.drive = drive
+        self.supabase = supabase
+        self.stages: Dict[str, Dict[str, Any]] = {}
+
+    @contextlib.contextmanager
+    def stage(self, name: str, quiet: bool = True):
+        calls_before = dict(self.drive.call_counts)
+        db_before = self.supabase.request_count
+        info: Dict[str, Any] = {"items": 0}
+        start = time.perf_counter()
+        with open(os.devnull, "w") as devnull:
+            # Вывод этапов (построчные print и tqdm) не должен искажать замер
+            with contextlib.redirect_stdout(devnull) if quiet else contextlib.nullcontext(), \
+                    contextlib.redirect_stderr(devnull) if quiet else contextlib.nullcontext():
+                yield info
+        seconds = time.perf_counter() - start
+        current, peak = rss_mb()
+        api_calls = {method: count - calls_before.get(method, 0) for method, count in self.drive.call_counts.items()
+                     if count != calls_before.get(method, 0)}
+        result = {
+            "seconds": round(seconds, 4),
+            "items": info["items"],
+            "items_per_second": round(info["items"] / seconds, 1) if seconds > 0 else None,
+            "api_calls": api_calls,
+            "db_requests": self.supabase.request_count - db_before,
+            "rss_mb": round(current, 1),
+            "peak_rss_mb": round(peak, 1),
+        }
+        result.update({key: value for key, value in info.items() if key != "items"})
+        self.stages[name] = result
+        calls = ", ".join(f"{method} {count}" for method, count in api_calls.items()) or "-"
+        print(f"{name:<16} {seconds:>9.2f} с {info['items']:>9} {result['items_per_second'] or 0:>12,.0f}/с "
+              f"{result['db_requests']:>8} {result['peak_rss_mb']:>9.0f}  {calls}")
+
+
+def run(args) -> Dict[str, Any]:
+    drive = FakeDriveService(latency=args.latency_ms / 1000, max_page_size=args.page_size,
+                             quota_per_second=args.quota_per_second, max_concurrent=args.max_concurrent_requests)
+    supabase = FakeSupabaseClient()
+    recorder = StageRecorder(drive, supabase)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        local_root = os.path.join(tmp, "documents")
+        print(f"Масштаб: {args.files} файлов, глубина {args.depth}, ветвление {args.fanout}, "
+              f"страница {args.page_size}, задержка API {args.latency_ms} мс")
+        print(f"\n{'стадия':<16} {'время':>11} {'элементов':>9} {'скорость':>14} {'запр. БД':>8} {'пик RSS':>9}  вызовы Drive API")
+
+        with recorder.stage("generate") as info:
+            generated = build_drive_tree(drive, args.files, args.depth, args.fanout,
+                                         avg_size=args.avg_size_kb * 1024, seed=args.seed)
+            previous, expected = build_previous_state(generated, args)
+            for record in previous:
+                write_sparse(os.path.join(local_root, record["path"]), record["size_bytes"])
+            supabase.tables["gdrive_mirror"] = {record["gdrive_id"]: dict(record) for record in previous}
+            info["items"] = len(generated) + len(previous)
+            info["total_gb"] = round(sum(int(item["file"]["size"]) for item in generated) / 2**30, 1)
+            info["folders"] = sum(args.fanout ** level for level in range(1, args.depth + 1))
+
+        governor = RateGovernor(rate=args.drive_rate, max_concurrency=args.drive_max_concurrency)
+        scanner = GDriveScanner(service=drive, state_file=os.path.join(tmp, "gdrive_state.json"), governor=governor)
+        with recorder.stage("scan_drive") as info:
+            gdrive_data = scanner.get_metadata_from_gdrive("root", args.scan_workers, args.folders_per_query)
+            info["items"] = len(gdrive_data)
+            info["throttled"] = dict(drive.throttled_counts)
+            info["governor"] = {key: round(value, 3) for key, value in governor.stats.items()}
+            info["governor"]["final_limit"] = governor.concurrency_limit
+
+        db_client = SupabaseClient(client=supabase)
+        with recorder.stage("read_mirror") as info:
+            db_data = db_client.get_all_documents()
+            info["items"] = len(db_data)
+
+        with recorder.stage("plan") as info:
+            to_create, to_update, to_move, to_delete = get_file_lists.get_gdrive_vs_db_plan(gdrive_data, db_data)
+            dir_moves, to_move = get_file_lists.collapse_directory_moves(to_move, db_data)
+            info["items"] = len(gdrive_data) + len(db_data)
+            info["plan"] = {"create": len(to_create), "update": len(to_update), "move": len(to_move),
+                            "dir_moves": len(dir_moves), "delete": len(to_delete)}
+
+        clone_files.db_client = db_client  # вместо клиента Supabase из .env
+        clone_files.LOCAL_SYNC_PATH = local_root
+        clone_files.DOWNLOAD_WORKERS = args.download_workers
+        provider = SyntheticProvider(args.download_latency_ms / 1000)
+        with recorder.stage("execute") as info:
+            synced = clone_files.execute_create(to_create, provider)
+            synced += clone_files.execute_change(to_update, provider)
+            moved = clone_files.execute_directory_move(dir_moves)
+            moved += clone_files.execute_move(to_move)
+            deleted = clone_files.execute_delete(to_delete)
+            info["items"] = len(synced) + len(moved) + len(deleted)
+            info["downloads"] = provider.fetched
+
+        cache_path = os.path.join(tmp, "server_scan_cache.json")
+        for name in ("scan_local_cold", "scan_local_warm"):
+            with recorder.stage(name) as info:
+                server_data = get_server_methadata.get_metadata_from_server_fast(
+                    local_root, args.server_scan_workers, cache_path)
+                info["items"] = len(server_data)
+
+        with recorder.stage("verify_plan") as info:
+            db_after = db_client.get_all_documents()
+            to_refetch, to_delete_local = get_file_lists.get_server_vs_db_plan(server_data, db_after)
+            info["items"] = len(server_data) + len(db_after)
+            info["refetch"] = len(to_refetch)
+            info["delete_local"] = len(to_delete_local)
+
+    if drive.throttled_counts:
+        governor.print_report()
+    plan = recorder.stages["plan"]["plan"]
+    plan_ok = all(plan[key] == expected[key] for key in expected)
+    verify = recorder.stages["verify_plan"]
+    print(f"\nПлан: {plan} (ожидалось {expected})")
+    if plan_ok and verify["refetch"] == 0 and verify["delete_local"] == 0:
+        print("✅ План совпал с ожидаемым, после исполнения диск и БД согласованы.")
+    else:
+        print(f"❌ Расхождение: план {'совпал' if plan_ok else 'не совпал'}, после исполнения "
+              f"перекачать {verify['refetch']}, удалить локально {verify['delete_local']}.")
+
+    return {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "params": {key: value for key, value in vars(args).items() if key not in ("json", "compare", "tolerance")},
+        "consistent": plan_ok and verify["refetch"] == 0 and verify["delete_local"] == 0,
+        "stages": recorder.stages,
+    }
+
+
+def compare(previous: Dict[str, Any], current: Dict[str, Any], tolerance: float) -> List[str]:
+    """Печатает разницу со старым прогоном; возвращает список регрессий."""
+    if previous.get("params") != current["params"]:
+        print("⚠️ Параметры прогонов различаются - сравнение приблизительное.")
+    regressions = []
+    print(f"\n{'стадия':<16} {'было, с':>9} {'стало, с':>9} {'изм.':>7} {'пик RSS, МБ':>14}  вызовы API")
+    for name, stage in current["stages"].items():
+        old = previous.get("stages", {}).get(name)
+        if old is None:
+            continue
+        change = (stage["seconds"] - old["seconds"]) / old["seconds"] if old["seconds"] else 0.0
+        calls = "" if old["api_calls"] == stage["api_calls"] else f"{old['api_calls']} -> {stage['api_calls']}"
+        print(f"{name:<16} {old['seconds']:>9.2f} {stage['seconds']:>9.2f} {change:>+7.0%} "
+              f"{old['peak_rss_mb']:>6.0f} -> {stage['peak_rss_mb']:<5.0f}  {calls}")
+        # Короткие стадии шумят сильнее допуска - их не считаем регрессией
+        if change > tolerance and stage["seconds"] - old["seconds"] > 0.05:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    args = parse_args()
+    result = run(args)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"✅ Результаты сохранены в {args.json}")
+    failed = not result["consistent"]
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(json.load(f), result, args.tolerance)
+        if regressions:
+            print(f"❌ Замедление больше {args.tolerance:.0%}: {', '.join(regressions)}")
+            failed = True
+        else:
+            print(f"✅ Регрессий больше {args.tolerance:.0%} нет.")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+# Файл: scripts/chunk_text.py
+#
+# Описание:
+# Потоковое разбиение извлеченного текста на чанки (processing.chunk_size /
+# processing.chunk_overlap из settings.yml).
+#
+# - Вход - разделы документа (страницы, листы, слайды) из extract_documents.iter_sections();
+#   они читаются лениво, в памяти держится только текущее окно текста.
+# - Смещения чанков считаются в тексте документа, склеенном из разделов
+#   через "\n\n": text == документ[start:end]. Для каждого чанка известны
+#   номера первого и последнего раздела (страницы) и стабильный хэш содержимого.
+# - Граница чанка ищется во второй половине окна: конец абзаца, затем конец
+#   предложения (RU/EN, с учетом сокращений и инициалов), перевод строки,
+#   пробел; только если ничего нет - жесткий разрез.
+# - Перекрытие не больше половины чанка, а следующий чанк начинается не
+#   ближе chunk_size // 4 от начала предыдущего: ранняя граница не
+#   превращает большое перекрытие в сдвиг на одно слово.
+# - Время линейно по длине текста: каждое окно просматривается один раз,
+#   а буфер сдвигается, только когда прочитанная часть больше половины.
+
+import re
+import bisect
+import hashlib
+from typing import Dict, Any, List, Iterable, Iterator, Optional, Tuple
+
+from get_settings import get_setting
+
+SECTION_SEPARATOR = "\n\n"
+
+# Конец предложения: знаки препинания, затем закрывающие кавычки/скобки и пробел
+_SENTENCE_END = re.compile(r'[.!?…]+["»”’)\]]*(?=\s)')
+_LAST_WORD = re.compile(r'(\w+)\W*$')
+# Сокращения, после которых точка не заканчивает предложение
+_ABBREVIATIONS = {
+    "т", "е", "д", "п", "г", "гг", "в", "вв", "др", "пр", "см", "ср", "стр", "рис", "табл", "им", "ул", "тыс", "млн", "млрд", "руб", "коп",
+    "mr", "mrs", "ms", "dr", "prof", "st", "vs", "etc", "e", "i", "g", "fig", "no", "vol", "pp", "inc", "ltd", "jr", "sr",
+}
+
+
+def chunk_hash(text: str) -> str:
+    """Стабильный хэш содержимого чанка (ключ кэша эмбеддингов и т.п.)."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _is_sentence_end(text: str, match: re.Match) -> bool:
+    if text[match.start()] != ".":
+        return True
+    word = _LAST_WORD.search(text, max(0, match.start() - 12), match.start())
+    if word is None:
+        return True
+    word = word.group(1)
+    # Инициалы ("А. С. Пушкин") и известные сокращения
+    return not ((len(word) == 1 and word.isupper()) or word.lower() in _ABBREVIATIONS)
+
+
+def _find_boundary(text: str, min_end: int, limit: int) -> int:
+    """Лучшая граница чанка в text[min_end:limit] (позиция конца, не включая)."""
+    paragraph = text.rfind("\n\n", min_end, limit)
+    if paragraph != -1:
+        return paragraph
+
+    sentence_end = -1
+    for match in _SENTENCE_END.finditer(text, min_end, limit):
+        if _is_sentence_end(text, match):
+            sentence_end = match.end()
+    if sentence_end != -1:
+        return sentence_end
+
+    for separator in ("\n", " ", "\t"):
+        position = text.rfind(separator, min_end, limit)
+        if position != -1:
+            return position
+    return limit
+
+
+def iter_chunks(sections: Iterable[Dict[str, Any]], chunk_size: Optional[int] = None,
+                chunk_overlap: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Разбивает разделы документа на чанки.
+
+    Args:
+        sections: Разделы {'text', 'number', ...} в порядке документа.
+        chunk_size: Максимальная длина чанка в символах (по умолчанию processing.chunk_size).
+        chunk_overlap: Перекрытие соседних чанков, не больше chunk_size // 2 (по умолчанию processing.chunk_overlap).
+
+    Yields:
+        {'chunk_index', 'text', 'start', 'end', 'page_start', 'page_end', 'content_hash'}.
+    """
+    chunk_size = chunk_size or get_setting("processing", "chunk_size", 1000)
+    chunk_overlap = get_setting("processing", "chunk_overlap", 200) if chunk_overlap is None else chunk_overlap
+    if not 0 <= chunk_overlap <= chunk_size // 2:
+        raise ValueError("chunk_overlap должен быть в диапазоне [0, chunk_size // 2]")
+    # Граница чанка не раньше chunk_size // 2, поэтому этот шаг не создает пропусков текста
+    min_stride = max(1, chunk_size // 4)
+
+    sections = iter(sections)
+    buffer = ""         # Непрочитанный хвост документа
+    base = 0            # Смещение buffer[0] в документе
+    pages: List[Tuple[int, Any]] = []   # (смещение начала раздела, номер раздела)
+    page_starts: List[int] = []
+    exhausted = False
+    has_text = False
+    local = 0           # Начало следующего чанка в buffer
+    chunk_index = 0
+
+    def page_at(offset: int):
+        index = bisect.bisect_right(page_starts, offset) - 1
+        return pages[index][1] if index >= 0 else None
+
+    while True:
+        # Дочитываем разделы, пока в буфере не наберется полное окно
+        while not exhausted and len(buffer) - local <= chunk_size:
+            section = next(sections, None)
+            if section is None:
+                exhausted = True
+                break
+            text = section.get("text") or ""
+            if has_text:
+                buffer += SECTION_SEPARATOR
+            has_text = True
+            pages.append((base + len(buffer), section.get("number")))
+            page_starts.append(base + len(buffer))
+            buffer += text
+
+        while local < len(buffer) and buffer[local].isspace():
+            local += 1
+        if local >= len(buffer):
+            if exhausted:
+                return
+            continue
+
+        limit = min(local + chunk_size, len(buffer))
+        if exhausted and limit == len(buffer):
+            end = limit
+        else:
+            end = _find_boundary(buffer, local + chunk_size // 2, limit)
+        trimmed_end = end
+        while trimmed_end > local and buffer[trimmed_end - 1].isspace():
+            trimmed_end -= 1
+
+        text = buffer[local:trimmed_end]
+        start_offset, end_offset = base + local, base + trimmed_end
+        yield {
+            "chunk_index": chunk_index,
+            "text": text,
+            "start": start_offset,
+            "end": end_offset,
+            "page_start": page_at(start_offset),
+            "page_end": page_at(end_offset - 1),
+            "content_hash": chunk_hash(text),
+        }
+        chunk_index += 1
+        if exhausted and end >= len(buffer):
+            return
+
+        # Следующий чанк начинается за chunk_overlap символов до конца, с начала слова
+        next_local = max(end - chunk_overlap, local + min_stride)
+        if chunk_overlap and not buffer[next_local - 1].isspace():
+            space = buffer.find(" ", next_local, end)
+            if space != -1:
+                next_local = space
+        local = next_local
+
+        # Сдвиг буфера - только когда прочитанная часть больше половины (амортизированно O(n))
+        if local > len(buffer) // 2:
+            buffer = buffer[local:]
+            base += local
+            local = 0
+            first_page = max(0, bisect.bisect_right(page_starts, base) - 1)
+            if first_page:
+                del pages[:first_page]
+                del page_starts[:first_page]
+
+
+def chunk_text(text: str, chunk_size: Optional[int] = None, chunk_overlap: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+    """Разбивает один текст (без структуры разделов) на чанки."""
+    return iter_chunks([{"text": text, "number": None}], chunk_size, chunk_overlap)
@@ -1,18 +1,38 @@
 # Файл: scripts/clone_files.py
-# (Описание файла остается прежним)
+#
+# Описание:
+# Исполнители плана синхронизации: скачивание/копирование файлов,
+# перемещение и удаление на диске и пакетная запись изменений в gdrive_mirror.
 
 import os
-import subprocess
-from typing import List, Dict
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Optional
+
+import metrics
 from db_client import SupabaseClient
+from source_providers import SourceProvider, rclone_copy
+from sync_journal import SyncJournal
+from verify_local_files import hash_file
 
 # --- Константы из .env ---
 # Теперь мы просто читаем переменные. Если их нет, main.py должен был прервать выполнение.
 RCLONE_REMOTE_NAME = os.getenv("RCLONE_REMOTE_NAME")
 LOCAL_SYNC_PATH = os.getenv("LOCAL_SYNC_PATH")
+DOWNLOAD_WORKERS = int(os.getenv("DOWNLOAD_WORKERS", "1")) # Параллельные скачивания в execute_create/execute_change
+
+# --- Клиент БД ---
+# Создается при первом обращении (не при импорте) и живет весь процесс;
+# main.py подключает к нему снимок gdrive_mirror, бенчмарк подменяет его фейковым.
+db_client: Optional[SupabaseClient] = None
+
 
-# --- Инициализация клиента БД ---
-db_client = SupabaseClient()
+def get_db_client() -> SupabaseClient:
+    """Общий клиент gdrive_mirror исполнителей (создается один раз)."""
+    global db_client
+    if db_client is None:
+        db_client = SupabaseClient()
+    return db_client
 
 
 def _clone_single_file_with_rclone(relative_path: str):
@@ -22,133 +42,310 @@ def _clone_single_file_with_rclone(relative_path: str):
     if not RCLONE_REMOTE_NAME or not LOCAL_SYNC_PATH:
         print("  ❌ Ошибка: RCLONE_REMOTE_NAME или LOCAL_SYNC_PATH не заданы в .env")
         return False, "Переменные окружения не заданы"
-        
-    remote_source = f"{RCLONE_REMOTE_NAME}:" 
-    local_destination = LOCAL_SYNC_PATH
-
-    command = [
-        "rclone", "copy",
-        remote_source,
-        local_destination,
-        "--include", f"/{relative_path}", # Добавляем слэш в начало для точности
-        "--create-empty-src-dirs",
-        "--immutable",
-        "--progress"
-    ]
-    
-    print(f"  Выполнение: {' '.join(command)}")
-    try:
-        subprocess.run(command, check=True, capture_output=True, text=True, timeout=600)
-        return True, None
-    except subprocess.TimeoutExpired:
-        error_message = "Таймаут скачивания файла (10 минут)."
-        print(f"  ❌ {error_message}")
-        return False, error_message
-    except subprocess.CalledProcessError as e:
-        # Убираем лишние переносы строк из вывода ошибки rclone
-        error_details = e.stderr.strip().replace('\n', ' ')
-        error_message = f"Rclone ошибка: {error_details}"
-        print(f"  ❌ {error_message}")
-        return False, error_message
+    return rclone_copy(RCLONE_REMOTE_NAME, LOCAL_SYNC_PATH, relative_path)
 
-#
-# ОСТАЛЬНАЯ ЧАСТЬ ФАЙЛА (execute_create, execute_change, etc.) ОСТАЕТСЯ БЕЗ ИЗМЕНЕНИЙ
-#
-# ... (скопируйте сюда все функции execute_... из предыдущей версии) ...
-#
 
-def execute_create(files_to_create: List[Dict]):
-    """Клонирует новые файлы с GDrive и создает записи в БД."""
+def fetch_file(file_data: Dict, provider: Optional[SourceProvider] = None):
+    """Доставляет файл через провайдер источника; без провайдера - из GDrive через rclone."""
+    if provider is None:
+        return _clone_single_file_with_rclone(file_data['path'])
+    return provider.fetch_file(file_data, LOCAL_SYNC_PATH)
+
+
+def _report_db_failures(failures: List):
+    """Печатает строки, которые не удалось записать в БД (остальные строки порции записаны)."""
+    for gdrive_id, error in failures:
+        print(f"  ❌ Не удалось записать в БД {gdrive_id}: {error}")
+
+
+def _already_fetched(file_data: Dict, journal: Optional[SyncJournal]) -> bool:
+    """
+    Файл доставлен в прерванном прогоне (отметка в журнале) и лежит на месте:
+    его достаточно записать в БД. Поля, измененные доставкой, восстанавливаются.
+    """
+    fields = journal.fetched_fields(file_data['gdrive_id']) if journal is not None else None
+    if fields is None:
+        return False
+    local_path = os.path.join(LOCAL_SYNC_PATH, file_data['path'])
+    size_bytes = fields.get('size_bytes', file_data.get('size_bytes'))
+    if not os.path.isfile(local_path) or (size_bytes is not None and os.path.getsize(local_path) != size_bytes):
+        return False
+    file_data.update(fields)
+    return True
+
+
+def _verify_md5(file_data: Dict) -> bool:
+    """Сверяет MD5 доставленного файла с md5_checksum записи (у Google-документов его нет)."""
+    expected_md5 = file_data.get('md5_checksum')
+    if not expected_md5:
+        return True
+    actual_md5 = hash_file(os.path.join(LOCAL_SYNC_PATH, file_data['path']))
+    if actual_md5 != expected_md5:
+        print(f"  ❌ MD5 после скачивания не совпадает: ожидался {expected_md5}, получен {actual_md5}")
+        return False
+    return True
+
+
+def _download_and_record(files: List[Dict], provider: Optional[SourceProvider], action: str, kind: str,
+                         journal: Optional[SyncJournal] = None, verify_md5: bool = False):
+    """
+    Скачивает файлы и пакетно записывает успешные в gdrive_mirror.
+    Записи сбрасываются в БД каждые db_client.chunk_size файлов, чтобы
+    сбой посреди длинного прогона не терял уже скачанное.
+    Скачивание идет в DOWNLOAD_WORKERS потоков, запись в БД - в текущем потоке.
+    kind - метка действия в метриках (create, change) и в журнале.
+    С journal доставленные и записанные файлы отмечаются в журнале, а файлы,
+    доставленные до перезапуска, не скачиваются повторно.
+    verify_md5=True - файл записывается как SYNCED, только если его MD5 совпал с md5_checksum.
+    Возвращает записи, которые скачаны и записаны в БД.
+    """
+    db_client = get_db_client()
+    pending_records = []
+    recorded = []
+    total_written = 0
+    total_failures = []
+    downloaded_bytes = 0
+    start = time.perf_counter()
+
+    def flush():
+        nonlocal total_written
+        if not pending_records:
+            return
+        written, failures = db_client.upsert_documents(pending_records)
+        failed_ids = {gdrive_id for gdrive_id, _ in failures}
+        flushed = [record for record in pending_records if record['gdrive_id'] not in failed_ids]
+        recorded.extend(flushed)
+        if journal is not None:
+            journal.mark_done(kind, [record['gdrive_id'] for record in flushed])
+        total_written += written
+        total_failures.extend(failures)
+        pending_records.clear()
+
+    def fetch_one(file_data: Dict):
+        if _already_fetched(file_data, journal):
+            print(f"-> {action}: {file_data['path']} (доставлен до перезапуска)")
+            return file_data, True, True
+        print(f"-> {action}: {file_data['path']}")
+        with metrics.timer("sync_action_seconds", action=kind):
+            is_success, _ = fetch_file(file_data, provider)
+            if is_success and verify_md5:
+                is_success = _verify_md5(file_data)
+        return file_data, is_success, False
+
+    with ThreadPoolExecutor(max_workers=max(1, DOWNLOAD_WORKERS)) as executor:
+        for file_data, is_success, resumed in executor.map(fetch_one, files):
+            metrics.inc("sync_actions", action=kind, status="resumed" if resumed else "ok" if is_success else "failed")
+            if is_success:
+                if not resumed:
+                    downloaded_bytes += file_data.get('size_bytes') or 0
+                    if journal is not None:
+                        journal.mark_fetched(file_data['gdrive_id'], {'size_bytes': file_data.get('size_bytes')})
+                file_data['status'] = 'SYNCED'
+                pending_records.append(file_data)
+                if len(pending_records) >= db_client.chunk_size:
+                    flush()
+            else:
+                print(f"  ! Пропуск записи в БД для файла {file_data['path']} из-за ошибки скачивания.")
+    flush()
+
+    elapsed = time.perf_counter() - start
+    metrics.inc("sync_download_bytes", downloaded_bytes, action=kind)
+    if elapsed > 0:
+        metrics.set_gauge("sync_download_bytes_per_second", downloaded_bytes / elapsed, action=kind)
+    _report_db_failures(total_failures)
+    print(f"  ✅ Записано в gdrive_mirror: {total_written}, ошибок записи: {len(total_failures)}.")
+    return recorded
+
+
+@metrics.staged("execute_create")
+def execute_create(files_to_create: List[Dict], provider: Optional[SourceProvider] = None,
+                   journal: Optional[SyncJournal] = None):
+    """Клонирует новые файлы с GDrive и создает записи в БД. Возвращает записанные."""
     print(f"\n--- Обработка {len(files_to_create)} новых файлов ---")
     if not files_to_create:
-        return
+        return []
+    return _download_and_record(files_to_create, provider, "Создание файла", "create", journal)
 
-    successful_records = []
-    for file_data in files_to_create:
-        print(f"-> Создание файла: {file_data['path']}")
-        is_success, error = _clone_single_file_with_rclone(file_data['path'])
-        
-        if is_success:
-            file_data['status'] = 'SYNCED'
-            successful_records.append(file_data)
-        else:
-            print(f"  ! Пропуск записи в БД для файла {file_data['path']} из-за ошибки скачивания.")
-    
-    if successful_records:
-        print(f"\n-> Добавление {len(successful_records)} записей в gdrive_mirror...")
-        db_client.client.table('gdrive_mirror').insert(successful_records).execute()
-        print("  ✅ Записи успешно добавлены.")
-
-def execute_change(files_to_change: List[Dict]):
-    """Перезаписывает измененные файлы и обновляет их метаданные в БД."""
+@metrics.staged("execute_change")
+def execute_change(files_to_change: List[Dict], provider: Optional[SourceProvider] = None,
+                   journal: Optional[SyncJournal] = None):
+    """Перезаписывает измененные файлы и обновляет их метаданные в БД. Возвращает записанные."""
     print(f"\n--- Обработка {len(files_to_change)} измененных файлов ---")
     if not files_to_change:
-        return
+        return []
+    return _download_and_record(files_to_change, provider, "Обновление файла", "change", journal)
 
-    for file_data in files_to_change:
-        print(f"-> Обновление файла: {file_data['path']}")
-        is_success, error = _clone_single_file_with_rclone(file_data['path'])
-        
-        if is_success:
-            file_data['status'] = 'SYNCED'
-            print(f"  -> Обновление записи в gdrive_mirror для ID {file_data['gdrive_id']}...")
-            db_client.client.table('gdrive_mirror').update(file_data).eq('gdrive_id', file_data['gdrive_id']).execute()
-            print("  ✅ Запись успешно обновлена.")
-        else:
-             print(f"  ! Пропуск обновления БД для файла {file_data['path']} из-за ошибки скачивания.")
+
+@metrics.staged("execute_refetch")
+def execute_refetch(files_to_refetch: List[Dict], provider: Optional[SourceProvider] = None):
+    """
+    Самоисцеление этапа B: перекачивает отсутствующие и поврежденные файлы.
+    Локальная копия удаляется до скачивания: rclone с --immutable сравнивает
+    только размер и время изменения и не перезаписал бы поврежденный файл
+    того же размера. Запись в БД - только после сверки MD5. Возвращает записанные.
+    """
+    print(f"\n--- Перекачка {len(files_to_refetch)} файлов ---")
+    if not files_to_refetch:
+        return []
+    for file_data in files_to_refetch:
+        try:
+            os.remove(os.path.join(LOCAL_SYNC_PATH, file_data['path']))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"  ⚠️ Не удалось удалить локальную копию {file_data['path']}: {e}")
+    return _download_and_record(files_to_refetch, provider, "Перекачка файла", "refetch", verify_md5=True)
 
 
-def execute_move(files_to_move: List[Dict]):
-    """Перемещает/переименовывает файлы локально и обновляет путь в БД."""
+@metrics.staged("execute_move")
+def execute_move(files_to_move: List[Dict], journal: Optional[SyncJournal] = None):
+    """
+    Перемещает/переименовывает файлы локально и обновляет путь в БД. Возвращает перемещенные.
+    Файл, который уже лежит по новому пути (перемещение прервано до записи в БД), только записывается в БД.
+    """
     print(f"\n--- Обработка {len(files_to_move)} перемещенных файлов ---")
     if not files_to_move:
-        return
+        return []
+
+    # Старые пути получаем одним запросом на порцию вместо select на каждый файл
+    db_client = get_db_client()
+    old_paths = db_client.get_paths_by_ids([file_data['gdrive_id'] for file_data in files_to_move])
 
+    path_updates = []
     for file_data in files_to_move:
-        response = db_client.client.table('gdrive_mirror').select('path').eq('gdrive_id', file_data['gdrive_id']).single().execute()
-        if not response.data: continue
+        if file_data['gdrive_id'] not in old_paths: continue
         
-        old_local_path = os.path.join(LOCAL_SYNC_PATH, response.data['path'])
+        old_local_path = os.path.join(LOCAL_SYNC_PATH, old_paths[file_data['gdrive_id']])
         new_local_path = os.path.join(LOCAL_SYNC_PATH, file_data['path'])
         
         print(f"-> Перемещение: {old_local_path} -> {new_local_path}")
         try:
             if os.path.exists(old_local_path):
-                os.makedirs(os.path.dirname(new_local_path), exist_ok=True)
-                os.rename(old_local_path, new_local_path)
+                with metrics.timer("sync_action_seconds", action="move"):
+                    os.makedirs(os.path.dirname(new_local_path), exist_ok=True)
+                    os.rename(old_local_path, new_local_path)
+            elif os.path.exists(new_local_path):
+                print("  - Файл уже на новом месте, обновляем только путь в БД.")
             else:
-                print(f"  - Исходный файл {old_local_path} не найден, возможно, он не был скачан. Пропускаем перемещение.")
+                # Файл не был скачан: запись все равно переносится, этап B докачает его по новому пути
+                print(f"  - Исходный файл {old_local_path} не найден, обновляем только путь в БД.")
+                metrics.inc("sync_actions", action="move", status="skipped")
+                path_updates.append(file_data)
                 continue
-
-            print(f"  -> Обновление пути в gdrive_mirror для ID {file_data['gdrive_id']}...")
-            db_client.client.table('gdrive_mirror').update({'path': file_data['path']}).eq('gdrive_id', file_data['gdrive_id']).execute()
-            print("  ✅ Путь успешно обновлен.")
+            metrics.inc("sync_actions", action="move", status="ok")
+            path_updates.append(file_data)
         except Exception as e:
+            metrics.inc("sync_actions", action="move", status="failed")
             print(f"  ❌ Ошибка при перемещении файла {old_local_path}: {e}")
 
-def execute_delete(ids_to_delete: List[str]):
-    """Удаляет файлы локально и удаляет записи из БД."""
+    if not path_updates:
+        return []
+    print(f"\n-> Обновление {len(path_updates)} путей в gdrive_mirror...")
+    written, failures = db_client.upsert_documents(path_updates)
+    _report_db_failures(failures)
+    print(f"  ✅ Пути обновлены: {written}, ошибок записи: {len(failures)}.")
+    failed_ids = {gdrive_id for gdrive_id, _ in failures}
+    moved = [file_data for file_data in path_updates if file_data['gdrive_id'] not in failed_ids]
+    if journal is not None:
+        journal.mark_done("move", [file_data['gdrive_id'] for file_data in moved])
+    return moved
+
+@metrics.staged("execute_directory_move")
+def execute_directory_move(dir_moves: List[Dict], journal: Optional[SyncJournal] = None):
+    """
+    Переносит целые директории одним os.rename и одной пакетной записью путей в БД.
+    Если перенос директории невозможен (нет исходной, занята целевая),
+    ее файлы обрабатываются как обычные перемещения.
+    Возвращает записи перемещенных файлов.
+    """
+    print(f"\n--- Обработка {len(dir_moves)} перемещенных директорий ---")
+    moved = []
+    if not dir_moves:
+        return moved
+
+    db_client = get_db_client()
+    for dir_move in dir_moves:
+        old_local_dir = os.path.join(LOCAL_SYNC_PATH, dir_move['old_path'])
+        new_local_dir = os.path.join(LOCAL_SYNC_PATH, dir_move['new_path'])
+        print(f"-> Перемещение директории ({len(dir_move['files'])} файлов): {old_local_dir} -> {new_local_dir}")
+
+        if not os.path.isdir(old_local_dir) or os.path.exists(new_local_dir):
+            print("  - Перенос директории целиком невозможен, перемещаем файлы по одному.")
+            moved.extend(execute_move(dir_move['files'], journal))
+            if journal is not None:
+                journal.mark_done("directory_move", [dir_move['old_path']])
+            continue
+        try:
+            with metrics.timer("sync_action_seconds", action="directory_move"):
+                os.makedirs(os.path.dirname(new_local_dir), exist_ok=True)
+                os.rename(old_local_dir, new_local_dir)
+        except Exception as e:
+            metrics.inc("sync_actions", action="directory_move", status="failed")
+            print(f"  ❌ Ошибка при перемещении директории {old_local_dir}: {e}, перемещаем файлы по одному.")
+            moved.extend(execute_move(dir_move['files'], journal))
+            if journal is not None:
+                journal.mark_done("directory_move", [dir_move['old_path']])
+            continue
+        metrics.inc("sync_actions", action="directory_move", status="ok")
+
+        written, failures = db_client.upsert_documents(dir_move['files'])
+        _report_db_failures(failures)
+        print(f"  ✅ Пути обновлены: {written}, ошибок записи: {len(failures)}.")
+        failed_ids = {gdrive_id for gdrive_id, _ in failures}
+        moved.extend(file_data for file_data in dir_move['files'] if file_data['gdrive_id'] not in failed_ids)
+        if journal is not None:
+            journal.mark_done("move", [file_data['gdrive_id'] for file_data in dir_move['files'] if file_data['gdrive_id'] not in failed_ids])
+            if not failures:
+                journal.mark_done("directory_move", [dir_move['old_path']])
+    return moved
+
+@metrics.staged("execute_delete")
+def execute_delete(ids_to_delete: List[str], journal: Optional[SyncJournal] = None,
+                   provider: Optional[SourceProvider] = None):
+    """
+    Удаляет файлы локально и удаляет записи из БД. Возвращает id удаленных записей.
+    provider.forget() получает удаленные id (очистка кэшей источника).
+    """
     print(f"\n--- Обработка {len(ids_to_delete)} удаленных файлов ---")
     if not ids_to_delete:
-        return
+        return []
+
+    db_client = get_db_client()
+    paths_to_remove = db_client.get_paths_by_ids(ids_to_delete)
+    # Записей, которых уже нет в БД, удалять не нужно
+    already_deleted = [gdrive_id for gdrive_id in ids_to_delete if gdrive_id not in paths_to_remove]
+    if journal is not None:
+        journal.mark_done("delete", already_deleted)
 
-    response = db_client.client.table('gdrive_mirror').select('gdrive_id, path').in_('gdrive_id', ids_to_delete).execute()
-    files_to_remove_from_disk = response.data
-    
     successfully_deleted_ids = []
-    for file_info in files_to_remove_from_disk:
-        local_path = os.path.join(LOCAL_SYNC_PATH, file_info['path'])
+    for gdrive_id, path in paths_to_remove.items():
+        local_path = os.path.join(LOCAL_SYNC_PATH, path)
         print(f"-> Удаление файла: {local_path}")
         try:
-            os.remove(local_path)
-            successfully_deleted_ids.append(file_info['gdrive_id'])
+            with metrics.timer("sync_action_seconds", action="delete"):
+                os.remove(local_path)
+            metrics.inc("sync_actions", action="delete", status="ok")
+            successfully_deleted_ids.append(gdrive_id)
         except FileNotFoundError:
             print("  - Файл уже отсутствует, считаем удаленным.")
-            successfully_deleted_ids.append(file_info['gdrive_id'])
+            metrics.inc("sync_actions", action="delete", status="ok")
+            successfully_deleted_ids.append(gdrive_id)
         except Exception as e:
+            metrics.inc("sync_actions", action="delete", status="failed")
             print(f"  ❌ Ошибка при удалении файла {local_path}: {e}")
 
-    if successfully_deleted_ids:
-        print(f"\n-> Удаление {len(successfully_deleted_ids)} записей из gdrive_mirror...")
-        db_client.client.table('gdrive_mirror').delete().in_('gdrive_id', successfully_deleted_ids).execute()
-        print("  ✅ Записи успешно удалены.")
\ No newline at end of file
+    if provider is not None:
+        provider.forget(already_deleted)
+    if not successfully_deleted_ids:
+        return already_deleted
+    print(f"\n-> Удаление {len(successfully_deleted_ids)} записей из gdrive_mirror...")
+    deleted, failures = db_client.delete_documents(successfully_deleted_ids)
+    _report_db_failures(failures)
+    print(f"  ✅ Записи удалены: {deleted}, ошибок: {len(failures)}.")
+    failed_ids = {gdrive_id for gdrive_id, _ in failures}
+    deleted_ids = [gdrive_id for gdrive_id in successfully_deleted_ids if gdrive_id not in failed_ids]
+    if journal is not None:
+        journal.mark_done("delete", deleted_ids)
+    if provider is not None:
+        provider.forget(deleted_ids)
+    return already_deleted + deleted_ids
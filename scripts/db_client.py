@@ -2,40 +2,292 @@
 #
 # Описание:
 # Этот модуль предоставляет единую точку доступа к базе данных Supabase.
-# Он содержит класс SupabaseClient, который инкапсулирует подключение
-# и базовые операции чтения.
+# Он содержит класс SupabaseClient, который инкапсулирует подключение,
+# базовые операции чтения и пакетную запись (upsert/delete порциями
+# с повторными попытками и изоляцией ошибочных строк).
+# К клиенту можно подключить локальный снимок таблицы (MirrorSnapshot):
+# тогда запись идет сквозь снимок, а чтение - из снимка после сверки
+# с Supabase по водяному знаку updated_at. Колонку updated_at и триггер для
+# нее создает init/supabase_gdrive_mirror_updated_at.sql; без нее снимок
+# загружается целиком при каждом чтении.
 
 import os
-from typing import Dict, Any
+import time
+from typing import Dict, Any, List, Iterable, Iterator, Optional, Tuple
 from supabase import create_client, Client
+from postgrest.exceptions import APIError
 from dotenv import load_dotenv
 
+import metrics
+from mirror_snapshot import MirrorSnapshot
+
 class SupabaseClient:
     """Класс для инкапсуляции логики взаимодействия с Supabase."""
-    def __init__(self):
+    DEFAULT_CHUNK_SIZE = 500    # Строк в одном upsert/delete
+    IN_FILTER_CHUNK_SIZE = 200  # id в одном фильтре in_ (ограничение длины URL)
+    DEFAULT_READ_PAGE_SIZE = 1000  # Совпадает с max-rows PostgREST в Supabase по умолчанию
+    # Поля, нужные для всех типов сравнений
+    DOCUMENT_COLUMNS = "gdrive_id, path, md5_checksum, size_bytes, version"
+    MAX_RETRIES = 3
+    RETRY_BACKOFF_SECONDS = 0.5
+    # Коды "нет такой колонки": Postgres (undefined_column) и кэш схемы PostgREST
+    MISSING_COLUMN_CODES = {"42703", "PGRST204"}
+
+    def __init__(self, client=None, chunk_size: int = None, read_page_size: int = None):
+        """
+        Args:
+            client: Готовый клиент (например, FakeSupabaseClient для проверки без сети).
+            chunk_size: Размер порции для пакетной записи (по умолчанию DB_WRITE_CHUNK_SIZE или 500).
+            read_page_size: Размер страницы при чтении (по умолчанию DB_READ_PAGE_SIZE или 1000).
+        """
+        self.table_name = "gdrive_mirror"
+        self.chunk_size = chunk_size or int(os.getenv("DB_WRITE_CHUNK_SIZE", self.DEFAULT_CHUNK_SIZE))
+        self.read_page_size = read_page_size or int(os.getenv("DB_READ_PAGE_SIZE", self.DEFAULT_READ_PAGE_SIZE))
+        self.snapshot: Optional[MirrorSnapshot] = None
+        # Есть ли в таблице updated_at для инкрементальной сверки снимка (выясняется при первой сверке)
+        self.has_updated_at = True
+        if client is not None:
+            self.client = client
+            return
+
         load_dotenv()
         url: str = os.environ.get("SUPABASE_URL")
         key: str = os.environ.get("SUPABASE_KEY")
         if not url or not key:
             raise ValueError("SUPABASE_URL и SUPABASE_KEY должны быть установлены в .env файле.")
         self.client: Client = create_client(url, key)
-        self.table_name = "gdrive_mirror"
         print(f"✅ Supabase клиент успешно инициализирован для таблицы '{self.table_name}'.")
 
-    def get_all_documents(self) -> Dict[str, Dict[str, Any]]:
+    def attach_snapshot(self, snapshot: MirrorSnapshot):
+        """Подключает локальный снимок gdrive_mirror (см. mirror_snapshot.py)."""
+        self.snapshot = snapshot
+
+    def iter_document_pages(self, page_size: int = None, updated_after: Optional[str] = None,
+                            columns: str = None) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Постранично читает 'gdrive_mirror' с keyset-пагинацией по gdrive_id
+        (WHERE gdrive_id > последний ORDER BY gdrive_id LIMIT page_size).
+
+        В отличие от offset-пагинации, стоимость страницы не растет с номером,
+        а ограничение PostgREST на число строк (max-rows) не обрезает результат:
+        чтение продолжается до пустой страницы.
+
+        Args:
+            page_size: Размер страницы.
+            updated_after: Если задан - только строки с updated_at не раньше этого значения
+                (строки на самой границе читаются повторно, снимок их отбрасывает).
+            columns: Список полей (по умолчанию DOCUMENT_COLUMNS).
+
+        Yields:
+            Списки записей (страницы). Ошибки запроса пробрасываются наружу.
+        """
+        page_size = page_size or self.read_page_size
+        columns = columns or self.DOCUMENT_COLUMNS
+        last_id = None
+        while True:
+            def build_query():
+                query = self.client.table(self.table_name).select(columns)
+                if updated_after is not None:
+                    query = query.gte("updated_at", updated_after)
+                if last_id is not None:
+                    query = query.gt("gdrive_id", last_id)
+                return query.order("gdrive_id").limit(page_size)
+
+            page = self._execute_with_retry(build_query).data or []
+            if not page:
+                return
+            yield page
+            last_id = page[-1]['gdrive_id']
+
+    def get_all_documents(self) -> Optional[Dict[str, Dict[str, Any]]]:
         """
         Получает все записи из таблицы 'gdrive_mirror' для сверки.
-        Возвращает словарь, где ключ - 'gdrive_id'.
+        Возвращает словарь, где ключ - 'gdrive_id', или None при ошибке:
+        неполные данные нельзя выдавать за пустую таблицу, иначе планировщик
+        запланирует массовое повторное скачивание.
+        Если подключен снимок, данные читаются из него после сверки с Supabase.
         """
         try:
-            # Запрашиваем поля, нужные для всех типов сравнений
-            response = self.client.table(self.table_name).select(
-                "gdrive_id, path, md5_checksum, size_bytes"
-            ).execute()
-            
-            if response.data:
-                return {item['gdrive_id']: item for item in response.data}
-            return {}
+            if self.snapshot is not None:
+                self.refresh_snapshot()
+                return self.snapshot.get_all()
+
+            documents = {}
+            for page in self.iter_document_pages():
+                for item in page:
+                    documents[item['gdrive_id']] = item
+            return documents
         except Exception as e:
             print(f"❌ Ошибка при получении данных из Supabase: {e}")
-            return {}
\ No newline at end of file
+            return None
+
+    def count_documents(self) -> int:
+        """Число строк в gdrive_mirror (count=exact, без выгрузки строк)."""
+        response = self._execute_with_retry(
+            lambda: self.client.table(self.table_name).select("gdrive_id", count="exact").limit(1), "count"
+        )
+        return response.count
+
+    def _is_missing_column(self, error: Exception) -> bool:
+        return isinstance(error, APIError) and error.code in self.MISSING_COLUMN_CODES
+
+    def refresh_snapshot(self):
+        """
+        Сверяет снимок с Supabase. Если снимок еще не загружался или старше
+        DB_SNAPSHOT_MAX_AGE_HOURS - полная загрузка, иначе догружаются только
+        строки с updated_at не раньше водяного знака. Удаления чужими клиентами
+        водяной знак не видит, поэтому после сверки сравнивается число строк;
+        при расхождении снимок перезагружается целиком.
+        Если в таблице нет колонки updated_at, снимок каждый раз загружается
+        целиком обычной keyset-пагинацией.
+        """
+        if self.has_updated_at:
+            try:
+                self._refresh_snapshot_by_watermark()
+                return
+            except APIError as e:
+                if not self._is_missing_column(e):
+                    raise
+                self.has_updated_at = False
+                print("  ⚠️ В gdrive_mirror нет колонки updated_at (см. init/supabase_gdrive_mirror_updated_at.sql): "
+                      "снимок будет загружаться целиком.")
+        loaded = self.snapshot.replace_all(self.iter_document_pages())
+        metrics.inc("db_snapshot_refreshes", mode="full")
+        print(f"  - Снимок gdrive_mirror загружен полностью: {loaded} строк.")
+
+    def _refresh_snapshot_by_watermark(self):
+        columns = f"{self.DOCUMENT_COLUMNS}, updated_at"
+        watermark = self.snapshot.watermark
+        max_age_hours = float(os.getenv("DB_SNAPSHOT_MAX_AGE_HOURS", "24"))
+        if watermark is not None and self.snapshot.age_seconds() < max_age_hours * 3600:
+            try:
+                changed = self.snapshot.apply_remote_changes(
+                    self.iter_document_pages(updated_after=watermark or None, columns=columns)
+                )
+                remote_count = self.count_documents()
+                if remote_count == self.snapshot.count():
+                    metrics.inc("db_snapshot_refreshes", mode="incremental")
+                    print(f"  - Снимок gdrive_mirror сверен: обновлено {changed} строк.")
+                    return
+                print(f"  - Снимок расходится с Supabase ({self.snapshot.count()} vs {remote_count}), полная загрузка...")
+            except Exception as e:
+                if self._is_missing_column(e):
+                    raise
+                print(f"  ⚠️ Инкрементальная сверка снимка не удалась ({e}), полная загрузка...")
+
+        loaded = self.snapshot.replace_all(self.iter_document_pages(columns=columns))
+        metrics.inc("db_snapshot_refreshes", mode="full")
+        print(f"  - Снимок gdrive_mirror загружен полностью: {loaded} строк.")
+
+    # --- Пакетные операции ---
+
+    @staticmethod
+    def _chunks(items: List, size: int) -> Iterable[List]:
+        for start in range(0, len(items), size):
+            yield items[start:start + size]
+
+    @staticmethod
+    def _is_transient(error: Exception) -> bool:
+        """Ошибки PostgREST с кодом Postgres (нарушение ограничений и т.п.) повторять бессмысленно."""
+        return not (isinstance(error, APIError) and error.code and not error.code.startswith("5"))
+
+    def _execute_with_retry(self, build_query, operation: str = "select"):
+        """Выполняет запрос с повторами при временных ошибках (сеть, 5xx)."""
+        for attempt in range(self.MAX_RETRIES):
+            metrics.inc("db_requests", operation=operation)
+            try:
+                with metrics.timer("db_request_seconds", operation=operation):
+                    return build_query().execute()
+            except Exception as e:
+                metrics.inc("db_errors", operation=operation)
+                if not self._is_transient(e) or attempt == self.MAX_RETRIES - 1:
+                    raise
+                metrics.inc("db_retries", operation=operation)
+                time.sleep(self.RETRY_BACKOFF_SECONDS * (2 ** attempt))
+
+    def get_paths_by_ids(self, ids: List[str]) -> Dict[str, str]:
+        """
+        Возвращает {gdrive_id: path} для списка id одним запросом in_ на порцию
+        (или из снимка, если он подключен).
+        """
+        if self.snapshot is not None:
+            return self.snapshot.get_paths_by_ids(ids)
+        paths = {}
+        for chunk in self._chunks(list(ids), self.IN_FILTER_CHUNK_SIZE):
+            response = self._execute_with_retry(
+                lambda: self.client.table(self.table_name).select("gdrive_id, path").in_("gdrive_id", chunk)
+            )
+            for item in response.data or []:
+                paths[item['gdrive_id']] = item['path']
+        return paths
+
+    def upsert_documents(self, records: List[Dict[str, Any]]) -> Tuple[int, List[Tuple[str, str]]]:
+        """
+        Записывает записи порциями через upsert по gdrive_id.
+
+        Порция, которая не прошла после повторов, разбирается построчно, чтобы
+        одна "плохая" строка не отменяла запись остальных. При построчной
+        записи существующие строки обновляются через update (это работает и
+        для неполного набора колонок, например только gdrive_id и path),
+        новые - вставляются через upsert.
+
+        Returns:
+            (число записанных строк, список (gdrive_id, текст ошибки) для незаписанных).
+        """
+        written = 0
+        failures = []
+        # PostgREST требует одинаковый набор колонок во всех строках запроса
+        groups: Dict[frozenset, List[Dict[str, Any]]] = {}
+        for record in records:
+            groups.setdefault(frozenset(record), []).append(record)
+
+        for group in groups.values():
+            for chunk in self._chunks(group, self.chunk_size):
+                try:
+                    self._execute_with_retry(
+                        lambda: self.client.table(self.table_name).upsert(chunk, on_conflict="gdrive_id"), "upsert"
+                    )
+                    written += len(chunk)
+                    continue
+                except Exception as e:
+                    print(f"  ⚠️ Порция из {len(chunk)} строк не записана ({e}), пробуем построчно...")
+
+                for record in chunk:
+                    try:
+                        # Сначала update: для существующих строк он не требует полного набора колонок
+                        response = self._execute_with_retry(
+                            lambda: self.client.table(self.table_name).update(record).eq("gdrive_id", record['gdrive_id']),
+                            "update"
+                        )
+                        if not response.data:
+                            self._execute_with_retry(
+                                lambda: self.client.table(self.table_name).upsert(record, on_conflict="gdrive_id"), "upsert"
+                            )
+                        written += 1
+                    except Exception as row_error:
+                        failures.append((record.get('gdrive_id'), str(row_error)))
+
+        metrics.inc("db_rows_written", written)
+        metrics.inc("db_row_failures", len(failures), operation="upsert")
+        if self.snapshot is not None:
+            failed_ids = {gdrive_id for gdrive_id, _ in failures}
+            self.snapshot.upsert([record for record in records if record.get('gdrive_id') not in failed_ids])
+        return written, failures
+
+    def delete_documents(self, ids: List[str]) -> Tuple[int, List[Tuple[str, str]]]:
+        """Удаляет записи порциями по gdrive_id. Возвращает (число удаленных, ошибки)."""
+        deleted = 0
+        failures = []
+        for chunk in self._chunks(list(ids), self.IN_FILTER_CHUNK_SIZE):
+            try:
+                self._execute_with_retry(
+                    lambda: self.client.table(self.table_name).delete().in_("gdrive_id", chunk), "delete"
+                )
+                deleted += len(chunk)
+                if self.snapshot is not None:
+                    self.snapshot.delete(chunk)
+            except Exception as e:
+                failures.extend((id, str(e)) for id in chunk)
+        metrics.inc("db_rows_deleted", deleted)
+        metrics.inc("db_row_failures", len(failures), operation="delete")
+        return deleted, failures
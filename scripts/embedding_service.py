@@ -0,0 +1,350 @@
+# Файл: scripts/embedding_service.py
+#
+# Описание:
+# Слой эмбеддингов для чанков (ai_models.embedding в settings.yml).
+#
+# - Чанки собираются в пакеты по числу токенов (и не больше batch_size
+#   штук), несколько пакетов отправляются параллельно в пределах лимитов
+#   запросов и токенов в минуту.
+# - Векторы кэшируются на диске (SQLite) по ключу (модель, хэш содержимого
+#   чанка) компактно - float32 или float16. Повторная синхронизация
+#   документа, где изменилась одна страница, платит только за ее чанки.
+# - StubEmbeddingProvider - детерминированный локальный провайдер для
+#   проверки без сети и ключей.
+# - В конце печатаются доля попаданий в кэш и сэкономленная стоимость.
+
+import os
+import sys
+import time
+import array
+import struct
+import sqlite3
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Iterable, Iterator, Tuple
+
+from chunk_text import chunk_hash
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "embedding_cache.sqlite")
+
+
+# --- Подсчет токенов ---
+
+class TokenCounter:
+    """Число токенов текста: tiktoken, если установлен, иначе оценка по длине."""
+    CHARS_PER_TOKEN = 3  # Осторожная оценка для смеси русского и английского
+
+    def __init__(self, model: str):
+        self._encoding = None
+        if tiktoken is not None:
+            try:
+                self._encoding = tiktoken.encoding_for_model(model)
+            except KeyError:
+                self._encoding = tiktoken.get_encoding("cl100k_base")
+
+    def count(self, text: str) -> int:
+        if self._encoding is not None:
+            return len(self._encoding.encode(text, disallowed_special=()))
+        return len(text) // self.CHARS_PER_TOKEN + 1
+
+
+# --- Провайдеры ---
+
+class EmbeddingProvider:
+    """Базовый провайдер: embed() возвращает векторы в порядке текстов."""
+    model = "base"
+    dimension = 0
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        raise NotImplementedError
+
+
+class OpenAIEmbeddingProvider(EmbeddingProvider):
+    """Эмбеддинги OpenAI (ключ - OPENAI_API_KEY)."""
+    def __init__(self, model: str, dimension: int):
+        from openai import OpenAI
+        self.model = model
+        self.dimension = dimension
+        self.client = OpenAI()
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        response = self.client.embeddings.create(model=self.model, input=texts)
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+
+class StubEmbeddingProvider(EmbeddingProvider):
+    """
+    Детерминированный локальный провайдер: вектор получается из SHA-256
+    текста, нормирован по длине. Одинаковый текст - одинаковый вектор.
+    """
+    def __init__(self, dimension: int, model: str = "stub", latency_seconds: float = 0.0):
+        self.model = model
+        self.dimension = dimension
+        self.latency_seconds = latency_seconds
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _vector(self, text: str) -> List[float]:
+        values = []
+        counter = 0
+        seed = text.encode("utf-8")
+        while len(values) < self.dimension:
+            digest = hashlib.sha256(seed + counter.to_bytes(4, "little")).digest()
+            values.extend(byte / 127.5 - 1.0 for byte in digest)
+            counter += 1
+        values = values[:self.dimension]
+        norm = sum(value * value for value in values) ** 0.5 or 1.0
+        return [value / norm for value in values]
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        with self._lock:
+            self.calls += 1
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+        return [self._vector(text) for text in texts]
+
+
+def get_embedding_provider(settings: Dict[str, Any]) -> EmbeddingProvider:
+    """Создает провайдер по ai_models.embedding; размерность - vector_db.vector_size."""
+    embedding = (settings.get("ai_models") or {}).get("embedding") or {}
+    dimension = (settings.get("vector_db") or {}).get("vector_size", 1536)
+    provider = embedding.get("provider", "openai")
+    if provider == "openai":
+        return OpenAIEmbeddingProvider(embedding.get("model", "text-embedding-ada-002"), dimension)
+    if provider == "stub":
+        return StubEmbeddingProvider(dimension)
+    raise ValueError(f"Неизвестный провайдер эмбеддингов: {provider}")
+
+
+# --- Кэш ---
+
+class EmbeddingCache:
+    """Векторы в SQLite по (модель, хэш чанка); хранятся как float32 или float16."""
+    DTYPES = ("float32", "float16")
+
+    def __init__(self, db_path: str, dtype: str = "float32"):
+        if dtype not in self.DTYPES:
+            raise ValueError(f"dtype должен быть одним из {self.DTYPES}")
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.dtype = dtype
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT, content_hash TEXT, dtype TEXT, vector BLOB,
+                PRIMARY KEY (model, content_hash)
+            )
+        """)
+        self._conn.commit()
+
+    @staticmethod
+    def _encode(vector: List[float], dtype: str) -> bytes:
+        if dtype == "float16":
+            return struct.pack(f"<{len(vector)}e", *vector)
+        values = array.array("f", vector)
+        if sys.byteorder != "little":
+            values.byteswap()
+        return values.tobytes()
+
+    @staticmethod
+    def _decode(blob: bytes, dtype: str) -> List[float]:
+        if dtype == "float16":
+            return list(struct.unpack(f"<{len(blob) // 2}e", blob))
+        values = array.array("f")
+        values.frombytes(blob)
+        if sys.byteorder != "little":
+            values.byteswap()
+        return values.tolist()
+
+    def get_many(self, model: str, hashes: List[str]) -> Dict[str, List[float]]:
+        found = {}
+        with self._lock:
+            for start in range(0, len(hashes), 500):
+                part = hashes[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT content_hash, dtype, vector FROM embeddings WHERE model = ? "
+                    f"AND content_hash IN ({', '.join('?' for _ in part)})",
+                    [model, *part]
+                ).fetchall()
+                for content_hash, dtype, blob in rows:
+                    found[content_hash] = self._decode(blob, dtype)
+        return found
+
+    def put_many(self, model: str, vectors: Dict[str, List[float]]):
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, content_hash, dtype, vector) VALUES (?, ?, ?, ?)",
+                [(model, content_hash, self.dtype, self._encode(vector, self.dtype)) for content_hash, vector in vectors.items()]
+            )
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# --- Ограничение частоты ---
+
+class _RateLimiter:
+    """Лимиты запросов и токенов в минуту, общие для всех потоков (0 - без ограничения)."""
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float):
+        self.request_interval = 60.0 / requests_per_minute if requests_per_minute else 0.0
+        self.token_interval = 60.0 / tokens_per_minute if tokens_per_minute else 0.0
+        self._next_time = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: int):
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_time)
+            self._next_time = start + max(self.request_interval, tokens * self.token_interval)
+        if start > now:
+            time.sleep(start - now)
+
+
+# --- Сервис ---
+
+class EmbeddingService:
+    """Пакетные эмбеддинги чанков с дисковым кэшем."""
+
+    def __init__(self, provider: EmbeddingProvider, cache: Optional[EmbeddingCache] = None,
+                 batch_tokens: int = 50000, batch_size: int = 256, max_concurrency: int = 4,
+                 requests_per_minute: float = 0, tokens_per_minute: float = 0,
+                 price_per_1k_tokens: float = 0.0, max_retries: int = 3):
+        """
+        Args:
+            provider: Провайдер эмбеддингов.
+            cache: Дисковый кэш векторов (None - без кэша).
+            batch_tokens: Максимум токенов в одном запросе.
+            batch_size: Максимум текстов в одном запросе.
+            max_concurrency: Число одновременных запросов.
+            requests_per_minute / tokens_per_minute: Лимиты провайдера (0 - без ограничения).
+            price_per_1k_tokens: Цена 1000 токенов - для отчета о сэкономленной стоимости.
+        """
+        self.provider = provider
+        self.cache = cache
+        self.batch_tokens = batch_tokens
+        self.batch_size = batch_size
+        self.max_concurrency = max(1, max_concurrency)
+        self.price_per_1k_tokens = price_per_1k_tokens
+        self.max_retries = max_retries
+        self.token_counter = TokenCounter(provider.model)
+        self._limiter = _RateLimiter(requests_per_minute, tokens_per_minute)
+        self.stats = {"chunks": 0, "cache_hits": 0, "embedded": 0, "requests": 0,
+                      "tokens_embedded": 0, "tokens_saved": 0}
+
+    def _make_batches(self, items: List[Tuple[str, str, int]]) -> List[List[Tuple[str, str, int]]]:
+        """Раскладывает (хэш, текст, токены) по пакетам с ограничением токенов и числа текстов."""
+        batches = []
+        batch = []
+        batch_tokens = 0
+        for item in items:
+            if batch and (batch_tokens + item[2] > self.batch_tokens or len(batch) >= self.batch_size):
+                batches.append(batch)
+                batch = []
+                batch_tokens = 0
+            batch.append(item)
+            batch_tokens += item[2]
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def _embed_batch(self, batch: List[Tuple[str, str, int]]) -> Dict[str, List[float]]:
+        tokens = sum(item[2] for item in batch)
+        for attempt in range(self.max_retries):
+            self._limiter.acquire(tokens)
+            try:
+                vectors = self.provider.embed([item[1] for item in batch])
+                return {item[0]: vector for item, vector in zip(batch, vectors)}
+            except Exception as e:
+                if attempt == self.max_retries - 1:
+                    raise
+                print(f"  ⚠️ Ошибка запроса эмбеддингов ({e}), повтор...")
+                time.sleep(2 ** attempt)
+
+    def _embed_window(self, window: List[Dict[str, Any]], executor: ThreadPoolExecutor) -> List[List[float]]:
+        hashes = [chunk.get("content_hash") or chunk_hash(chunk["text"]) for chunk in window]
+        vectors = self.cache.get_many(self.provider.model, list(set(hashes))) if self.cache else {}
+
+        missing: Dict[str, Tuple[str, str, int]] = {}
+        for chunk, content_hash in zip(window, hashes):
+            tokens = self.token_counter.count(chunk["text"])
+            if content_hash in vectors:
+                self.stats["cache_hits"] += 1
+                self.stats["tokens_saved"] += tokens
+            elif content_hash not in missing:
+                missing[content_hash] = (content_hash, chunk["text"], tokens)
+            else:
+                # Одинаковый текст в одном окне эмбеддится один раз
+                self.stats["cache_hits"] += 1
+                self.stats["tokens_saved"] += tokens
+
+        batches = self._make_batches(list(missing.values()))
+        new_vectors: Dict[str, List[float]] = {}
+        for result in executor.map(self._embed_batch, batches):
+            new_vectors.update(result)
+        if new_vectors:
+            if self.cache:
+                self.cache.put_many(self.provider.model, new_vectors)
+            vectors.update(new_vectors)
+        self.stats["requests"] += len(batches)
+        self.stats["embedded"] += len(missing)
+        self.stats["tokens_embedded"] += sum(item[2] for item in missing.values())
+        self.stats["chunks"] += len(window)
+        return [vectors[content_hash] for content_hash in hashes]
+
+    def embed_chunks(self, chunks: Iterable[Dict[str, Any]]) -> Iterator[Tuple[Dict[str, Any], List[float]]]:
+        """
+        Возвращает (чанк, вектор) в исходном порядке. Чанки читаются окнами
+        (batch_size * max_concurrency), поэтому вход может быть генератором.
+        """
+        window_size = self.batch_size * self.max_concurrency
+        window = []
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            for chunk in chunks:
+                window.append(chunk)
+                if len(window) >= window_size:
+                    yield from zip(window, self._embed_window(window, executor))
+                    window = []
+            if window:
+                yield from zip(window, self._embed_window(window, executor))
+
+    def report(self) -> Dict[str, Any]:
+        """Счетчики stats, доля попаданий в кэш (0..1) и стоимость: потраченная и сэкономленная кэшем."""
+        stats = dict(self.stats)
+        stats["hit_rate"] = stats["cache_hits"] / stats["chunks"] if stats["chunks"] else 0.0
+        stats["cost_spent"] = stats["tokens_embedded"] / 1000 * self.price_per_1k_tokens
+        stats["cost_saved"] = stats["tokens_saved"] / 1000 * self.price_per_1k_tokens
+        return stats
+
+    def print_report(self):
+        stats = self.report()
+        print(f"  ✅ Эмбеддинги: чанков {stats['chunks']}, из кэша {stats['cache_hits']} ({stats['hit_rate'] * 100:.1f}%), "
+              f"получено {stats['embedded']} за {stats['requests']} запросов; токенов {stats['tokens_embedded']:,} "
+              f"(${stats['cost_spent']:.4f}), сэкономлено {stats['tokens_saved']:,} (${stats['cost_saved']:.4f}).")
+
+
+def create_embedding_service(settings: Dict[str, Any], provider: Optional[EmbeddingProvider] = None) -> EmbeddingService:
+    """Сервис с параметрами из ai_models.embedding и кэшем EMBEDDING_CACHE_PATH."""
+    embedding = (settings.get("ai_models") or {}).get("embedding") or {}
+    cache = None
+    if embedding.get("cache", True):
+        cache = EmbeddingCache(os.getenv("EMBEDDING_CACHE_PATH", DEFAULT_CACHE_PATH), embedding.get("cache_dtype", "float32"))
+    return EmbeddingService(
+        provider or get_embedding_provider(settings),
+        cache,
+        batch_tokens=embedding.get("batch_tokens", 50000),
+        batch_size=embedding.get("batch_size", 256),
+        max_concurrency=embedding.get("max_concurrency", 4),
+        requests_per_minute=embedding.get("requests_per_minute", 0),
+        tokens_per_minute=embedding.get("tokens_per_minute", 0),
+        price_per_1k_tokens=embedding.get("price_per_1k_tokens", 0.0)
+    )
@@ -0,0 +1,117 @@
+# Файл: scripts/export_cache.py
+#
+# Описание:
+# Кэш экспортированных Google-документов. Ключ - (gdrive_id, version):
+# каждая ревизия документа экспортируется из Google Drive ровно один раз,
+# а повторные доставки (перезакачка на этапе B, повтор после ошибки записи
+# в БД) берут файл из кэша. При сохранении новой ревизии старые удаляются.
+#
+# Копии удаленных документов убираются через remove() (GDriveProvider.forget),
+# а prune() ограничивает кэш по возрасту и общему размеру: первыми удаляются
+# давно не использованные ревизии (restore обновляет mtime копии).
+
+import os
+import time
+import shutil
+from typing import Iterable, Optional, Tuple
+
+
+class ExportCache:
+    """Файлы экспорта в <cache_dir>/<gdrive_id>/<version>.<расширение>."""
+
+    def __init__(self, cache_dir: str, max_size_mb: float = 0, max_age_days: float = 0):
+        """
+        Args:
+            cache_dir: Каталог кэша.
+            max_size_mb: Предельный общий размер копий в МБ (0 - без ограничения).
+            max_age_days: Удалять копии, не использованные столько дней (0 - без ограничения).
+        """
+        self.cache_dir = cache_dir
+        self.max_size_mb = max_size_mb
+        self.max_age_days = max_age_days
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, gdrive_id: str, version: str, extension: str) -> str:
+        return os.path.join(self.cache_dir, gdrive_id, f"{version}.{extension}")
+
+    def restore(self, gdrive_id: str, version: Optional[str], extension: str, destination_path: str) -> bool:
+        """Копирует ревизию из кэша в destination_path (атомарно). False - ревизии нет в кэше."""
+        if not version:
+            return False
+        cached_path = self._path(gdrive_id, version, extension)
+        if not os.path.isfile(cached_path):
+            return False
+        tmp_path = f"{destination_path}.partial"
+        os.makedirs(os.path.dirname(destination_path), exist_ok=True)
+        shutil.copy2(cached_path, tmp_path)
+        os.replace(tmp_path, destination_path)
+        os.utime(cached_path)  # Время последнего использования - для prune
+        return True
+
+    def store(self, gdrive_id: str, version: Optional[str], extension: str, source_path: str):
+        """Сохраняет экспортированный файл как ревизию version, удаляя прежние ревизии."""
+        if not version:
+            return
+        cached_path = self._path(gdrive_id, version, extension)
+        document_dir = os.path.dirname(cached_path)
+        os.makedirs(document_dir, exist_ok=True)
+        tmp_path = f"{cached_path}.partial"
+        shutil.copy2(source_path, tmp_path)
+        os.replace(tmp_path, cached_path)
+        os.utime(cached_path)  # copy2 переносит mtime экспорта, а нужен момент сохранения
+        for name in os.listdir(document_dir):
+            if name != os.path.basename(cached_path):
+                os.remove(os.path.join(document_dir, name))
+
+    def remove(self, gdrive_ids: Iterable[str]) -> int:
+        """Удаляет все ревизии документов (например, удаленных из Drive). Возвращает их число."""
+        removed = 0
+        for gdrive_id in gdrive_ids:
+            document_dir = os.path.join(self.cache_dir, gdrive_id)
+            if os.path.isdir(document_dir):
+                shutil.rmtree(document_dir, ignore_errors=True)
+                removed += 1
+        return removed
+
+    def prune(self) -> Tuple[int, int]:
+        """
+        Удаляет копии старше max_age_days, затем самые давно использованные,
+        пока общий размер больше max_size_mb. Возвращает (удалено файлов, освобождено байт).
+        """
+        if not self.max_size_mb and not self.max_age_days:
+            return 0, 0
+        entries = []
+        with os.scandir(self.cache_dir) as document_dirs:
+            for document_dir in document_dirs:
+                if not document_dir.is_dir(follow_symlinks=False):
+                    continue
+                with os.scandir(document_dir.path) as files:
+                    for entry in files:
+                        if entry.is_file(follow_symlinks=False):
+                            stat = entry.stat(follow_symlinks=False)
+                            entries.append((stat.st_mtime, stat.st_size, entry.path))
+        entries.sort()
+
+        total_size = sum(size for _, size, _ in entries)
+        max_size = self.max_size_mb * 1024 * 1024
+        oldest_allowed = time.time() - self.max_age_days * 86400
+        removed, freed = 0, 0
+        for mtime, size, path in entries:
+            expired = self.max_age_days and mtime < oldest_allowed
+            if not expired and not (max_size and total_size > max_size):
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_size -= size
+            removed += 1
+            freed += size
+            try:
+                os.rmdir(os.path.dirname(path))
+            except OSError:
+                pass  # В директории документа есть другие файлы
+        if removed:
+            print(f"  - Кэш экспорта: удалено {removed} копий ({freed / 1024 / 1024:.1f} МБ), "
+                  f"осталось {total_size / 1024 / 1024:.1f} МБ.")
+        return removed, freed
@@ -0,0 +1,351 @@
+# Файл: scripts/extract_documents.py
+#
+# Описание:
+# Этап извлечения текста: превращает синхронизированные в LOCAL_SYNC_PATH
+# документы (форматы из file_system.supported_formats) в текст со структурой
+# (страницы PDF, листы XLSX, слайды PPTX, тело DOCX).
+#
+# - Документы разбираются в пуле процессов. У каждого файла есть таймаут:
+#   зависший парсер останавливается вместе со своим процессом, а процесс
+#   заменяется новым. Память процесса ограничена через RLIMIT_AS, поэтому
+#   "тяжелый" файл падает с MemoryError, не затрагивая остальные.
+# - Результат не копится в памяти: процесс пишет разделы документа
+#   построчно в JSONL (<output_dir>/<gdrive_id>.jsonl, первая строка -
+#   заголовок с version), а следующие этапы читают их генератором iter_sections().
+# - Время извлечения считается по каждому файлу и по каждому формату,
+#   в конце печатаются самые медленные файлы.
+#
+# Запуск: python extract_documents.py --workers 4 --timeout 120 --memory-mb 1024
+
+import os
+import json
+import time
+import queue
+import argparse
+import multiprocessing
+from typing import Dict, Any, List, Optional, Iterable, Iterator
+
+from get_settings import get_setting
+
+DEFAULT_OUTPUT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "processed")
+
+
+# --- Парсеры (выполняются в рабочих процессах) ---
+# Библиотеки импортируются внутри функций: без установленного парсера
+# ошибкой завершаются только файлы этого формата.
+
+def _iter_pdf(full_path: str) -> Iterator[Dict[str, Any]]:
+    import fitz  # PyMuPDF
+    with fitz.open(full_path) as document:
+        for number, page in enumerate(document, start=1):
+            yield {"unit": "page", "number": number, "text": page.get_text()}
+
+
+def _iter_docx(full_path: str) -> Iterator[Dict[str, Any]]:
+    import docx
+    document = docx.Document(full_path)
+    # В DOCX нет страниц: тело документа - один раздел, таблицы - отдельные разделы
+    yield {"unit": "body", "number": 1, "text": "\n".join(paragraph.text for paragraph in document.paragraphs)}
+    for number, table in enumerate(document.tables, start=1):
+        rows = ("\t".join(cell.text for cell in row.cells) for row in table.rows)
+        yield {"unit": "table", "number": number, "text": "\n".join(rows)}
+
+
+def _iter_xlsx(full_path: str) -> Iterator[Dict[str, Any]]:
+    import openpyxl
+    workbook = openpyxl.load_workbook(full_path, read_only=True, data_only=True)
+    try:
+        for number, sheet in enumerate(workbook.worksheets, start=1):
+            lines = []
+            for row in sheet.iter_rows(values_only=True):
+                values = ["" if value is None else str(value) for value in row]
+                if any(values):
+                    lines.append("\t".join(values))
+            yield {"unit": "sheet", "number": number, "title": sheet.title, "text": "\n".join(lines)}
+    finally:
+        workbook.close()
+
+
+def _iter_pptx(full_path: str) -> Iterator[Dict[str, Any]]:
+    import pptx
+    presentation = pptx.Presentation(full_path)
+    for number, slide in enumerate(presentation.slides, start=1):
+        texts = [shape.text_frame.text for shape in slide.shapes if shape.has_text_frame]
+        if slide.has_notes_slide:
+            texts.append(slide.notes_slide.notes_text_frame.text)
+        yield {"unit": "slide", "number": number, "text": "\n".join(text for text in texts if text)}
+
+
+PARSERS = {
+    "pdf": _iter_pdf,
+    "docx": _iter_docx,
+    "xlsx": _iter_xlsx,
+    "pptx": _iter_pptx,
+}
+
+
+def output_path_for(output_dir: str, gdrive_id: str) -> str:
+    """Путь JSONL для документа (':' в id локальных провайдеров заменяется)."""
+    return os.path.join(output_dir, f"{gdrive_id.replace(':', '_')}.jsonl")
+
+
+def _extract_to_file(task: Dict[str, Any]) -> Dict[str, Any]:
+    """Извлекает текст одного файла в JSONL. Выполняется в рабочем процессе."""
+    start = time.perf_counter()
+    result = {"gdrive_id": task["gdrive_id"], "path": task["path"], "format": task["format"],
+              "output_path": task["output_path"], "sections": 0, "chars": 0}
+    tmp_path = f"{task['output_path']}.partial"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            header = {"gdrive_id": task["gdrive_id"], "path": task["path"], "version": task.get("version"), "format": task["format"]}
+            f.write(json.dumps(header, ensure_ascii=False) + "\n")
+            for section in PARSERS[task["format"]](task["full_path"]):
+                f.write(json.dumps(section, ensure_ascii=False) + "\n")
+                result["sections"] += 1
+                result["chars"] += len(section["text"])
+        os.replace(tmp_path, task["output_path"])
+        result["status"] = "ok"
+    except MemoryError:
+        result.update(status="error", error="Превышен лимит памяти")
+    except Exception as e:
+        result.update(status="error", error=f"{type(e).__name__}: {e}")
+    if result["status"] != "ok" and os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+
+def _worker_main(task_queue, result_queue, memory_limit_mb: int):
+    """Цикл рабочего процесса: одна задача за раз из собственной очереди."""
+    if memory_limit_mb:
+        import resource
+        limit = memory_limit_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    while True:
+        task = task_queue.get()
+        if task is None:
+            return
+        result_queue.put(_extract_to_file(task))
+
+
+# --- Пул процессов с таймаутами ---
+
+class _Worker:
+    def __init__(self, context, result_queue, memory_limit_mb: int):
+        self.task_queue = context.Queue()
+        self.process = context.Process(target=_worker_main, args=(self.task_queue, result_queue, memory_limit_mb), daemon=True)
+        self.process.start()
+        self.task: Optional[Dict[str, Any]] = None
+        self.started_at = 0.0
+
+    def assign(self, task: Dict[str, Any]):
+        self.task = task
+        self.started_at = time.perf_counter()
+        self.task_queue.put(task)
+
+    def stop(self):
+        if self.process.is_alive():
+            self.task_queue.put(None)
+            self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+
+
+class ExtractionStats:
+    """Время извлечения по файлам и форматам."""
+    def __init__(self):
+        self.by_format: Dict[str, Dict[str, float]] = {}
+        self.files: List[Dict[str, Any]] = []
+
+    def add(self, result: Dict[str, Any]):
+        stats = self.by_format.setdefault(result["format"], {"files": 0, "errors": 0, "seconds": 0.0, "max_seconds": 0.0, "chars": 0})
+        stats["files"] += 1
+        stats["errors"] += result["status"] != "ok"
+        stats["seconds"] += result["seconds"]
+        stats["max_seconds"] = max(stats["max_seconds"], result["seconds"])
+        stats["chars"] += result["chars"]
+        self.files.append({key: result.get(key) for key in ("path", "format", "status", "seconds", "chars")})
+
+    def print_report(self, slowest: int = 10):
+        print("\n--- Время извлечения по форматам ---")
+        for file_format, stats in sorted(self.by_format.items(), key=lambda item: -item[1]["seconds"]):
+            average = stats["seconds"] / stats["files"] if stats["files"] else 0
+            print(f"  {file_format:<6} файлов {stats['files']:>6}, ошибок {stats['errors']:>4}, всего {stats['seconds']:8.1f} с, "
+                  f"в среднем {average:6.2f} с, максимум {stats['max_seconds']:6.2f} с, символов {stats['chars']:,}")
+        if self.files:
+            print("--- Самые медленные файлы ---")
+            for item in sorted(self.files, key=lambda item: -item["seconds"])[:slowest]:
+                print(f"  {item['seconds']:8.2f} с  [{item['status']}] {item['path']}")
+
+
+def iter_extraction_tasks(files: Iterable[Dict[str, Any]], local_root: str, output_dir: str,
+                          supported_formats: Optional[List[str]] = None, max_file_size_mb: float = 0,
+                          force: bool = False) -> Iterator[Dict[str, Any]]:
+    """
+    Отбирает файлы для извлечения из записей gdrive_mirror (синхронизированный
+    набор или списки to_create/to_update плана): поддерживаемый формат, размер
+    в пределах max_file_size_mb и (без force) еще не извлеченная версия.
+    """
+    supported = {file_format.lower() for file_format in (supported_formats or PARSERS)} & set(PARSERS)
+    for file_data in files:
+        file_format = os.path.splitext(file_data['path'])[1].lstrip('.').lower()
+        if file_format not in supported:
+            continue
+        if max_file_size_mb and (file_data.get('size_bytes') or 0) > max_file_size_mb * 1024 * 1024:
+            print(f"  - Пропуск {file_data['path']}: больше {max_file_size_mb} МБ.")
+            continue
+        output_path = output_path_for(output_dir, file_data['gdrive_id'])
+        if not force and read_header(output_path).get("version") == file_data.get('version') and file_data.get('version'):
+            continue  # Эта версия уже извлечена
+        yield {
+            "gdrive_id": file_data['gdrive_id'],
+            "path": file_data['path'],
+            "version": file_data.get('version'),
+            "format": file_format,
+            "full_path": os.path.join(local_root, file_data['path']),
+            "output_path": output_path,
+        }
+
+
+def extract_documents(tasks: Iterable[Dict[str, Any]], max_workers: int = 4, timeout_seconds: float = 120,
+                      memory_limit_mb: int = 1024, stats: Optional[ExtractionStats] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Извлекает текст в пуле процессов и отдает результаты по мере готовности.
+
+    Задачи читаются из tasks лениво (не больше одной на процесс), поэтому
+    на вход можно подавать генератор по всему синхронизированному набору.
+
+    Yields:
+        {'gdrive_id', 'path', 'format', 'status' ('ok' | 'error' | 'timeout'),
+         'error', 'sections', 'chars', 'seconds', 'output_path'}.
+    """
+    context = multiprocessing.get_context()
+    result_queue = context.Queue()
+    workers = [_Worker(context, result_queue, memory_limit_mb) for _ in range(max(1, max_workers))]
+    tasks = iter(tasks)
+    tasks_left = True
+
+    def finish(worker: _Worker, result: Dict[str, Any]) -> Dict[str, Any]:
+        worker.task = None
+        if stats is not None:
+            stats.add(result)
+        return result
+
+    def failed(worker: _Worker, status: str, error: str) -> Dict[str, Any]:
+        task = worker.task
+        return {"gdrive_id": task["gdrive_id"], "path": task["path"], "format": task["format"],
+                "output_path": task["output_path"], "status": status, "error": error,
+                "sections": 0, "chars": 0, "seconds": time.perf_counter() - worker.started_at}
+
+    try:
+        while True:
+            for worker in workers:
+                if worker.task is None and tasks_left:
+                    task = next(tasks, None)
+                    if task is None:
+                        tasks_left = False
+                    else:
+                        worker.assign(task)
+            busy = [worker for worker in workers if worker.task is not None]
+            if not busy:
+                return
+
+            try:
+                result = result_queue.get(timeout=0.2)
+                for worker in busy:
+                    if worker.task["gdrive_id"] == result["gdrive_id"]:
+                        yield finish(worker, result)
+                        break
+            except queue.Empty:
+                pass
+
+            # Зависшие и упавшие процессы заменяются новыми
+            for index, worker in enumerate(workers):
+                if worker.task is None:
+                    continue
+                if time.perf_counter() - worker.started_at > timeout_seconds:
+                    result = failed(worker, "timeout", f"Таймаут {timeout_seconds} с")
+                elif not worker.process.is_alive():
+                    result = failed(worker, "error", f"Процесс завершился с кодом {worker.process.exitcode}")
+                else:
+                    continue
+                worker.process.kill()
+                worker.process.join()
+                workers[index] = _Worker(context, result_queue, memory_limit_mb)
+                partial_path = f"{result['output_path']}.partial"
+                if os.path.exists(partial_path):
+                    os.remove(partial_path)
+                yield finish(worker, result)
+    finally:
+        for worker in workers:
+            worker.stop()
+
+
+# --- Чтение результатов следующими этапами ---
+
+def read_header(output_path: str) -> Dict[str, Any]:
+    """Заголовок JSONL (gdrive_id, path, version, format) или {} если файла нет."""
+    try:
+        with open(output_path, "r", encoding="utf-8") as f:
+            return json.loads(f.readline() or "{}")
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def iter_sections(output_path: str) -> Iterator[Dict[str, Any]]:
+    """Разделы документа по одному: {'unit', 'number', 'text'[, 'title']}."""
+    with open(output_path, "r", encoding="utf-8") as f:
+        f.readline()  # Заголовок
+        for line in f:
+            yield json.loads(line)
+
+
+def parse_args():
+    """Парсер аргументов командной строки"""
+    extraction = get_setting("processing", "extraction", {}) or {}
+    parser = argparse.ArgumentParser(description='Извлечение текста из синхронизированных документов')
+    parser.add_argument('--workers', type=int, default=extraction.get("workers", 4), help='Число процессов')
+    parser.add_argument('--timeout', type=float, default=extraction.get("timeout_seconds", 120), help='Таймаут на файл, с')
+    parser.add_argument('--memory-mb', type=int, default=extraction.get("memory_limit_mb", 1024),
+                        help='Лимит памяти процесса, МБ (0 - без ограничения)')
+    parser.add_argument('--output-dir', type=str, default=os.getenv("PROCESSED_DATA_DIR", DEFAULT_OUTPUT_DIR),
+                        help='Каталог для JSONL с извлеченным текстом')
+    parser.add_argument('--force', action='store_true', help='Извлечь заново уже обработанные версии')
+    return parser.parse_args()
+
+
+def main():
+    from dotenv import load_dotenv
+    from db_client import SupabaseClient
+
+    args = parse_args()
+    load_dotenv()
+    local_root = os.getenv("LOCAL_SYNC_PATH")
+    if not local_root:
+        print("❌ Ошибка: переменная LOCAL_SYNC_PATH должна быть задана.")
+        return
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    db_data = SupabaseClient().get_all_documents()
+    if db_data is None:
+        return
+    tasks = iter_extraction_tasks(
+        db_data.values(), local_root, args.output_dir,
+        supported_formats=get_setting("file_system", "supported_formats"),
+        max_file_size_mb=get_setting("file_system", "max_file_size_mb", 0),
+        force=args.force
+    )
+
+    print(f"🚀 Извлечение текста ({args.workers} процессов, таймаут {args.timeout} с, память {args.memory_mb} МБ)...")
+    stats = ExtractionStats()
+    for result in extract_documents(tasks, args.workers, args.timeout, args.memory_mb, stats):
+        if result["status"] == "ok":
+            print(f"-> {result['path']}: {result['sections']} разделов, {result['chars']:,} символов, {result['seconds']:.2f} с")
+        else:
+            print(f"  ❌ {result['path']}: {result['error']}")
+    stats.print_report()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,543 @@
+# Файл: scripts/fake_services.py
+#
+# Описание:
+# Фейковые реализации внешних сервисов для проверки и бенчмарков без сети.
+# FakeDriveService повторяет минимальное подмножество Google Drive API v3
+# (files().list, changes().getStartPageToken, changes().list), которое
+# использует GDriveScanner, и скачивание содержимого files().get_media
+# с поддержкой заголовка Range (для GDriveDownloader).
+# Квота (запросов в секунду, одновременных запросов) и throttle_next
+# имитируют троттлинг Drive: 403 rateLimitExceeded и 429.
+# FakeSupabaseClient - таблицы в памяти с тем же цепочечным интерфейсом
+# запросов (table().select().in_()...execute()), что и клиент supabase.
+
+import os
+import re
+import json
+import heapq
+import math
+import time
+import random
+import hashlib
+import threading
+from collections import deque
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional
+
+import httplib2
+from googleapiclient.errors import HttpError
+from postgrest.exceptions import APIError
+
+FOLDER_MIME_TYPE = "application/vnd.google-apps.folder"
+
+
+class _FakeRequest:
+    """Отложенный запрос: как и в googleapiclient, выполняется через execute()."""
+    def __init__(self, handler, **kwargs):
+        self._handler = handler
+        self._kwargs = kwargs
+
+    def execute(self):
+        return self._handler(**self._kwargs)
+
+
+class _FakeFilesResource:
+    def __init__(self, service: "FakeDriveService"):
+        self._service = service
+
+    def list(self, **kwargs):
+        return _FakeRequest(self._service._files_list, **kwargs)
+
+    def get_media(self, fileId: str, **_):
+        return _FakeMediaRequest(self._service, fileId)
+
+    def export_media(self, fileId: str, mimeType: str, **_):
+        return _FakeMediaRequest(self._service, fileId, export_mime_type=mimeType)
+
+
+class _FakeHttpResponse(dict):
+    """Ответ в стиле httplib2: заголовки в словаре, код в атрибуте status."""
+    def __init__(self, status: int, headers: Optional[Dict[str, str]] = None):
+        super().__init__(headers or {})
+        self.status = status
+
+
+class _FakeMediaHttp:
+    def __init__(self, service: "FakeDriveService"):
+        self._service = service
+
+    def request(self, uri: str, method: str = "GET", headers: Optional[Dict[str, str]] = None, **_):
+        file_uri, _, export_mime_type = uri.partition("?export=")
+        file_id = file_uri.rsplit("/", 1)[-1]
+        if export_mime_type:
+            return self._service._export_request(file_id, export_mime_type)
+        return self._service._media_request(file_id, headers or {})
+
+
+class _FakeMediaRequest:
+    """Как HttpRequest из googleapiclient для get_media/export_media: uri, headers и http с методом request()."""
+    def __init__(self, service: "FakeDriveService", file_id: str, export_mime_type: Optional[str] = None):
+        self.uri = f"fake://drive/v3/files/{file_id}" + (f"?export={export_mime_type}" if export_mime_type else "")
+        self.headers = {}
+        self.http = _FakeMediaHttp(service)
+
+
+class _FakeChangesResource:
+    def __init__(self, service: "FakeDriveService"):
+        self._service = service
+
+    def getStartPageToken(self, **kwargs):
+        return _FakeRequest(self._service._changes_start_token, **kwargs)
+
+    def list(self, **kwargs):
+        return _FakeRequest(self._service._changes_list, **kwargs)
+
+
+class FakeDriveService:
+    """
+    Фейковый сервис Google Drive, хранящий дерево файлов в памяти.
+
+    Поддерживает запросы вида "'a' in parents [or 'b' in parents] and trashed=false",
+    постраничную выдачу (pageSize/pageToken) и считает число вызовов API.
+    Все изменения через update/trash/remove попадают в журнал Changes API,
+    где token - это позиция в журнале.
+    Для бенчмарков: latency - задержка каждого вызова API в секундах,
+    max_page_size - сколько элементов сервис отдает на страницу, даже если
+    клиент просит больше (как Drive при тяжелом fields).
+    Троттлинг: вызов сверх quota_per_second за последнюю секунду или сверх
+    max_concurrent одновременных получает отказ (попеременно 403
+    rateLimitExceeded и 429); отказы считаются в throttled_counts.
+    """
+    DEFAULT_PAGE_SIZE = 100
+
+    def __init__(self, files: Optional[List[Dict[str, Any]]] = None, latency: float = 0.0,
+                 max_page_size: Optional[int] = None, quota_per_second: Optional[float] = None,
+                 max_concurrent: Optional[int] = None):
+        self.latency = latency
+        self.max_page_size = max_page_size
+        self.quota_per_second = quota_per_second
+        self.max_concurrent = max_concurrent
+        self.files_by_id: Dict[str, Dict[str, Any]] = {}
+        self.children: Dict[str, List[str]] = {}
+        self.call_counts: Dict[str, int] = {}
+        self.throttled_counts: Dict[str, int] = {}
+        self.change_log: List[Dict[str, Any]] = []
+        self.contents: Dict[str, bytes] = {}
+        self._media_failures = 0
+        self._throttle_next = 0
+        self._recent_calls = deque()
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        for file in files or []:
+            self.add(file)
+
+    def add(self, file: Dict[str, Any]) -> Dict[str, Any]:
+        """Добавляет файл или папку (словарь в формате ответа Drive API)."""
+        self.files_by_id[file["id"]] = file
+        for parent_id in file.get("parents", []):
+            self.children.setdefault(parent_id, []).append(file["id"])
+        self._log_change(file["id"])
+        return file
+
+    def update(self, file_id: str, **fields) -> Dict[str, Any]:
+        """Меняет поля файла (name, parents, md5Checksum, ...) и пишет изменение в журнал."""
+        file = self.files_by_id[file_id]
+        if "parents" in fields:
+            for parent_id in file.get("parents", []):
+                self.children[parent_id].remove(file_id)
+            for parent_id in fields["parents"]:
+                self.children.setdefault(parent_id, []).append(file_id)
+        file.update(fields)
+        self._log_change(file_id)
+        return file
+
+    def trash(self, file_id: str) -> Dict[str, Any]:
+        return self.update(file_id, trashed=True)
+
+    def remove(self, file_id: str):
+        """Удаляет файл навсегда (в журнале - изменение с removed=True)."""
+        file = self.files_by_id.pop(file_id)
+        for parent_id in file.get("parents", []):
+            self.children[parent_id].remove(file_id)
+        self.change_log.append({"fileId": file_id, "removed": True})
+
+    def _log_change(self, file_id: str):
+        self.change_log.append({"fileId": file_id, "removed": False, "file": dict(self.files_by_id[file_id])})
+
+    def add_folder(self, folder_id: str, name: str, parent_id: str) -> Dict[str, Any]:
+        return self.add({"id": folder_id, "name": name, "mimeType": FOLDER_MIME_TYPE, "parents": [parent_id]})
+
+    def add_file(self, file_id: str, name: str, parent_id: str, size: int = 0, **extra) -> Dict[str, Any]:
+        file = {
+            "id": file_id,
+            "name": name,
+            "mimeType": extra.pop("mimeType", "application/octet-stream"),
+            "parents": [parent_id],
+            "size": str(size),
+            "md5Checksum": extra.pop("md5Checksum", f"md5-{file_id}"),
+            "version": extra.pop("version", "1"),
+        }
+        file.update(extra)
+        if file["mimeType"].startswith("application/vnd.google-apps."):
+            # У Google-документов нет собственного содержимого, md5 и размера
+            file.pop("size")
+            file.pop("md5Checksum")
+        return self.add(file)
+
+    def set_content(self, file_id: str, content: bytes) -> Dict[str, Any]:
+        """
+        Задает содержимое файла для get_media (size и md5Checksum пересчитываются).
+        Для Google-документа - содержимое экспорта: у него меняется только version.
+        """
+        self.contents[file_id] = content
+        file = self.files_by_id[file_id]
+        if file.get("mimeType", "").startswith("application/vnd.google-apps."):
+            return self.update(file_id, version=str(int(file.get("version", "0")) + 1))
+        return self.update(file_id, size=str(len(content)), md5Checksum=hashlib.md5(content).hexdigest())
+
+    def fail_media_next(self, count: int):
+        """Следующие count запросов get_media завершатся ответом 503."""
+        self._media_failures = count
+
+    def throttle_next(self, count: int):
+        """Следующие count вызовов любого метода получат отказ по квоте."""
+        self._throttle_next = count
+
+    def files(self):
+        return _FakeFilesResource(self)
+
+    def changes(self):
+        return _FakeChangesResource(self)
+
+    def _count(self, method: str) -> Optional[int]:
+        """
+        Учитывает вызов и выдерживает latency. Возвращает код отказа по квоте
+        (403 или 429) или None, если вызов пропущен.
+        """
+        with self._lock:
+            self.call_counts[method] = self.call_counts.get(method, 0) + 1
+            now = time.monotonic()
+            while self._recent_calls and now - self._recent_calls[0] >= 1.0:
+                self._recent_calls.popleft()
+            throttled = (self._throttle_next > 0
+                         or (self.quota_per_second is not None and len(self._recent_calls) >= self.quota_per_second)
+                         or (self.max_concurrent is not None and self._in_flight >= self.max_concurrent))
+            if throttled:
+                self._throttle_next = max(0, self._throttle_next - 1)
+                count = self.throttled_counts[method] = self.throttled_counts.get(method, 0) + 1
+                return 429 if count % 2 == 0 else 403
+            self._recent_calls.append(now)
+            self._in_flight += 1
+        try:
+            if self.latency:
+                time.sleep(self.latency)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+        return None
+
+    @staticmethod
+    def _throttle_body(status: int) -> bytes:
+        message = "Rate Limit Exceeded" if status == 403 else "Too Many Requests"
+        return json.dumps({"error": {"code": status, "message": message, "errors": [
+            {"domain": "usageLimits", "reason": "rateLimitExceeded", "message": message}]}}).encode()
+
+    def _check_quota(self, method: str):
+        """Для вызовов через execute(): отказ по квоте - HttpError, как у googleapiclient."""
+        status = self._count(method)
+        if status is not None:
+            raise HttpError(httplib2.Response({"status": status}), self._throttle_body(status),
+                            uri=f"fake://drive/v3/{method}")
+
+    def _page_size(self, requested: Optional[int]) -> int:
+        page_size = requested or self.DEFAULT_PAGE_SIZE
+        return min(page_size, self.max_page_size) if self.max_page_size else page_size
+
+    def _files_list(self, q: str = "", fields: str = None, pageSize: int = None, pageToken: str = None, **_):
+        self._check_quota("files.list")
+        parent_ids = re.findall(r"'([^']+)' in parents", q)
+        matches = []
+        seen = set()
+        for parent_id in parent_ids:
+            for child_id in self.children.get(parent_id, []):
+                if child_id in seen:
+                    continue
+                seen.add(child_id)
+                child = self.files_by_id[child_id]
+                if "trashed=false" in q and child.get("trashed"):
+                    continue
+                matches.append(child)
+
+        page_size = self._page_size(pageSize)
+        offset = int(pageToken) if pageToken else 0
+        response = {"files": [dict(f) for f in matches[offset:offset + page_size]]}
+        if offset + page_size < len(matches):
+            response["nextPageToken"] = str(offset + page_size)
+        return response
+
+    def _media_request(self, file_id: str, headers: Dict[str, str]):
+        status = self._count("files.get_media")
+        if status is not None:
+            return _FakeHttpResponse(status, {"retry-after": "0"} if status == 429 else None), self._throttle_body(status)
+        with self._lock:
+            if self._media_failures:
+                self._media_failures -= 1
+                return _FakeHttpResponse(503), b""
+        file = self.files_by_id.get(file_id)
+        if file is None:
+            return _FakeHttpResponse(404), b""
+        if file.get("mimeType", "").startswith("application/vnd.google-apps."):
+            return _FakeHttpResponse(403), b""
+        content = self.contents.get(file_id, b"")
+        match = re.match(r"bytes=(\d+)-(\d*)", headers.get("range", ""))
+        if not match:
+            return _FakeHttpResponse(200), content
+        start = int(match.group(1))
+        end = min(int(match.group(2)) if match.group(2) else len(content) - 1, len(content) - 1)
+        if start >= len(content):
+            return _FakeHttpResponse(416, {"content-range": f"bytes */{len(content)}"}), b""
+        return (_FakeHttpResponse(206, {"content-range": f"bytes {start}-{end}/{len(content)}"}),
+                content[start:end + 1])
+
+    def _export_request(self, file_id: str, export_mime_type: str):
+        """Экспорт Google-документа: Range не поддерживается, всегда отдается файл целиком."""
+        status = self._count("files.export_media")
+        if status is not None:
+            return _FakeHttpResponse(status), self._throttle_body(status)
+        file = self.files_by_id.get(file_id)
+        if file is None:
+            return _FakeHttpResponse(404), b""
+        if not file.get("mimeType", "").startswith("application/vnd.google-apps."):
+            return _FakeHttpResponse(403), b""
+        return _FakeHttpResponse(200, {"content-type": export_mime_type}), self.contents.get(file_id, b"")
+
+    def _changes_start_token(self, **_):
+        self._check_quota("changes.getStartPageToken")
+        return {"startPageToken": str(len(self.change_log))}
+
+    def _changes_list(self, pageToken: str, pageSize: int = None, **_):
+        self._check_quota("changes.list")
+        page_size = self._page_size(pageSize)
+        offset = int(pageToken)
+        response = {"changes": [dict(c) for c in self.change_log[offset:offset + page_size]]}
+        if offset + page_size < len(self.change_log):
+            response["nextPageToken"] = str(offset + page_size)
+        else:
+            response["newStartPageToken"] = str(len(self.change_log))
+        return response
+
+
+def build_drive_tree(service: FakeDriveService, files: int, depth: int, fanout: int,
+                     root_id: str = "root", avg_size: int = 870 * 1024, seed: int = 42) -> List[Dict[str, Any]]:
+    """
+    Заполняет сервис деревом: fanout подпапок на уровень до глубины depth и
+    files файлов, случайно разложенных по всем папкам (размеры - логнормальные
+    со средним avg_size). Возвращает [{"file": ответ API, "path": путь}] по файлам.
+    """
+    rng = random.Random(seed)
+    folders = [(root_id, "")]
+    level = [(root_id, "")]
+    for _ in range(depth):
+        next_level = []
+        for parent_id, parent_path in level:
+            for i in range(fanout):
+                folder_id = f"folder{len(folders)}"
+                name = f"dir{i}"
+                service.add_folder(folder_id, name, parent_id)
+                next_level.append((folder_id, os.path.join(parent_path, name)))
+                folders.append(next_level[-1])
+        level = next_level
+
+    extensions = ["pdf", "docx", "xlsx", "pptx", "txt"]
+    # Логнормальное распределение с заданным средним: mu = ln(mean) - sigma^2 / 2
+    sigma = 1.5
+    mu = math.log(max(1, avg_size)) - sigma ** 2 / 2
+    generated = []
+    for i in range(files):
+        parent_id, parent_path = folders[rng.randrange(len(folders))]
+        name = f"file{i}.{extensions[i % len(extensions)]}"
+        file = service.add_file(f"file{i}", name, parent_id, size=int(rng.lognormvariate(mu, sigma)),
+                                modifiedTime="2026-01-01T00:00:00.000Z", createdTime="2025-01-01T00:00:00.000Z")
+        generated.append({"file": file, "path": os.path.join(parent_path, name)})
+    return generated
+
+
+class _FakeResponse:
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+
+class _FakeTableQuery:
+    """Цепочка запроса к таблице; выполняется в execute(), как в postgrest."""
+    def __init__(self, client: "FakeSupabaseClient", table_name: str):
+        self._client = client
+        self._table_name = table_name
+        self._operation = "select"
+        self._payload = None
+        self._columns: Optional[List[str]] = None
+        self._filters = []
+        self._filter_columns: List[str] = []
+        self._order = []
+        self._offset = 0
+        self._limit: Optional[int] = None
+        self._single = False
+        self._on_conflict = ""
+        self._count = None
+
+    # --- Операции ---
+    def select(self, *columns: str, count: Optional[str] = None, **_):
+        self._operation = "select"
+        self._count = count
+        names = [c.strip() for column in columns for c in column.split(",")]
+        self._columns = None if names in ([], ["*"]) else names
+        return self
+
+    def insert(self, json, **_):
+        self._operation, self._payload = "insert", json
+        return self
+
+    def upsert(self, json, on_conflict: str = "", **_):
+        self._operation, self._payload, self._on_conflict = "upsert", json, on_conflict
+        return self
+
+    def update(self, json, **_):
+        self._operation, self._payload = "update", json
+        return self
+
+    def delete(self, **_):
+        self._operation = "delete"
+        return self
+
+    # --- Фильтры и модификаторы ---
+    def eq(self, column: str, value):
+        self._filters.append(lambda row: row.get(column) == value)
+        return self
+
+    def in_(self, column: str, values):
+        values = set(values)
+        self._filters.append(lambda row: row.get(column) in values)
+        return self
+
+    def gt(self, column: str, value):
+        self._filter_columns.append(column)
+        self._filters.append(lambda row: row.get(column) is not None and row.get(column) > value)
+        return self
+
+    def gte(self, column: str, value):
+        self._filter_columns.append(column)
+        self._filters.append(lambda row: row.get(column) is not None and row.get(column) >= value)
+        return self
+
+    def order(self, column: str, desc: bool = False, **_):
+        self._order.append((column, desc))
+        return self
+
+    def limit(self, size: int, **_):
+        self._limit = size
+        return self
+
+    def range(self, start: int, end: int, **_):
+        self._offset, self._limit = start, end - start + 1
+        return self
+
+    def single(self):
+        self._single = True
+        return self
+
+    def execute(self):
+        return self._client._execute(self)
+
+
+class FakeSupabaseClient:
+    """
+    Фейковый клиент Supabase: таблицы в памяти с первичным ключом gdrive_id.
+
+    - max_rows имитирует ограничение PostgREST на число строк в ответе;
+    - required_columns имитирует NOT NULL: вставка/upsert строки без этих
+      колонок падает с APIError (как и в Postgres, даже при конфликте ключа);
+    - fail_next(n) заставляет следующие n запросов упасть с временной ошибкой;
+    - при записи строкам проставляется updated_at (одинаковый в пределах
+      запроса, как now() в транзакции Postgres); с track_updated_at=False
+      колонки нет, и запрос, который ее упоминает, падает с APIError 42703.
+    """
+    def __init__(self, primary_key: str = "gdrive_id", max_rows: int = 1000,
+                 required_columns: Optional[List[str]] = None, track_updated_at: bool = True):
+        self.primary_key = primary_key
+        self.max_rows = max_rows
+        self.required_columns = required_columns or []
+        self.track_updated_at = track_updated_at
+        self.tables: Dict[str, Dict[Any, Dict[str, Any]]] = {}
+        self.request_count = 0
+        self._failures_left = 0
+        self._lock = threading.Lock()
+
+    def table(self, table_name: str) -> _FakeTableQuery:
+        return _FakeTableQuery(self, table_name)
+
+    def fail_next(self, count: int):
+        self._failures_left = count
+
+    def _check_required(self, row: Dict[str, Any]):
+        missing = [column for column in self.required_columns if row.get(column) is None]
+        if missing:
+            raise APIError({"code": "23502", "message": f'null value in column "{missing[0]}" violates not-null constraint'})
+
+    def _stamp(self, now: Optional[str]) -> Dict[str, str]:
+        return {"updated_at": now} if self.track_updated_at else {}
+
+    def _execute(self, query: _FakeTableQuery) -> _FakeResponse:
+        with self._lock:
+            self.request_count += 1
+            if self._failures_left > 0:
+                self._failures_left -= 1
+                raise ConnectionError("Имитация временного сбоя сети")
+
+            rows = self.tables.setdefault(query._table_name, {})
+            pk = self.primary_key
+            if not self.track_updated_at and "updated_at" in (query._columns or []) + query._filter_columns:
+                raise APIError({"code": "42703", "message": "column gdrive_mirror.updated_at does not exist"})
+            now = datetime.now(timezone.utc).isoformat() if self.track_updated_at else None
+
+            if query._operation in ("insert", "upsert"):
+                payload = query._payload if isinstance(query._payload, list) else [query._payload]
+                for row in payload:
+                    self._check_required(row)
+                    if query._operation == "insert" and row[pk] in rows:
+                        raise APIError({"code": "23505", "message": "duplicate key value violates unique constraint"})
+                for row in payload:
+                    rows.setdefault(row[pk], {}).update(row, **self._stamp(now))
+                return _FakeResponse([dict(rows[row[pk]]) for row in payload])
+
+            matched = [row for row in rows.values() if all(f(row) for f in query._filters)]
+
+            if query._operation == "update":
+                for row in matched:
+                    row.update(query._payload, **self._stamp(now))
+                return _FakeResponse([dict(row) for row in matched])
+
+            if query._operation == "delete":
+                for row in matched:
+                    del rows[row[pk]]
+                return _FakeResponse(matched)
+
+            total = len(matched) if query._count else None
+            end = len(matched) if query._limit is None else query._offset + query._limit
+            if len(query._order) == 1 and query._limit is not None:
+                # Постраничное чтение большой таблицы: частичная сортировка вместо полной
+                column, desc = query._order[0]
+                select = heapq.nlargest if desc else heapq.nsmallest
+                matched = select(end, matched, key=lambda row: (row.get(column) is None, row.get(column)))
+            for column, desc in reversed(query._order):
+                matched.sort(key=lambda row: (row.get(column) is None, row.get(column)), reverse=desc)
+            matched = matched[query._offset:end][:self.max_rows]
+            if query._columns is not None:
+                matched = [{column: row.get(column) for column in query._columns} for row in matched]
+            else:
+                matched = [dict(row) for row in matched]
+
+            if query._single:
+                if len(matched) != 1:
+                    raise APIError({"code": "PGRST116", "message": "JSON object requested, multiple (or no) rows returned"})
+                return _FakeResponse(matched[0], total)
+            return _FakeResponse(matched, total)
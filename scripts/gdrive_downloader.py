@@ -0,0 +1,192 @@
+# Файл: scripts/gdrive_downloader.py
+#
+# Описание:
+# Скачивание файлов Google Drive внутри процесса, без запуска rclone на
+# каждый файл. Используется авторизованный клиент GDriveScanner (свой в
+# каждом потоке), файл запрашивается по gdrive_id (files.get_media) кусками
+# через заголовок Range.
+#
+# - Данные пишутся во временный файл <путь>.partial рядом с целевым, MD5
+#   считается на лету и сверяется с md5_checksum записи.
+# - После проверки временный файл атомарно переименовывается в целевой:
+#   в LOCAL_SYNC_PATH никогда не появляется недокачанный файл.
+# - Если скачивание прервалось, .partial остается и при следующей попытке
+#   докачивается с места остановки.
+# - Google-документы (Docs, Sheets, ...) не имеют содержимого для
+#   get_media, они выгружаются через files.export_media в формат экспорта
+#   (см. export()); кэш ревизий - в GDriveProvider и export_cache.py.
+# - Каждый кусок идет через регулятор темпа сканера (rate_governor.py):
+#   троттлинг (429, 403 rateLimitExceeded) и временные ошибки повторяются
+#   с экспоненциальной паузой.
+
+import os
+import hashlib
+from typing import Dict, Any, Optional, Tuple
+
+import metrics
+from get_gdrive_methadata import GDriveScanner
+from rate_governor import RetryableError, classify_response, retry_after_seconds
+
+
+class DownloadError(Exception):
+    """Ошибка скачивания. transient=True - можно повторить (временный .partial сохраняется)."""
+    def __init__(self, message: str, transient: bool = True):
+        super().__init__(message)
+        self.transient = transient
+
+
+class GDriveDownloader:
+    """Скачивание файлов Google Drive по gdrive_id с докачкой и проверкой MD5."""
+    DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+    GOOGLE_APPS_MIME_PREFIX = "application/vnd.google-apps."
+    # Расширение формата экспорта -> MIME-тип для files.export_media
+    EXPORT_MIME_TYPES = {
+        "docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+        "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        "pptx": "application/vnd.openxmlformats-officedocument.presentationml.presentation",
+        "pdf": "application/pdf",
+        "odt": "application/vnd.oasis.opendocument.text",
+        "ods": "application/vnd.oasis.opendocument.spreadsheet",
+        "csv": "text/csv",
+        "txt": "text/plain",
+        "svg": "image/svg+xml",
+        "png": "image/png",
+    }
+
+    def __init__(self, scanner: GDriveScanner, chunk_size: Optional[int] = None):
+        """
+        Args:
+            scanner: Сканер с авторизованным клиентом Drive (или фейковым сервисом).
+            chunk_size: Размер куска одного Range-запроса в байтах.
+        """
+        self.scanner = scanner
+        self.chunk_size = chunk_size or self.DEFAULT_CHUNK_SIZE
+
+    @classmethod
+    def can_download(cls, file_data: Dict[str, Any]) -> bool:
+        """Google-документы скачиваются только экспортом, get_media для них не работает."""
+        return not (file_data.get('mime_type') or "").startswith(cls.GOOGLE_APPS_MIME_PREFIX)
+
+    @staticmethod
+    def _parse_total_size(response) -> Optional[int]:
+        """Полный размер файла из заголовка 'content-range: bytes 0-99/1000'."""
+        content_range = response.get('content-range', '')
+        total = content_range.rpartition('/')[2]
+        return int(total) if total.isdigit() else None
+
+    def _fetch_range(self, request, offset: int):
+        """
+        Запрашивает кусок файла начиная с offset через регулятор темпа сканера:
+        троттлинг и временные ошибки повторяются, после исчерпания повторов -
+        DownloadError(transient=True).
+        """
+        headers = dict(getattr(request, 'headers', None) or {})
+        headers['range'] = f"bytes={offset}-{offset + self.chunk_size - 1}"
+
+        def attempt():
+            metrics.inc("drive_requests", method="files.get_media")
+            try:
+                with metrics.timer("drive_request_seconds", method="files.get_media"):
+                    response, content = request.http.request(request.uri, "GET", headers=headers)
+            except Exception as e:
+                metrics.inc("drive_errors", method="files.get_media")
+                raise RetryableError(f"Сетевая ошибка: {e}") from e
+            if response.status in (200, 206, 416):
+                metrics.inc("drive_download_bytes", len(content))
+                return response, content
+            metrics.inc("drive_errors", method="files.get_media")
+            kind = classify_response(response.status, content)
+            if kind is None:
+                raise DownloadError(f"HTTP {response.status}", transient=False)
+            raise RetryableError(f"HTTP {response.status}", throttled=kind == "throttled",
+                                 retry_after=retry_after_seconds(response))
+
+        try:
+            return self.scanner.governor.call(attempt, "files.get_media")
+        except RetryableError as e:
+            raise DownloadError(str(e)) from e
+
+    def _download_to(self, request, file_data: Dict[str, Any], tmp_path: str) -> str:
+        """Скачивает (или докачивает) ответ request в tmp_path. Возвращает MD5 всего содержимого."""
+        md5 = hashlib.md5()
+        offset = 0
+        expected_size = file_data.get('size_bytes') or 0
+        if os.path.exists(tmp_path):
+            if 0 < os.path.getsize(tmp_path) < expected_size:
+                # Докачка: учитываем в MD5 уже скачанную часть
+                with open(tmp_path, "rb") as f:
+                    for block in iter(lambda: f.read(self.chunk_size), b""):
+                        md5.update(block)
+                        offset += len(block)
+            else:
+                os.remove(tmp_path)
+
+        with open(tmp_path, "r+b" if offset else "wb") as f:
+            f.seek(offset)
+            while True:
+                response, content = self._fetch_range(request, offset)
+                if response.status == 416:
+                    break  # Запрошенный диапазон за концом файла (в т.ч. пустой файл)
+                if response.status == 200 and offset:
+                    # Сервер проигнорировал Range и вернул файл целиком
+                    f.seek(0)
+                    f.truncate()
+                    md5 = hashlib.md5()
+                    offset = 0
+                f.write(content)
+                md5.update(content)
+                offset += len(content)
+                total = self._parse_total_size(response)
+                if response.status == 200 or not content or total is None or offset >= total:
+                    break
+        return md5.hexdigest()
+
+    def download(self, file_data: Dict[str, Any], local_root: str) -> Tuple[bool, Optional[str]]:
+        """
+        Скачивает файл в local_root/<path>. Интерфейс как у SourceProvider.fetch_file.
+        """
+        destination_path = os.path.join(local_root, file_data['path'])
+        tmp_path = f"{destination_path}.partial"
+        expected_md5 = file_data.get('md5_checksum')
+        try:
+            os.makedirs(os.path.dirname(destination_path), exist_ok=True)
+            request = self.scanner.get_thread_service().files().get_media(fileId=file_data['gdrive_id'])
+            resumed = os.path.exists(tmp_path)
+            md5 = self._download_to(request, file_data, tmp_path)
+            if expected_md5 and md5 != expected_md5 and resumed:
+                # Недокачанный файл мог остаться от другой версии - качаем заново
+                os.remove(tmp_path)
+                md5 = self._download_to(request, file_data, tmp_path)
+            if expected_md5 and md5 != expected_md5:
+                os.remove(tmp_path)
+                raise DownloadError(f"MD5 не совпадает: ожидался {expected_md5}, получен {md5}", transient=False)
+            os.replace(tmp_path, destination_path)
+            return True, None
+        except (DownloadError, OSError) as e:
+            if not getattr(e, 'transient', False) and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            error_message = f"Ошибка скачивания: {e}"
+            print(f"  ❌ {error_message}")
+            return False, error_message
+
+    def export(self, file_data: Dict[str, Any], local_root: str, extension: str) -> Tuple[bool, Optional[str]]:
+        """Экспортирует Google-документ в формат extension и сохраняет в local_root/<path>."""
+        mime_type = self.EXPORT_MIME_TYPES.get(extension)
+        if mime_type is None:
+            return False, f"Неизвестный формат экспорта: {extension}"
+        destination_path = os.path.join(local_root, file_data['path'])
+        tmp_path = f"{destination_path}.partial"
+        try:
+            os.makedirs(os.path.dirname(destination_path), exist_ok=True)
+            request = self.scanner.get_thread_service().files().export_media(
+                fileId=file_data['gdrive_id'], mimeType=mime_type
+            )
+            self._download_to(request, {**file_data, 'size_bytes': 0}, tmp_path)
+            os.replace(tmp_path, destination_path)
+            return True, None
+        except (DownloadError, OSError) as e:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            error_message = f"Ошибка экспорта: {e}"
+            print(f"  ❌ {error_message}")
+            return False, error_message
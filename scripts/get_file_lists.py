@@ -8,9 +8,28 @@
 # На основе сравнения он формирует план действий, разделяя все файлы
 # на 4 категории: на создание, на изменение, на перемещение и на удаление.
 
+import os
 from typing import Dict, Any, List, Tuple
 from datetime import datetime, timezone
 
+GOOGLE_APPS_MIME_PREFIX = "application/vnd.google-apps."
+
+
+def _is_content_changed(source_item: Dict, db_item: Dict) -> bool:
+    """
+    Изменилось ли содержимое файла. Если источник отдает md5 - сравниваем его,
+    иначе (локальные источники без контрольных сумм) - version и размер.
+    У Google-документов нет ни md5, ни размера: сравнивается только version,
+    а в size_bytes БД хранится размер экспортированного файла (0 - еще не экспортирован).
+    """
+    if (source_item.get('mime_type') or '').startswith(GOOGLE_APPS_MIME_PREFIX):
+        return source_item.get('version') != db_item.get('version') or not db_item.get('size_bytes')
+    if source_item.get('md5_checksum') is not None:
+        return source_item['md5_checksum'] != db_item.get('md5_checksum')
+    return (source_item.get('version') != db_item.get('version')
+            or source_item.get('size_bytes') != db_item.get('size_bytes'))
+
+
 # --- Функция 1: Сравнение GDrive с Базой ---
 def get_gdrive_vs_db_plan(
     gdrive_data: Dict[str, Dict],
@@ -34,7 +53,7 @@ def get_gdrive_vs_db_plan(
         gdrive_item = gdrive_data[id]
         db_item = db_data[id]
 
-        if gdrive_item['md5_checksum'] != db_item.get('md5_checksum'):
+        if _is_content_changed(gdrive_item, db_item):
             to_update.append(gdrive_item)
             continue
 
@@ -44,6 +63,147 @@ def get_gdrive_vs_db_plan(
     return to_create, to_update, to_move, to_delete
 
 
+# --- Функция 1б: Инкрементальное сравнение изменений GDrive с Базой ---
+def get_gdrive_changes_vs_db_plan(
+    changes: Dict[str, Any],
+    db_data: Dict[str, Dict]
+) -> Tuple[List, List, List, List]:
+    """
+    Строит тот же план, что и get_gdrive_vs_db_plan, но только по изменениям,
+    полученным GDriveScanner.get_changes_from_gdrive().
+
+    Args:
+        changes: Словарь с ключами 'files', 'removed' и 'folder_moves'.
+        db_data: Словарь из БД, ключ - 'gdrive_id'.
+
+    Returns:
+        Кортеж (to_create, to_update, to_move, to_delete) в формате get_gdrive_vs_db_plan.
+    """
+    changed_files = changes.get('files', {})
+    removed_ids = set(changes.get('removed', ()))
+    folder_moves = changes.get('folder_moves', {})
+
+    to_delete = [id for id in removed_ids if id in db_data and id not in changed_files]
+    to_create = []
+    to_update = []
+    to_move = []
+
+    for id, gdrive_item in changed_files.items():
+        db_item = db_data.get(id)
+        if db_item is None:
+            to_create.append(gdrive_item)
+        elif _is_content_changed(gdrive_item, db_item):
+            to_update.append(gdrive_item)
+        elif gdrive_item['path'] != db_item.get('path'):
+            to_move.append(gdrive_item)
+
+    # Файлы внутри переименованных/перемещенных/удаленных папок не попадают
+    # в Changes API, поэтому их новые пути выводим из путей папок.
+    if folder_moves:
+        handled_ids = removed_ids | set(changed_files)
+        for id, db_item in db_data.items():
+            if id in handled_ids:
+                continue
+            path = db_item.get('path') or ''
+            prefix = os.path.dirname(path)
+            while prefix and prefix not in folder_moves:
+                prefix = os.path.dirname(prefix)
+            if not prefix:
+                continue
+            new_prefix = folder_moves[prefix]
+            if new_prefix is None:
+                to_delete.append(id)
+            else:
+                to_move.append({**db_item, 'path': new_prefix + path[len(prefix):]})
+
+    return to_create, to_update, to_move, to_delete
+
+
+# --- Функция 1в: Схлопывание перемещений в перемещения директорий ---
+def _count_files_under_dirs(db_data: Dict[str, Dict]) -> Dict[str, int]:
+    """Для каждой директории - число файлов из БД во всем ее поддереве."""
+    counts: Dict[str, int] = {}
+    for item in db_data.values():
+        directory = os.path.dirname(item.get('path') or '')
+        while directory:
+            counts[directory] = counts.get(directory, 0) + 1
+            directory = os.path.dirname(directory)
+    return counts
+
+
+def collapse_directory_moves(
+    to_move: List[Dict],
+    db_data: Dict[str, Dict]
+) -> Tuple[List[Dict], List[Dict]]:
+    """
+    Находит среди перемещений переименования/переносы целых директорий.
+
+    Для каждого файла старый и новый пути раскладываются на общий "хвост"
+    (совпадающие последние компоненты) и различающиеся префиксы: A/B/x.pdf ->
+    A2/B/x.pdf дает кандидата A -> A2. Группа кандидата превращается в одно
+    перемещение директории, только если в нее входят ВСЕ файлы из БД под
+    старым префиксом, а под новым префиксом файлов нет. Иначе кандидат
+    уточняется на уровень глубже (A/B -> A2/B), и так до имени файла -
+    тогда файл остается обычным перемещением.
+
+    Args:
+        to_move: Перемещения из get_gdrive_vs_db_plan (записи с новым 'path').
+        db_data: Словарь из БД, ключ - 'gdrive_id' (старые пути).
+
+    Returns:
+        Кортеж (dir_moves, file_moves):
+        - dir_moves: [{'old_path', 'new_path', 'files': [записи]}];
+        - file_moves: оставшиеся перемещения отдельных файлов.
+    """
+    counts = _count_files_under_dirs(db_data)
+
+    # (запись, компоненты старого пути, компоненты нового пути, длина общего хвоста директорий)
+    pending = []
+    file_moves = []
+    for item in to_move:
+        db_item = db_data.get(item['gdrive_id'])
+        if db_item is None:
+            file_moves.append(item)
+            continue
+        old_parts = db_item['path'].split(os.sep)
+        new_parts = item['path'].split(os.sep)
+        common = 0
+        while (common < min(len(old_parts), len(new_parts)) - 1
+               and old_parts[-2 - common] == new_parts[-2 - common]):
+            common += 1
+        # Первый кандидат - самые короткие префиксы (самая верхняя директория)
+        pending.append((item, old_parts, new_parts, common))
+
+    dir_moves = []
+    while pending:
+        groups: Dict[Tuple[str, str], List] = {}
+        for entry in pending:
+            item, old_parts, new_parts, common = entry
+            old_prefix = os.sep.join(old_parts[:len(old_parts) - 1 - common])
+            new_prefix = os.sep.join(new_parts[:len(new_parts) - 1 - common])
+            groups.setdefault((old_prefix, new_prefix), []).append(entry)
+
+        pending = []
+        for (old_prefix, new_prefix), entries in groups.items():
+            is_nested = (new_prefix + os.sep).startswith(old_prefix + os.sep) or (old_prefix + os.sep).startswith(new_prefix + os.sep)
+            if (old_prefix and new_prefix and not is_nested
+                    and counts.get(old_prefix, 0) == len(entries)
+                    and counts.get(new_prefix, 0) == 0):
+                dir_moves.append({
+                    'old_path': old_prefix,
+                    'new_path': new_prefix,
+                    'files': [entry[0] for entry in entries]
+                })
+                continue
+            for item, old_parts, new_parts, common in entries:
+                if common > 0:
+                    pending.append((item, old_parts, new_parts, common - 1))
+                else:
+                    file_moves.append(item)
+
+    return dir_moves, file_moves
+
+
 # --- Функция 2: Контрольная проверка Сервера с Базой ---
 def get_server_vs_db_plan(
     server_data: Dict[str, Dict],
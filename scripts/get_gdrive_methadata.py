@@ -5,10 +5,32 @@
 # Он содержит класс GDriveScanner, который выполняет аутентификацию
 # и получает полный рекурсивный список метаданных для всех файлов
 # в указанной папке на Google Drive.
+#
+# Обход дерева папок выполняется либо последовательно (одна папка за раз),
+# либо параллельно: очередь папок (deque) разбирается пулом потоков, а
+# несколько соседних папок можно объединять в один запрос вида
+# "'a' in parents or 'b' in parents".
+#
+# Инкрементальный режим использует Changes API: между запусками в файле
+# состояния хранятся start page token и карта папок (id -> имя, родитель),
+# по которой восстанавливаются пути измененных файлов.
+#
+# Все запросы к API идут через регулятор темпа (rate_governor.py): квота,
+# адаптивный лимит параллельности и повторы при троттлинге (429,
+# 403 rateLimitExceeded) и временных ошибках.
+#
+# Google-документы (Docs, Sheets, Slides, Drawings) не имеют содержимого,
+# md5Checksum и size: они экспортируются в формат из настроек, и в записи
+# gdrive_mirror путь получает расширение этого формата (Отчет -> Отчет.docx).
+# Остальные типы application/vnd.google-apps.* (формы, сайты, ярлыки) пропускаются.
 
 import os
 import json
-from typing import Dict, Any, Optional
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, Any, Optional, List, Tuple, Iterator
 
 from google.oauth2.credentials import Credentials
 from google.auth.transport.requests import Request
@@ -17,6 +39,9 @@ from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 from tqdm import tqdm
 
+import metrics
+from rate_governor import RateGovernor
+
 class GDriveScanner:
     """
     Класс для сканирования Google Drive, инкапсулирующий аутентификацию и получение данных.
@@ -24,12 +49,49 @@ class GDriveScanner:
     SCOPES = ["https://www.googleapis.com/auth/drive.readonly"]
     CREDENTIALS_FILE = "credentials.json"
     TOKEN_FILE = "token.json"
+    FOLDER_MIME_TYPE = "application/vnd.google-apps.folder"
+    GOOGLE_APPS_MIME_PREFIX = "application/vnd.google-apps."
+    # Вид Google-документа -> формат экспорта (переопределяется sync.google_export в settings.yml)
+    DEFAULT_EXPORT_FORMATS = {"document": "docx", "spreadsheet": "xlsx", "presentation": "pdf", "drawing": "pdf"}
+    LIST_FIELDS = "nextPageToken, files(id, name, mimeType, md5Checksum, version, webViewLink, createdTime, modifiedTime, size, parents)"
+    PAGE_SIZE = 1000  # Максимум, который разрешает files().list
+    FILE_FIELDS = "id, name, mimeType, md5Checksum, version, webViewLink, createdTime, modifiedTime, size, parents, trashed"
+    CHANGES_FIELDS = f"nextPageToken, newStartPageToken, changes(fileId, removed, file({FILE_FIELDS}))"
+    STATE_FILE = "gdrive_state.json"
 
-    def __init__(self):
+    def __init__(self, service=None, state_file: Optional[str] = None,
+                 export_formats: Optional[Dict[str, str]] = None,
+                 governor: Optional[RateGovernor] = None):
         """
         Инициализатор класса. При создании объекта сразу же выполняет
         аутентификацию и создает готовый к работе сервис-клиент.
+
+        Args:
+            service: Готовый сервис-клиент (например, фейковый для тестов).
+                     Если передан, аутентификация не выполняется.
+            state_file: Путь к файлу состояния инкрементального режима.
+            export_formats: Формат экспорта по виду Google-документа ({"document": "docx", ...}).
+            governor: Регулятор темпа запросов к Drive (общий со скачиванием).
         """
+        self.state_file = state_file or self.STATE_FILE
+        # MIME-тип Google-документа -> расширение экспортированного файла
+        self.export_formats = {
+            self.GOOGLE_APPS_MIME_PREFIX + kind: extension.lower().lstrip(".")
+            for kind, extension in (export_formats or self.DEFAULT_EXPORT_FORMATS).items()
+        }
+        self._thread_local = threading.local()
+        self.governor = governor or RateGovernor()
+        # Карта папок дерева: id -> {"name", "parent"}. Заполняется при полном
+        # сканировании и используется инкрементальным режимом для путей.
+        self.root_folder_id: Optional[str] = None
+        self.folders: Dict[str, Dict[str, Optional[str]]] = {}
+        self._pending_start_page_token: Optional[str] = None
+        self._pending_full_scan_time: Optional[float] = None
+        if service is not None:
+            self.creds = None
+            self.service = service
+            return
+
         self.creds = self._authenticate()
         if self.creds:
             self.service = build("drive", "v3", credentials=self.creds)
@@ -58,12 +120,136 @@ class GDriveScanner:
                 token.write(creds.to_json())
         return creds
 
-    def get_metadata_from_gdrive(self, folder_id: str) -> Optional[Dict[str, Dict[str, Any]]]:
+    @classmethod
+    def is_google_native(cls, mime_type: Optional[str]) -> bool:
+        """Google-документ без собственного содержимого (скачивается только экспортом)."""
+        return (mime_type or "").startswith(cls.GOOGLE_APPS_MIME_PREFIX)
+
+    def _build_file_record(self, file: Dict[str, Any], file_path: str) -> Optional[Dict[str, Any]]:
+        """
+        Преобразует ответ Drive API в запись формата gdrive_mirror.
+        Для Google-документов к пути добавляется расширение формата экспорта;
+        None - для типов, которые нельзя скачать или экспортировать.
+        """
+        if self.is_google_native(file.get("mimeType")):
+            extension = self.export_formats.get(file.get("mimeType"))
+            if not extension:
+                return None
+            file_path = f"{file_path}.{extension}"
+        return {
+            "gdrive_id": file.get("id"),
+            "name": file.get("name"),
+            "path": file_path,
+            "md5_checksum": file.get("md5Checksum"),
+            "version": file.get("version"),
+            "mime_type": file.get("mimeType"),
+            "web_view_link": file.get("webViewLink"),
+            "gdrive_created_time": file.get("createdTime"),
+            "gdrive_modified_time": file.get("modifiedTime"),
+            "size_bytes": int(file.get("size", 0))
+        }
+
+    def get_thread_service(self):
+        """
+        Возвращает сервис-клиент для текущего потока.
+        Клиент googleapiclient (httplib2) не потокобезопасен, поэтому каждый
+        рабочий поток строит свой. Фейковый сервис (без creds) используется общий.
+        """
+        if not self.creds:
+            return self.service
+        service = getattr(self._thread_local, "service", None)
+        if service is None:
+            service = build("drive", "v3", credentials=self.creds)
+            self._thread_local.service = service
+        return service
+
+    def _execute(self, request, method: str) -> Dict[str, Any]:
+        """
+        Выполняет запрос Drive API через регулятор темпа (с повторами при
+        троттлинге) с учетом в метриках (число, длительность, ошибки).
+        """
+        def attempt():
+            metrics.inc("drive_requests", method=method)
+            try:
+                with metrics.timer("drive_request_seconds", method=method):
+                    return request.execute()
+            except HttpError:
+                metrics.inc("drive_errors", method=method)
+                raise
+
+        return self.governor.call(attempt, method)
+
+    def _list_folders(self, service, folders: List[Tuple[str, str]]) -> List[Tuple[Dict[str, Any], str, str]]:
+        """
+        Получает содержимое одной или нескольких папок одним запросом (со всеми страницами).
+
+        Args:
+            service: Сервис-клиент Drive API.
+            folders: Список пар (folder_id, путь папки).
+
+        Returns:
+            Список троек (ответ API по файлу, id родительской папки, путь родительской папки).
+        """
+        folder_paths = dict(folders)
+        parents_query = " or ".join(f"'{folder_id}' in parents" for folder_id in folder_paths)
+        query = f"({parents_query}) and trashed=false" if len(folder_paths) > 1 else f"{parents_query} and trashed=false"
+
+        items = []
+        page_token = None
+        while True:
+            response = self._execute(service.files().list(
+                q=query,
+                fields=self.LIST_FIELDS,
+                pageSize=self.PAGE_SIZE,
+                pageToken=page_token
+            ), "files.list")
+            metrics.inc("drive_items_listed", len(response.get('files', [])))
+
+            for file in response.get('files', []):
+                # При объединенном запросе родителя определяем по полю parents
+                parent_id = None
+                for candidate in file.get('parents', []):
+                    if candidate in folder_paths:
+                        parent_id = candidate
+                        break
+                if parent_id is None:
+                    if len(folder_paths) > 1:
+                        continue
+                    parent_id = folders[0][0]
+                items.append((file, parent_id, folder_paths[parent_id]))
+
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                break
+        return items
+
+    def _handle_listed_item(self, file: Dict[str, Any], parent_id: str, parent_path: str,
+                            folders_to_visit: deque) -> Optional[Dict[str, Any]]:
+        """
+        Раскладывает элемент листинга: папку - в очередь и карту папок (возвращает None),
+        файл - в запись формата gdrive_mirror (None, если файл не скачивается).
+        """
+        file_path = os.path.join(parent_path, file.get("name"))
+        if file.get('mimeType') == self.FOLDER_MIME_TYPE:
+            folders_to_visit.append((file['id'], file_path))
+            self.folders[file['id']] = {"name": file.get("name"), "parent": parent_id}
+            return None
+        return self._build_file_record(file, file_path)
+
+    def get_metadata_from_gdrive(
+        self,
+        folder_id: str,
+        max_workers: int = 1,
+        folders_per_query: int = 1
+    ) -> Optional[Dict[str, Dict[str, Any]]]:
         """
         Рекурсивно получает метаданные всех файлов из указанной папки.
 
         Args:
             folder_id (str): ID корневой папки для сканирования.
+            max_workers (int): Число параллельных запросов к Drive API.
+                               1 - последовательный обход.
+            folders_per_query (int): Сколько соседних папок объединять в один запрос.
 
         Returns:
             Словарь, где ключ - это gdrive_id, а значение - словарь с метаданными файла.
@@ -73,48 +259,314 @@ class GDriveScanner:
             print("Ошибка: сервис Google Drive не инициализирован.")
             return None
 
-        all_files = {}
-        folders_to_visit = [(folder_id, "")]
-        
-        print("Сканирование Google Drive...")
         try:
-            with tqdm(total=len(folders_to_visit), desc="Анализ папок") as pbar:
-                while folders_to_visit:
-                    current_folder_id, current_path = folders_to_visit.pop(0)
-                    
-                    page_token = None
-                    while True:
-                        response = self.service.files().list(
-                            q=f"'{current_folder_id}' in parents and trashed=false",
-                            fields="nextPageToken, files(id, name, mimeType, md5Checksum, version, webViewLink, createdTime, modifiedTime, size)",
-                            pageToken=page_token
-                        ).execute()
-                        
-                        for file in response.get('files', []):
-                            file_path = os.path.join(current_path, file.get("name"))
-                            if file.get('mimeType') == 'application/vnd.google-apps.folder':
-                                folders_to_visit.append((file['id'], file_path))
-                                pbar.total += 1
-                            else:
-                                all_files[file.get("id")] = {
-                                    "gdrive_id": file.get("id"),
-                                    "name": file.get("name"),
-                                    "path": file_path,
-                                    "md5_checksum": file.get("md5Checksum"),
-                                    "version": file.get("version"),
-                                    "mime_type": file.get("mimeType"),
-                                    "web_view_link": file.get("webViewLink"),
-                                    "gdrive_created_time": file.get("createdTime"),
-                                    "gdrive_modified_time": file.get("modifiedTime"),
-                                    "size_bytes": int(file.get("size", 0))
-                                }
-                        
-                        page_token = response.get('nextPageToken')
-                        if not page_token:
-                            break
-                    pbar.update(1)
+            return {record["gdrive_id"]: record for record in self.iter_metadata_from_gdrive(folder_id, max_workers, folders_per_query)}
         except HttpError as error:
             print(f"Произошла ошибка при доступе к Google Drive API: {error}")
             return None
-        
-        return all_files
\ No newline at end of file
+
+    def iter_metadata_from_gdrive(
+        self,
+        folder_id: str,
+        max_workers: int = 1,
+        folders_per_query: int = 1
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Потоковый вариант get_metadata_from_gdrive: отдает записи файлов по мере
+        обхода, чтобы следующие стадии могли начать работу до конца сканирования.
+        Ошибки Drive API (HttpError) пробрасываются вызывающему.
+        """
+        self.root_folder_id = folder_id
+        self.folders = {}
+        print("Сканирование Google Drive...")
+        yield from self._iter_walk(folder_id, "", max(1, max_workers), max(1, folders_per_query))
+
+    def _walk(self, folder_id: str, root_path: str, max_workers: int, folders_per_query: int) -> Dict[str, Dict[str, Any]]:
+        """Обходит поддерево папки и возвращает {gdrive_id: запись}."""
+        return {record["gdrive_id"]: record for record in self._iter_walk(folder_id, root_path, max_workers, folders_per_query)}
+
+    def _iter_walk(self, folder_id: str, root_path: str, max_workers: int, folders_per_query: int) -> Iterator[Dict[str, Any]]:
+        """Обходит поддерево папки последовательно или параллельно (см. _iter_walk_parallel)."""
+        if max_workers > 1 or folders_per_query > 1:
+            yield from self._iter_walk_parallel(folder_id, root_path, max_workers, folders_per_query)
+            return
+
+        folders_to_visit = deque([(folder_id, root_path)])
+
+        with tqdm(total=len(folders_to_visit), desc="Анализ папок") as pbar:
+            while folders_to_visit:
+                current_folder = folders_to_visit.popleft()
+
+                for file, parent_id, parent_path in self._list_folders(self.service, [current_folder]):
+                    record = self._handle_listed_item(file, parent_id, parent_path, folders_to_visit)
+                    if record is None:
+                        pbar.total += 1
+                    else:
+                        yield record
+                pbar.update(1)
+
+    def _iter_walk_parallel(self, folder_id: str, root_path: str, max_workers: int, folders_per_query: int) -> Iterator[Dict[str, Any]]:
+        """
+        Параллельный обход дерева: очередь папок разбирается пулом потоков.
+        Результаты обрабатываются только в потоке-потребителе, поэтому очередь
+        и карта папок не требуют блокировок.
+        """
+        folders_to_visit = deque([(folder_id, root_path)])
+        in_flight = {}
+
+        def list_batch(batch):
+            return self._list_folders(self.get_thread_service(), batch)
+
+        print(f"  (потоков: {max_workers}, папок в запросе: {folders_per_query})")
+        with tqdm(total=len(folders_to_visit), desc="Анализ папок") as pbar, \
+                ThreadPoolExecutor(max_workers=max_workers) as executor:
+            while folders_to_visit or in_flight:
+                while folders_to_visit and len(in_flight) < max_workers:
+                    batch = [folders_to_visit.popleft() for _ in range(min(folders_per_query, len(folders_to_visit)))]
+                    in_flight[executor.submit(list_batch, batch)] = len(batch)
+
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    batch_len = in_flight.pop(future)
+                    for file, parent_id, parent_path in future.result():
+                        record = self._handle_listed_item(file, parent_id, parent_path, folders_to_visit)
+                        if record is None:
+                            pbar.total += 1
+                        else:
+                            yield record
+                    pbar.update(batch_len)
+
+    # --- Инкрементальный режим (Changes API) ---
+
+    def load_state(self) -> Optional[Dict[str, Any]]:
+        """Читает сохраненное состояние инкрементального сканирования (или None)."""
+        state_file = self.state_file
+        if not os.path.exists(state_file) or os.path.getsize(state_file) == 0:
+            return None
+        try:
+            with open(state_file, "r") as f:
+                state = json.load(f)
+        except (json.JSONDecodeError, OSError):
+            return None
+        self.root_folder_id = state.get("root_folder_id")
+        self.folders = state.get("folders", {})
+        return state
+
+    def save_state(self, start_page_token: str, full_scan_time: Optional[float] = None):
+        """
+        Атомарно сохраняет token и карту папок. Время последнего полного
+        сканирования переносится из предыдущего состояния, если не задано.
+        """
+        state_file = self.state_file
+        if full_scan_time is None:
+            previous = {}
+            if os.path.exists(state_file):
+                try:
+                    with open(state_file, "r") as f:
+                        previous = json.load(f)
+                except (json.JSONDecodeError, OSError):
+                    previous = {}
+            full_scan_time = previous.get("last_full_scan", 0)
+
+        state = {
+            "root_folder_id": self.root_folder_id,
+            "start_page_token": start_page_token,
+            "last_full_scan": full_scan_time,
+            "folders": self.folders,
+        }
+        if os.path.dirname(state_file):
+            os.makedirs(os.path.dirname(state_file), exist_ok=True)
+        tmp_file = f"{state_file}.tmp"
+        with open(tmp_file, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_file, state_file)
+
+    def begin_full_scan(self) -> Optional[str]:
+        """
+        Запрашивает текущий start page token перед полным сканированием, чтобы
+        изменения, сделанные во время обхода, попали в следующий инкрементальный
+        запуск. Token сохраняется только вызовом commit_state().
+        """
+        try:
+            token = self._execute(self.service.changes().getStartPageToken(), "changes.getStartPageToken").get("startPageToken")
+        except HttpError as error:
+            print(f"Произошла ошибка при получении startPageToken: {error}")
+            return None
+        self._pending_start_page_token = token
+        self._pending_full_scan_time = time.time()
+        return token
+
+    def is_full_scan_due(self, folder_id: str, max_age_hours: float) -> bool:
+        """
+        Проверяет, нужен ли полный пересчет: нет состояния, сменилась корневая
+        папка или с последнего полного сканирования прошло больше max_age_hours.
+        """
+        state = self.load_state()
+        if not state or not state.get("start_page_token"):
+            return True
+        if state.get("root_folder_id") != folder_id:
+            return True
+        return time.time() - state.get("last_full_scan", 0) > max_age_hours * 3600
+
+    def _resolve_folder_path(self, folder_id: str, cache: Dict[str, Optional[str]]) -> Optional[str]:
+        """
+        Восстанавливает путь папки относительно корня по карте папок.
+        Возвращает None, если папка лежит вне отслеживаемого дерева.
+        """
+        chain = []
+        current = folder_id
+        while current not in cache:
+            if current == self.root_folder_id:
+                cache[current] = ""
+                break
+            info = self.folders.get(current)
+            if info is None or len(chain) > len(self.folders):
+                cache[current] = None
+                break
+            chain.append(current)
+            current = info["parent"]
+
+        path = cache[current]
+        for child_id in reversed(chain):
+            path = None if path is None else os.path.join(path, self.folders[child_id]["name"])
+            cache[child_id] = path
+        return cache[folder_id]
+
+    def _path_in_tree(self, file: Dict[str, Any], cache: Dict[str, Optional[str]]) -> Tuple[Optional[str], Optional[str]]:
+        """Возвращает (id родителя, путь файла) или (None, None), если файл вне дерева."""
+        for parent_id in file.get("parents", []):
+            parent_path = self._resolve_folder_path(parent_id, cache)
+            if parent_path is not None:
+                return parent_id, os.path.join(parent_path, file.get("name"))
+        return None, None
+
+    def get_changes_from_gdrive(self) -> Optional[Dict[str, Any]]:
+        """
+        Получает изменения с момента последнего запуска через Changes API.
+
+        Returns:
+            Словарь с ключами:
+            - files: {gdrive_id: запись} - измененные/новые файлы внутри дерева;
+            - removed: множество gdrive_id, которые удалены, в корзине или вынесены из дерева;
+            - folder_moves: {старый путь папки: новый путь или None} - переименованные,
+              перемещенные или удаленные папки, чьи вложенные файлы нужно переложить.
+            None, если состояния нет или token недействителен - тогда нужен полный пересчет.
+            Новый token сохраняется только вызовом commit_state().
+        """
+        if not self.service:
+            print("Ошибка: сервис Google Drive не инициализирован.")
+            return None
+        state = self.load_state()
+        if not state or not state.get("start_page_token"):
+            return None
+
+        # Последнее изменение по каждому id отражает его итоговое состояние
+        latest: Dict[str, Dict[str, Any]] = {}
+        page_token = state["start_page_token"]
+        try:
+            while page_token:
+                response = self._execute(self.service.changes().list(
+                    pageToken=page_token,
+                    fields=self.CHANGES_FIELDS,
+                    pageSize=self.PAGE_SIZE,
+                    includeRemoved=True,
+                    spaces="drive"
+                ), "changes.list")
+                for change in response.get("changes", []):
+                    latest[change["fileId"]] = change
+                if response.get("newStartPageToken"):
+                    self._pending_start_page_token = response["newStartPageToken"]
+                page_token = response.get("nextPageToken")
+        except HttpError as error:
+            print(f"Не удалось получить изменения (token мог устареть): {error}")
+            return None
+
+        old_cache: Dict[str, Optional[str]] = {}
+        folder_changes = {
+            file_id: change for file_id, change in latest.items()
+            if file_id in self.folders
+            or (change.get("file") or {}).get("mimeType") == self.FOLDER_MIME_TYPE
+        }
+        old_folder_paths = {file_id: self._resolve_folder_path(file_id, old_cache) for file_id in folder_changes}
+
+        # 1. Обновляем карту папок итоговым состоянием
+        for file_id, change in folder_changes.items():
+            file = change.get("file") or {}
+            if change.get("removed") or file.get("trashed") or not file.get("parents"):
+                self.folders.pop(file_id, None)
+            else:
+                self.folders[file_id] = {"name": file.get("name"), "parent": file["parents"][0]}
+
+        new_cache: Dict[str, Optional[str]] = {}
+        folder_moves: Dict[str, Optional[str]] = {}
+        files: Dict[str, Dict[str, Any]] = {}
+        new_folders = []
+        for file_id in folder_changes:
+            old_path = old_folder_paths[file_id]
+            new_path = self._resolve_folder_path(file_id, new_cache) if file_id in self.folders else None
+            if old_path is None and new_path is not None:
+                new_folders.append((file_id, new_path))
+            elif old_path is not None and old_path != new_path:
+                folder_moves[old_path] = new_path
+            if new_path is None:
+                self.folders.pop(file_id, None)
+
+        # 2. Папки, впервые попавшие в дерево, сканируем целиком: Changes API
+        #    не сообщает о содержимом папки, перенесенной извне.
+        new_folders.sort(key=lambda item: item[1].count(os.sep))
+        scanned_prefixes = []
+        try:
+            for folder_id, folder_path in new_folders:
+                if any(folder_path.startswith(prefix + os.sep) for prefix in scanned_prefixes):
+                    continue
+                scanned_prefixes.append(folder_path)
+                files.update(self._walk(folder_id, folder_path, 1, 1))
+        except HttpError as error:
+            print(f"Ошибка при сканировании новой папки: {error}")
+            return None
+
+        # 3. Файлы: итоговое состояние внутри дерева или удаление
+        removed = set()
+        for file_id, change in latest.items():
+            if file_id in folder_changes:
+                continue
+            file = change.get("file") or {}
+            if change.get("removed") or file.get("trashed"):
+                removed.add(file_id)
+                continue
+            _, file_path = self._path_in_tree(file, new_cache)
+            record = self._build_file_record(file, file_path) if file_path is not None else None
+            if record is None:
+                removed.add(file_id)
+            else:
+                files[file_id] = record
+
+        return {"files": files, "removed": removed, "folder_moves": folder_moves}
+
+    def commit_state(self):
+        """
+        Сохраняет новый token и карту папок после успешного применения плана.
+        До этого момента повторный запуск получит те же изменения заново.
+        """
+        if self._pending_start_page_token:
+            self.save_state(self._pending_start_page_token, self._pending_full_scan_time)
+            self._pending_start_page_token = None
+            self._pending_full_scan_time = None
+
+    def pending_state(self) -> Optional[Dict[str, Any]]:
+        """Состояние, которое сохранит commit_state() (для журнала плана), или None."""
+        if not self._pending_start_page_token:
+            return None
+        return {
+            "start_page_token": self._pending_start_page_token,
+            "full_scan_time": self._pending_full_scan_time,
+            "root_folder_id": self.root_folder_id,
+            "folders": self.folders,
+        }
+
+    def restore_pending_state(self, state: Dict[str, Any]):
+        """Восстанавливает состояние из pending_state() при продолжении плана после перезапуска."""
+        self._pending_start_page_token = state["start_page_token"]
+        self._pending_full_scan_time = state.get("full_scan_time")
+        self.root_folder_id = state.get("root_folder_id")
+        self.folders = state.get("folders", {})
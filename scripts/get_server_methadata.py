@@ -3,9 +3,33 @@
 # Описание:
 # Этот модуль сканирует локальную директорию на сервере и собирает
 # сокращенный набор метаданных о файлах для контрольной сверки.
+#
+# Есть два сканера с одинаковым форматом результата:
+# - get_metadata_from_server: простой последовательный обход через os.walk;
+# - get_metadata_from_server_fast: os.scandir, параллельный обход директорий
+#   пулом потоков и постоянный кэш листингов по mtime директорий.
+#
+# Временные файлы скачиваний (<файл>.partial встроенного скачивания и
+# <файл>.<хэш>.partial rclone) в результат не попадают: иначе этап B удалил
+# бы их как лишние и встроенное скачивание не смогло бы докачать файл.
 
 import os
-from typing import Dict, Any
+import json
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, Any, Optional, Tuple
+
+import metrics
+
+# Суффикс временных файлов незавершенных скачиваний
+PARTIAL_SUFFIX = ".partial"
+
+
+def is_partial_download(name: str) -> bool:
+    """Временный файл незавершенного скачивания (встроенного или rclone)."""
+    return name.endswith(PARTIAL_SUFFIX)
+
 
 def get_metadata_from_server(local_path: str) -> Dict[str, Dict[str, Any]]:
     """
@@ -22,6 +46,8 @@ def get_metadata_from_server(local_path: str) -> Dict[str, Dict[str, Any]]:
     print(f"Сканирование локальной директории: {local_path}...")
     for root, _, files in os.walk(local_path):
         for name in files:
+            if is_partial_download(name):
+                continue
             full_path = os.path.join(root, name)
             relative_path = os.path.relpath(full_path, local_path)
             
@@ -35,5 +61,141 @@ def get_metadata_from_server(local_path: str) -> Dict[str, Dict[str, Any]]:
             except FileNotFoundError:
                 # Файл мог быть удален во время сканирования, пропускаем
                 continue
+    metrics.set_gauge("server_scan_files", len(server_files))
     print(f"✅ Найдено {len(server_files)} файлов на сервере.")
-    return server_files
\ No newline at end of file
+    return server_files
+
+
+def _load_scan_cache(cache_path: Optional[str], max_age_hours: float) -> Tuple[Dict[str, Any], float]:
+    """
+    Читает кэш листингов. Кэш старше max_age_hours (с момента полного
+    сканирования без кэша) игнорируется.
+
+    Returns:
+        (листинги директорий, время полного сканирования, к которому относится кэш).
+    """
+    if not cache_path or not os.path.exists(cache_path):
+        return {}, time.time()
+    try:
+        with open(cache_path, "r") as f:
+            cache = json.load(f)
+    except (json.JSONDecodeError, OSError):
+        return {}, time.time()
+    created_at = cache.get("created_at", 0)
+    if time.time() - created_at > max_age_hours * 3600:
+        return {}, time.time()
+    return cache.get("dirs", {}), created_at
+
+
+def _save_scan_cache(cache_path: str, dirs: Dict[str, Any], created_at: float):
+    if os.path.dirname(cache_path):
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    tmp_path = f"{cache_path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"created_at": created_at, "dirs": dirs}, f)
+    os.replace(tmp_path, cache_path)
+
+
+def _scan_directory(local_path: str, relative_dir: str, cached: Optional[Dict[str, Any]]) -> Tuple[Optional[Dict[str, Any]], bool]:
+    """
+    Читает одну директорию. Если ее mtime не изменился с прошлого запуска,
+    листинг и stat файлов берутся из кэша.
+
+    Returns:
+        (запись кэша {"mtime_ns", "files": {имя: [размер, mtime]}, "dirs": [имена]}
+         или None, если директория исчезла; был ли использован кэш).
+    """
+    full_dir = os.path.join(local_path, relative_dir)
+    try:
+        dir_mtime_ns = os.stat(full_dir).st_mtime_ns
+    except FileNotFoundError:
+        return None, False
+    if cached and cached.get("mtime_ns") == dir_mtime_ns:
+        return cached, True
+
+    entry_data = {"mtime_ns": dir_mtime_ns, "files": {}, "dirs": []}
+    try:
+        with os.scandir(full_dir) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        entry_data["dirs"].append(entry.name)
+                    elif entry.is_file(follow_symlinks=False):
+                        stat = entry.stat(follow_symlinks=False)
+                        entry_data["files"][entry.name] = [stat.st_size, stat.st_mtime]
+                except FileNotFoundError:
+                    # Файл мог быть удален во время сканирования, пропускаем
+                    continue
+    except FileNotFoundError:
+        return None, False
+    return entry_data, False
+
+
+def get_metadata_from_server_fast(
+    local_path: str,
+    max_workers: int = 8,
+    cache_path: Optional[str] = None,
+    cache_max_age_hours: float = 24
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Быстрый аналог get_metadata_from_server с тем же форматом результата.
+
+    Директории обходятся пулом потоков через os.scandir. Если задан cache_path,
+    листинги директорий сохраняются между запусками: директория, чей mtime не
+    изменился, не перечитывается и ее файлы не stat-ятся повторно (на каждую
+    директорию остается один stat). mtime директории меняется при создании,
+    удалении и переименовании файлов в ней, но не при перезаписи файла "на месте" -
+    такие изменения найдет следующий полный проход: кэш старше
+    cache_max_age_hours отбрасывается.
+
+    Args:
+        local_path: Абсолютный путь к корневой директории для сканирования.
+        max_workers: Число потоков.
+        cache_path: Путь к JSON-файлу кэша (None - без кэша).
+        cache_max_age_hours: Максимальный возраст кэша в часах.
+
+    Returns:
+        Словарь, где ключ - это относительный путь файла, а значение -
+        словарь с его метаданными (размер, время модификации).
+    """
+    print(f"Сканирование локальной директории: {local_path} (потоков: {max_workers})...")
+    old_cache, cache_created_at = _load_scan_cache(cache_path, cache_max_age_hours)
+    new_cache: Dict[str, Any] = {}
+    server_files = {}
+    cache_hits = 0
+
+    dirs_to_visit = deque([""])
+    in_flight = {}
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        while dirs_to_visit or in_flight:
+            while dirs_to_visit and len(in_flight) < max_workers * 2:
+                relative_dir = dirs_to_visit.popleft()
+                future = executor.submit(_scan_directory, local_path, relative_dir, old_cache.get(relative_dir))
+                in_flight[future] = relative_dir
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                relative_dir = in_flight.pop(future)
+                entry_data, from_cache = future.result()
+                if entry_data is None:
+                    continue
+                cache_hits += from_cache
+                new_cache[relative_dir] = entry_data
+                for name, (size, mtime) in entry_data["files"].items():
+                    if is_partial_download(name):
+                        continue
+                    relative_path = os.path.join(relative_dir, name)
+                    server_files[relative_path] = {
+                        'path': relative_path,
+                        'size_bytes': size,
+                        'modified_time': mtime # timestamp
+                    }
+                dirs_to_visit.extend(os.path.join(relative_dir, name) for name in entry_data["dirs"])
+
+    if cache_path:
+        _save_scan_cache(cache_path, new_cache, cache_created_at)
+    metrics.inc("server_scan_dirs", cache_hits, source="cache")
+    metrics.inc("server_scan_dirs", len(new_cache) - cache_hits, source="disk")
+    metrics.set_gauge("server_scan_files", len(server_files))
+    print(f"✅ Найдено {len(server_files)} файлов на сервере (директорий: {len(new_cache)}, из кэша: {cache_hits}).")
+    return server_files
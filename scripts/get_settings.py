@@ -0,0 +1,39 @@
+# Файл: scripts/get_settings.py
+#
+# Описание:
+# Этот модуль читает основные настройки проекта из config/settings.yml.
+# Путь можно переопределить переменной окружения SETTINGS_PATH
+# (в Docker файл монтируется в /app/config/settings.yml).
+
+import os
+from typing import Dict, Any, Optional
+
+import yaml
+
+DEFAULT_SETTINGS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "config", "settings.yml")
+
+_settings_cache: Optional[Dict[str, Any]] = None
+
+
+def get_settings(reload: bool = False) -> Dict[str, Any]:
+    """
+    Возвращает настройки из settings.yml (с кэшированием).
+    Если файл не найден, возвращает пустой словарь - модули используют свои значения по умолчанию.
+    """
+    global _settings_cache
+    if _settings_cache is not None and not reload:
+        return _settings_cache
+
+    settings_path = os.getenv("SETTINGS_PATH", DEFAULT_SETTINGS_PATH)
+    try:
+        with open(settings_path, "r", encoding="utf-8") as f:
+            _settings_cache = yaml.safe_load(f) or {}
+    except FileNotFoundError:
+        print(f"⚠️ Файл настроек {settings_path} не найден, используются значения по умолчанию.")
+        _settings_cache = {}
+    return _settings_cache
+
+
+def get_setting(section: str, key: str, default: Any = None) -> Any:
+    """Возвращает значение settings[section][key] или default."""
+    return (get_settings().get(section) or {}).get(key, default)
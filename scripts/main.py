@@ -3,93 +3,391 @@
 # Описание:
 # Главный скрипт-оркестратор. Запускает все этапы процесса синхронизации
 # в соответствии с утвержденным планом.
+#
+# Клиенты (Drive, Supabase со снимком gdrive_mirror, Qdrant) собраны в
+# SyncSession: при разовом запуске она живет один прогон, в режиме демона
+# (sync_daemon.py) - весь процесс, и прогоны не платят за холодный старт.
 
 import os
+import time
+import threading
+from typing import Dict, List, Optional
 from dotenv import load_dotenv
 
 # Импортируем наши собственные модули
+import metrics
 from get_gdrive_methadata import GDriveScanner
-from db_client import SupabaseClient
+from rate_governor import RateGovernor
+from gdrive_downloader import GDriveDownloader
+from export_cache import ExportCache
+from mirror_snapshot import MirrorSnapshot
+from source_providers import GDriveProvider, SourceProvider, get_local_providers
+from sync_journal import (SyncJournal, failed_actions, load_failed_actions, remove_partial_files,
+                          requeue_failed_actions, save_failed_actions)
+from get_settings import get_settings, get_setting
 import get_file_lists
 import clone_files
 import get_server_methadata # Импортируем новый сканер
+import verify_local_files
+from verify_local_files import HashCache
+from sync_pipeline import SyncPipeline
+from vector_index import create_vector_indexer
+
+
+class SyncSession:
+    """
+    Настройки из .env и клиенты синхронизации, которые переживают прогон:
+    аутентифицированный GDriveScanner с регулятором темпа, провайдеры,
+    клиент gdrive_mirror со снимком и индексатор Qdrant.
+
+    verify_interval_hours - как часто выполнять этап B, если этап A ничего
+    не изменил (None - в каждом прогоне). stop_event - запрос остановки:
+    прогон завершает текущую стадию и не начинает следующие.
+    """
+
+    def __init__(self, verify_interval_hours: Optional[float] = None):
+        self.gdrive_folder_id = os.getenv("GOOGLE_DRIVE_FOLDER_ID")
+        self.local_sync_path = os.getenv("LOCAL_SYNC_PATH") # Путь к /documents
+        self.state_dir = os.getenv("SYNC_STATE_DIR", "state") # Файлы состояния между запусками
+        self.use_pipeline = os.getenv("SYNC_PIPELINE", "false").lower() == "true"
+        # Журнал плана этапа A: прерванный прогон продолжается с места остановки
+        self.use_journal = os.getenv("SYNC_JOURNAL", "true").lower() == "true"
+        self.journal_max_age_hours = float(os.getenv("SYNC_JOURNAL_MAX_AGE_HOURS", "12"))
+        self.journal_fsync_every = int(os.getenv("SYNC_JOURNAL_FSYNC_EVERY", "100"))
+        self.verify_interval_hours = verify_interval_hours
+        self.stop_event = threading.Event()
+        self.connected = False
+        self.drive_governor: Optional[RateGovernor] = None
+        self.providers = []
+        self.db_client = None
+        self.vector_indexer = None
+        # Итоги последнего прогона: сколько изменений применил этап A, когда был этап B
+        self.applied = 0
+        self.last_verify_time: Optional[float] = None
+
+    def stopping(self) -> bool:
+        return self.stop_event.is_set()
+
+    def connect(self) -> bool:
+        """Аутентификация и создание клиентов (один раз на сессию)."""
+        if self.connected:
+            return True
+        if not self.gdrive_folder_id or not self.local_sync_path:
+            print("❌ Ошибка: Переменные GOOGLE_DRIVE_FOLDER_ID и LOCAL_SYNC_PATH должны быть заданы.")
+            return False
+
+        # Общий регулятор темпа для сканирования, скачивания и rclone
+        self.drive_governor = RateGovernor(
+            rate=float(os.getenv("DRIVE_RATE_LIMIT", str(RateGovernor.DEFAULT_RATE))),
+            max_concurrency=int(os.getenv("DRIVE_MAX_CONCURRENCY", str(RateGovernor.DEFAULT_MAX_CONCURRENCY))),
+            max_retries=int(os.getenv("DRIVE_MAX_RETRIES", str(RateGovernor.DEFAULT_MAX_RETRIES)))
+        )
+        gdrive_scanner = GDriveScanner(
+            state_file=os.path.join(self.state_dir, "gdrive_state.json"),
+            export_formats=get_setting("sync", "google_export"),
+            governor=self.drive_governor
+        )
+        if not gdrive_scanner.service: return False
+        # Встроенное скачивание через API вместо процесса rclone на каждый файл
+        gdrive_downloader = None
+        if os.getenv("GDRIVE_DOWNLOAD_BACKEND", "rclone").lower() == "native":
+            gdrive_downloader = GDriveDownloader(
+                gdrive_scanner,
+                chunk_size=int(float(os.getenv("GDRIVE_DOWNLOAD_CHUNK_MB", "8")) * 1024 * 1024)
+            )
+
+        self.providers = [GDriveProvider(
+            gdrive_scanner,
+            self.gdrive_folder_id,
+            os.getenv("RCLONE_REMOTE_NAME"),
+            incremental=os.getenv("GDRIVE_INCREMENTAL", "true").lower() == "true",
+            full_scan_interval_hours=float(os.getenv("GDRIVE_FULL_SCAN_INTERVAL_HOURS", "24")),
+            max_workers=int(os.getenv("GDRIVE_SCAN_WORKERS", "8")),
+            folders_per_query=int(os.getenv("GDRIVE_SCAN_FOLDERS_PER_QUERY", "1")),
+            downloader=gdrive_downloader,
+            export_cache=ExportCache(
+                os.path.join(self.state_dir, "export_cache"),
+                max_size_mb=float(os.getenv("GDRIVE_EXPORT_CACHE_MAX_MB", "2048")),
+                max_age_days=float(os.getenv("GDRIVE_EXPORT_CACHE_MAX_AGE_DAYS", "30"))
+            ) if os.getenv("GDRIVE_EXPORT_CACHE", "true").lower() == "true" else None
+        )] + get_local_providers(get_settings())
+        print(f"  - Источники: {', '.join(provider.name for provider in self.providers)}")
+
+        # Используем клиент модуля clone_files: через него же идут записи исполнителей,
+        # поэтому локальный снимок gdrive_mirror обновляется сквозным образом.
+        self.db_client = clone_files.get_db_client()
+        if os.getenv("DB_SNAPSHOT", "true").lower() == "true" and self.db_client.snapshot is None:
+            self.db_client.attach_snapshot(MirrorSnapshot(os.path.join(self.state_dir, "gdrive_mirror.sqlite")))
+        # Поддержка индекса Qdrant по выполненному плану (нужны Qdrant и провайдер эмбеддингов)
+        if os.getenv("VECTOR_INDEX", "false").lower() == "true":
+            self.vector_indexer = create_vector_indexer(self.local_sync_path)
+        self.connected = True
+        return True
+
+    def failed_actions_path(self, provider: SourceProvider) -> str:
+        """Неудавшиеся действия провайдера, которые повторяются в следующем прогоне."""
+        return os.path.join(self.state_dir, "journal", f"{provider.name}.failed.json")
+
+    def open_journal(self, provider: SourceProvider) -> Optional[SyncJournal]:
+        if not self.use_journal:
+            return None
+        return SyncJournal(os.path.join(self.state_dir, "journal", f"{provider.name}.jsonl"),
+                           fsync_every=self.journal_fsync_every)
+
+    def verify_due(self, now: float) -> bool:
+        """Нужен ли этап B: всегда при разовом запуске, иначе - после изменений или по интервалу."""
+        if self.verify_interval_hours is None or self.applied or self.last_verify_time is None:
+            return True
+        return now - self.last_verify_time >= self.verify_interval_hours * 3600
+
+
+def load_journaled_plan(session: SyncSession, provider: SourceProvider,
+                        journal: SyncJournal) -> Optional[Dict[str, List]]:
+    """
+    Оставшаяся часть плана прерванного прогона из журнала или None, если
+    журнала нет или он устарел (тогда он удаляется и план строится заново).
+    """
+    if not journal.load():
+        return None
+    stale_reason = journal.stale_reason(session.local_sync_path, session.journal_max_age_hours)
+    if stale_reason:
+        removed = journal.discard()
+        print(f"  ⚠️ Журнал прерванного прогона устарел ({stale_reason}), строим план заново. "
+              f"Удалено временных файлов: {removed}.")
+        metrics.inc("sync_journal", event="stale", provider=provider.name)
+        return None
+    if journal.pending_state:
+        provider.restore_pending_state(journal.pending_state)
+    # Временные файлы rclone не докачиваются, а .partial встроенного скачивания - да
+    removed = remove_partial_files(session.local_sync_path, journal.download_paths(), keep_resumable=True)
+    print(f"  - Продолжаем план из журнала: выполнено {len(journal.done)} действий, "
+          f"доставлено без записи в БД {len(journal.fetched)} файлов, удалено временных файлов {removed}.")
+    metrics.inc("sync_journal", event="resumed", provider=provider.name)
+    return journal.remaining_plan()
+
+
+def run_stage_a(session: SyncSession) -> bool:
+    """Этап А: источники -> gdrive_mirror -> локальные файлы (+ индекс Qdrant)."""
+    # --- ЭТАП А: Синхронизация Источники (GDrive, NAS, ...) -> База -> Локальные Файлы ---
+    print("\n" + "="*20 + " ЭТАП А: Синхронизация с источниками " + "="*20)
 
-def main():
-    """Главная функция-оркестратор."""
-    print("🚀 Запуск процесса полной сверки и синхронизации...")
-    
-    load_dotenv()
-    GDRIVE_FOLDER_ID = os.getenv("GOOGLE_DRIVE_FOLDER_ID")
-    LOCAL_SYNC_PATH = os.getenv("LOCAL_SYNC_PATH") # Путь к /documents
-    if not GDRIVE_FOLDER_ID or not LOCAL_SYNC_PATH:
-        print("❌ Ошибка: Переменные GOOGLE_DRIVE_FOLDER_ID и LOCAL_SYNC_PATH должны быть заданы.")
-        return
-
-    # --- ЭТАП А: Синхронизация GDrive -> База -> Локальные Файлы ---
-    print("\n" + "="*20 + " ЭТАП А: Синхронизация с Google Drive " + "="*20)
-    
     # A.1. Сбор данных
-    print("\n[A.1] Сбор данных с GDrive и из БД...")
-    gdrive_scanner = GDriveScanner()
-    if not gdrive_scanner.service: return
-    
-    gdrive_metadata = gdrive_scanner.get_metadata_from_gdrive(GDRIVE_FOLDER_ID)
-    if gdrive_metadata is None: return
-    print(f"  - Найдено {len(gdrive_metadata)} файлов на Google Drive.")
-
-    db_client = SupabaseClient() # Клиент уже создан в модуле clone_files, но здесь он нужен для чтения
-    db_mirror_data = db_client.get_all_documents()
-    print(f"  - Получено {len(db_mirror_data)} записей из gdrive_mirror.")
-
-    # A.2. Планирование (GDrive vs База)
-    print("\n[A.2] Сравнение GDrive с базой данных...")
-    to_create, to_update, to_move, to_delete = get_file_lists.get_gdrive_vs_db_plan(gdrive_metadata, db_mirror_data)
-    print(f"  - План: Создать({len(to_create)}), Изменить({len(to_update)}), Переместить({len(to_move)}), Удалить({len(to_delete)})")
-
-    # A.3. Исполнение плана
-    print("\n[A.3] Выполнение плана синхронизации...")
-    clone_files.execute_create(to_create)
-    clone_files.execute_change(to_update)
-    clone_files.execute_move(to_move)
-    clone_files.execute_delete(to_delete)
-    
+    print("\n[A.1] Подключение к источникам и чтение БД...")
+    with metrics.stage("A.1"):
+        if not session.connect(): return False
+        db_client = session.db_client
+        db_mirror_data = db_client.get_all_documents()
+        if db_mirror_data is None: return False
+        print(f"  - Получено {len(db_mirror_data)} записей из gdrive_mirror.")
+
+    vector_indexer = session.vector_indexer
+    session.applied = 0
+    for provider in session.providers:
+        if session.stopping():
+            print("  ⚠️ Запрошена остановка, оставшиеся источники пропущены.")
+            return False
+        if session.use_pipeline:
+            # A.2 + A.3. Сканирование, скачивание и запись в БД идут одновременно
+            print(f"\n[A.2-A.3] Конвейерная синхронизация источника '{provider.name}'...")
+            provider_db_data = provider.filter_records(db_mirror_data)
+            with metrics.stage("A.2-A.3", provider=provider.name):
+                pipeline = SyncPipeline(
+                    provider,
+                    db_client,
+                    download_workers=int(os.getenv("PIPELINE_DOWNLOAD_WORKERS", "8")),
+                    db_writers=int(os.getenv("PIPELINE_DB_WRITERS", "1")),
+                    queue_size=int(os.getenv("PIPELINE_QUEUE_SIZE", "1000")),
+                    failed_actions_path=session.failed_actions_path(provider)
+                )
+                pipeline.run(provider_db_data)
+            synced, moved, deleted = pipeline.applied["synced"], pipeline.applied["moved"], pipeline.applied["deleted"]
+        else:
+            # A.2. Планирование (Источник vs База) - только по записям этого источника
+            print(f"\n[A.2] Сравнение источника '{provider.name}' с базой данных...")
+            provider_db_data = provider.filter_records(db_mirror_data)
+            journal = session.open_journal(provider)
+            with metrics.stage("A.2", provider=provider.name) as stage:
+                plan = load_journaled_plan(session, provider, journal) if journal is not None else None
+                if plan is not None:
+                    stage["labels"]["source"] = "journal"
+                else:
+                    source_plan = provider.get_plan(provider_db_data)
+                    if source_plan is None:
+                        stage["status"] = "failed"
+                    else:
+                        to_create, to_update, to_move, to_delete = source_plan
+                        # Переименование папки не должно превращаться в тысячи перемещений файлов
+                        dir_moves, to_move = get_file_lists.collapse_directory_moves(to_move, provider_db_data)
+                        plan = {"to_create": to_create, "to_update": to_update, "dir_moves": dir_moves,
+                                "to_move": to_move, "to_delete": to_delete}
+                        # Changes API не вернет то, что не удалось в прошлый раз; полное сканирование найдет само
+                        if not provider.last_plan_full:
+                            requeued = requeue_failed_actions(
+                                plan, load_failed_actions(session.failed_actions_path(provider)), provider_db_data)
+                            if requeued:
+                                print(f"  - Повтор неудавшихся действий прошлого прогона: {requeued}.")
+                        if journal is not None and any(plan.values()):
+                            journal.begin(plan, session.local_sync_path, provider.pending_state())
+                            metrics.inc("sync_journal", event="started", provider=provider.name)
+            if plan is None:
+                print(f"  ❌ Не удалось получить данные источника '{provider.name}', пропускаем.")
+                continue
+            print(f"  - План: Создать({len(plan['to_create'])}), Изменить({len(plan['to_update'])}), "
+                  f"Переместить({len(plan['to_move'])} файлов, {len(plan['dir_moves'])} папок), "
+                  f"Удалить({len(plan['to_delete'])})")
+
+            # A.3. Исполнение плана (с отметками в журнале)
+            if not any(plan.values()):
+                print(f"\n[A.3] План '{provider.name}' пуст, исполнение пропущено.")
+                metrics.inc("stages_skipped", stage="A.3")
+                synced, moved, deleted = [], [], []
+            else:
+                print(f"\n[A.3] Выполнение плана синхронизации '{provider.name}'...")
+                try:
+                    with metrics.stage("A.3", provider=provider.name):
+                        synced = clone_files.execute_create(plan["to_create"], provider, journal)
+                        synced += clone_files.execute_change(plan["to_update"], provider, journal)
+                        moved = clone_files.execute_directory_move(plan["dir_moves"], journal)
+                        moved += clone_files.execute_move(plan["to_move"], journal)
+                        deleted = clone_files.execute_delete(plan["to_delete"], journal, provider)
+                finally:
+                    if journal is not None:
+                        journal.close()
+            executed_plan = plan
+            if journal is not None and journal.header is not None:
+                # Для A.4 - все выполненные действия плана, в том числе до перезапуска
+                executed_plan = journal.header["plan"]
+                synced, moved, deleted = journal.completed()
+            # Неудавшиеся действия сохраняются до token: иначе они потеряются до полного сканирования
+            failed_count = save_failed_actions(session.failed_actions_path(provider),
+                                               failed_actions(executed_plan, synced, moved, deleted))
+            if failed_count:
+                print(f"  ⚠️ Не выполнено действий: {failed_count}, они будут повторены в следующем прогоне.")
+                metrics.inc("sync_failed_actions", failed_count, provider=provider.name)
+            provider.commit()
+            if journal is not None:
+                journal.finish()
+        session.applied += len(synced) + len(moved) + len(deleted)
+
+        # A.4. Векторный индекс: только то, что затронул план
+        if vector_indexer and (synced or moved or deleted):
+            print(f"\n[A.4] Обновление векторного индекса для '{provider.name}'...")
+            with metrics.stage("A.4", provider=provider.name):
+                vector_indexer.apply(synced, moved, deleted, provider_db_data)
+
+    session.drive_governor.print_report()
+    if vector_indexer:
+        vector_indexer.print_report()
     print("\n✅ ЭТАП А завершен.")
+    return True
 
 
+def run_stage_b(session: SyncSession) -> bool:
+    """Этап B: контрольная сверка диска с gdrive_mirror и самоисцеление."""
+    local_sync_path = session.local_sync_path
+    state_dir = session.state_dir
+    db_client = session.db_client
+
     # --- ЭТАП B: Контрольная проверка сервера ---
     print("\n" + "="*20 + " ЭТАП B: Контрольная проверка сервера " + "="*20)
 
     # B.1. Сбор данных
     print("\n[B.1] Сбор данных с сервера и из БД...")
-    server_metadata = get_server_methadata.get_metadata_from_server(LOCAL_SYNC_PATH)
-    db_mirror_data_updated = db_client.get_all_documents() # Перечитываем базу, она изменилась
+    with metrics.stage("B.1"):
+        server_metadata = get_server_methadata.get_metadata_from_server_fast(
+            local_sync_path,
+            max_workers=int(os.getenv("SERVER_SCAN_WORKERS", "8")),
+            cache_path=os.path.join(state_dir, "server_scan_cache.json") if os.getenv("SERVER_SCAN_CACHE", "true").lower() == "true" else None,
+            cache_max_age_hours=float(os.getenv("SERVER_SCAN_CACHE_MAX_AGE_HOURS", "24"))
+        )
+        db_mirror_data_updated = db_client.get_all_documents() # Перечитываем базу (из снимка, сверенного с Supabase)
+    if db_mirror_data_updated is None: return False
     print(f"  - Получено {len(db_mirror_data_updated)} актуальных записей из gdrive_mirror.")
-    
+
     # B.2. Планирование (Сервер vs База)
     print("\n[B.2] Сравнение сервера с базой данных...")
-    to_refetch, to_delete_local = get_file_lists.get_server_vs_db_plan(server_metadata, db_mirror_data_updated)
+    with metrics.stage("B.2"):
+        to_refetch, to_delete_local = get_file_lists.get_server_vs_db_plan(server_metadata, db_mirror_data_updated)
+
+        # Необязательная проверка содержимого по MD5 (постепенно, в пределах бюджета)
+        if os.getenv("VERIFY_CONTENT", "false").lower() == "true":
+            hash_cache = HashCache(os.path.join(state_dir, "hash_cache.sqlite"))
+            to_refetch.extend(verify_local_files.find_corrupted_files(
+                local_sync_path,
+                server_metadata,
+                db_mirror_data_updated,
+                hash_cache,
+                max_files=int(os.getenv("VERIFY_MAX_FILES", "0")),
+                max_mb=float(os.getenv("VERIFY_MAX_MB", "0")),
+                mb_per_second=float(os.getenv("VERIFY_MB_PER_SECOND", "0")),
+                max_workers=int(os.getenv("VERIFY_WORKERS", "4"))
+            ))
+            hash_cache.close()
     print(f"  - План проверки: Перекачать({len(to_refetch)}), Удалить локально({len(to_delete_local)})")
-    
-    # B.3. Исполнение плана "самоисцеления"
-    # Для перезакачки мы можем переиспользовать нашу функцию execute_change,
-    # т.к. она делает то же самое - качает файл и обновляет запись в БД.
+
+    # B.3. Исполнение плана "самоисцеления": перекачка с проверкой MD5 и запись в БД
     print("\n[B.3] Выполнение плана самоисцеления...")
-    clone_files.execute_change(to_refetch)
-
-    # Удаляем "мусорные" файлы с диска
-    print(f"\n--- Удаление {len(to_delete_local)} 'мусорных' файлов с сервера ---")
-    for relative_path in to_delete_local:
-        full_path = os.path.join(LOCAL_SYNC_PATH, relative_path)
-        print(f"-> Удаление: {full_path}")
-        try:
-            os.remove(full_path)
-        except Exception as e:
-            print(f"  ❌ Ошибка при удалении {full_path}: {e}")
+    with metrics.stage("B.3"):
+        for provider in session.providers:
+            clone_files.execute_refetch([item for item in to_refetch if provider.owns(item['gdrive_id'])], provider)
+
+        # Удаляем "мусорные" файлы с диска
+        print(f"\n--- Удаление {len(to_delete_local)} 'мусорных' файлов с сервера ---")
+        for relative_path in to_delete_local:
+            full_path = os.path.join(local_sync_path, relative_path)
+            print(f"-> Удаление: {full_path}")
+            try:
+                os.remove(full_path)
+                metrics.inc("sync_actions", action="delete_local", status="ok")
+            except Exception as e:
+                metrics.inc("sync_actions", action="delete_local", status="failed")
+                print(f"  ❌ Ошибка при удалении {full_path}: {e}")
 
+    session.drive_governor.print_report()
     print("\n✅ ЭТАП B завершен.")
-    
+    return True
+
+
+def run_sync(session: Optional[SyncSession] = None, now: Optional[float] = None) -> bool:
+    """
+    Один прогон синхронизации (этапы A и B). Возвращает True, если он дошел до конца.
+    С session клиенты переиспользуются между прогонами, а этап B может быть
+    пропущен (см. SyncSession.verify_due).
+    """
+    session = session or SyncSession()
+    if not run_stage_a(session):
+        return False
+    if session.stopping():
+        print("  ⚠️ Запрошена остановка, этап B пропущен.")
+        return False
+    now = now or time.time()
+    if session.verify_due(now):
+        if not run_stage_b(session):
+            return False
+        session.last_verify_time = now
+    else:
+        print(f"\n[B] Этап A ничего не изменил, контрольная проверка пропущена "
+              f"(обязательна раз в {session.verify_interval_hours:g} ч).")
+        metrics.inc("stages_skipped", stage="B")
+
     print("\n✨✨✨ Процесс полной сверки и синхронизации завершен! ✨✨✨")
+    return True
+
+
+def main():
+    """Главная функция-оркестратор: прогон синхронизации и отчеты о нем."""
+    print("🚀 Запуск процесса полной сверки и синхронизации...")
+
+    load_dotenv()
+    metrics.configure()
+    result = False
+    try:
+        result = run_sync()
+    finally:
+        report_path = metrics.write_reports(status="ok" if result else "failed")
+        if report_path:
+            print(f"\n📊 Отчет о прогоне: {report_path}")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,437 @@
+# Файл: scripts/metrics.py
+#
+# Описание:
+# Метрики прогона синхронизации: стадии (вложенные интервалы времени),
+# таймеры действий, счетчики, гистограммы и значения (gauge).
+#
+# Модули вызывают функции этого модуля (metrics.inc, metrics.stage, ...),
+# которые передают вызов текущему реестру. По умолчанию реестр - NoopMetrics:
+# вызовы ничего не делают, поэтому модули можно использовать без настройки
+# (бенчмарки, API). main.py включает сбор через configure() (METRICS_ENABLED)
+# и в конце прогона пишет в METRICS_DIR:
+# - run_report.json - отчет прогона (стадии, счетчики, гистограммы, система);
+# - sync_metrics.prom - текстовый формат Prometheus (textfile collector);
+# - system_report.html - HTML-сводка для просмотра глазами.
+# С METRICS_PORT метрики также отдаются по HTTP (GET /metrics).
+#
+# Имена метрик - без префикса и суффиксов; в формате Prometheus добавляются
+# префикс rag_sync_, _total у счетчиков и единицы из имени (..._seconds, ..._bytes).
+
+import os
+import json
+import time
+import html
+import shutil
+import bisect
+import functools
+import threading
+import contextlib
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, List, Optional, Tuple
+
+PROMETHEUS_PREFIX = "rag_sync_"
+# Границы гистограмм по умолчанию: длительности в секундах
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 600)
+BYTES_BUCKETS = (1024, 16 * 1024, 256 * 1024, 1024 ** 2, 16 * 1024 ** 2, 256 * 1024 ** 2, 1024 ** 3, 16 * 1024 ** 3)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Dict[str, Any]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+class _Histogram:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, fraction: float) -> float:
+        """Оценка квантиля по верхней границе корзины (как histogram_quantile без интерполяции)."""
+        if not self.count:
+            return 0.0
+        rank = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return self.buckets[index] if index < len(self.buckets) else self.max
+        return self.max
+
+
+class NoopMetrics:
+    """Реестр без сбора: все методы ничего не делают."""
+    enabled = False
+    _null = contextlib.nullcontext()
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        pass
+
+    def set_gauge(self, name: str, value: float, **labels):
+        pass
+
+    def observe(self, name: str, value: float, buckets: Tuple[float, ...] = SECONDS_BUCKETS, **labels):
+        pass
+
+    def timer(self, name: str, **labels):
+        return self._null
+
+    def stage(self, name: str, **labels):
+        # Запись стадии, которую можно пометить (entry["status"] = "failed"), но она никуда не попадет
+        return contextlib.nullcontext({"name": name, "labels": labels, "status": "ok"})
+
+    def report(self) -> Dict[str, Any]:
+        return {}
+
+    def prometheus_text(self) -> str:
+        return ""
+
+
+class Metrics(NoopMetrics):
+    """Потокобезопасный реестр метрик одного прогона."""
+    enabled = True
+
+    def __init__(self, run_name: str = "sync"):
+        self.run_name = run_name
+        self.started_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.status: Optional[str] = None
+        self.counters: Dict[Tuple[str, Labels], float] = {}
+        self.gauges: Dict[Tuple[str, Labels], float] = {}
+        self.histograms: Dict[Tuple[str, Labels], _Histogram] = {}
+        self.stages: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._perf_start = time.perf_counter()
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        key = (name, _labels(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def set_gauge(self, name: str, value: float, **labels):
+        with self._lock:
+            self.gauges[(name, _labels(labels))] = value
+
+    def observe(self, name: str, value: float, buckets: Tuple[float, ...] = SECONDS_BUCKETS, **labels):
+        key = (name, _labels(labels))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = _Histogram(buckets)
+            histogram.observe(value)
+
+    @contextlib.contextmanager
+    def timer(self, name: str, **labels):
+        """Длительность блока в гистограмму name (секунды). Для частых действий."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    @contextlib.contextmanager
+    def stage(self, name: str, **labels):
+        """
+        Стадия прогона: попадает в отчет (с родительской стадией текущего потока)
+        и в гистограмму stage_seconds. Исключение внутри помечает стадию failed.
+        """
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        entry = {"name": name, "labels": dict(labels), "parent": stack[-1]["name"] if stack else None,
+                 "start_offset": round(time.perf_counter() - self._perf_start, 4), "status": "ok"}
+        stack.append(entry)
+        start = time.perf_counter()
+        try:
+            yield entry
+        except BaseException:
+            entry["status"] = "failed"
+            raise
+        finally:
+            stack.pop()
+            entry["seconds"] = round(time.perf_counter() - start, 4)
+            with self._lock:
+                self.stages.append(entry)
+            self.observe("stage_seconds", entry["seconds"], stage=name, **labels)
+
+    # --- Отчеты ---
+
+    def finish(self, status: str):
+        self.finished_at = time.time()
+        self.status = status
+
+    def report(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = [{"name": name, "labels": dict(labels), "value": value}
+                        for (name, labels), value in sorted(self.counters.items())]
+            gauges = [{"name": name, "labels": dict(labels), "value": value}
+                      for (name, labels), value in sorted(self.gauges.items())]
+            histograms = [{"name": name, "labels": dict(labels), "count": h.count, "sum": round(h.sum, 6),
+                           "max": round(h.max, 6), "p50": h.quantile(0.5), "p95": h.quantile(0.95)}
+                          for (name, labels), h in sorted(self.histograms.items())]
+            stages = sorted(self.stages, key=lambda entry: entry["start_offset"])
+        finished_at = self.finished_at or time.time()
+        return {
+            "run": {
+                "name": self.run_name,
+                "status": self.status or "running",
+                "started_at": datetime.fromtimestamp(self.started_at, timezone.utc).isoformat(),
+                "finished_at": datetime.fromtimestamp(finished_at, timezone.utc).isoformat(),
+                "seconds": round(finished_at - self.started_at, 3),
+            },
+            "stages": stages,
+            "counters": counters,
+            "gauges": gauges,
+            "histograms": histograms,
+            "system": system_snapshot(),
+        }
+
+    def prometheus_text(self) -> str:
+        lines = []
+
+        def label_text(labels: Labels, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+            pairs = labels + extra
+            if not pairs:
+                return ""
+            escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+            return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + "}"
+
+        with self._lock:
+            typed = set()
+            for (name, labels), value in sorted(self.counters.items()):
+                metric = f"{PROMETHEUS_PREFIX}{name}_total"
+                if metric not in typed:
+                    typed.add(metric)
+                    lines.append(f"# TYPE {metric} counter")
+                lines.append(f"{metric}{label_text(labels)} {value!r}")
+            for (name, labels), value in sorted(self.gauges.items()):
+                metric = f"{PROMETHEUS_PREFIX}{name}"
+                if metric not in typed:
+                    typed.add(metric)
+                    lines.append(f"# TYPE {metric} gauge")
+                lines.append(f"{metric}{label_text(labels)} {value!r}")
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                metric = f"{PROMETHEUS_PREFIX}{name}"
+                if metric not in typed:
+                    typed.add(metric)
+                    lines.append(f"# TYPE {metric} histogram")
+                cumulative = 0
+                for bound, count in zip(histogram.buckets + (float("inf"),), histogram.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f"{metric}_bucket{label_text(labels, (('le', le),))} {cumulative}")
+                lines.append(f"{metric}_sum{label_text(labels)} {histogram.sum!r}")
+                lines.append(f"{metric}_count{label_text(labels)} {histogram.count}")
+        run = f'{{run="{self.run_name}"}}'
+        lines.append(f"# TYPE {PROMETHEUS_PREFIX}run_started_timestamp_seconds gauge")
+        lines.append(f"{PROMETHEUS_PREFIX}run_started_timestamp_seconds{run} {self.started_at:.3f}")
+        if self.finished_at is not None:
+            lines.append(f"# TYPE {PROMETHEUS_PREFIX}run_finished_timestamp_seconds gauge")
+            lines.append(f"{PROMETHEUS_PREFIX}run_finished_timestamp_seconds{run} {self.finished_at:.3f}")
+            lines.append(f"# TYPE {PROMETHEUS_PREFIX}run_success gauge")
+            lines.append(f"{PROMETHEUS_PREFIX}run_success{run} {int(self.status == 'ok')}")
+        return "\n".join(lines) + "\n"
+
+
+def system_snapshot(disk_path: Optional[str] = None) -> Dict[str, Any]:
+    """Ресурсы системы и процесса на момент отчета (что есть на этой платформе)."""
+    snapshot: Dict[str, Any] = {}
+    try:
+        import resource
+        snapshot["process_peak_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    except ImportError:
+        pass
+    try:
+        snapshot["load_average_1m"] = round(os.getloadavg()[0], 2)
+    except (AttributeError, OSError):
+        pass
+    try:
+        with open("/proc/meminfo") as f:
+            meminfo = {line.split(":")[0]: int(line.split()[1]) for line in f}
+        snapshot["memory_total_mb"] = meminfo["MemTotal"] // 1024
+        snapshot["memory_available_mb"] = meminfo["MemAvailable"] // 1024
+    except (OSError, KeyError, ValueError, IndexError):
+        pass
+    disk_path = disk_path or os.getenv("LOCAL_SYNC_PATH") or "."
+    try:
+        usage = shutil.disk_usage(disk_path)
+        snapshot["disk_path"] = disk_path
+        snapshot["disk_used_percent"] = round(usage.used / usage.total * 100, 1)
+        snapshot["disk_free_gb"] = round(usage.free / 1024 ** 3, 1)
+    except OSError:
+        pass
+    return snapshot
+
+
+# --- Текущий реестр и функции модуля ---
+
+_registry: NoopMetrics = NoopMetrics()
+_server: Optional[ThreadingHTTPServer] = None
+
+
+def configure(enabled: Optional[bool] = None, run_name: str = "sync") -> NoopMetrics:
+    """
+    Начинает новый прогон: Metrics или NoopMetrics (METRICS_ENABLED, по умолчанию true).
+    С METRICS_PORT при первом вызове запускается HTTP-сервер /metrics.
+    """
+    global _registry
+    if enabled is None:
+        enabled = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+    _registry = Metrics(run_name) if enabled else NoopMetrics()
+    port = os.getenv("METRICS_PORT")
+    if enabled and port and _server is None:
+        start_http_server(int(port))
+    return _registry
+
+
+def get_registry() -> NoopMetrics:
+    return _registry
+
+
+def inc(name: str, amount: float = 1, **labels):
+    _registry.inc(name, amount, **labels)
+
+
+def set_gauge(name: str, value: float, **labels):
+    _registry.set_gauge(name, value, **labels)
+
+
+def observe(name: str, value: float, buckets: Tuple[float, ...] = SECONDS_BUCKETS, **labels):
+    _registry.observe(name, value, buckets, **labels)
+
+
+def timer(name: str, **labels):
+    return _registry.timer(name, **labels)
+
+
+def stage(name: str, **labels):
+    return _registry.stage(name, **labels)
+
+
+def staged(name: str, **labels):
+    """Декоратор: каждый вызов функции - стадия name (реестр берется в момент вызова)."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with _registry.stage(name, **labels):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def start_http_server(port: int):
+    """Отдает метрики текущего прогона по GET /metrics в фоновом потоке."""
+    global _server
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = _registry.prometheus_text().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    _server = ThreadingHTTPServer(("0.0.0.0", port), Handler)
+    threading.Thread(target=_server.serve_forever, daemon=True).start()
+    print(f"✅ Метрики доступны на http://0.0.0.0:{port}/metrics")
+
+
+def _write_atomic(path: str, content: str):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+
+def render_html(report: Dict[str, Any]) -> str:
+    """HTML-сводка прогона: стадии, основные счетчики, ресурсы системы."""
+    escape = lambda value: html.escape(str(value))
+    run = report["run"]
+    total = run["seconds"] or 1
+    status_class = "normal" if run["status"] == "ok" else "critical"
+
+    stage_rows = []
+    for entry in report["stages"]:
+        labels = ", ".join(f"{key}={value}" for key, value in entry["labels"].items())
+        indent = "&nbsp;&nbsp;&nbsp;&nbsp;" if entry["parent"] else ""
+        css = "normal" if entry["status"] == "ok" else "critical"
+        stage_rows.append(f"<tr><td>{indent}{escape(entry['name'])}</td><td>{escape(labels)}</td>"
+                          f"<td>{entry['seconds']:.2f}</td><td>{entry['seconds'] / total * 100:.1f}%</td>"
+                          f"<td class=\"{css}\">{escape(entry['status'])}</td></tr>")
+    counter_rows = [f"<tr><td>{escape(item['name'])}</td><td>{escape(', '.join(f'{k}={v}' for k, v in item['labels'].items()))}</td>"
+                    f"<td>{item['value']:g}</td></tr>" for item in report["counters"] + report["gauges"]]
+    histogram_rows = [f"<tr><td>{escape(item['name'])}</td><td>{escape(', '.join(f'{k}={v}' for k, v in item['labels'].items()))}</td>"
+                      f"<td>{item['count']}</td><td>{item['sum']:.2f}</td><td>{item['p50']:g}</td><td>{item['p95']:g}</td></tr>"
+                      for item in report["histograms"] if item["name"] != "stage_seconds"]
+    system_rows = [f"<tr><td>{escape(key)}</td><td>{escape(value)}</td></tr>" for key, value in report["system"].items()]
+
+    def table(title: str, headers: List[str], rows: List[str]) -> str:
+        header = "".join(f"<th>{escape(h)}</th>" for h in headers)
+        return (f"<div class=\"stats\"><h2>{escape(title)}</h2><table><tr>{header}</tr>"
+                + "".join(rows) + "</table></div>")
+
+    return f"""<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="utf-8">
+    <title>Sync Run Report</title>
+    <style>
+        body {{ font-family: Arial, sans-serif; margin: 20px; }}
+        h1 {{ color: #333; }}
+        .stats {{ margin: 20px 0; }}
+        .stats table {{ border-collapse: collapse; width: 100%; }}
+        .stats th, .stats td {{ border: 1px solid #ddd; padding: 8px; text-align: left; }}
+        .stats th {{ background-color: #f2f2f2; }}
+        .warning {{ color: orange; }}
+        .critical {{ color: red; }}
+        .normal {{ color: green; }}
+    </style>
+</head>
+<body>
+    <h1>Sync Run Report</h1>
+    <p>Run: {escape(run['name'])}, {escape(run['started_at'])} - {escape(run['finished_at'])},
+       {run['seconds']:.1f} s, status: <span class="{status_class}">{escape(run['status'])}</span></p>
+    {table("Stages", ["Stage", "Labels", "Seconds", "Share", "Status"], stage_rows)}
+    {table("Counters", ["Metric", "Labels", "Value"], counter_rows)}
+    {table("Timings", ["Metric", "Labels", "Count", "Sum, s", "p50", "p95"], histogram_rows)}
+    {table("System Resources", ["Metric", "Value"], system_rows)}
+</body>
+</html>
+"""
+
+
+def write_reports(output_dir: Optional[str] = None, status: str = "ok") -> Optional[str]:
+    """
+    Завершает прогон и пишет run_report.json, sync_metrics.prom и system_report.html
+    в output_dir (по умолчанию METRICS_DIR или logs). Возвращает путь JSON-отчета.
+    """
+    registry = _registry
+    if not registry.enabled:
+        return None
+    registry.finish(status)
+    output_dir = output_dir or os.getenv("METRICS_DIR", "logs")
+    os.makedirs(output_dir, exist_ok=True)
+    report = registry.report()
+    report_path = os.path.join(output_dir, "run_report.json")
+    _write_atomic(report_path, json.dumps(report, ensure_ascii=False, indent=2))
+    _write_atomic(os.path.join(output_dir, "sync_metrics.prom"), registry.prometheus_text())
+    _write_atomic(os.path.join(output_dir, "system_report.html"), render_html(report))
+    return report_path
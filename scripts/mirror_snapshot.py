@@ -0,0 +1,180 @@
+# Файл: scripts/mirror_snapshot.py
+#
+# Описание:
+# Локальный снимок таблицы gdrive_mirror в SQLite.
+# SupabaseClient пишет в него сквозным образом (write-through) при каждой
+# пакетной записи и сверяет с Supabase по водяному знаку updated_at, поэтому
+# повторные чтения таблицы (этап B, следующие запуски) не требуют полной
+# выгрузки по сети.
+
+import os
+import time
+import sqlite3
+import threading
+from typing import Dict, Any, List, Optional, Iterable
+
+
+class MirrorSnapshot:
+    """Снимок gdrive_mirror: только поля, нужные для планирования."""
+    COLUMNS = ("gdrive_id", "path", "md5_checksum", "size_bytes", "version", "updated_at")
+
+    def __init__(self, db_path: str):
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.db_path = db_path
+        # Соединение используется из разных потоков исполнителей, доступ - под блокировкой
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS documents (
+                gdrive_id TEXT PRIMARY KEY,
+                path TEXT,
+                md5_checksum TEXT,
+                size_bytes INTEGER,
+                version TEXT,
+                updated_at TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_documents_path ON documents(path);
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+        """)
+        self._conn.commit()
+
+    # --- Служебные значения ---
+
+    def _get_meta(self, key: str) -> Optional[str]:
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key: str, value: Optional[str]):
+        self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    @property
+    def watermark(self) -> Optional[str]:
+        """Максимальный updated_at, полученный из Supabase (None - снимок не загружен)."""
+        with self._lock:
+            return self._get_meta("watermark")
+
+    # --- Запись ---
+
+    def replace_all(self, pages: Iterable[List[Dict[str, Any]]]) -> int:
+        """Полностью перезагружает снимок из страниц Supabase. Возвращает число строк."""
+        with self._lock:
+            try:
+                self._conn.execute("DELETE FROM documents")
+                watermark = None
+                count = 0
+                for page in pages:
+                    watermark = self._upsert_rows(page, watermark)
+                    count += len(page)
+                self._set_meta("watermark", watermark or "")
+                self._set_meta("loaded_at", str(time.time()))
+                self._conn.commit()
+            except Exception:
+                # Неполная загрузка не должна подменить собой снимок
+                self._conn.rollback()
+                raise
+        return count
+
+    def age_seconds(self) -> float:
+        """Сколько секунд прошло с последней полной загрузки."""
+        with self._lock:
+            loaded_at = self._get_meta("loaded_at")
+        return time.time() - float(loaded_at) if loaded_at else float("inf")
+
+    def apply_remote_changes(self, pages: Iterable[List[Dict[str, Any]]]) -> int:
+        """
+        Применяет строки, измененные в Supabase с момента водяного знака (включительно),
+        и сдвигает его. Строки с updated_at, равным знаку, уже примененные раньше
+        (тот же gdrive_id и тот же updated_at), пропускаются. Возвращает число примененных строк.
+        """
+        with self._lock:
+            try:
+                watermark = self._get_meta("watermark") or None
+                boundary = watermark
+                count = 0
+                for page in pages:
+                    if boundary:
+                        page = [row for row in page if not (
+                            row.get("updated_at") == boundary and self._stored_updated_at(row["gdrive_id"]) == boundary
+                        )]
+                    watermark = self._upsert_rows(page, watermark)
+                    count += len(page)
+                self._set_meta("watermark", watermark or "")
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+        return count
+
+    def _stored_updated_at(self, gdrive_id: str) -> Optional[str]:
+        row = self._conn.execute("SELECT updated_at FROM documents WHERE gdrive_id = ?", (gdrive_id,)).fetchone()
+        return row[0] if row else None
+
+    def _upsert_rows(self, rows: List[Dict[str, Any]], watermark: Optional[str]) -> Optional[str]:
+        """Вставляет/обновляет строки (без commit). Возвращает новый максимум updated_at."""
+        for row in rows:
+            columns = [column for column in self.COLUMNS if column in row]
+            self._conn.execute(
+                f"INSERT INTO documents ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)}) "
+                f"ON CONFLICT(gdrive_id) DO UPDATE SET "
+                + ", ".join(f"{column} = excluded.{column}" for column in columns if column != "gdrive_id"),
+                [row[column] for column in columns]
+            )
+            updated_at = row.get("updated_at")
+            if updated_at and (watermark is None or updated_at > watermark):
+                watermark = updated_at
+        return watermark
+
+    def upsert(self, records: List[Dict[str, Any]]):
+        """Сквозная запись: отражает в снимке строки, успешно записанные в Supabase."""
+        if not records:
+            return
+        with self._lock:
+            # updated_at назначает сервер; локальные записи его не двигают
+            self._upsert_rows([{k: v for k, v in record.items() if k != "updated_at"} for record in records], None)
+            self._conn.commit()
+
+    def delete(self, ids: List[str]):
+        if not ids:
+            return
+        with self._lock:
+            self._conn.executemany("DELETE FROM documents WHERE gdrive_id = ?", [(id,) for id in ids])
+            self._conn.commit()
+
+    def invalidate(self):
+        """Сбрасывает водяной знак: следующая сверка выполнит полную загрузку."""
+        with self._lock:
+            self._conn.execute("DELETE FROM meta WHERE key = 'watermark'")
+            self._conn.commit()
+
+    # --- Чтение ---
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def get_all(self) -> Dict[str, Dict[str, Any]]:
+        """Все записи в формате SupabaseClient.get_all_documents (ключ - gdrive_id)."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT gdrive_id, path, md5_checksum, size_bytes, version FROM documents"
+            ).fetchall()
+        return {
+            row[0]: {"gdrive_id": row[0], "path": row[1], "md5_checksum": row[2], "size_bytes": row[3], "version": row[4]}
+            for row in rows
+        }
+
+    def get_paths_by_ids(self, ids: List[str]) -> Dict[str, str]:
+        paths = {}
+        with self._lock:
+            for id in ids:
+                row = self._conn.execute("SELECT path FROM documents WHERE gdrive_id = ?", (id,)).fetchone()
+                if row:
+                    paths[id] = row[0]
+        return paths
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
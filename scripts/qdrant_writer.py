@@ -0,0 +1,322 @@
+# Файл: scripts/qdrant_writer.py
+#
+# Описание:
+# Пакетная запись чанков с векторами в коллекцию Qdrant
+# (создается init/init_qdrant_collection.py).
+#
+# - Точки собираются в пакеты и отправляются параллельно из пула потоков
+#   (REST или gRPC - QDRANT_PREFER_GRPC), число пакетов в полете ограничено.
+# - ID точки детерминирован: UUID5 от (gdrive_id, номер чанка). Повтор
+#   после сбоя перезаписывает те же точки, а не создает дубликаты.
+# - Режим bulk_load() на время первичной загрузки отключает построение
+#   HNSW (indexing_threshold=0) и возвращает прежний порог после нее:
+#   индекс строится один раз по всем точкам, а не перестраивается по ходу.
+
+import os
+import time
+import uuid
+import threading
+import contextlib
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, Any, List, Iterable, Optional, Tuple
+
+from qdrant_client import QdrantClient
+from qdrant_client.http import models
+
+from get_settings import get_setting
+from sparse_vectors import SPARSE_VECTOR_NAME
+
+# Пространство имен UUID5 для ID точек (постоянное: от него зависят ID в коллекции)
+POINT_ID_NAMESPACE = uuid.UUID("6f1c2b7e-3d4a-5b8c-9e0f-1a2b3c4d5e6f")
+
+
+def point_id(gdrive_id: str, chunk_index: int) -> str:
+    """Детерминированный ID точки для чанка документа."""
+    return str(uuid.uuid5(POINT_ID_NAMESPACE, f"{gdrive_id}:{chunk_index}"))
+
+
+def file_type(path: str) -> str:
+    return os.path.splitext(path)[1].lstrip('.').lower()
+
+
+def build_payload(file_data: Dict[str, Any], chunk: Dict[str, Any]) -> Dict[str, Any]:
+    """Payload точки: поля с индексами из init_qdrant_collection.py и данные чанка."""
+    gdrive_id = file_data['gdrive_id']
+    return {
+        "gdrive_id": gdrive_id,
+        "file_path": file_data['path'],
+        # У записей локальных провайдеров id вида "<name>:<sha1>", у Google Drive - без ':'
+        "source": gdrive_id.split(":", 1)[0] if ":" in gdrive_id else "google",
+        "file_type": file_type(file_data['path']),
+        "last_modified": file_data.get('gdrive_modified_time'),
+        "version": file_data.get('version'),
+        "chunk_index": chunk['chunk_index'],
+        "text": chunk['text'],
+        "start": chunk.get('start'),
+        "end": chunk.get('end'),
+        "page_start": chunk.get('page_start'),
+        "page_end": chunk.get('page_end'),
+        "content_hash": chunk.get('content_hash'),
+    }
+
+
+def build_point(file_data: Dict[str, Any], chunk: Dict[str, Any], vector: List[float],
+                sparse: Optional[Tuple[List[int], List[float]]] = None) -> models.PointStruct:
+    """Точка чанка; sparse - (индексы, веса) BM25 для именованного вектора SPARSE_VECTOR_NAME."""
+    if sparse is not None:
+        vector = {"": vector, SPARSE_VECTOR_NAME: models.SparseVector(indices=sparse[0], values=sparse[1])}
+    return models.PointStruct(
+        id=point_id(file_data['gdrive_id'], chunk['chunk_index']),
+        vector=vector,
+        payload=build_payload(file_data, chunk)
+    )
+
+
+def create_qdrant_client(location: Optional[str] = None, prefer_grpc: Optional[bool] = None) -> QdrantClient:
+    """
+    Клиент Qdrant из QDRANT_HOST / QDRANT_PORT / QDRANT_API_KEY (config/.env).
+
+    Args:
+        location: ":memory:" или путь к каталогу - локальный режим qdrant_client без сервера.
+        prefer_grpc: gRPC вместо REST (по умолчанию QDRANT_PREFER_GRPC, порт QDRANT_GRPC_PORT).
+    """
+    if location == ":memory:":
+        return QdrantClient(location=":memory:")
+    if location:
+        return QdrantClient(path=location)
+    if prefer_grpc is None:
+        prefer_grpc = os.getenv("QDRANT_PREFER_GRPC", "false").lower() == "true"
+    return QdrantClient(
+        host=os.getenv("QDRANT_HOST", "localhost"),
+        port=int(os.getenv("QDRANT_PORT", "6333")),
+        grpc_port=int(os.getenv("QDRANT_GRPC_PORT", "6334")),
+        prefer_grpc=prefer_grpc,
+        api_key=os.getenv("QDRANT_API_KEY"),
+        https=False,
+        timeout=60
+    )
+
+
+def is_local_client(client: QdrantClient) -> bool:
+    """Локальный режим qdrant_client (":memory:" или path) - без сервера."""
+    options = getattr(client, "init_options", None) or {}
+    return options.get("location") == ":memory:" or bool(options.get("path"))
+
+
+def get_collection_name() -> str:
+    return os.getenv("QDRANT_COLLECTION") or get_setting("vector_db", "collection_name", "documents")
+
+
+class QdrantWriter:
+    """Параллельная пакетная запись точек в коллекцию."""
+    RETRY_BACKOFF_SECONDS = 0.5
+
+    def __init__(self, client: QdrantClient, collection_name: str, batch_size: int = 256,
+                 parallel: int = 4, max_retries: int = 3, wait_for_result: bool = True):
+        """
+        Args:
+            client: Клиент Qdrant.
+            collection_name: Коллекция (vector_db.collection_name).
+            batch_size: Точек в одном запросе upsert.
+            parallel: Число одновременных запросов.
+            max_retries: Попыток записи пакета, не меньше 1 (повтор безопасен: ID детерминированы).
+            wait_for_result: Ждать применения пакета на сервере (wait=True).
+        """
+        if max_retries < 1:
+            raise ValueError(f"max_retries должно быть не меньше 1, получено {max_retries}")
+        self.client = client
+        self.collection_name = collection_name
+        self.batch_size = batch_size
+        self.parallel = max(1, parallel)
+        self.max_retries = max_retries
+        self.wait_for_result = wait_for_result
+        self.stats = {"points": 0, "batches": 0, "retries": 0, "seconds": 0.0}
+        self._has_sparse: Optional[bool] = None
+        # Локальный режим не потокобезопасен: пакеты готовятся параллельно, пишутся по одному
+        self._write_lock = threading.Lock() if is_local_client(client) else contextlib.nullcontext()
+
+    def _upsert_batch(self, batch: List[models.PointStruct]) -> int:
+        for attempt in range(self.max_retries):
+            try:
+                with self._write_lock:
+                    self.client.upsert(collection_name=self.collection_name, points=batch, wait=self.wait_for_result)
+                return len(batch)
+            except Exception as e:
+                if attempt == self.max_retries - 1:
+                    raise
+                self.stats["retries"] += 1
+                print(f"  ⚠️ Пакет из {len(batch)} точек не записан ({e}), повтор...")
+                time.sleep(self.RETRY_BACKOFF_SECONDS * (2 ** attempt))
+
+    def upsert_points(self, points: Iterable[models.PointStruct]) -> int:
+        """
+        Записывает точки пакетами. Вход читается лениво: в памяти не больше
+        2 * parallel пакетов. Возвращает число записанных точек.
+        """
+        start = time.perf_counter()
+        written = 0
+        pending = set()
+        batch: List[models.PointStruct] = []
+
+        def collect(done):
+            nonlocal written
+            for future in done:
+                written += future.result()
+                self.stats["batches"] += 1
+
+        with ThreadPoolExecutor(max_workers=self.parallel) as executor:
+            for point in points:
+                batch.append(point)
+                if len(batch) < self.batch_size:
+                    continue
+                pending.add(executor.submit(self._upsert_batch, batch))
+                batch = []
+                if len(pending) >= 2 * self.parallel:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(done)
+            if batch:
+                pending.add(executor.submit(self._upsert_batch, batch))
+            done, _ = wait(pending)
+            collect(done)
+
+        self.stats["points"] += written
+        self.stats["seconds"] += time.perf_counter() - start
+        return written
+
+    def delete_documents(self, gdrive_ids: List[str]):
+        """Удаляет все точки документов по фильтру gdrive_id."""
+        if not gdrive_ids:
+            return
+        self.client.delete(
+            collection_name=self.collection_name,
+            points_selector=models.FilterSelector(filter=models.Filter(must=[
+                models.FieldCondition(key="gdrive_id", match=models.MatchAny(any=list(gdrive_ids)))
+            ])),
+            wait=self.wait_for_result
+        )
+
+    @staticmethod
+    def _document_filter(gdrive_id: str, *conditions) -> models.Filter:
+        return models.Filter(must=[
+            models.FieldCondition(key="gdrive_id", match=models.MatchValue(value=gdrive_id)), *conditions
+        ])
+
+    def get_document_chunks(self, gdrive_id: str) -> Dict[int, Dict[str, Any]]:
+        """Точки документа в коллекции: {chunk_index: {'id', 'content_hash'}} (без векторов)."""
+        chunks = {}
+        offset = None
+        while True:
+            records, offset = self.client.scroll(
+                collection_name=self.collection_name,
+                scroll_filter=self._document_filter(gdrive_id),
+                limit=self.batch_size,
+                offset=offset,
+                with_payload=["chunk_index", "content_hash"],
+                with_vectors=False
+            )
+            for record in records:
+                chunks[record.payload["chunk_index"]] = {"id": record.id, "content_hash": record.payload.get("content_hash")}
+            if offset is None:
+                return chunks
+
+    def get_vectors(self, point_ids: List[str]) -> Dict[str, Any]:
+        """Плотные векторы существующих точек по их ID."""
+        if not point_ids:
+            return {}
+        records = self.client.retrieve(collection_name=self.collection_name, ids=point_ids, with_vectors=[""]
+                                       if self.has_sparse_vectors() else True)
+        return {str(record.id): record.vector.get("") if isinstance(record.vector, dict) else record.vector
+                for record in records}
+
+    def has_sparse_vectors(self) -> bool:
+        """Есть ли в коллекции именованный sparse-вектор SPARSE_VECTOR_NAME (init_qdrant_collection.py)."""
+        if self._has_sparse is None:
+            params = self.client.get_collection(self.collection_name).config.params
+            self._has_sparse = SPARSE_VECTOR_NAME in (params.sparse_vectors or {})
+        return self._has_sparse
+
+    def set_document_payload(self, gdrive_id: str, payload: Dict[str, Any]):
+        """Обновляет поля payload у всех точек документа (без перезаписи векторов)."""
+        self.client.set_payload(
+            collection_name=self.collection_name,
+            payload=payload,
+            points=self._document_filter(gdrive_id),
+            wait=self.wait_for_result
+        )
+
+    def delete_chunks_from(self, gdrive_id: str, chunk_count: int):
+        """Удаляет точки документа с номером чанка >= chunk_count (хвост после укорачивания)."""
+        self.client.delete(
+            collection_name=self.collection_name,
+            points_selector=models.FilterSelector(filter=self._document_filter(
+                gdrive_id, models.FieldCondition(key="chunk_index", range=models.Range(gte=chunk_count))
+            )),
+            wait=self.wait_for_result
+        )
+
+    def move_documents(self, moves: List[Dict[str, str]]):
+        """
+        Меняет file_path (и file_type) у точек перемещенных документов, без
+        перезаписи векторов. moves - [{'gdrive_id', 'old_path', 'new_path'}];
+        обновления отправляются пакетами по batch_size в одном запросе.
+        """
+        for start in range(0, len(moves), self.batch_size):
+            operations = []
+            for move in moves[start:start + self.batch_size]:
+                operations.append(models.SetPayloadOperation(set_payload=models.SetPayload(
+                    payload={
+                        "file_path": move['new_path'],
+                        "file_type": file_type(move['new_path'])
+                    },
+                    # Фильтр по индексу file_path; gdrive_id защищает от обмена путями двух файлов
+                    filter=self._document_filter(
+                        move['gdrive_id'],
+                        models.FieldCondition(key="file_path", match=models.MatchValue(value=move['old_path']))
+                    )
+                )))
+            self.client.batch_update_points(
+                collection_name=self.collection_name,
+                update_operations=operations,
+                wait=self.wait_for_result
+            )
+
+    @contextlib.contextmanager
+    def bulk_load(self):
+        """
+        Режим первичной загрузки: построение индекса отключено (indexing_threshold=0),
+        после выхода восстанавливается прежний порог и Qdrant строит HNSW один раз.
+        """
+        info = self.client.get_collection(self.collection_name)
+        optimizer_config = getattr(info.config, "optimizer_config", None)
+        previous_threshold = getattr(optimizer_config, "indexing_threshold", None) or 20000
+        print(f"  - Bulk-режим: индексация {self.collection_name} отключена (был порог {previous_threshold}).")
+        self.client.update_collection(
+            collection_name=self.collection_name,
+            optimizer_config=models.OptimizersConfigDiff(indexing_threshold=0)
+        )
+        try:
+            yield self
+        finally:
+            self.client.update_collection(
+                collection_name=self.collection_name,
+                optimizer_config=models.OptimizersConfigDiff(indexing_threshold=previous_threshold)
+            )
+            print(f"  - Bulk-режим завершен: порог индексации {previous_threshold} восстановлен.")
+
+    def print_report(self):
+        stats = self.stats
+        speed = stats["points"] / stats["seconds"] if stats["seconds"] else 0
+        print(f"  ✅ Qdrant: записано {stats['points']} точек за {stats['batches']} пакетов, "
+              f"повторов {stats['retries']}, {speed:,.0f} точек/с.")
+
+
+def create_qdrant_writer(client: Optional[QdrantClient] = None) -> QdrantWriter:
+    """Писатель с параметрами vector_db.upload из settings.yml."""
+    upload = get_setting("vector_db", "upload") or {}
+    return QdrantWriter(
+        client or create_qdrant_client(),
+        get_collection_name(),
+        batch_size=upload.get("batch_size", 256),
+        parallel=upload.get("parallel", 4),
+        max_retries=upload.get("max_retries", 3)
+    )
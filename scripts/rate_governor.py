@@ -0,0 +1,253 @@
+# Файл: scripts/rate_governor.py
+#
+# Описание:
+# Общий регулятор темпа запросов к Google Drive API. Через него проходят все
+# вызовы GDriveScanner (files.list, changes.*), куски GDriveDownloader
+# (files.get_media / export_media) и процессы rclone.
+#
+# - Token bucket: не больше rate запросов в секунду (квота Drive -
+#   12 000 запросов в минуту на пользователя), всплеск до burst.
+# - AIMD-параллельность: лимит одновременных запросов растет на 1 за "круг"
+#   успешных ответов (+1/лимит на ответ) и делится пополам при троттлинге
+#   (не чаще раза в decrease_interval, чтобы пачка отказов от запросов,
+#   ушедших до снижения, не обрушила лимит до минимума).
+# - Повтор запроса: при 429, 403 rateLimitExceeded/userRateLimitExceeded и
+#   временных ошибках (408, 5xx, сеть) - экспоненциальная пауза с полным
+#   jitter (random(0, base * 2^попытка)), Retry-After сервера учитывается.
+#   dailyLimitExceeded и прочие 4xx не повторяются.
+#
+# В статистике и метриках - время, проведенное в паузах после троттлинга,
+# и ожидание токенов.
+
+import json
+import time
+import random
+import threading
+from typing import Any, Callable, Optional
+
+from googleapiclient.errors import HttpError
+
+import metrics
+
+# Причины 403, означающие превышение темпа (повторяемы); остальные 403 - нет
+THROTTLE_REASONS = {"rateLimitExceeded", "userRateLimitExceeded"}
+TRANSIENT_STATUSES = {408, 500, 502, 503, 504}
+
+
+class RetryableError(Exception):
+    """
+    Повторяемый отказ, который вызывающий код распознал сам (ответ httplib2,
+    сетевая ошибка, вывод rclone). throttled=True - превышение квоты.
+    """
+    def __init__(self, message: str, throttled: bool = False, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.throttled = throttled
+        self.retry_after = retry_after
+
+
+def _error_reasons(content: Any) -> set:
+    """Поля reason из тела ошибки Drive {"error": {"errors": [{"reason": ...}]}}."""
+    try:
+        body = json.loads(content.decode("utf-8") if isinstance(content, bytes) else content)
+        return {item.get("reason") for item in body["error"].get("errors", [])}
+    except (ValueError, TypeError, KeyError, AttributeError):
+        return set()
+
+
+def classify_response(status: int, content: Any = b"") -> Optional[str]:
+    """'throttled', 'transient' или None (повторять бессмысленно) по коду и телу ответа."""
+    if status == 429 or (status == 403 and _error_reasons(content) & THROTTLE_REASONS):
+        return "throttled"
+    if status in TRANSIENT_STATUSES:
+        return "transient"
+    return None
+
+
+def retry_after_seconds(headers: Any) -> Optional[float]:
+    try:
+        value = headers.get("retry-after") if headers is not None else None
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def classify_error(error: Exception) -> Optional[str]:
+    """'throttled', 'transient' или None для исключения вызова."""
+    if isinstance(error, RetryableError):
+        return "throttled" if error.throttled else "transient"
+    if isinstance(error, HttpError):
+        return classify_response(error.resp.status, error.content)
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return "transient"
+    return None
+
+
+class RateGovernor:
+    """Token bucket + AIMD-лимит параллельности + повторы с экспоненциальной паузой."""
+    DEFAULT_RATE = 200.0          # запросов в секунду (12 000 в минуту)
+    DEFAULT_MAX_CONCURRENCY = 16
+    DEFAULT_MAX_RETRIES = 8
+    BASE_DELAY_SECONDS = 1.0
+    MAX_DELAY_SECONDS = 64.0
+
+    def __init__(self, rate: float = DEFAULT_RATE, burst: Optional[float] = None,
+                 max_concurrency: int = DEFAULT_MAX_CONCURRENCY, min_concurrency: int = 1,
+                 max_retries: int = DEFAULT_MAX_RETRIES, base_delay: float = BASE_DELAY_SECONDS,
+                 max_delay: float = MAX_DELAY_SECONDS, decrease_interval: Optional[float] = None,
+                 name: str = "drive"):
+        """
+        Args:
+            rate: Запросов в секунду (0 - без ограничения темпа).
+            burst: Емкость корзины токенов (по умолчанию - секунда запросов, не меньше 1).
+            max_concurrency: Верхняя граница лимита одновременных запросов (он же начальный).
+            min_concurrency: Нижняя граница лимита.
+            max_retries: Повторов одного запроса после отказа.
+            base_delay, max_delay: Пауза перед повтором n - random(0, min(max_delay, base_delay * 2^n)).
+            decrease_interval: Не снижать лимит чаще (по умолчанию base_delay).
+            name: Метка в метриках и отчете.
+        """
+        self.rate = rate
+        self.burst = burst or max(1.0, rate)
+        self.max_concurrency = max(1, max_concurrency)
+        self.min_concurrency = max(1, min(min_concurrency, self.max_concurrency))
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.decrease_interval = base_delay if decrease_interval is None else decrease_interval
+        self.name = name
+
+        self._tokens = self.burst
+        self._refilled_at = time.monotonic()
+        self._paused_until = 0.0
+        self._bucket_lock = threading.Lock()
+
+        self._limit = float(self.max_concurrency)
+        self._in_flight = 0
+        self._last_decrease = float("-inf")
+        self._slots = threading.Condition()
+
+        self.stats = {"requests": 0, "throttled": 0, "transient": 0, "retries": 0, "failures": 0,
+                      "throttled_seconds": 0.0, "token_wait_seconds": 0.0, "min_limit": self.max_concurrency}
+        self._stats_lock = threading.Lock()
+        metrics.set_gauge("rate_concurrency_limit", self.max_concurrency, governor=self.name)
+
+    @property
+    def concurrency_limit(self) -> int:
+        return int(self._limit)
+
+    def _count(self, key: str, amount: float = 1):
+        with self._stats_lock:
+            self.stats[key] += amount
+
+    # --- Token bucket ---
+
+    def _take_token(self):
+        """Берет токен; если корзина пуста - резервирует следующий и ждет его."""
+        if self.rate <= 0 and not self._paused_until:
+            return
+        with self._bucket_lock:
+            now = time.monotonic()
+            if self.rate > 0:
+                self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate)
+                self._refilled_at = now
+                self._tokens -= 1
+                wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            else:
+                wait = 0.0
+            # Retry-After от сервера приостанавливает всех
+            wait = max(wait, self._paused_until - now)
+        if wait > 0:
+            self._count("token_wait_seconds", wait)
+            metrics.inc("rate_wait_seconds", wait, governor=self.name)
+            time.sleep(wait)
+
+    # --- AIMD-лимит параллельности ---
+
+    def _acquire_slot(self):
+        with self._slots:
+            while self._in_flight >= int(self._limit):
+                self._slots.wait()
+            self._in_flight += 1
+
+    def _release_slot(self):
+        with self._slots:
+            self._in_flight -= 1
+            self._slots.notify_all()
+
+    def _on_success(self):
+        with self._slots:
+            if self._limit < self.max_concurrency:
+                self._limit = min(self.max_concurrency, self._limit + 1 / self._limit)
+                self._slots.notify_all()
+
+    def _on_throttled(self, retry_after: Optional[float]):
+        now = time.monotonic()
+        with self._slots:
+            if now - self._last_decrease >= self.decrease_interval:
+                self._limit = max(self.min_concurrency, self._limit / 2)
+                self._last_decrease = now
+                limit = int(self._limit)
+                with self._stats_lock:
+                    self.stats["min_limit"] = min(self.stats["min_limit"], limit)
+                metrics.set_gauge("rate_concurrency_limit", limit, governor=self.name)
+        if retry_after:
+            with self._bucket_lock:
+                self._paused_until = max(self._paused_until, now + retry_after)
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    # --- Вызов ---
+
+    def call(self, func: Callable[[], Any], method: str = "request") -> Any:
+        """
+        Выполняет func() в рамках темпа и лимита параллельности, повторяя
+        троттлинг и временные ошибки. После max_retries повторов (или сразу
+        для неповторяемых ошибок) исключение func пробрасывается.
+        """
+        attempt = 0
+        while True:
+            self._take_token()
+            self._acquire_slot()
+            try:
+                self._count("requests")
+                result = func()
+            except Exception as error:
+                kind = classify_error(error)
+                if kind is None:
+                    raise
+                self._count(kind)
+                retry_after = getattr(error, "retry_after", None)
+                if isinstance(error, HttpError):
+                    retry_after = retry_after_seconds(error.resp)
+                if kind == "throttled":
+                    metrics.inc("rate_throttled", method=method, governor=self.name)
+                    self._on_throttled(retry_after)
+                if attempt >= self.max_retries:
+                    self._count("failures")
+                    print(f"  ❌ {method}: отказ после {attempt} повторов ({error})")
+                    raise
+            else:
+                self._on_success()
+                return result
+            finally:
+                self._release_slot()
+
+            delay = max(self._backoff(attempt), retry_after or 0)
+            attempt += 1
+            self._count("retries")
+            metrics.inc("rate_retries", method=method, governor=self.name)
+            if kind == "throttled":
+                self._count("throttled_seconds", delay)
+                metrics.inc("rate_throttled_seconds", delay, governor=self.name)
+            time.sleep(delay)
+
+    def print_report(self):
+        stats = self.stats
+        if not stats["requests"]:
+            return
+        print(f"  - Темп {self.name}: запросов {stats['requests']}, троттлинг {stats['throttled']} "
+              f"({stats['throttled_seconds']:.1f} с пауз), временных ошибок {stats['transient']}, "
+              f"повторов {stats['retries']}, отказов {stats['failures']}; ожидание токенов "
+              f"{stats['token_wait_seconds']:.1f} с, лимит параллельности {self.concurrency_limit} "
+              f"(минимум {stats['min_limit']} из {self.max_concurrency}).")
@@ -0,0 +1,353 @@
+# Файл: scripts/retrieval_service.py
+#
+# Описание:
+# Асинхронный поиск по коллекции documents (ядро API src/backend).
+#
+# - Один AsyncQdrantClient на процесс с пулом соединений (api.retrieval.qdrant_pool_size).
+# - Фильтры по индексированным полям payload: file_path, source, file_type,
+#   last_modified (диапазон дат).
+# - На запрос настраиваются hnsw_ef, exact и рескоринг квантованных векторов
+#   (rescore, oversampling).
+# - Эмбеддинги запросов кэшируются в LRU с TTL - повторный запрос не ходит к провайдеру.
+# - Результаты кэшируются в LRU с TTL и сбрасываются, когда синхронизация
+#   меняет индекс: VectorIndexer увеличивает счетчик поколения в файле
+#   SYNC_STATE_DIR/index_generation, сервис сверяет его не чаще раза в
+#   generation_check_seconds.
+# - Режимы поиска: dense (плотные векторы), sparse (BM25 по именованному
+#   sparse-вектору, без вызова провайдера эмбеддингов) и hybrid - оба списка
+#   кандидатов объединяются в Qdrant через RRF. Если в коллекции нет
+#   sparse-вектора, sparse/hybrid выполняются как dense.
+
+import os
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
+
+from qdrant_client import AsyncQdrantClient
+from qdrant_client.http import models
+
+from embedding_service import EmbeddingProvider, get_embedding_provider
+from get_settings import get_settings, get_setting
+from qdrant_writer import get_collection_name
+from sparse_vectors import SPARSE_VECTOR_NAME, BM25Encoder, create_bm25_encoder
+
+SEARCH_MODES = ("dense", "sparse", "hybrid")
+
+# Поля payload в ответе (вектор и служебные поля не передаются)
+RESULT_FIELDS = ["gdrive_id", "file_path", "source", "file_type", "last_modified",
+                 "chunk_index", "page_start", "page_end", "text"]
+
+
+def get_generation_path() -> str:
+    return os.getenv("INDEX_GENERATION_PATH") or os.path.join(os.getenv("SYNC_STATE_DIR", "state"), "index_generation")
+
+
+def bump_index_generation(path: Optional[str] = None):
+    """Отмечает изменение индекса: кэши результатов API будут сброшены."""
+    path = path or get_generation_path()
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(str(time.time_ns()))
+    os.replace(tmp_path, path)
+
+
+def read_index_generation(path: Optional[str] = None) -> str:
+    try:
+        with open(path or get_generation_path(), "r") as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return ""
+
+
+class TTLCache:
+    """LRU-кэш с ограничением размера и временем жизни записей. Потокобезопасен."""
+
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._items: "OrderedDict[Any, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None or item[0] < time.monotonic():
+                if item is not None:
+                    del self._items[key]
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def put(self, key, value):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._items[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {"size": len(self._items), "hits": self.hits, "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0}
+
+
+def build_filter(filters: Optional[Dict[str, Any]]) -> Optional[models.Filter]:
+    """
+    Фильтр Qdrant из параметров запроса:
+    file_path, source, file_type - строка или список (совпадение с любым);
+    modified_after / modified_before - ISO-даты для last_modified.
+    """
+    if not filters:
+        return None
+    conditions = []
+    for key in ("file_path", "source", "file_type"):
+        value = filters.get(key)
+        if not value:
+            continue
+        if isinstance(value, (list, tuple)):
+            conditions.append(models.FieldCondition(key=key, match=models.MatchAny(any=list(value))))
+        else:
+            conditions.append(models.FieldCondition(key=key, match=models.MatchValue(value=value)))
+    if filters.get("modified_after") or filters.get("modified_before"):
+        conditions.append(models.FieldCondition(key="last_modified", range=models.DatetimeRange(
+            gte=filters.get("modified_after"), lte=filters.get("modified_before")
+        )))
+    return models.Filter(must=conditions) if conditions else None
+
+
+def create_async_qdrant_client(location: Optional[str] = None, pool_size: Optional[int] = None) -> AsyncQdrantClient:
+    """Асинхронный клиент Qdrant с теми же переменными окружения, что и qdrant_writer.create_qdrant_client."""
+    if location == ":memory:":
+        return AsyncQdrantClient(location=":memory:")
+    if location:
+        return AsyncQdrantClient(path=location)
+    return AsyncQdrantClient(
+        host=os.getenv("QDRANT_HOST", "localhost"),
+        port=int(os.getenv("QDRANT_PORT", "6333")),
+        grpc_port=int(os.getenv("QDRANT_GRPC_PORT", "6334")),
+        prefer_grpc=os.getenv("QDRANT_PREFER_GRPC", "false").lower() == "true",
+        api_key=os.getenv("QDRANT_API_KEY"),
+        https=False,
+        timeout=30,
+        pool_size=pool_size
+    )
+
+
+class RetrievalService:
+    """Поиск чанков по тексту запроса с кэшами эмбеддингов и результатов."""
+
+    def __init__(self, client: AsyncQdrantClient, collection_name: str, provider: EmbeddingProvider,
+                 default_limit: int = 10, max_limit: int = 100, hnsw_ef: Optional[int] = None,
+                 rescore: bool = True, oversampling: Optional[float] = None,
+                 query_cache_size: int = 10000, query_cache_ttl_seconds: float = 3600,
+                 result_cache_size: int = 2000, result_cache_ttl_seconds: float = 300,
+                 generation_path: Optional[str] = None, generation_check_seconds: float = 1.0,
+                 mode: str = "hybrid", bm25: Optional[BM25Encoder] = None, prefetch_multiplier: int = 4):
+        """
+        Args:
+            client: Асинхронный клиент Qdrant (один на процесс).
+            collection_name: Коллекция (vector_db.collection_name).
+            provider: Провайдер эмбеддингов запросов (та же модель, что при индексации).
+            default_limit / max_limit: Число результатов по умолчанию и верхняя граница.
+            hnsw_ef / rescore / oversampling: Параметры поиска по умолчанию (переопределяются в запросе).
+            query_cache_* / result_cache_*: Размер и TTL кэшей эмбеддингов запросов и результатов.
+            generation_path: Файл поколения индекса (по умолчанию SYNC_STATE_DIR/index_generation).
+            generation_check_seconds: Как часто сверять поколение индекса.
+            mode: Режим поиска по умолчанию (dense, sparse, hybrid).
+            bm25: Кодировщик запросов для sparse-вектора (по умолчанию - vector_db.sparse).
+            prefetch_multiplier: Кандидатов от каждого поиска в hybrid - limit * prefetch_multiplier.
+        """
+        self.client = client
+        self.collection_name = collection_name
+        self.provider = provider
+        self.default_limit = default_limit
+        self.max_limit = max_limit
+        self.hnsw_ef = hnsw_ef
+        self.rescore = rescore
+        self.oversampling = oversampling
+        self.query_cache = TTLCache(query_cache_size, query_cache_ttl_seconds)
+        self.result_cache = TTLCache(result_cache_size, result_cache_ttl_seconds)
+        self.generation_path = generation_path or get_generation_path()
+        self.generation_check_seconds = generation_check_seconds
+        self._generation = read_index_generation(self.generation_path)
+        self._generation_checked_at = time.monotonic()
+        self._inflight: Dict[Tuple[str, str], asyncio.Future] = {}
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Неизвестный режим поиска: {mode}")
+        self.mode = mode
+        self.bm25 = bm25 or create_bm25_encoder()
+        self.prefetch_multiplier = prefetch_multiplier
+        self._has_sparse: Optional[bool] = None
+        self.stats = {"requests": 0, "invalidations": 0, "dense_fallbacks": 0}
+
+    def _check_generation(self):
+        """Сбрасывает кэш результатов, если синхронизация изменила индекс."""
+        now = time.monotonic()
+        if now - self._generation_checked_at < self.generation_check_seconds:
+            return
+        self._generation_checked_at = now
+        generation = read_index_generation(self.generation_path)
+        if generation != self._generation:
+            self._generation = generation
+            self.result_cache.clear()
+            self.stats["invalidations"] += 1
+
+    async def embed_query(self, query: str) -> List[float]:
+        """Эмбеддинг запроса из кэша; одинаковые одновременные запросы считаются один раз."""
+        key = (self.provider.model, " ".join(query.split()))
+        vector = self.query_cache.get(key)
+        if vector is not None:
+            return vector
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            return await inflight
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            # Провайдер синхронный (HTTP-клиент OpenAI) - выполняем вне цикла событий
+            vector = (await asyncio.to_thread(self.provider.embed, [key[1]]))[0]
+            self.query_cache.put(key, vector)
+            future.set_result(vector)
+            return vector
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # Ошибку получат ожидающие; без них не печатать предупреждение
+            raise
+        finally:
+            del self._inflight[key]
+
+    def _search_params(self, hnsw_ef: Optional[int], exact: bool, rescore: Optional[bool],
+                       oversampling: Optional[float]) -> models.SearchParams:
+        rescore = self.rescore if rescore is None else rescore
+        oversampling = self.oversampling if oversampling is None else oversampling
+        return models.SearchParams(
+            hnsw_ef=hnsw_ef or self.hnsw_ef,
+            exact=exact,
+            quantization=models.QuantizationSearchParams(rescore=rescore, oversampling=oversampling)
+        )
+
+    async def _resolve_mode(self, mode: Optional[str]) -> str:
+        mode = mode or self.mode
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Неизвестный режим поиска: {mode}")
+        if mode == "dense":
+            return mode
+        if self._has_sparse is None:
+            info = await self.client.get_collection(self.collection_name)
+            self._has_sparse = SPARSE_VECTOR_NAME in (info.config.params.sparse_vectors or {})
+        if not self._has_sparse:
+            self.stats["dense_fallbacks"] += 1
+            return "dense"
+        return mode
+
+    async def _query(self, mode: str, vector: Optional[List[float]], query: str, query_filter: Optional[models.Filter],
+                     limit: int, search_params: models.SearchParams) -> List[models.ScoredPoint]:
+        arguments = {"collection_name": self.collection_name, "query_filter": query_filter,
+                     "limit": limit, "with_payload": RESULT_FIELDS}
+        if mode == "dense":
+            response = await self.client.query_points(query=vector, search_params=search_params, **arguments)
+            return response.points
+
+        indices, values = self.bm25.encode_query(query)
+        if not indices:
+            # В запросе нет слов (только стоп-слова) - искать по BM25 нечего
+            if mode == "sparse":
+                return []
+            response = await self.client.query_points(query=vector, search_params=search_params, **arguments)
+            return response.points
+        sparse_query = models.SparseVector(indices=indices, values=values)
+        if mode == "sparse":
+            response = await self.client.query_points(query=sparse_query, using=SPARSE_VECTOR_NAME, **arguments)
+            return response.points
+
+        candidates = limit * self.prefetch_multiplier
+        response = await self.client.query_points(
+            prefetch=[
+                models.Prefetch(query=vector, filter=query_filter, params=search_params, limit=candidates),
+                models.Prefetch(query=sparse_query, using=SPARSE_VECTOR_NAME, filter=query_filter, limit=candidates),
+            ],
+            query=models.FusionQuery(fusion=models.Fusion.RRF),
+            **arguments
+        )
+        return response.points
+
+    async def search(self, query: str, limit: Optional[int] = None, filters: Optional[Dict[str, Any]] = None,
+                     hnsw_ef: Optional[int] = None, exact: bool = False, rescore: Optional[bool] = None,
+                     oversampling: Optional[float] = None, mode: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Ищет чанки по тексту запроса. mode - dense, sparse или hybrid (по умолчанию self.mode).
+
+        Returns:
+            {'results': [{'id', 'score', <RESULT_FIELDS>}], 'cached': bool, 'timings_ms': {...}}.
+        """
+        start = time.perf_counter()
+        self.stats["requests"] += 1
+        self._check_generation()
+        limit = min(limit or self.default_limit, self.max_limit)
+        mode = await self._resolve_mode(mode)
+        cache_key = (" ".join(query.split()), limit, repr(sorted((filters or {}).items())), hnsw_ef, exact, rescore,
+                     oversampling, mode)
+        cached = self.result_cache.get(cache_key)
+        if cached is not None:
+            return {"results": cached, "cached": True, "mode": mode,
+                    "timings_ms": {"total": round((time.perf_counter() - start) * 1000, 3)}}
+
+        generation = self._generation
+        vector = await self.embed_query(query) if mode != "sparse" else None
+        embedded_at = time.perf_counter()
+        points = await self._query(mode, vector, query, build_filter(filters), limit,
+                                   self._search_params(hnsw_ef, exact, rescore, oversampling))
+        searched_at = time.perf_counter()
+
+        results = [{"id": str(point.id), "score": point.score, **(point.payload or {})} for point in points]
+        # Индекс мог измениться, пока шел поиск - такой результат не кэшируем
+        if generation == self._generation:
+            self.result_cache.put(cache_key, results)
+        return {"results": results, "cached": False, "mode": mode, "timings_ms": {
+            "embedding": round((embedded_at - start) * 1000, 3),
+            "search": round((searched_at - embedded_at) * 1000, 3),
+            "total": round((searched_at - start) * 1000, 3),
+        }}
+
+    def get_stats(self) -> Dict[str, Any]:
+        # Стеммер запросов должен совпадать со стеммером индексации (vector_db.sparse.stemmer)
+        return {**self.stats, "stemmer": self.bm25.tokenizer.stemmer,
+                "query_cache": self.query_cache.stats(), "result_cache": self.result_cache.stats()}
+
+    async def close(self):
+        await self.client.close()
+
+
+def create_retrieval_service(provider: Optional[EmbeddingProvider] = None,
+                             client: Optional[AsyncQdrantClient] = None) -> RetrievalService:
+    """Сервис с параметрами api.retrieval из settings.yml."""
+    retrieval = get_setting("api", "retrieval") or {}
+    return RetrievalService(
+        client or create_async_qdrant_client(pool_size=retrieval.get("qdrant_pool_size")),
+        get_collection_name(),
+        provider or get_embedding_provider(get_settings()),
+        default_limit=retrieval.get("default_limit", 10),
+        max_limit=retrieval.get("max_limit", 100),
+        hnsw_ef=retrieval.get("hnsw_ef"),
+        rescore=retrieval.get("rescore", True),
+        oversampling=retrieval.get("oversampling"),
+        query_cache_size=retrieval.get("query_cache_size", 10000),
+        query_cache_ttl_seconds=retrieval.get("query_cache_ttl_seconds", 3600),
+        result_cache_size=retrieval.get("result_cache_size", 2000),
+        result_cache_ttl_seconds=retrieval.get("result_cache_ttl_seconds", 300),
+        mode=retrieval.get("mode", "hybrid"),
+        prefetch_multiplier=retrieval.get("prefetch_multiplier", 4)
+    )
@@ -0,0 +1,406 @@
+# Файл: scripts/source_providers.py
+#
+# Описание:
+# Этот модуль описывает источники файлов для синхронизации.
+# Каждый источник (провайдер) отдает метаданные в едином формате записи
+# gdrive_mirror, строит план действий и умеет доставить файл в LOCAL_SYNC_PATH.
+#
+# - GDriveProvider: Google Drive (GDriveScanner + rclone или встроенный GDriveDownloader).
+# - LocalDirectoryProvider: локальная директория или смонтированный NAS,
+#   файлы копируются напрямую, без промежуточного облака.
+
+import os
+import re
+import hashlib
+import mimetypes
+import shutil
+import subprocess
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional, Tuple, Iterator
+
+import get_file_lists
+from get_gdrive_methadata import GDriveScanner
+from gdrive_downloader import GDriveDownloader
+from export_cache import ExportCache
+from rate_governor import RateGovernor, RetryableError
+
+Plan = Tuple[List, List, List, List]
+
+# Признаки троттлинга Drive в выводе rclone (после его собственных повторов)
+RCLONE_THROTTLE_PATTERN = re.compile(r"rateLimitExceeded|userRateLimitExceeded|Rate Limit Exceeded|Error 429|Too Many Requests", re.I)
+
+
+def rclone_copy(remote_name: str, local_root: str, relative_path: str,
+                extra_args: Optional[List[str]] = None,
+                governor: Optional[RateGovernor] = None) -> Tuple[bool, Optional[str]]:
+    """
+    Клонирует один файл с GDrive на сервер через rclone, СОХРАНЯЯ СТРУКТУРУ ПАПОК.
+    С governor процесс rclone занимает место в лимите параллельности Drive,
+    а отказ из-за троттлинга повторяется с паузой.
+    """
+    command = [
+        "rclone", "copy",
+        f"{remote_name}:",
+        local_root,
+        "--include", f"/{relative_path}", # Добавляем слэш в начало для точности
+        "--create-empty-src-dirs",
+        "--immutable",
+        "--progress"
+    ] + (extra_args or [])
+
+    def run():
+        try:
+            subprocess.run(command, check=True, capture_output=True, text=True, timeout=600)
+        except subprocess.CalledProcessError as e:
+            if governor is not None and RCLONE_THROTTLE_PATTERN.search(e.stderr or ""):
+                raise RetryableError(e.stderr.strip().replace('\n', ' '), throttled=True) from e
+            raise
+
+    print(f"  Выполнение: {' '.join(command)}")
+    try:
+        if governor is None:
+            run()
+        else:
+            governor.call(run, "rclone.copy")
+        return True, None
+    except subprocess.TimeoutExpired:
+        error_message = "Таймаут скачивания файла (10 минут)."
+        print(f"  ❌ {error_message}")
+        return False, error_message
+    except subprocess.CalledProcessError as e:
+        # Убираем лишние переносы строк из вывода ошибки rclone
+        error_details = e.stderr.strip().replace('\n', ' ')
+        error_message = f"Rclone ошибка: {error_details}"
+        print(f"  ❌ {error_message}")
+        return False, error_message
+    except RetryableError as e:
+        error_message = f"Rclone ошибка (троттлинг Drive): {e}"
+        print(f"  ❌ {error_message}")
+        return False, error_message
+
+
+class SourceProvider:
+    """
+    Базовый класс источника файлов.
+
+    Записи провайдера идентифицируются по gdrive_id; у всех провайдеров, кроме
+    Google Drive, id имеет префикс "<name>:", чтобы записи разных источников
+    в gdrive_mirror не пересекались при планировании.
+    """
+    name = "base"
+    # Был ли последний план get_plan построен полным сканированием (а не по изменениям)
+    last_plan_full = True
+
+    def owns(self, record_id: str) -> bool:
+        """Принадлежит ли запись gdrive_mirror с этим id данному провайдеру."""
+        return record_id.startswith(f"{self.name}:")
+
+    def filter_records(self, db_data: Dict[str, Dict]) -> Dict[str, Dict]:
+        """Оставляет из данных БД только записи этого провайдера."""
+        return {id: item for id, item in db_data.items() if self.owns(id)}
+
+    def get_metadata(self) -> Optional[Dict[str, Dict[str, Any]]]:
+        """Полный список файлов источника: {id: запись gdrive_mirror} или None при ошибке."""
+        raise NotImplementedError
+
+    def iter_metadata(self) -> Iterator[Dict[str, Any]]:
+        """
+        Потоковый вариант get_metadata: записи отдаются по мере сканирования.
+        При ошибке источника бросает исключение (а не возвращает неполный список).
+        """
+        metadata = self.get_metadata()
+        if metadata is None:
+            raise RuntimeError(f"Источник '{self.name}' недоступен")
+        yield from metadata.values()
+
+    def get_incremental_plan(self, db_data: Dict[str, Dict]) -> Optional[Plan]:
+        """План только по изменениям с прошлого запуска или None, если нужен полный проход."""
+        return None
+
+    def prepare_full_scan(self):
+        """Вызывается перед полным сканированием источника."""
+
+    def validate_scan(self, found: int, db_data: Dict[str, Dict]) -> bool:
+        """
+        Можно ли строить план (в том числе удаления) по полному сканированию,
+        нашедшему found файлов, при записях db_data этого источника в БД.
+        """
+        return True
+
+    def get_plan(self, db_data: Dict[str, Dict]) -> Optional[Plan]:
+        """
+        Строит план (to_create, to_update, to_move, to_delete) относительно записей БД.
+        Сначала пробует инкрементальный план, иначе - полное сравнение через get_gdrive_vs_db_plan.
+        """
+        plan = self.get_incremental_plan(db_data)
+        self.last_plan_full = plan is None
+        if plan is not None:
+            return plan
+
+        self.prepare_full_scan()
+        metadata = self.get_metadata()
+        if metadata is None or not self.validate_scan(len(metadata), db_data):
+            return None
+        print(f"  - [{self.name}] Найдено {len(metadata)} файлов.")
+        return get_file_lists.get_gdrive_vs_db_plan(metadata, db_data)
+
+    def fetch_file(self, file_data: Dict[str, Any], local_root: str) -> Tuple[bool, Optional[str]]:
+        """Доставляет файл в local_root/<path>. Возвращает (успех, текст ошибки)."""
+        raise NotImplementedError
+
+    def commit(self):
+        """Вызывается после успешного выполнения плана (например, чтобы сохранить состояние)."""
+
+    def forget(self, record_ids: List[str]):
+        """Вызывается для удаленных записей (например, чтобы очистить кэши источника)."""
+
+    def pending_state(self) -> Optional[Dict[str, Any]]:
+        """Несохраненное состояние плана (его сохранит commit), JSON-совместимое; для журнала."""
+        return None
+
+    def restore_pending_state(self, state: Dict[str, Any]):
+        """Восстанавливает pending_state() при продолжении плана из журнала вместо get_plan."""
+
+
+class GDriveProvider(SourceProvider):
+    """
+    Google Drive: полное или инкрементальное сканирование.
+    Скачивание - через rclone или, если передан downloader, внутри процесса.
+    Google-документы экспортируются в формат из scanner.export_formats;
+    с export_cache каждая ревизия документа экспортируется один раз.
+    """
+    name = "google"
+
+    def __init__(self, scanner: GDriveScanner, folder_id: str, remote_name: Optional[str],
+                 incremental: bool = True, full_scan_interval_hours: float = 24,
+                 max_workers: int = 1, folders_per_query: int = 1,
+                 downloader: Optional[GDriveDownloader] = None,
+                 export_cache: Optional[ExportCache] = None):
+        self.scanner = scanner
+        self.downloader = downloader
+        self.export_cache = export_cache
+        self.folder_id = folder_id
+        self.remote_name = remote_name
+        self.incremental = incremental
+        self.full_scan_interval_hours = full_scan_interval_hours
+        self.max_workers = max_workers
+        self.folders_per_query = folders_per_query
+
+    def owns(self, record_id: str) -> bool:
+        # ID файлов Google Drive никогда не содержат ':'
+        return ":" not in record_id
+
+    def get_metadata(self) -> Optional[Dict[str, Dict[str, Any]]]:
+        return self.scanner.get_metadata_from_gdrive(
+            self.folder_id,
+            max_workers=self.max_workers,
+            folders_per_query=self.folders_per_query
+        )
+
+    def iter_metadata(self) -> Iterator[Dict[str, Any]]:
+        return self.scanner.iter_metadata_from_gdrive(
+            self.folder_id,
+            max_workers=self.max_workers,
+            folders_per_query=self.folders_per_query
+        )
+
+    def get_incremental_plan(self, db_data: Dict[str, Dict]) -> Optional[Plan]:
+        # Инкрементальный режим (Changes API), если есть сохраненный token и
+        # не подошло время периодического полного пересчета.
+        if not self.incremental or self.scanner.is_full_scan_due(self.folder_id, self.full_scan_interval_hours):
+            return None
+        changes = self.scanner.get_changes_from_gdrive()
+        if changes is None:
+            print("  - Инкрементальный режим недоступен, выполняем полное сканирование.")
+            return None
+        print(f"  - [{self.name}] Инкрементально: изменено {len(changes['files'])}, удалено {len(changes['removed'])} файлов, "
+              f"перемещено папок {len(changes['folder_moves'])}.")
+        return get_file_lists.get_gdrive_changes_vs_db_plan(changes, db_data)
+
+    def prepare_full_scan(self):
+        self.scanner.begin_full_scan()
+
+    def _export_extension(self, file_data: Dict[str, Any]) -> Optional[str]:
+        """Расширение формата экспорта для Google-документа или None для обычного файла."""
+        mime_type = file_data.get('mime_type')
+        if mime_type:
+            return self.scanner.export_formats.get(mime_type)
+        # Записи из БД (перезакачка на этапе B) без mime_type: у обычных файлов Drive md5 есть всегда
+        extension = os.path.splitext(file_data['path'])[1].lstrip('.').lower()
+        if file_data.get('md5_checksum') is None and extension in self.scanner.export_formats.values():
+            return extension
+        return None
+
+    def _rclone_copy(self, file_data: Dict[str, Any], local_root: str,
+                     extra_args: Optional[List[str]] = None) -> Tuple[bool, Optional[str]]:
+        if not self.remote_name or not local_root:
+            print("  ❌ Ошибка: RCLONE_REMOTE_NAME или LOCAL_SYNC_PATH не заданы в .env")
+            return False, "Переменные окружения не заданы"
+        return rclone_copy(self.remote_name, local_root, file_data['path'], extra_args, self.scanner.governor)
+
+    def _fetch_export(self, file_data: Dict[str, Any], local_root: str, extension: str) -> Tuple[bool, Optional[str]]:
+        """
+        Доставляет экспорт Google-документа (из кэша ревизий или из Drive) и
+        записывает в size_bytes его размер: с ним сверяется этап B.
+        """
+        destination_path = os.path.join(local_root, file_data['path'])
+        gdrive_id, version = file_data['gdrive_id'], file_data.get('version')
+        if self.export_cache is not None and self.export_cache.restore(gdrive_id, version, extension, destination_path):
+            print(f"  - Ревизия {version} взята из кэша экспорта.")
+        else:
+            if self.downloader is not None:
+                is_success, error = self.downloader.export(file_data, local_root, extension)
+            else:
+                is_success, error = self._rclone_copy(file_data, local_root, ["--drive-export-formats", extension])
+            if not is_success:
+                return is_success, error
+            if self.export_cache is not None:
+                self.export_cache.store(gdrive_id, version, extension, destination_path)
+        file_data['size_bytes'] = os.path.getsize(destination_path)
+        return True, None
+
+    def fetch_file(self, file_data: Dict[str, Any], local_root: str) -> Tuple[bool, Optional[str]]:
+        extension = self._export_extension(file_data)
+        if extension is not None:
+            return self._fetch_export(file_data, local_root, extension)
+        if self.downloader is not None:
+            return self.downloader.download(file_data, local_root)
+        return self._rclone_copy(file_data, local_root)
+
+    def commit(self):
+        # Token сохраняем только после применения плана, чтобы сбой не потерял изменения
+        self.scanner.commit_state()
+        if self.export_cache is not None:
+            self.export_cache.prune()
+
+    def forget(self, record_ids: List[str]):
+        if self.export_cache is not None:
+            self.export_cache.remove(record_ids)
+
+    def pending_state(self) -> Optional[Dict[str, Any]]:
+        return self.scanner.pending_state()
+
+    def restore_pending_state(self, state: Dict[str, Any]):
+        self.scanner.restore_pending_state(state)
+
+
+class LocalDirectoryProvider(SourceProvider):
+    """
+    Локальная директория или NAS. Файлы попадают в LOCAL_SYNC_PATH/<name>/...
+
+    ID записи - "<name>:" + sha1 относительного пути: он стабилен между
+    запусками и не меняется при атомарном сохранении файла (запись во
+    временный файл + rename), в отличие от номера inode.
+    Без контрольных сумм изменение определяется по version (mtime в нс) и размеру.
+
+    Любая ошибка чтения директории прерывает сканирование: неполный список
+    файлов превратился бы в план удаления пропущенных. По той же причине
+    пустой корень при записях источника в БД (NAS не смонтирован, Docker
+    создал пустую точку монтирования) считается ошибкой.
+    """
+    HASH_CHUNK_SIZE = 1024 * 1024
+
+    def __init__(self, name: str, root_path: str, checksums: bool = False):
+        self.name = name
+        self.root_path = root_path
+        self.checksums = checksums
+
+    def _record_id(self, relative_path: str) -> str:
+        return f"{self.name}:{hashlib.sha1(relative_path.encode('utf-8')).hexdigest()}"
+
+    def _md5(self, full_path: str) -> str:
+        md5 = hashlib.md5()
+        with open(full_path, "rb") as f:
+            for chunk in iter(lambda: f.read(self.HASH_CHUNK_SIZE), b""):
+                md5.update(chunk)
+        return md5.hexdigest()
+
+    def _build_record(self, relative_path: str, full_path: str, stat: os.stat_result) -> Dict[str, Any]:
+        name = os.path.basename(relative_path)
+        return {
+            "gdrive_id": self._record_id(relative_path),
+            "name": name,
+            "path": os.path.join(self.name, relative_path),
+            "md5_checksum": self._md5(full_path) if self.checksums else None,
+            "version": str(stat.st_mtime_ns),
+            "mime_type": mimetypes.guess_type(name)[0],
+            "web_view_link": None,
+            "gdrive_created_time": datetime.fromtimestamp(stat.st_ctime, timezone.utc).isoformat(),
+            "gdrive_modified_time": datetime.fromtimestamp(stat.st_mtime, timezone.utc).isoformat(),
+            "size_bytes": stat.st_size
+        }
+
+    def get_metadata(self) -> Optional[Dict[str, Dict[str, Any]]]:
+        try:
+            return {record["gdrive_id"]: record for record in self.iter_metadata()}
+        except OSError as e:
+            print(f"❌ [{self.name}] Сканирование {self.root_path} прервано: {e}")
+            return None
+
+    def validate_scan(self, found: int, db_data: Dict[str, Dict]) -> bool:
+        if found == 0 and db_data:
+            print(f"❌ [{self.name}] Директория {self.root_path} пуста, а в БД {len(db_data)} записей источника: "
+                  f"источник не смонтирован? Удаления не планируются.")
+            return False
+        return True
+
+    def iter_metadata(self) -> Iterator[Dict[str, Any]]:
+        if not os.path.isdir(self.root_path):
+            raise FileNotFoundError(f"Директория {self.root_path} недоступна")
+
+        print(f"Сканирование источника '{self.name}': {self.root_path}...")
+        dirs_to_visit = [""]
+        while dirs_to_visit:
+            relative_dir = dirs_to_visit.pop()
+            # Ошибка листинга (нет прав, EIO, ESTALE, директория пропала) не пропускается:
+            # файлы директории выпали бы из списка и были бы удалены
+            with os.scandir(os.path.join(self.root_path, relative_dir)) as entries:
+                for entry in entries:
+                    relative_path = os.path.join(relative_dir, entry.name)
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            dirs_to_visit.append(relative_path)
+                        elif entry.is_file(follow_symlinks=False):
+                            yield self._build_record(relative_path, entry.path, entry.stat(follow_symlinks=False))
+                    except FileNotFoundError:
+                        # Файл мог быть удален во время сканирования, пропускаем
+                        continue
+
+    def fetch_file(self, file_data: Dict[str, Any], local_root: str) -> Tuple[bool, Optional[str]]:
+        source_path = os.path.join(self.root_path, os.path.relpath(file_data['path'], self.name))
+        destination_path = os.path.join(local_root, file_data['path'])
+        tmp_path = f"{destination_path}.partial"
+        try:
+            os.makedirs(os.path.dirname(destination_path), exist_ok=True)
+            shutil.copy2(source_path, tmp_path)
+            os.replace(tmp_path, destination_path)
+            return True, None
+        except OSError as e:
+            error_message = f"Ошибка копирования: {e}"
+            print(f"  ❌ {error_message}")
+            return False, error_message
+
+
+def get_local_providers(settings: Dict[str, Any]) -> List[SourceProvider]:
+    """
+    Создает провайдеры локальных директорий из секции sync.providers settings.yml.
+    Используются включенные провайдеры с заданным path (local, nas, ...).
+    """
+    sync_settings = settings.get("sync") or {}
+    if not sync_settings.get("enabled", True):
+        return []
+
+    providers = []
+    for provider_settings in sync_settings.get("providers") or []:
+        name = provider_settings.get("name")
+        if not provider_settings.get("enabled", False) or name == GDriveProvider.name:
+            continue
+        if not provider_settings.get("path"):
+            print(f"  - Провайдер '{name}' пропущен: не задан path.")
+            continue
+        providers.append(LocalDirectoryProvider(
+            name,
+            provider_settings["path"],
+            checksums=bool(provider_settings.get("checksums", False))
+        ))
+    return providers
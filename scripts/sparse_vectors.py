@@ -0,0 +1,179 @@
+# Файл: scripts/sparse_vectors.py
+#
+# Описание:
+# Разреженные BM25-векторы для гибридного поиска (именованный sparse-вектор
+# "bm25" рядом с плотным вектором коллекции documents).
+#
+# - Токенизация RU/EN (processing.languages): нижний регистр, ё -> е, слова и
+#   числа; идентификаторы вида "ДП-2024/117" или "INV_8841" дают и части, и
+#   целый токен, поэтому точный номер документа находится как одно слово.
+# - Нормализация: стоп-слова и стемминг (vector_db.sparse.stemmer: snowball -
+#   snowballstemmer, light - упрощенное отсечение окончаний). Токены с цифрами
+#   не стеммируются. Стеммер выбирается настройкой, а не наличием пакета:
+#   индексация (sync) и запросы (API) обязаны давать одинаковые термины,
+#   поэтому без snowballstemmer режим snowball падает с ошибкой.
+# - Вес термина в чанке - TF-часть BM25 с нормализацией по длине
+#   (k1, b, средняя длина чанка из vector_db.sparse). IDF считает Qdrant при
+#   запросе (modifier=IDF), поэтому векторы не пересчитываются при росте корпуса.
+# - Индекс термина - crc32 от нормализованной формы: словарь не хранится.
+
+import re
+import zlib
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from get_settings import get_setting
+
+try:
+    import snowballstemmer
+except ImportError:
+    snowballstemmer = None
+
+SPARSE_VECTOR_NAME = "bm25"
+
+_WORD = re.compile(r"\w+")
+# Идентификатор: буквенно-цифровые части, соединенные - / _ . (номера договоров, артикулы, версии)
+_IDENTIFIER = re.compile(r"\w+(?:[-/_.]\w+)+")
+_CYRILLIC = re.compile(r"[а-я]")
+
+STOP_WORDS = {
+    # ru
+    "и", "в", "во", "не", "что", "он", "на", "я", "с", "со", "как", "а", "то", "все", "она", "так", "его", "но", "да", "ты",
+    "к", "у", "же", "вы", "за", "бы", "по", "только", "ее", "мне", "было", "вот", "от", "меня", "еще", "нет", "о", "из",
+    "ему", "теперь", "когда", "даже", "ну", "ли", "если", "уже", "или", "ни", "быть", "был", "него", "до", "вас", "нибудь",
+    "уж", "вам", "там", "потом", "себя", "ничего", "ей", "может", "они", "тут", "где", "есть", "надо", "ней", "для", "мы",
+    "тебя", "их", "чем", "была", "сам", "чтоб", "без", "будто", "чего", "раз", "тоже", "себе", "под", "будет", "ж", "тогда",
+    "кто", "этот", "того", "потому", "этого", "какой", "совсем", "ним", "здесь", "этом", "один", "почти", "мой", "тем",
+    "чтобы", "нее", "были", "куда", "зачем", "всех", "можно", "при", "об", "это", "эти", "эта", "также", "который", "которые",
+    # en
+    "a", "an", "the", "and", "or", "but", "if", "of", "at", "by", "for", "with", "about", "to", "from", "in", "on", "is",
+    "are", "was", "were", "be", "been", "being", "it", "its", "this", "that", "these", "those", "as", "not", "no", "so",
+    "than", "too", "very", "can", "will", "just", "do", "does", "did", "have", "has", "had", "i", "you", "he", "she", "we",
+    "they", "them", "his", "her", "our", "your", "their", "what", "which", "who", "whom", "into", "over", "under", "then",
+}
+
+# Окончания для упрощенного стемминга (от длинных к коротким)
+_RU_ENDINGS = sorted([
+    "иями", "ями", "ами", "иях", "ях", "ах", "ией", "ов", "ев", "ей", "ой", "ий", "ый", "ая", "яя", "ое", "ее", "ые",
+    "ие", "ых", "их", "ым", "им", "ом", "ем", "ам", "ям", "ую", "юю", "ия", "ья", "ье", "ого", "его", "ому", "ему", "ться",
+    "ется", "ются", "ить", "ать", "ять", "еть", "ла", "ли", "ло", "а", "я", "о", "е", "ы", "и", "у", "ю", "ь", "й",
+], key=len, reverse=True)
+_EN_SUFFIXES = [("ies", "y"), ("sses", "ss"), ("ing", ""), ("ed", ""), ("es", ""), ("s", "")]
+_MIN_STEM = 3
+STEMMERS = ("snowball", "light")
+
+
+def _light_stem_ru(word: str) -> str:
+    for ending in _RU_ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= _MIN_STEM:
+            return word[:-len(ending)]
+    return word
+
+
+def _light_stem_en(word: str) -> str:
+    if word.endswith("ss"):
+        return word
+    for suffix, replacement in _EN_SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= _MIN_STEM:
+            return word[:-len(suffix)] + replacement
+    return word
+
+
+class Tokenizer:
+    """Нормализация RU/EN текста в термины для BM25."""
+
+    def __init__(self, languages: Optional[List[str]] = None, stemmer: Optional[str] = None):
+        """
+        Args:
+            languages: Языки стемминга (по умолчанию processing.languages).
+            stemmer: snowball или light (по умолчанию vector_db.sparse.stemmer).
+        """
+        languages = set(languages or get_setting("processing", "languages", ["en", "ru"]))
+        self.stemmer = stemmer or (get_setting("vector_db", "sparse") or {}).get("stemmer", "snowball")
+        if self.stemmer not in STEMMERS:
+            raise ValueError(f"Неизвестный стеммер: {self.stemmer} (допустимо: {', '.join(STEMMERS)})")
+        if self.stemmer == "snowball" and snowballstemmer is None:
+            # Тихий переход на light дал бы термины, не совпадающие с проиндексированными
+            raise ImportError("vector_db.sparse.stemmer: snowball требует пакет snowballstemmer "
+                              "(или задайте light и переиндексируйте коллекцию)")
+        self._stemmers = {}
+        if self.stemmer == "snowball":
+            if "ru" in languages:
+                self._stemmers["ru"] = snowballstemmer.stemmer("russian")
+            if "en" in languages:
+                self._stemmers["en"] = snowballstemmer.stemmer("english")
+        self._fallback = {"ru": _light_stem_ru, "en": _light_stem_en}
+        self._languages = languages
+        self._cache: Dict[str, str] = {}
+
+    def _stem(self, word: str) -> str:
+        stem = self._cache.get(word)
+        if stem is not None:
+            return stem
+        language = "ru" if _CYRILLIC.search(word) else "en"
+        if any(char.isdigit() for char in word) or language not in self._languages:
+            stem = word
+        elif language in self._stemmers:
+            stem = self._stemmers[language].stemWord(word)
+        else:
+            stem = self._fallback[language](word)
+        if len(self._cache) < 200000:
+            self._cache[word] = stem
+        return stem
+
+    def tokenize(self, text: str) -> List[str]:
+        text = text.lower().replace("ё", "е")
+        terms = [self._stem(word) for word in _WORD.findall(text)
+                 if word not in STOP_WORDS and (len(word) > 1 or word.isdigit())]
+        terms.extend(match.group(0) for match in _IDENTIFIER.finditer(text))
+        return terms
+
+
+def term_index(term: str) -> int:
+    return zlib.crc32(term.encode("utf-8"))
+
+
+class BM25Encoder:
+    """BM25-веса терминов чанка (документная часть) и термины запроса."""
+
+    def __init__(self, tokenizer: Optional[Tokenizer] = None, k1: float = 1.2, b: float = 0.75, avg_length: float = 150):
+        """
+        Args:
+            tokenizer: Токенизатор (по умолчанию - языки из processing.languages).
+            k1, b: Параметры BM25.
+            avg_length: Средняя длина чанка в терминах (для нормализации по длине).
+        """
+        self.tokenizer = tokenizer or Tokenizer()
+        self.k1 = k1
+        self.b = b
+        self.avg_length = avg_length
+
+    def _to_sparse(self, weights: Dict[int, float]) -> Tuple[List[int], List[float]]:
+        indices = sorted(weights)
+        return indices, [weights[index] for index in indices]
+
+    def encode_document(self, text: str) -> Tuple[List[int], List[float]]:
+        """(индексы, веса) для хранения в коллекции."""
+        terms = self.tokenizer.tokenize(text)
+        if not terms:
+            return [], []
+        length_norm = self.k1 * (1 - self.b + self.b * len(terms) / self.avg_length)
+        weights: Dict[int, float] = {}
+        for term, frequency in Counter(terms).items():
+            index = term_index(term)
+            weights[index] = weights.get(index, 0.0) + frequency * (self.k1 + 1) / (frequency + length_norm)
+        return self._to_sparse(weights)
+
+    def encode_query(self, text: str) -> Tuple[List[int], List[float]]:
+        """(индексы, веса) запроса: каждый термин с весом 1 (IDF добавляет Qdrant)."""
+        return self._to_sparse({term_index(term): 1.0 for term in self.tokenizer.tokenize(text)})
+
+
+def create_bm25_encoder() -> BM25Encoder:
+    """Кодировщик с параметрами vector_db.sparse из settings.yml."""
+    sparse = get_setting("vector_db", "sparse") or {}
+    return BM25Encoder(k1=sparse.get("k1", 1.2), b=sparse.get("b", 0.75), avg_length=sparse.get("avg_chunk_terms", 150))
+
+
+def sparse_enabled() -> bool:
+    return bool((get_setting("vector_db", "sparse") or {}).get("enabled", False))
@@ -0,0 +1,216 @@
+# Файл: scripts/sync_daemon.py
+#
+# Описание:
+# Режим демона для контейнера sync_service: процесс не завершается после
+# прогона, а выполняет синхронизацию "тиками" по расписанию.
+#
+# - Клиенты живут весь процесс (SyncSession из main.py): аутентификация в
+#   Drive, discovery-клиент, регулятор темпа, клиент Supabase со снимком
+#   gdrive_mirror и индексатор Qdrant создаются один раз.
+# - Расписание: SYNC_INTERVAL_MINUTES (интервал между началами тиков) или
+#   cron-выражение SYNC_SCHEDULE / indexing.schedule из settings.yml.
+# - Стадии без изменившихся входов пропускаются: пустой инкрементальный
+#   план не исполняется, индекс Qdrant не трогается, этап B (сверка диска)
+#   выполняется после изменений этапа A или раз в SYNC_VERIFY_INTERVAL_HOURS.
+# - SIGTERM/SIGINT: текущая стадия доделывается, следующие не начинаются,
+#   отчеты тика пишутся, процесс завершается с кодом 0. Повторный сигнал
+#   прерывает процесс сразу.
+# - Метрики: на каждый тик новый реестр (metrics.configure), отчеты в
+#   METRICS_DIR; с METRICS_PORT /metrics отдает текущий или последний тик.
+#
+# Запуск: python sync_daemon.py             (по расписанию)
+#         python sync_daemon.py --once      (один тик с теми же правилами пропуска)
+
+import os
+import sys
+import time
+import signal
+import argparse
+from datetime import datetime, timedelta
+from typing import Optional, Set
+
+from dotenv import load_dotenv
+
+import metrics
+from get_settings import get_setting
+from main import SyncSession, run_sync
+
+CRON_FIELDS = [("минуты", 0, 59), ("часы", 0, 23), ("дни месяца", 1, 31), ("месяцы", 1, 12), ("дни недели", 0, 7)]
+
+
+def parse_args():
+    """Парсер аргументов командной строки"""
+    parser = argparse.ArgumentParser(description='Синхронизация в режиме демона')
+    parser.add_argument('--once', action='store_true', help='Выполнить один тик и завершиться')
+    parser.add_argument('--interval-minutes', type=float, default=None,
+                        help='Интервал между тиками (по умолчанию SYNC_INTERVAL_MINUTES или cron)')
+    parser.add_argument('--schedule', type=str, default=None,
+                        help='Cron-выражение (по умолчанию SYNC_SCHEDULE или indexing.schedule)')
+    return parser.parse_args()
+
+
+class CronSchedule:
+    """
+    Cron-выражение из пяти полей (минута, час, день месяца, месяц, день недели):
+    *, числа, диапазоны a-b, списки через запятую и шаг /n. Как в cron, если
+    ограничены и день месяца, и день недели, подходит любой из них.
+    """
+
+    def __init__(self, expression: str):
+        self.expression = expression
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"ожидается 5 полей cron, получено {len(fields)}: '{expression}'")
+        self.minutes, self.hours, self.days, self.months, self.weekdays = [
+            self._parse_field(field, name, low, high) for field, (name, low, high) in zip(fields, CRON_FIELDS)
+        ]
+        self.any_day = fields[2] == "*"
+        self.any_weekday = fields[4] == "*"
+
+    @staticmethod
+    def _parse_field(field: str, name: str, low: int, high: int) -> Set[int]:
+        values = set()
+        for part in field.split(","):
+            expression, _, step = part.partition("/")
+            if expression == "*":
+                start, end = low, high
+            elif "-" in expression:
+                start, end = (int(value) for value in expression.split("-", 1))
+            else:
+                start = end = int(expression)
+                if step:
+                    end = high
+            if start < low or end > high or start > end:
+                raise ValueError(f"поле '{name}' вне диапазона {low}-{high}: '{part}'")
+            values.update(range(start, end + 1, int(step) if step else 1))
+        if high == 7 and 7 in values:
+            values = (values - {7}) | {0}  # день недели 7 - тоже воскресенье
+        return values
+
+    def _day_matches(self, moment: datetime) -> bool:
+        day = moment.day in self.days
+        weekday = (moment.weekday() + 1) % 7 in self.weekdays  # в cron 0 - воскресенье
+        if self.any_day or self.any_weekday:
+            return day and weekday
+        return day or weekday
+
+    def next_after(self, moment: datetime) -> datetime:
+        """Ближайшее время срабатывания строго после moment (локальное время)."""
+        candidate = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = candidate + timedelta(days=366 * 4)
+        while candidate < limit:
+            if candidate.month not in self.months or not self._day_matches(candidate):
+                candidate = (candidate + timedelta(days=1)).replace(hour=0, minute=0)
+            elif candidate.hour not in self.hours:
+                candidate = (candidate + timedelta(hours=1)).replace(minute=0)
+            elif candidate.minute not in self.minutes:
+                candidate += timedelta(minutes=1)
+            else:
+                return candidate
+        raise ValueError(f"cron '{self.expression}' не срабатывает никогда")
+
+
+class SyncDaemon:
+    """Цикл тиков синхронизации с общей SyncSession и мягкой остановкой по сигналу."""
+
+    def __init__(self, interval_minutes: Optional[float] = None, schedule: Optional[CronSchedule] = None,
+                 verify_interval_hours: float = 24, run_on_start: bool = True):
+        if interval_minutes is None and schedule is None:
+            raise ValueError("нужен интервал или cron-расписание")
+        self.interval_minutes = interval_minutes
+        self.schedule = schedule
+        self.run_on_start = run_on_start
+        self.session = SyncSession(verify_interval_hours=verify_interval_hours)
+        self.ticks = 0
+        self.failed_ticks = 0
+
+    def describe_schedule(self) -> str:
+        if self.interval_minutes is not None:
+            return f"каждые {self.interval_minutes:g} мин"
+        return f"по cron '{self.schedule.expression}'"
+
+    def next_tick_time(self, last_start: Optional[float]) -> float:
+        now = time.time()
+        if last_start is None and self.run_on_start:
+            return now
+        if self.interval_minutes is not None:
+            # Интервал отсчитывается от начала тика; затянувшийся тик не копит пропущенные
+            return max(now, (last_start or now) + self.interval_minutes * 60)
+        return self.schedule.next_after(datetime.fromtimestamp(now)).timestamp()
+
+    def request_stop(self, signum, _frame):
+        if self.session.stopping():
+            print("\n⚠️ Повторный сигнал, немедленная остановка.")
+            signal.signal(signum, signal.SIG_DFL)
+            os.kill(os.getpid(), signum)
+            return
+        print(f"\n⚠️ Получен сигнал {signal.Signals(signum).name}: доделываем текущую стадию и останавливаемся...")
+        self.session.stop_event.set()
+
+    def tick(self) -> bool:
+        """Один прогон со своим реестром метрик и отчетами."""
+        self.ticks += 1
+        print(f"\n🚀 Тик #{self.ticks}: {datetime.now().isoformat(timespec='seconds')}")
+        metrics.configure(run_name="sync_daemon")
+        result = False
+        try:
+            result = run_sync(self.session)
+        except Exception as e:
+            # Ошибка одного тика не останавливает демон: следующий тик начнется по расписанию
+            print(f"❌ Тик #{self.ticks} завершился с ошибкой: {e!r}")
+        if not result:
+            self.failed_ticks += 1
+        metrics.set_gauge("daemon_ticks", self.ticks)
+        metrics.set_gauge("daemon_failed_ticks", self.failed_ticks)
+        report_path = metrics.write_reports(status="ok" if result else "failed")
+        if report_path:
+            print(f"📊 Отчет о тике: {report_path}")
+        return result
+
+    def run(self, once: bool = False):
+        signal.signal(signal.SIGTERM, self.request_stop)
+        signal.signal(signal.SIGINT, self.request_stop)
+        print(f"🚀 Демон синхронизации запущен, расписание: {self.describe_schedule()}.")
+        last_start = None
+        while not self.session.stopping():
+            next_time = self.next_tick_time(last_start)
+            if next_time > time.time():
+                print(f"  - Следующий тик: {datetime.fromtimestamp(next_time).isoformat(timespec='seconds')}")
+                # Ожидание прерывается сигналом остановки
+                if self.session.stop_event.wait(next_time - time.time()):
+                    break
+            last_start = time.time()
+            self.tick()
+            if once:
+                break
+        print(f"✅ Демон остановлен: тиков {self.ticks}, неудачных {self.failed_ticks}.")
+
+
+def create_daemon(interval_minutes: Optional[float] = None, schedule: Optional[str] = None) -> SyncDaemon:
+    """Демон с параметрами из аргументов, .env и settings.yml."""
+    if interval_minutes is None and os.getenv("SYNC_INTERVAL_MINUTES"):
+        interval_minutes = float(os.getenv("SYNC_INTERVAL_MINUTES"))
+    cron = None
+    if interval_minutes is None:
+        cron = CronSchedule(schedule or os.getenv("SYNC_SCHEDULE") or get_setting("indexing", "schedule", "0 2 * * *"))
+    return SyncDaemon(
+        interval_minutes=interval_minutes,
+        schedule=cron,
+        verify_interval_hours=float(os.getenv("SYNC_VERIFY_INTERVAL_HOURS", "24")),
+        run_on_start=os.getenv("SYNC_RUN_ON_START", "true").lower() == "true"
+    )
+
+
+def main():
+    args = parse_args()
+    load_dotenv()
+    try:
+        daemon = create_daemon(args.interval_minutes, args.schedule)
+    except ValueError as e:
+        print(f"❌ Неверное расписание: {e}")
+        sys.exit(1)
+    daemon.run(once=args.once)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,307 @@
+# Файл: scripts/sync_journal.py
+#
+# Описание:
+# Журнал выполнения плана этапа A на диске: если контейнер перезапустился
+# посреди длинного execute_create, следующий запуск продолжает тот же план
+# вместо нового сканирования источника и пересчета.
+#
+# - Файл <SYNC_STATE_DIR>/journal/<провайдер>.jsonl, только дозапись строк
+#   JSON: первая - план и несохраненное состояние провайдера (token Changes
+#   API и карта папок), дальше - отметки о выполненных действиях.
+# - fsync пачками: не на каждую отметку, а раз в fsync_every отметок или
+#   fsync_interval секунд. При сбое теряется только хвост последней пачки,
+#   а эти действия просто выполняются повторно (исполнители идемпотентны).
+#   Оборванная последняя строка при чтении пропускается.
+# - Отметки: "fetched" - файл доставлен на диск (при возобновлении он не
+#   качается заново, только записывается в БД), "done" - действие записано
+#   в gdrive_mirror.
+# - Журнал старше max_age_hours или от другого LOCAL_SYNC_PATH считается
+#   устаревшим: он удаляется, и план строится заново.
+# - Временные файлы: при возобновлении удаляются брошенные временные файлы
+#   rclone (<файл>.<хэш>.partial) по путям незавершенных скачиваний;
+#   <файл>.partial встроенного скачивания остается для докачки. Для
+#   устаревшего журнала удаляются и они.
+# - После выполнения плана и provider.commit() журнал удаляется.
+#
+# Неудавшиеся действия (ошибка скачивания, записи в БД, перемещения или
+# удаления) сохраняются в <SYNC_STATE_DIR>/journal/<провайдер>.failed.json
+# до сохранения token провайдера и добавляются в план следующего
+# инкрементального прогона: Changes API их больше не вернет. Полное
+# сканирование сравнивает весь источник с БД и находит их само, поэтому
+# после него список сбрасывается.
+
+import os
+import glob
+import json
+import time
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import metrics
+
+JOURNAL_VERSION = 1
+
+
+def remove_partial_files(local_root: str, paths: Iterable[str], keep_resumable: bool = False) -> int:
+    """
+    Удаляет временные файлы скачивания для путей paths (относительно local_root).
+    keep_resumable=True оставляет <путь>.partial, который встроенное скачивание докачивает.
+    Возвращает число удаленных файлов.
+    """
+    removed = 0
+    for relative_path in paths:
+        destination_path = os.path.join(local_root, relative_path)
+        candidates = glob.glob(f"{glob.escape(destination_path)}.*.partial")
+        if not keep_resumable:
+            candidates.append(f"{destination_path}.partial")
+        for tmp_path in candidates:
+            try:
+                os.remove(tmp_path)
+                removed += 1
+            except FileNotFoundError:
+                continue
+            except OSError as e:
+                print(f"  ⚠️ Не удалось удалить временный файл {tmp_path}: {e}")
+    return removed
+
+
+def failed_actions(plan: Dict[str, List], synced: List[Dict[str, Any]], moved: List[Dict[str, Any]],
+                   deleted: List[str]) -> Dict[str, List]:
+    """Действия плана, которых нет среди результатов исполнителей."""
+    synced_ids = {item['gdrive_id'] for item in synced}
+    moved_ids = {item['gdrive_id'] for item in moved}
+    deleted_ids = set(deleted)
+    moves = plan["to_move"] + [item for dir_move in plan.get("dir_moves", []) for item in dir_move['files']]
+    return {
+        "to_create": [item for item in plan["to_create"] if item['gdrive_id'] not in synced_ids],
+        "to_update": [item for item in plan["to_update"] if item['gdrive_id'] not in synced_ids],
+        "to_move": [item for item in moves if item['gdrive_id'] not in moved_ids],
+        "to_delete": [gdrive_id for gdrive_id in plan["to_delete"] if gdrive_id not in deleted_ids],
+    }
+
+
+def load_failed_actions(path: str) -> Dict[str, List]:
+    """Неудавшиеся действия прошлого прогона (пустой план, если их нет)."""
+    empty = {"to_create": [], "to_update": [], "to_move": [], "to_delete": []}
+    if not os.path.exists(path):
+        return empty
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return {**empty, **json.load(f)}
+    except (ValueError, OSError) as e:
+        print(f"  ⚠️ Не удалось прочитать {path}: {e}")
+        return empty
+
+
+def save_failed_actions(path: str, actions: Dict[str, List]) -> int:
+    """Атомарно сохраняет неудавшиеся действия (или удаляет файл, если их нет). Возвращает их число."""
+    count = sum(len(items) for items in actions.values())
+    if not count:
+        if os.path.exists(path):
+            os.remove(path)
+        return 0
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(actions, f, ensure_ascii=False, default=str)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return count
+
+
+def requeue_failed_actions(plan: Dict[str, List], failed: Dict[str, List],
+                           db_data: Dict[str, Dict]) -> int:
+    """
+    Добавляет в план неудавшиеся действия прошлого прогона. Файлы, которые
+    уже есть в новом плане, берутся из него (он свежее); перемещения и
+    удаления - только для записей, которые еще есть в БД. Возвращает число добавленных.
+    """
+    planned_ids = {item['gdrive_id'] for key in ("to_create", "to_update", "to_move") for item in plan[key]}
+    planned_ids.update(item['gdrive_id'] for dir_move in plan.get("dir_moves", []) for item in dir_move['files'])
+    planned_ids.update(plan["to_delete"])
+    added = 0
+    for item in failed["to_create"] + failed["to_update"]:
+        if item['gdrive_id'] in planned_ids:
+            continue
+        # Запись могла появиться в БД после прошлой попытки: тогда это изменение
+        plan["to_update" if item['gdrive_id'] in db_data else "to_create"].append(item)
+        planned_ids.add(item['gdrive_id'])
+        added += 1
+    for item in failed["to_move"]:
+        if item['gdrive_id'] not in planned_ids and item['gdrive_id'] in db_data:
+            plan["to_move"].append(item)
+            planned_ids.add(item['gdrive_id'])
+            added += 1
+    for gdrive_id in failed["to_delete"]:
+        if gdrive_id not in planned_ids and gdrive_id in db_data:
+            plan["to_delete"].append(gdrive_id)
+            added += 1
+    return added
+
+
+class SyncJournal:
+    """Журнал плана одного провайдера с отметками о выполненных действиях."""
+
+    def __init__(self, path: str, fsync_every: int = 100, fsync_interval: float = 1.0):
+        """
+        Args:
+            path: Файл журнала.
+            fsync_every: Сбрасывать на диск после стольких отметок...
+            fsync_interval: ...или если с прошлого сброса прошло столько секунд.
+        """
+        self.path = path
+        self.fsync_every = max(1, fsync_every)
+        self.fsync_interval = fsync_interval
+        self.header: Optional[Dict[str, Any]] = None
+        self.done = set()                       # (действие, ключ)
+        self.fetched: Dict[str, Dict[str, Any]] = {}  # gdrive_id -> поля, измененные доставкой
+        self._file = None
+        self._unsynced = 0
+        self._synced_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    # --- Чтение ---
+
+    def load(self) -> bool:
+        """Читает журнал с диска. False - журнала нет или в нем нет плана."""
+        self.header, self.done, self.fetched = None, set(), {}
+        if not os.path.exists(self.path):
+            return False
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # Строка, оборванная сбоем во время записи
+                        continue
+                    if entry.get("type") == "plan":
+                        self.header = entry
+                    elif entry.get("type") == "fetched":
+                        self.fetched[entry["key"]] = entry.get("fields", {})
+                    elif entry.get("type") == "done":
+                        self.done.add((entry["action"], entry["key"]))
+        except OSError as e:
+            print(f"  ⚠️ Не удалось прочитать журнал {self.path}: {e}")
+            return False
+        return self.header is not None and self.header.get("version") == JOURNAL_VERSION
+
+    def stale_reason(self, local_root: str, max_age_hours: float) -> Optional[str]:
+        """Почему загруженный план нельзя продолжить (None - можно)."""
+        if self.header.get("local_root") != local_root:
+            return "изменился LOCAL_SYNC_PATH"
+        age_hours = (time.time() - self.header.get("created_at", 0)) / 3600
+        if age_hours > max_age_hours:
+            return f"план составлен {age_hours:.1f} ч назад (лимит {max_age_hours:g} ч)"
+        return None
+
+    @property
+    def pending_state(self) -> Optional[Dict[str, Any]]:
+        return self.header.get("pending_state") if self.header else None
+
+    def download_paths(self) -> List[str]:
+        plan = self.header["plan"]
+        return [item['path'] for item in plan["to_create"] + plan["to_update"]]
+
+    def remaining_plan(self) -> Dict[str, List]:
+        """План из журнала без действий, отмеченных как выполненные."""
+        plan = self.header["plan"]
+        return {
+            "to_create": [item for item in plan["to_create"] if ("create", item['gdrive_id']) not in self.done],
+            "to_update": [item for item in plan["to_update"] if ("change", item['gdrive_id']) not in self.done],
+            "dir_moves": [item for item in plan["dir_moves"] if ("directory_move", item['old_path']) not in self.done],
+            "to_move": [item for item in plan["to_move"] if ("move", item['gdrive_id']) not in self.done],
+            "to_delete": [gdrive_id for gdrive_id in plan["to_delete"] if ("delete", gdrive_id) not in self.done],
+        }
+
+    def completed(self) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]], List[str]]:
+        """
+        Выполненные действия плана, включая выполненные до перезапуска:
+        (записанные, перемещенные, удаленные) - как результаты исполнителей для A.4.
+        """
+        plan = self.header["plan"]
+        synced = [
+            {**item, **self.fetched.get(item['gdrive_id'], {}), 'status': 'SYNCED'}
+            for action, items in (("create", plan["to_create"]), ("change", plan["to_update"]))
+            for item in items if (action, item['gdrive_id']) in self.done
+        ]
+        moves = plan["to_move"] + [item for dir_move in plan["dir_moves"] for item in dir_move['files']]
+        moved = [item for item in moves if ("move", item['gdrive_id']) in self.done]
+        deleted = [gdrive_id for gdrive_id in plan["to_delete"] if ("delete", gdrive_id) in self.done]
+        return synced, moved, deleted
+
+    def fetched_fields(self, gdrive_id: str) -> Optional[Dict[str, Any]]:
+        """Поля записи после доставки, если файл уже доставлен в прошлом запуске."""
+        return self.fetched.get(gdrive_id)
+
+    # --- Запись ---
+
+    def begin(self, plan: Dict[str, List], local_root: str, pending_state: Optional[Dict[str, Any]] = None):
+        """Начинает новый журнал с плана (старый перезаписывается)."""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self.close()
+        self.header = {
+            "type": "plan",
+            "version": JOURNAL_VERSION,
+            "created_at": time.time(),
+            "local_root": local_root,
+            "pending_state": pending_state,
+            "plan": plan,
+        }
+        self.done, self.fetched = set(), {}
+        self._file = open(self.path, "w", encoding="utf-8")
+        self._file.write(json.dumps(self.header, ensure_ascii=False, default=str) + "\n")
+        self.sync()
+
+    def _append(self, entry: Dict[str, Any]):
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, "a", encoding="utf-8")
+            self._file.write(json.dumps(entry, ensure_ascii=False, default=str) + "\n")
+            self._unsynced += 1
+            if self._unsynced >= self.fsync_every or time.monotonic() - self._synced_at >= self.fsync_interval:
+                self._sync_locked()
+
+    def mark_fetched(self, gdrive_id: str, fields: Dict[str, Any]):
+        self.fetched[gdrive_id] = fields
+        self._append({"type": "fetched", "key": gdrive_id, "fields": fields})
+
+    def mark_done(self, action: str, keys: Iterable[str]):
+        for key in keys:
+            self.done.add((action, key))
+            self._append({"type": "done", "action": action, "key": key})
+
+    def _sync_locked(self):
+        if self._file is None:
+            return
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._synced_at = time.monotonic()
+        metrics.inc("sync_journal_fsyncs")
+
+    def sync(self):
+        """Сбрасывает накопленные отметки на диск."""
+        with self._lock:
+            self._sync_locked()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._sync_locked()
+                self._file.close()
+                self._file = None
+
+    def finish(self):
+        """План выполнен и состояние провайдера сохранено: журнал больше не нужен."""
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.header = None
+
+    def discard(self) -> int:
+        """Удаляет устаревший журнал и временные файлы его скачиваний."""
+        removed = remove_partial_files(self.header["local_root"], self.download_paths()) if self.header else 0
+        self.finish()
+        return removed
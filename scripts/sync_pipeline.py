@@ -0,0 +1,265 @@
+# Файл: scripts/sync_pipeline.py
+#
+# Описание:
+# Конвейерный исполнитель этапа А. Вместо последовательности "полное
+# сканирование -> полный план -> скачивание -> запись в БД" этапы работают
+# одновременно и связаны ограниченными очередями:
+#
+#   сканер источника -> планировщик -> [очередь] -> потоки скачивания
+#                                   -> [очередь] -> потоки записи в gdrive_mirror
+#
+# - Скачивание начинается, пока сканирование еще идет.
+# - Очереди ограничены: если скачивание не успевает, планировщик (а значит
+#   и сканер) ждет, память не растет (backpressure).
+# - Запись в БД идет порциями db_client.chunk_size или по таймауту простоя.
+# - Удаления и перемещения выполняются только после полного сканирования
+#   (до этого неизвестно, что файл удален). Создание/изменение файла по пути,
+#   который в БД занят другим файлом, откладывается до удалений и
+#   перемещений, чтобы не перезаписать еще не перенесенный файл.
+# - При ошибке сканирования удаления и сохранение состояния провайдера не
+#   выполняются: неполный список файлов нельзя считать полным.
+# - Неудавшиеся скачивания, записи, перемещения и удаления сохраняются в
+#   failed_actions_path до сохранения состояния провайдера и повторяются в
+#   следующем инкрементальном прогоне (см. sync_journal.py).
+
+import queue
+import threading
+import time
+from typing import Dict, Any, List, Optional
+
+import clone_files
+import get_file_lists
+from db_client import SupabaseClient
+from source_providers import SourceProvider
+from sync_journal import failed_actions, load_failed_actions, requeue_failed_actions, save_failed_actions
+
+# Сигнал завершения для потоков
+_STOP = None
+
+
+class SyncPipeline:
+    """Конвейерная синхронизация одного источника с gdrive_mirror и LOCAL_SYNC_PATH."""
+
+    def __init__(self, provider: SourceProvider, db_client: SupabaseClient,
+                 download_workers: int = 8, db_writers: int = 1,
+                 queue_size: int = 1000, db_flush_seconds: float = 2.0,
+                 failed_actions_path: Optional[str] = None):
+        """
+        Args:
+            provider: Источник файлов.
+            db_client: Клиент gdrive_mirror (тот же, что у clone_files, чтобы работал снимок).
+            download_workers: Число параллельных скачиваний.
+            db_writers: Число потоков пакетной записи в БД.
+            queue_size: Емкость каждой очереди (ограничивает память и опережение сканера).
+            db_flush_seconds: Через сколько секунд простоя неполная порция пишется в БД.
+            failed_actions_path: Файл неудавшихся действий для повтора в следующем прогоне.
+        """
+        self.provider = provider
+        self.db_client = db_client
+        self.download_workers = max(1, download_workers)
+        self.db_writers = max(1, db_writers)
+        self.queue_size = max(1, queue_size)
+        self.db_flush_seconds = db_flush_seconds
+        self.failed_actions_path = failed_actions_path
+
+        self._download_queue: queue.Queue = queue.Queue(maxsize=self.queue_size)
+        self._db_queue: queue.Queue = queue.Queue(maxsize=self.queue_size)
+        self._stats_lock = threading.Lock()
+        self.stats = {
+            "scanned": 0, "created": 0, "updated": 0, "moved": 0, "deleted": 0, "deferred": 0,
+            "downloaded": 0, "download_errors": 0, "written": 0, "write_errors": 0
+        }
+        # Успешно примененные действия - для следующих этапов (векторный индекс)
+        self.applied: Dict[str, List] = {"synced": [], "moved": [], "deleted": []}
+        # Неудавшиеся действия (создание и изменение различаются при повторе по БД)
+        self.failed: Dict[str, List] = {"to_create": [], "to_update": [], "to_move": [], "to_delete": []}
+
+    def _count(self, key: str, amount: int = 1):
+        with self._stats_lock:
+            self.stats[key] += amount
+
+    # --- Потоки ---
+
+    def _download_worker(self):
+        while True:
+            item = self._download_queue.get()
+            if item is _STOP:
+                return
+            file_data, action = item
+            print(f"-> {action}: {file_data['path']}")
+            try:
+                is_success, error = clone_files.fetch_file(file_data, self.provider)
+            except Exception as e:
+                is_success, error = False, str(e)
+            if is_success:
+                self._count("downloaded")
+                file_data['status'] = 'SYNCED'
+                self._db_queue.put(file_data)
+            else:
+                self._count("download_errors")
+                with self._stats_lock:
+                    self.failed["to_create"].append(file_data)
+                print(f"  ! Пропуск записи в БД для файла {file_data['path']} из-за ошибки скачивания: {error}")
+
+    def _db_writer(self):
+        pending: List[Dict[str, Any]] = []
+
+        def flush():
+            if not pending:
+                return
+            written, failures = self.db_client.upsert_documents(pending)
+            clone_files._report_db_failures(failures)
+            self._count("written", written)
+            self._count("write_errors", len(failures))
+            failed_ids = {gdrive_id for gdrive_id, _ in failures}
+            with self._stats_lock:
+                self.applied["synced"].extend(item for item in pending if item['gdrive_id'] not in failed_ids)
+                self.failed["to_create"].extend(item for item in pending if item['gdrive_id'] in failed_ids)
+            pending.clear()
+
+        while True:
+            try:
+                item = self._db_queue.get(timeout=self.db_flush_seconds)
+            except queue.Empty:
+                flush()
+                continue
+            if item is _STOP:
+                flush()
+                return
+            pending.append(item)
+            if len(pending) >= self.db_client.chunk_size:
+                flush()
+
+    def _start(self, target, count: int) -> List[threading.Thread]:
+        threads = [threading.Thread(target=target, daemon=True) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        return threads
+
+    # --- Этапы плана ---
+
+    def _apply_deletes_and_moves(self, to_delete: List[str], to_move: List[Dict], db_data: Dict[str, Dict]):
+        """Удаления, затем перемещения: так освобождаются пути для отложенных созданий."""
+        deleted = clone_files.execute_delete(to_delete, provider=self.provider)
+        self.applied["deleted"].extend(deleted)
+        self._count("deleted", len(to_delete))
+        dir_moves, file_moves = get_file_lists.collapse_directory_moves(to_move, db_data)
+        moved = clone_files.execute_directory_move(dir_moves) + clone_files.execute_move(file_moves)
+        self.applied["moved"].extend(moved)
+        self._count("moved", len(to_move))
+        failed = failed_actions({"to_create": [], "to_update": [], "to_move": to_move, "to_delete": to_delete},
+                                [], moved, deleted)
+        self.failed["to_move"].extend(failed["to_move"])
+        self.failed["to_delete"].extend(failed["to_delete"])
+
+    def _stream_plan(self, db_data: Dict[str, Dict]) -> Optional[Dict[str, Any]]:
+        """
+        Сканирует источник и сразу отправляет создания/изменения в очередь скачивания.
+        Возвращает отложенную часть плана или None при ошибке сканирования.
+        """
+        path_owners = {item.get('path'): id for id, item in db_data.items()}
+        seen_ids = set()
+        to_move = []
+        deferred = []
+
+        try:
+            for record in self.provider.iter_metadata():
+                id = record['gdrive_id']
+                seen_ids.add(id)
+                self._count("scanned")
+                db_item = db_data.get(id)
+
+                if db_item is None:
+                    action, stat_key = "Создание файла", "created"
+                elif get_file_lists._is_content_changed(record, db_item):
+                    action, stat_key = "Обновление файла", "updated"
+                else:
+                    if record['path'] != db_item.get('path'):
+                        to_move.append(record)
+                    continue
+
+                self._count(stat_key)
+                owner = path_owners.get(record['path'])
+                if owner is not None and owner != id:
+                    # Путь еще занят другим файлом, который будет удален или перемещен
+                    deferred.append((record, action))
+                    self._count("deferred")
+                else:
+                    self._download_queue.put((record, action))  # блокируется при заполненной очереди
+        except Exception as e:
+            print(f"  ❌ Ошибка сканирования источника '{self.provider.name}': {e}")
+            return None
+        if not self.provider.validate_scan(len(seen_ids), db_data):
+            return None
+
+        return {
+            "to_delete": [id for id in db_data if id not in seen_ids],
+            "to_move": to_move,
+            "deferred": deferred
+        }
+
+    # --- Запуск ---
+
+    def run(self, db_data: Dict[str, Dict]) -> bool:
+        """
+        Синхронизирует источник. db_data - записи gdrive_mirror этого источника.
+        Возвращает True, если план выполнен полностью и состояние провайдера сохранено.
+        """
+        start = time.perf_counter()
+        download_threads = self._start(self._download_worker, self.download_workers)
+        writer_threads = self._start(self._db_writer, self.db_writers)
+
+        success = True
+        try:
+            plan = self.provider.get_incremental_plan(db_data)
+            if plan is not None:
+                to_create, to_update, to_move, to_delete = plan
+                if self.failed_actions_path:
+                    # Changes API не вернет то, что не удалось в прошлый раз
+                    requeued = requeue_failed_actions(
+                        {"to_create": to_create, "to_update": to_update, "to_move": to_move, "to_delete": to_delete},
+                        load_failed_actions(self.failed_actions_path), db_data)
+                    if requeued:
+                        print(f"  - Повтор неудавшихся действий прошлого прогона: {requeued}.")
+                self._apply_deletes_and_moves(to_delete, to_move, db_data)
+                for items, action, stat_key in ((to_create, "Создание файла", "created"),
+                                                (to_update, "Обновление файла", "updated")):
+                    for record in items:
+                        self._count(stat_key)
+                        self._download_queue.put((record, action))
+            else:
+                self.provider.prepare_full_scan()
+                streamed = self._stream_plan(db_data)
+                if streamed is None:
+                    success = False
+                else:
+                    print(f"  - [{self.provider.name}] Сканирование завершено: {self.stats['scanned']} файлов, "
+                          f"отложено до удалений/перемещений: {len(streamed['deferred'])}.")
+                    self._apply_deletes_and_moves(streamed['to_delete'], streamed['to_move'], db_data)
+                    for record, action in streamed['deferred']:
+                        self._download_queue.put((record, action))
+        finally:
+            # Уже поставленные в очередь файлы докачиваются и записываются в любом случае
+            for _ in download_threads:
+                self._download_queue.put(_STOP)
+            for thread in download_threads:
+                thread.join()
+            for _ in writer_threads:
+                self._db_queue.put(_STOP)
+            for thread in writer_threads:
+                thread.join()
+
+        if success:
+            if self.failed_actions_path:
+                failed_count = save_failed_actions(self.failed_actions_path, self.failed)
+                if failed_count:
+                    print(f"  ⚠️ Не выполнено действий: {failed_count}, они будут повторены в следующем прогоне.")
+            self.provider.commit()
+
+        elapsed = time.perf_counter() - start
+        stats = self.stats
+        print(f"  ✅ [{self.provider.name}] Конвейер завершен за {elapsed:.1f} с: просканировано {stats['scanned']}, "
+              f"создано {stats['created']}, изменено {stats['updated']}, перемещено {stats['moved']}, "
+              f"удалено {stats['deleted']}; скачано {stats['downloaded']} (ошибок {stats['download_errors']}), "
+              f"записано в БД {stats['written']} (ошибок {stats['write_errors']}).")
+        return success
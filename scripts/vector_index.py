@@ -0,0 +1,204 @@
+# Файл: scripts/vector_index.py
+#
+# Описание:
+# Инкрементальное обслуживание векторного индекса (Qdrant) по результатам
+# этапа А: индекс меняется только для файлов, затронутых планом синхронизации,
+# без полной переиндексации.
+#
+# - Созданные и измененные файлы: извлечение текста -> чанки -> сравнение с
+#   точками документа в коллекции по (номер чанка, хэш содержимого).
+#   Эмбеддинги считаются только для изменившихся чанков; если такой же текст
+#   уже есть у документа под другим номером, вектор берется из коллекции.
+#   Точки "лишних" чанков (документ стал короче) удаляются. Если в коллекции
+#   есть sparse-вектор, к каждой точке добавляются BM25-веса текста чанка.
+# - Перемещенные файлы: file_path меняется через set_payload по фильтру, без эмбеддингов.
+# - Удаленные файлы: точки удаляются по фильтру gdrive_id.
+# - Большие загрузки (от bulk_load_min_files файлов, например первичная)
+#   идут через QdrantWriter.bulk_load(): HNSW строится один раз после записи.
+# В работу берутся только действия, которые исполнители clone_files
+# (или SyncPipeline) применили успешно.
+
+import os
+import itertools
+import contextlib
+from typing import Dict, Any, List, Iterator, Optional
+
+from qdrant_client.http import models
+
+from chunk_text import iter_chunks
+from embedding_service import EmbeddingService, create_embedding_service
+from extract_documents import (ExtractionStats, extract_documents, iter_extraction_tasks,
+                               iter_sections, output_path_for, read_header, DEFAULT_OUTPUT_DIR)
+from get_settings import get_settings, get_setting
+from qdrant_writer import QdrantWriter, build_payload, build_point, create_qdrant_writer
+from sparse_vectors import BM25Encoder, create_bm25_encoder, sparse_enabled
+from retrieval_service import bump_index_generation
+
+
+class VectorIndexer:
+    """Применяет выполненный план синхронизации к коллекции Qdrant."""
+
+    def __init__(self, writer: QdrantWriter, embedding_service: EmbeddingService, local_root: str, output_dir: str,
+                 bm25: Optional[BM25Encoder] = None, bulk_load_min_files: int = 1000):
+        """
+        Args:
+            writer: Запись в коллекцию (qdrant_writer.create_qdrant_writer()).
+            embedding_service: Сервис эмбеддингов с кэшем.
+            local_root: LOCAL_SYNC_PATH - где лежат синхронизированные файлы.
+            output_dir: Каталог JSONL извлеченного текста (PROCESSED_DATA_DIR).
+            bm25: Кодировщик sparse-векторов (None - только плотные векторы).
+            bulk_load_min_files: С какого числа файлов запись идет в bulk-режиме (0 - никогда).
+        """
+        self.writer = writer
+        self.embedding_service = embedding_service
+        self.local_root = local_root
+        self.output_dir = output_dir
+        self.bm25 = bm25
+        self.bulk_load_min_files = bulk_load_min_files
+        self.stats = {"documents": 0, "chunks": 0, "unchanged": 0, "reused": 0, "embedded": 0,
+                      "orphans_cleared": 0, "moved": 0, "deleted": 0, "skipped": 0}
+
+    # --- Созданные и измененные файлы ---
+
+    def _extract(self, files: List[Dict[str, Any]]):
+        """Извлекает текст новых версий (уже извлеченные версии пропускаются)."""
+        extraction = get_setting("processing", "extraction", {}) or {}
+        tasks = iter_extraction_tasks(
+            files, self.local_root, self.output_dir,
+            supported_formats=get_setting("file_system", "supported_formats"),
+            max_file_size_mb=get_setting("file_system", "max_file_size_mb", 0)
+        )
+        stats = ExtractionStats()
+        for result in extract_documents(tasks, extraction.get("workers", 4), extraction.get("timeout_seconds", 120),
+                                        extraction.get("memory_limit_mb", 1024), stats):
+            if result["status"] != "ok":
+                print(f"  ❌ {result['path']}: {result['error']}")
+        stats.print_report()
+
+    def _build_point(self, file_data: Dict[str, Any], chunk: Dict[str, Any], vector: List[float]) -> models.PointStruct:
+        sparse = self.bm25.encode_document(chunk["text"]) if self.bm25 else None
+        return build_point(file_data, chunk, vector, sparse)
+
+    def _iter_changed_chunks(self, documents: List[Dict[str, Any]],
+                             reused_points: List[models.PointStruct]) -> Iterator[Dict[str, Any]]:
+        """
+        Чанки документов, которым нужен новый эмбеддинг. Точки, вектор которых
+        можно взять из коллекции, складываются в reused_points.
+        """
+        for file_data in documents:
+            gdrive_id = file_data['gdrive_id']
+            existing = self.writer.get_document_chunks(gdrive_id)
+            existing_by_hash = {item["content_hash"]: item["id"] for item in existing.values()}
+            chunks = list(iter_chunks(iter_sections(output_path_for(self.output_dir, gdrive_id))))
+
+            changed = [chunk for chunk in chunks
+                       if existing.get(chunk["chunk_index"], {}).get("content_hash") != chunk["content_hash"]]
+            # Текст сдвинулся на другой номер чанка - вектор уже есть в коллекции
+            movable = [chunk for chunk in changed if chunk["content_hash"] in existing_by_hash]
+            vectors = self.writer.get_vectors([str(existing_by_hash[chunk["content_hash"]]) for chunk in movable])
+            reused_hashes = set()
+            for chunk in movable:
+                vector = vectors.get(str(existing_by_hash[chunk["content_hash"]]))
+                if vector is not None:
+                    reused_points.append(self._build_point(file_data, chunk, vector))
+                    reused_hashes.add(chunk["content_hash"])
+                    self.stats["reused"] += 1
+
+            # Новые версия, путь и дата у точек неизменившихся чанков
+            if len(changed) < len(chunks):
+                payload = build_payload(file_data, chunks[0])
+                self.writer.set_document_payload(gdrive_id, {key: payload[key] for key in
+                                                             ("file_path", "source", "file_type", "last_modified", "version")})
+            if len(existing) > len(chunks):
+                self.writer.delete_chunks_from(gdrive_id, len(chunks))
+                self.stats["orphans_cleared"] += len(existing) - len(chunks)
+
+            self.stats["documents"] += 1
+            self.stats["chunks"] += len(chunks)
+            self.stats["unchanged"] += len(chunks) - len(changed)
+            for chunk in changed:
+                if chunk["content_hash"] not in reused_hashes:
+                    chunk["file_data"] = file_data
+                    self.stats["embedded"] += 1
+                    yield chunk
+
+    def index_files(self, files: List[Dict[str, Any]]):
+        """Индексирует созданные/измененные файлы (записи gdrive_mirror)."""
+        if not files:
+            return
+        print(f"\n--- Индексация {len(files)} созданных/измененных файлов ---")
+        self._extract(files)
+
+        documents = []
+        for file_data in files:
+            header = read_header(output_path_for(self.output_dir, file_data['gdrive_id']))
+            if header and header.get("version") == file_data.get('version'):
+                documents.append(file_data)
+        # Неизвлеченные файлы (неподдерживаемый формат, ошибка) не должны искаться по старому тексту
+        indexed_ids = {file_data['gdrive_id'] for file_data in documents}
+        stale_ids = [file_data['gdrive_id'] for file_data in files if file_data['gdrive_id'] not in indexed_ids]
+        self.writer.delete_documents(stale_ids)
+        self.stats["skipped"] += len(stale_ids)
+
+        reused_points: List[models.PointStruct] = []
+        embedded = (self._build_point(chunk["file_data"], chunk, vector)
+                    for chunk, vector in self.embedding_service.embed_chunks(self._iter_changed_chunks(documents, reused_points)))
+        # reused_points заполняется по ходу чтения embedded и читается, когда embedded исчерпан
+        bulk = 0 < self.bulk_load_min_files <= len(documents)
+        with self.writer.bulk_load() if bulk else contextlib.nullcontext():
+            self.writer.upsert_points(itertools.chain(embedded, reused_points))
+
+    # --- Перемещения и удаления ---
+
+    def move_files(self, moved: List[Dict[str, Any]], db_data: Dict[str, Dict]):
+        """Перемещенные файлы: db_data - записи gdrive_mirror до выполнения плана (старые пути)."""
+        moves = [{"gdrive_id": file_data['gdrive_id'], "old_path": db_data[file_data['gdrive_id']]['path'],
+                  "new_path": file_data['path']}
+                 for file_data in moved if file_data['gdrive_id'] in db_data]
+        if not moves:
+            return
+        print(f"\n--- Обновление путей {len(moves)} перемещенных файлов в индексе ---")
+        self.writer.move_documents(moves)
+        self.stats["moved"] += len(moves)
+
+    def delete_files(self, deleted_ids: List[str]):
+        if not deleted_ids:
+            return
+        print(f"\n--- Удаление {len(deleted_ids)} файлов из индекса ---")
+        self.writer.delete_documents(deleted_ids)
+        self.stats["deleted"] += len(deleted_ids)
+
+    def apply(self, synced: List[Dict[str, Any]], moved: List[Dict[str, Any]], deleted_ids: List[str],
+              db_data: Dict[str, Dict]):
+        """Применяет выполненный план: удаления, перемещения, затем созданные/измененные файлы."""
+        self.delete_files(deleted_ids)
+        self.move_files(moved, db_data)
+        self.index_files(synced)
+        if synced or moved or deleted_ids:
+            bump_index_generation()  # API сбросит кэш результатов
+
+    def print_report(self):
+        stats = self.stats
+        print(f"  ✅ Индекс: документов {stats['documents']}, чанков {stats['chunks']} (без изменений {stats['unchanged']}, "
+              f"вектор из коллекции {stats['reused']}, новых эмбеддингов {stats['embedded']}), удалено хвостовых чанков "
+              f"{stats['orphans_cleared']}; перемещено {stats['moved']}, удалено {stats['deleted']}, "
+              f"без текста {stats['skipped']}.")
+        self.embedding_service.print_report()
+        self.writer.print_report()
+
+
+def create_vector_indexer(local_root: str) -> VectorIndexer:
+    """Индексатор с клиентом Qdrant из .env и параметрами settings.yml."""
+    output_dir = os.getenv("PROCESSED_DATA_DIR", DEFAULT_OUTPUT_DIR)
+    os.makedirs(output_dir, exist_ok=True)
+    writer = create_qdrant_writer()
+    bm25 = None
+    if sparse_enabled():
+        if writer.has_sparse_vectors():
+            bm25 = create_bm25_encoder()
+        else:
+            print(f"  ⚠️ В коллекции {writer.collection_name} нет sparse-вектора (создана до гибридного поиска), "
+                  f"индексируются только плотные векторы. Пересоздайте ее: init_qdrant_collection.py --recreate.")
+    upload = get_setting("vector_db", "upload") or {}
+    return VectorIndexer(writer, create_embedding_service(get_settings()), local_root, output_dir, bm25,
+                         bulk_load_min_files=upload.get("bulk_load_min_files", 1000))
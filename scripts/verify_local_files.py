@@ -0,0 +1,184 @@
+# Файл: scripts/verify_local_files.py
+#
+# Описание:
+# Режим проверки содержимого для этапа B. Сравнение только по размеру не
+# находит поврежденные файлы того же размера, поэтому здесь локальные файлы
+# хэшируются (MD5, как md5Checksum в Google Drive) и сверяются с md5_checksum
+# из gdrive_mirror.
+#
+# - Хэши считаются в пуле потоков (hashlib отпускает GIL на больших блоках),
+#   чтение идет крупными блоками в заранее выделенный буфер без копирования.
+# - Результаты кэшируются в SQLite по (устройство, inode, размер, mtime):
+#   пока файл не менялся, он хэшируется ровно один раз.
+# - Бюджет (число файлов, объем и скорость чтения за запуск) позволяет
+#   проверять большое дерево постепенно, за несколько запусков.
+
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Tuple
+
+READ_BUFFER_SIZE = 4 * 1024 * 1024
+
+
+class HashCache:
+    """Кэш MD5 локальных файлов, ключ - (st_dev, st_ino); запись действительна при тех же размере и mtime."""
+    def __init__(self, db_path: str):
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._conn = sqlite3.connect(db_path)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS hashes (
+                dev INTEGER, ino INTEGER, size INTEGER, mtime_ns INTEGER, md5 TEXT,
+                PRIMARY KEY (dev, ino)
+            )
+        """)
+        self._conn.commit()
+
+    def get(self, stat: os.stat_result) -> Optional[str]:
+        row = self._conn.execute(
+            "SELECT md5 FROM hashes WHERE dev = ? AND ino = ? AND size = ? AND mtime_ns = ?",
+            (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        ).fetchone()
+        return row[0] if row else None
+
+    def put_many(self, items: List[Tuple[os.stat_result, str]]):
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO hashes (dev, ino, size, mtime_ns, md5) VALUES (?, ?, ?, ?, ?)",
+            [(stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns, md5) for stat, md5 in items]
+        )
+        self._conn.commit()
+
+    def close(self):
+        self._conn.close()
+
+
+class _Throttle:
+    """Ограничитель скорости чтения, общий для всех потоков (байт/с; 0 - без ограничения)."""
+    def __init__(self, bytes_per_second: float):
+        self.bytes_per_second = bytes_per_second
+        self._start = time.monotonic()
+        self._consumed = 0
+        self._lock = threading.Lock()
+
+    def consume(self, amount: int):
+        if not self.bytes_per_second:
+            return
+        with self._lock:
+            self._consumed += amount
+            delay = self._consumed / self.bytes_per_second - (time.monotonic() - self._start)
+        if delay > 0:
+            time.sleep(delay)
+
+
+def hash_file(full_path: str, throttle: Optional[_Throttle] = None) -> str:
+    """Считает MD5 файла, читая его крупными блоками в переиспользуемый буфер."""
+    md5 = hashlib.md5()
+    buffer = bytearray(READ_BUFFER_SIZE)
+    view = memoryview(buffer)
+    with open(full_path, "rb", buffering=0) as f:
+        while True:
+            read = f.readinto(buffer)
+            if not read:
+                break
+            md5.update(view[:read])
+            if throttle:
+                throttle.consume(read)
+    return md5.hexdigest()
+
+
+def find_corrupted_files(
+    local_path: str,
+    server_data: Dict[str, Dict[str, Any]],
+    db_data: Dict[str, Dict[str, Any]],
+    cache: HashCache,
+    max_files: int = 0,
+    max_mb: float = 0,
+    mb_per_second: float = 0,
+    max_workers: int = 4
+) -> List[Dict[str, Any]]:
+    """
+    Находит локальные файлы, содержимое которых не совпадает с md5_checksum в БД.
+
+    Проверяются файлы, которые есть и на сервере, и в БД, совпадают по размеру
+    и имеют md5_checksum (у Google-документов его нет). Файлы с актуальным
+    хэшем в кэше проверяются бесплатно; остальные хэшируются в пределах бюджета,
+    непроверенные остаются на следующие запуски.
+
+    Args:
+        local_path: Корень LOCAL_SYNC_PATH.
+        server_data: Результат сканирования сервера (ключ - относительный путь).
+        db_data: Записи gdrive_mirror (ключ - gdrive_id).
+        cache: Кэш хэшей.
+        max_files: Максимум файлов для хэширования за запуск (0 - без ограничения).
+        max_mb: Максимальный объем чтения за запуск в МБ (0 - без ограничения).
+        mb_per_second: Ограничение скорости чтения в МБ/с (0 - без ограничения).
+        max_workers: Число потоков хэширования.
+
+    Returns:
+        Записи из БД для файлов с несовпадающим хэшем (для перезакачки).
+    """
+    db_paths_map = {item['path']: item for item in db_data.values() if item.get('md5_checksum')}
+
+    corrupted = []
+    to_hash: List[Tuple[str, os.stat_result, Dict[str, Any]]] = []
+    cached_checked = 0
+    for path in sorted(server_data.keys() & db_paths_map.keys()):
+        db_item = db_paths_map[path]
+        if server_data[path]['size_bytes'] != db_item['size_bytes']:
+            continue  # Несовпадение размера уже найдено обычной проверкой
+        full_path = os.path.join(local_path, path)
+        try:
+            stat = os.stat(full_path)
+        except FileNotFoundError:
+            continue
+        cached_md5 = cache.get(stat)
+        if cached_md5 is None:
+            to_hash.append((full_path, stat, db_item))
+            continue
+        cached_checked += 1
+        if cached_md5 != db_item['md5_checksum']:
+            corrupted.append(db_item)
+
+    # Отбираем файлы в пределах бюджета на этот запуск
+    budget_bytes = max_mb * 1024 * 1024 if max_mb else None
+    selected = []
+    selected_bytes = 0
+    for full_path, stat, db_item in to_hash:
+        if max_files and len(selected) >= max_files:
+            break
+        if budget_bytes is not None and selected and selected_bytes + stat.st_size > budget_bytes:
+            break
+        selected.append((full_path, stat, db_item))
+        selected_bytes += stat.st_size
+
+    throttle = _Throttle(mb_per_second * 1024 * 1024)
+
+    def hash_one(item):
+        full_path, stat, db_item = item
+        try:
+            return stat, db_item, hash_file(full_path, throttle)
+        except OSError as e:
+            print(f"  ⚠️ Не удалось прочитать {full_path}: {e}")
+            return stat, db_item, None
+
+    start = time.perf_counter()
+    hashed = []
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        for stat, db_item, md5 in executor.map(hash_one, selected):
+            if md5 is None:
+                continue
+            hashed.append((stat, md5))
+            if md5 != db_item['md5_checksum']:
+                corrupted.append(db_item)
+    cache.put_many(hashed)
+    elapsed = time.perf_counter() - start
+
+    speed = selected_bytes / 1024 / 1024 / elapsed if elapsed > 0 else 0
+    print(f"  - Проверка содержимого: из кэша {cached_checked}, захэшировано {len(hashed)} "
+          f"({selected_bytes / 1024 / 1024:.1f} МБ, {speed:.1f} МБ/с), "
+          f"осталось на следующие запуски {len(to_hash) - len(selected)}, повреждено {len(corrupted)}.")
+    return corrupted
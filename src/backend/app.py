@@ -0,0 +1,84 @@
+# Файл: src/backend/app.py
+#
+# Описание:
+# REST API поиска по коллекции documents (сервис api в docker-compose.yml).
+# Логика поиска и кэши - scripts/retrieval_service.py; здесь только HTTP-слой.
+#
+# Запуск: uvicorn app:app --host 0.0.0.0 --port 8000
+# (каталог scripts должен быть в PYTHONPATH - в образе это сделано в Dockerfile)
+
+import os
+import secrets
+from contextlib import asynccontextmanager
+from typing import List, Literal, Optional, Union
+
+from dotenv import load_dotenv
+from fastapi import Depends, FastAPI, Header, HTTPException
+from pydantic import BaseModel, Field
+
+from retrieval_service import create_retrieval_service
+
+load_dotenv()
+API_TOKEN = os.getenv("API_TOKEN")
+
+
+class SearchFilters(BaseModel):
+    file_path: Optional[Union[str, List[str]]] = None
+    source: Optional[Union[str, List[str]]] = None
+    file_type: Optional[Union[str, List[str]]] = None
+    modified_after: Optional[str] = Field(None, description="ISO-дата: last_modified >= ")
+    modified_before: Optional[str] = Field(None, description="ISO-дата: last_modified <= ")
+
+
+class SearchRequest(BaseModel):
+    query: str = Field(..., min_length=1)
+    limit: Optional[int] = Field(None, ge=1)
+    filters: Optional[SearchFilters] = None
+    hnsw_ef: Optional[int] = Field(None, ge=1, description="Размер списка кандидатов HNSW")
+    exact: bool = Field(False, description="Точный поиск без HNSW")
+    rescore: Optional[bool] = Field(None, description="Пересчет по исходным векторам после квантованных")
+    oversampling: Optional[float] = Field(None, ge=1.0)
+    mode: Optional[Literal["dense", "sparse", "hybrid"]] = Field(None, description="Плотный, BM25 или гибридный (RRF) поиск")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.retrieval = create_retrieval_service()
+    yield
+    await app.state.retrieval.close()
+
+
+app = FastAPI(title="RAG Retrieval API", lifespan=lifespan)
+
+
+def check_token(authorization: Optional[str] = Header(None)):
+    """Bearer-токен API_TOKEN; если он не задан - доступ без авторизации."""
+    if not API_TOKEN:
+        return
+    if not authorization or not secrets.compare_digest(authorization, f"Bearer {API_TOKEN}"):
+        raise HTTPException(status_code=401, detail="Неверный токен")
+
+
+@app.post("/search", dependencies=[Depends(check_token)])
+async def search(request: SearchRequest):
+    filters = request.filters.model_dump(exclude_none=True) if request.filters else None
+    return await app.state.retrieval.search(
+        request.query,
+        limit=request.limit,
+        filters=filters,
+        hnsw_ef=request.hnsw_ef,
+        exact=request.exact,
+        rescore=request.rescore,
+        oversampling=request.oversampling,
+        mode=request.mode
+    )
+
+
+@app.get("/stats", dependencies=[Depends(check_token)])
+async def stats():
+    return app.state.retrieval.get_stats()
+
+
+@app.get("/health")
+async def health():
+    return {"status": "ok"}
@@ -0,0 +1,30 @@
+# Файл: tests/conftest.py
+#
+# Описание:
+# Общие настройки тестов: модули scripts/ импортируются по имени, как при
+# запуске из этой директории. Внешние сервисы заменяются фейками из
+# scripts/fake_services.py.
+
+import os
+import sys
+
+import pytest
+
+SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts")
+if SCRIPTS_DIR not in sys.path:
+    sys.path.insert(0, SCRIPTS_DIR)
+
+
+@pytest.fixture
+def local_mirror(tmp_path, monkeypatch):
+    """Исполнители clone_files с фейковой gdrive_mirror и локальной копией в tmp_path."""
+    import clone_files
+    from db_client import SupabaseClient
+    from fake_services import FakeSupabaseClient
+
+    local_root = tmp_path / "documents"
+    local_root.mkdir()
+    db_client = SupabaseClient(client=FakeSupabaseClient())
+    monkeypatch.setattr(clone_files, "db_client", db_client)
+    monkeypatch.setattr(clone_files, "LOCAL_SYNC_PATH", str(local_root))
+    return db_client, local_root
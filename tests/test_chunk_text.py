@@ -0,0 +1,68 @@
+# Файл: tests/test_chunk_text.py
+#
+# Описание:
+# Чанкер: смещения совпадают с текстом документа, текст покрывается без
+# пропусков, а большое перекрытие не размножает чанки.
+
+import random
+
+import pytest
+
+from chunk_text import SECTION_SEPARATOR, chunk_text, iter_chunks
+
+WORDS = "договор поставка оплата отчет налог аренда проект смета счет акт contract invoice report".split()
+
+
+def _document(chars, seed=3):
+    """Текст с абзацами и предложениями разной длины."""
+    rng = random.Random(seed)
+    paragraphs, length = [], 0
+    while length < chars:
+        sentences = [" ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 25))).capitalize() + "."
+                     for _ in range(rng.randint(1, 8))]
+        paragraphs.append(" ".join(sentences))
+        length += len(paragraphs[-1]) + 2
+    return "\n\n".join(paragraphs)
+
+
+def _assert_covered(text, chunks):
+    """Каждый непробельный символ текста попадает хотя бы в один чанк."""
+    covered = 0
+    for chunk in chunks:
+        assert text[chunk["start"]:chunk["end"]] == chunk["text"]
+        gap = text[covered:chunk["start"]]
+        assert not gap.strip(), f"пропуск текста перед чанком {chunk['chunk_index']}"
+        covered = max(covered, chunk["end"])
+    assert not text[covered:].strip()
+
+
+@pytest.mark.parametrize("chunk_overlap", [0, 200, 500])
+def test_chunks_cover_text_without_gaps(chunk_overlap):
+    text = _document(20000)
+    chunks = list(chunk_text(text, chunk_size=1000, chunk_overlap=chunk_overlap))
+    _assert_covered(text, chunks)
+    assert all(len(chunk["text"]) <= 1000 for chunk in chunks)
+
+
+def test_large_overlap_does_not_multiply_chunks():
+    text = _document(110000)
+    chunks = list(chunk_text(text, chunk_size=1000, chunk_overlap=500))
+    _assert_covered(text, chunks)
+    # Шаг не меньше chunk_size // 4: не больше ~4 чанков на chunk_size текста
+    assert len(chunks) <= 4 * len(text) // 1000 + 1
+    assert all(b["start"] - a["start"] >= 250 for a, b in zip(chunks, chunks[1:]))
+
+
+@pytest.mark.parametrize("chunk_overlap", [-1, 501, 900, 1000])
+def test_overlap_above_half_chunk_is_rejected(chunk_overlap):
+    with pytest.raises(ValueError):
+        list(chunk_text("текст", chunk_size=1000, chunk_overlap=chunk_overlap))
+
+
+def test_offsets_and_pages_span_sections():
+    sections = [{"text": _document(1500, seed=number), "number": number} for number in range(1, 4)]
+    document = SECTION_SEPARATOR.join(section["text"] for section in sections)
+    chunks = list(iter_chunks(sections, chunk_size=800, chunk_overlap=100))
+    _assert_covered(document, chunks)
+    assert chunks[0]["page_start"] == 1
+    assert chunks[-1]["page_end"] == 3
@@ -0,0 +1,133 @@
+# Файл: tests/test_db_client.py
+#
+# Описание:
+# Пакетная запись SupabaseClient на FakeSupabaseClient: порции по
+# chunk_size, повтор после временного сбоя, построчная запись порции с
+# "плохой" строкой без потери остальных и группировка строк по набору
+# колонок (PostgREST требует одинаковые колонки во всех строках запроса).
+
+import pytest
+
+import db_client
+from db_client import SupabaseClient
+from fake_services import FakeSupabaseClient
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(db_client.time, "sleep", lambda seconds: None)
+
+
+def _record(i, **fields):
+    record = {"gdrive_id": f"id{i:04d}", "path": f"docs/file{i}.pdf", "md5_checksum": f"md5-{i}", "version": "1"}
+    record.update(fields)
+    return record
+
+
+def _record_requests(fake):
+    """Запоминает (операция, строки запроса) для каждого execute()."""
+    requests = []
+    execute = fake._execute
+
+    def recording(query):
+        payload = query._payload
+        requests.append((query._operation, payload if isinstance(payload, list) else [payload]))
+        return execute(query)
+    fake._execute = recording
+    return requests
+
+
+def test_upsert_is_split_into_chunks():
+    fake = FakeSupabaseClient()
+    client = SupabaseClient(client=fake, chunk_size=500)
+
+    written, failures = client.upsert_documents([_record(i) for i in range(1205)])
+
+    assert (written, failures) == (1205, [])
+    assert fake.request_count == 3
+    assert len(fake.tables["gdrive_mirror"]) == 1205
+
+
+def test_upsert_retries_transient_failure():
+    fake = FakeSupabaseClient()
+    client = SupabaseClient(client=fake, chunk_size=500)
+    fake.fail_next(SupabaseClient.MAX_RETRIES - 1)
+
+    written, failures = client.upsert_documents([_record(i) for i in range(10)])
+
+    assert (written, failures) == (10, [])
+    assert fake.request_count == SupabaseClient.MAX_RETRIES  # порция записана с последней попытки
+
+
+def test_exhausted_retries_fall_back_to_rows():
+    fake = FakeSupabaseClient()
+    client = SupabaseClient(client=fake, chunk_size=500)
+    fake.fail_next(SupabaseClient.MAX_RETRIES)
+
+    written, failures = client.upsert_documents([_record(i) for i in range(5)])
+
+    assert (written, failures) == (5, [])
+    assert sorted(fake.tables["gdrive_mirror"]) == [f"id{i:04d}" for i in range(5)]
+
+
+def test_bad_row_does_not_drop_the_rest_of_the_chunk():
+    fake = FakeSupabaseClient(required_columns=["path"])
+    client = SupabaseClient(client=fake, chunk_size=500)
+    records = [_record(i) for i in range(10)]
+    records[3]["path"] = None  # NOT NULL: порция целиком отклоняется
+
+    written, failures = client.upsert_documents(records)
+
+    assert written == 9
+    assert [gdrive_id for gdrive_id, _ in failures] == ["id0003"]
+    assert "not-null" in failures[0][1]
+    assert sorted(fake.tables["gdrive_mirror"]) == [f"id{i:04d}" for i in range(10) if i != 3]
+
+
+def test_partial_rows_update_existing_records():
+    """Строки без обязательных колонок (только gdrive_id и path) обновляют существующие записи через update."""
+    fake = FakeSupabaseClient(required_columns=["md5_checksum"])
+    client = SupabaseClient(client=fake, chunk_size=500)
+    client.upsert_documents([_record(i) for i in range(3)])
+
+    written, failures = client.upsert_documents([
+        {"gdrive_id": "id0000", "path": "moved/file0.pdf"},
+        {"gdrive_id": "missing", "path": "moved/missing.pdf"},
+    ])
+
+    assert written == 1
+    assert [gdrive_id for gdrive_id, _ in failures] == ["missing"]
+    stored = fake.tables["gdrive_mirror"]["id0000"]
+    assert (stored["path"], stored["md5_checksum"]) == ("moved/file0.pdf", "md5-0")
+
+
+def test_records_are_grouped_by_column_set():
+    fake = FakeSupabaseClient()
+    client = SupabaseClient(client=fake, chunk_size=2)
+    requests = _record_requests(fake)
+    records = [_record(0), {"gdrive_id": "id0001", "path": "a.pdf"}, _record(2),
+               {"gdrive_id": "id0003", "path": "b.pdf"}, _record(4)]
+
+    written, failures = client.upsert_documents(records)
+
+    assert (written, failures) == (5, [])
+    upserts = [rows for operation, rows in requests if operation == "upsert"]
+    assert len(upserts) == 3  # полные строки - 2 порции (2 + 1), неполные - одна
+    for rows in upserts:
+        assert len({frozenset(row) for row in rows}) == 1
+    assert sorted(row["gdrive_id"] for rows in upserts for row in rows) == [f"id{i:04d}" for i in range(5)]
+
+
+def test_get_paths_by_ids_queries_in_chunks():
+    fake = FakeSupabaseClient()
+    client = SupabaseClient(client=fake)
+    client.upsert_documents([_record(i) for i in range(450)])
+    fake.request_count = 0
+
+    ids = [f"id{i:04d}" for i in range(450)] + ["unknown"]
+    paths = client.get_paths_by_ids(ids)
+
+    assert fake.request_count == 3  # 451 id порциями по IN_FILTER_CHUNK_SIZE = 200
+    assert len(paths) == 450
+    assert paths["id0123"] == "docs/file123.pdf"
+    assert "unknown" not in paths
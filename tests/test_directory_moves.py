@@ -0,0 +1,113 @@
+# Файл: tests/test_directory_moves.py
+#
+# Описание:
+# collapse_directory_moves на синтетическом дереве: вложенные
+# переименования, частичные переносы и занятая целевая директория.
+
+import os
+
+from get_file_lists import collapse_directory_moves
+
+
+def _record(gdrive_id, path):
+    return {'gdrive_id': gdrive_id, 'path': os.path.join(*path.split("/")), 'name': path.rsplit("/", 1)[-1]}
+
+
+def _tree(paths):
+    """БД из путей: id - порядковый номер файла."""
+    return {f"id{i}": _record(f"id{i}", path) for i, path in enumerate(paths)}
+
+
+def _moves(db_data, renames):
+    """Перемещения всех файлов БД, у которых префикс old заменен на new."""
+    to_move = []
+    for gdrive_id, item in db_data.items():
+        for old, new in renames:
+            old_prefix = os.path.join(*old.split("/")) + os.sep
+            if item['path'].startswith(old_prefix):
+                to_move.append(_record(gdrive_id, new + "/" + item['path'][len(old_prefix):].replace(os.sep, "/")))
+                break
+    return to_move
+
+
+def _summary(dir_moves):
+    return sorted((move['old_path'], move['new_path'], len(move['files'])) for move in dir_moves)
+
+
+def test_whole_directory_rename_collapses_to_one_move():
+    db_data = _tree(["A/B/x.pdf", "A/B/y.pdf", "A/z.pdf", "C/w.pdf"])
+    dir_moves, file_moves = collapse_directory_moves(_moves(db_data, [("A", "A2")]), db_data)
+    assert _summary(dir_moves) == [("A", "A2", 3)]
+    assert file_moves == []
+
+
+def test_nested_rename_collapses_to_inner_directory():
+    db_data = _tree(["A/B/x.pdf", "A/B/y.pdf", "A/z.pdf"])
+    dir_moves, file_moves = collapse_directory_moves(_moves(db_data, [("A/B", "A/B2")]), db_data)
+    assert _summary(dir_moves) == [(os.path.join("A", "B"), os.path.join("A", "B2"), 2)]
+    assert file_moves == []
+
+
+def test_rename_of_parent_and_child_in_one_plan():
+    # A -> A2 и одновременно A/B -> A2/C: обе группы покрывают свои директории целиком
+    db_data = _tree(["A/B/x.pdf", "A/B/y.pdf", "A/z.pdf"])
+    to_move = _moves(db_data, [("A/B", "A2/C"), ("A", "A2")])
+    dir_moves, file_moves = collapse_directory_moves(to_move, db_data)
+    moved_ids = sorted(item['gdrive_id'] for move in dir_moves for item in move['files'])
+    moved_ids += [item['gdrive_id'] for item in file_moves]
+    assert sorted(moved_ids) == sorted(db_data)
+    assert (os.path.join("A", "B"), os.path.join("A2", "C"), 2) in _summary(dir_moves)
+
+
+def test_partial_move_stays_file_moves():
+    # Из A/B уходит только один файл из двух: директорию целиком переносить нельзя
+    db_data = _tree(["A/B/x.pdf", "A/B/y.pdf"])
+    to_move = [_record("id0", "D/B/x.pdf")]
+    dir_moves, file_moves = collapse_directory_moves(to_move, db_data)
+    assert dir_moves == []
+    assert [item['gdrive_id'] for item in file_moves] == ["id0"]
+
+
+def test_existing_target_directory_is_not_overwritten():
+    # В A2 уже есть файлы: перенос A -> A2 как директории слил бы их
+    db_data = _tree(["A/x.pdf", "A/y.pdf", "A2/old.pdf"])
+    dir_moves, file_moves = collapse_directory_moves(_moves(db_data, [("A", "A2")]), db_data)
+    assert dir_moves == []
+    assert sorted(item['gdrive_id'] for item in file_moves) == ["id0", "id1"]
+
+
+def test_move_into_own_subdirectory_is_not_collapsed():
+    db_data = _tree(["A/x.pdf", "A/y.pdf"])
+    dir_moves, file_moves = collapse_directory_moves(_moves(db_data, [("A", "A/sub")]), db_data)
+    assert dir_moves == []
+    assert len(file_moves) == 2
+
+
+def test_unknown_record_is_plain_file_move():
+    db_data = _tree(["A/x.pdf"])
+    dir_moves, file_moves = collapse_directory_moves([_record("missing", "B/x.pdf")], db_data)
+    assert dir_moves == []
+    assert [item['gdrive_id'] for item in file_moves] == ["missing"]
+
+
+def test_directory_move_falls_back_to_file_moves_when_target_exists(local_mirror):
+    import clone_files
+
+    db_client, local_root = local_mirror
+    db_data = _tree(["A/x.pdf", "A/y.pdf"])
+    db_client.upsert_documents(list(db_data.values()))
+    for item in db_data.values():
+        (local_root / item['path']).parent.mkdir(parents=True, exist_ok=True)
+        (local_root / item['path']).write_text(item['gdrive_id'])
+    # Целевая директория уже есть на диске (файл вне БД): rename директории ее бы затер
+    (local_root / "A2").mkdir()
+    (local_root / "A2" / "keep.txt").write_text("keep")
+
+    dir_moves = [{'old_path': "A", 'new_path': "A2", 'files': _moves(db_data, [("A", "A2")])}]
+    moved = clone_files.execute_directory_move(dir_moves)
+
+    assert sorted(item['gdrive_id'] for item in moved) == ["id0", "id1"]
+    assert (local_root / "A2" / "keep.txt").read_text() == "keep"
+    assert (local_root / "A2" / "x.pdf").read_text() == "id0"
+    assert not (local_root / "A" / "x.pdf").exists()
+    assert db_client.get_paths_by_ids(["id0"])["id0"] == os.path.join("A2", "x.pdf")
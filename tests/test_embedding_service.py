@@ -0,0 +1,125 @@
+# Файл: tests/test_embedding_service.py
+#
+# Описание:
+# Слой эмбеддингов на StubEmbeddingProvider: кэш векторов в float32 и
+# float16, попадания в кэш между прогонами, пакеты с ограничением по
+# токенам, дедупликация одинаковых чанков в окне и учет доли попаданий и
+# сэкономленной стоимости.
+
+import pytest
+
+from chunk_text import chunk_hash
+from embedding_service import EmbeddingCache, EmbeddingService, StubEmbeddingProvider
+
+DIMENSION = 64
+
+
+def _chunks(texts):
+    return [{"text": text, "content_hash": chunk_hash(text)} for text in texts]
+
+
+def _texts(count, prefix="Раздел"):
+    return [f"{prefix} {i}: текст чанка для проверки эмбеддингов" for i in range(count)]
+
+
+@pytest.mark.parametrize("dtype, tolerance, item_size", [("float32", 1e-7, 4), ("float16", 1e-3, 2)])
+def test_cache_round_trip(tmp_path, dtype, tolerance, item_size):
+    vector = StubEmbeddingProvider(DIMENSION)._vector("пример")
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite"), dtype=dtype)
+    cache.put_many("stub", {"h1": vector})
+
+    restored = cache.get_many("stub", ["h1", "missing"])
+    assert list(restored) == ["h1"]
+    assert len(restored["h1"]) == DIMENSION
+    assert max(abs(a - b) for a, b in zip(restored["h1"], vector)) <= tolerance
+    blob, = cache._conn.execute("SELECT vector FROM embeddings").fetchone()
+    assert len(blob) == DIMENSION * item_size
+    assert cache.get_many("other-model", ["h1"]) == {}
+    cache.close()
+
+    # Вектор читается в том формате, в котором записан, даже если dtype кэша сменили
+    other_dtype = "float16" if dtype == "float32" else "float32"
+    reopened = EmbeddingCache(str(tmp_path / "cache.sqlite"), dtype=other_dtype)
+    assert reopened.get_many("stub", ["h1"]) == restored
+    reopened.close()
+
+
+def test_cache_rejects_unknown_dtype(tmp_path):
+    with pytest.raises(ValueError):
+        EmbeddingCache(str(tmp_path / "cache.sqlite"), dtype="int8")
+
+
+def test_cache_hits_across_runs(tmp_path):
+    cache_path = str(tmp_path / "cache.sqlite")
+    first_provider = StubEmbeddingProvider(DIMENSION)
+    first = EmbeddingService(first_provider, EmbeddingCache(cache_path), batch_size=4, max_concurrency=2)
+    first_vectors = [vector for _, vector in first.embed_chunks(_chunks(_texts(10)))]
+    first.cache.close()
+    assert first.stats["embedded"] == 10 and first.stats["cache_hits"] == 0
+
+    # Следующий прогон: документ изменился в двух чанках
+    second_provider = StubEmbeddingProvider(DIMENSION)
+    second = EmbeddingService(second_provider, EmbeddingCache(cache_path), batch_size=4, max_concurrency=2)
+    texts = _texts(10)[:8] + _texts(2, prefix="Новый раздел")
+    results = list(second.embed_chunks(_chunks(texts)))
+    second.cache.close()
+
+    assert [chunk["text"] for chunk, _ in results] == texts  # исходный порядок
+    assert second.stats["cache_hits"] == 8
+    assert second.stats["embedded"] == 2
+    assert second_provider.calls == 1
+    for (_, vector), expected in zip(results[:8], first_vectors[:8]):
+        assert vector == pytest.approx(expected, abs=1e-7)
+
+
+def test_batches_are_bounded_by_tokens_and_size():
+    service = EmbeddingService(StubEmbeddingProvider(DIMENSION), batch_tokens=100, batch_size=3)
+    items = [(f"h{i}", f"text {i}", tokens) for i, tokens in enumerate([40, 40, 40, 90, 10, 10, 10, 10, 10, 150])]
+
+    batches = service._make_batches(items)
+
+    assert [[item[2] for item in batch] for batch in batches] == [
+        [40, 40], [40], [90, 10], [10, 10, 10], [10], [150]  # 3 текста - предел batch_size; чанк больше лимита - отдельно
+    ]
+    assert [item for batch in batches for item in batch] == items
+
+
+def test_duplicates_in_window_are_embedded_once():
+    provider = StubEmbeddingProvider(DIMENSION)
+    service = EmbeddingService(provider, batch_size=8, max_concurrency=1)
+    texts = ["повтор", "первый", "повтор", "второй", "повтор", "первый"]
+
+    results = list(service.embed_chunks(_chunks(texts)))
+
+    assert service.stats["embedded"] == 3
+    assert service.stats["cache_hits"] == 3
+    assert provider.calls == 1
+    vectors = {}
+    for chunk, vector in results:
+        assert vectors.setdefault(chunk["text"], vector) == vector
+    assert vectors["повтор"] == provider._vector("повтор")
+
+
+def test_report_accounts_hit_rate_and_saved_cost(tmp_path):
+    cache_path = str(tmp_path / "cache.sqlite")
+    texts = _texts(6)
+    warmup = EmbeddingService(StubEmbeddingProvider(DIMENSION), EmbeddingCache(cache_path))
+    list(warmup.embed_chunks(_chunks(texts[:3])))
+    warmup.cache.close()
+
+    service = EmbeddingService(StubEmbeddingProvider(DIMENSION), EmbeddingCache(cache_path),
+                               price_per_1k_tokens=0.1)
+    list(service.embed_chunks(_chunks(texts + texts[3:4])))  # 3 из кэша, 3 новых, 1 повтор в окне
+    service.cache.close()
+
+    count = service.token_counter.count
+    saved_tokens = sum(count(text) for text in texts[:4])
+    embedded_tokens = sum(count(text) for text in texts[3:])
+    report = service.report()
+    assert report["chunks"] == 7
+    assert report["cache_hits"] == 4
+    assert report["hit_rate"] == pytest.approx(4 / 7)
+    assert (report["tokens_saved"], report["tokens_embedded"]) == (saved_tokens, embedded_tokens)
+    assert report["cost_saved"] == pytest.approx(saved_tokens / 1000 * 0.1)
+    assert report["cost_spent"] == pytest.approx(embedded_tokens / 1000 * 0.1)
+    assert EmbeddingService(StubEmbeddingProvider(DIMENSION)).report()["hit_rate"] == 0.0
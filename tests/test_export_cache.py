@@ -0,0 +1,84 @@
+# Файл: tests/test_export_cache.py
+#
+# Описание:
+# Кэш экспорта Google-документов: одна ревизия на документ, удаление копий
+# удаленных документов и ограничение по возрасту и размеру.
+
+import os
+import time
+
+from export_cache import ExportCache
+from source_providers import SourceProvider
+
+
+def _export(tmp_path, name, size):
+    path = tmp_path / "exports" / name
+    path.parent.mkdir(exist_ok=True)
+    path.write_bytes(b"x" * size)
+    return str(path)
+
+
+def _cached_files(cache):
+    return sorted(os.path.relpath(os.path.join(root, name), cache.cache_dir)
+                  for root, _, files in os.walk(cache.cache_dir) for name in files)
+
+
+def test_store_keeps_only_latest_version(tmp_path):
+    cache = ExportCache(str(tmp_path / "cache"))
+    cache.store("doc1", "1", "docx", _export(tmp_path, "a.docx", 10))
+    cache.store("doc1", "2", "docx", _export(tmp_path, "a.docx", 20))
+    assert _cached_files(cache) == [os.path.join("doc1", "2.docx")]
+
+
+def test_remove_drops_deleted_documents(tmp_path):
+    cache = ExportCache(str(tmp_path / "cache"))
+    cache.store("doc1", "1", "docx", _export(tmp_path, "a.docx", 10))
+    cache.store("doc2", "1", "xlsx", _export(tmp_path, "b.xlsx", 10))
+    assert cache.remove(["doc1", "missing"]) == 1
+    assert _cached_files(cache) == [os.path.join("doc2", "1.xlsx")]
+
+
+def test_prune_by_age(tmp_path):
+    cache = ExportCache(str(tmp_path / "cache"), max_age_days=1)
+    cache.store("old", "1", "docx", _export(tmp_path, "a.docx", 10))
+    cache.store("new", "1", "docx", _export(tmp_path, "b.docx", 10))
+    two_days_ago = time.time() - 2 * 86400
+    os.utime(os.path.join(cache.cache_dir, "old", "1.docx"), (two_days_ago, two_days_ago))
+
+    assert cache.prune() == (1, 10)
+    assert _cached_files(cache) == [os.path.join("new", "1.docx")]
+    assert not os.path.exists(os.path.join(cache.cache_dir, "old"))
+
+
+def test_prune_by_size_evicts_least_recently_used(tmp_path):
+    megabyte = 1024 * 1024
+    cache = ExportCache(str(tmp_path / "cache"), max_size_mb=2)
+    for index, gdrive_id in enumerate(("a", "b", "c")):
+        cache.store(gdrive_id, "1", "pdf", _export(tmp_path, f"{gdrive_id}.pdf", megabyte))
+        moment = time.time() - 100 + index
+        os.utime(os.path.join(cache.cache_dir, gdrive_id, "1.pdf"), (moment, moment))
+    # "a" использован последним: вытесняется "b"
+    assert cache.restore("a", "1", "pdf", str(tmp_path / "local" / "a.pdf"))
+
+    assert cache.prune() == (1, megabyte)
+    assert _cached_files(cache) == [os.path.join("a", "1.pdf"), os.path.join("c", "1.pdf")]
+
+
+def test_execute_delete_forgets_cached_exports(local_mirror, tmp_path):
+    import clone_files
+
+    class CachingProvider(SourceProvider):
+        def __init__(self, cache):
+            self.cache = cache
+
+        def forget(self, record_ids):
+            self.cache.remove(record_ids)
+
+    db_client, local_root = local_mirror
+    cache = ExportCache(str(tmp_path / "cache"))
+    cache.store("doc1", "1", "docx", _export(tmp_path, "a.docx", 10))
+    db_client.upsert_documents([{'gdrive_id': "doc1", 'path': "a.docx", 'name': "a.docx"}])
+    (local_root / "a.docx").write_bytes(b"x")
+
+    assert clone_files.execute_delete(["doc1"], provider=CachingProvider(cache)) == ["doc1"]
+    assert _cached_files(cache) == []
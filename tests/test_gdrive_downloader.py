@@ -0,0 +1,101 @@
+# Файл: tests/test_gdrive_downloader.py
+#
+# Описание:
+# GDriveDownloader на фейковом media-эндпоинте Drive: докачка .partial через
+# Range, сохранение .partial при временной ошибке и удаление его при
+# несовпадении MD5.
+
+import os
+import hashlib
+
+import pytest
+
+from fake_services import FakeDriveService
+from gdrive_downloader import GDriveDownloader
+from get_gdrive_methadata import GDriveScanner
+from rate_governor import RateGovernor
+
+CHUNK_SIZE = 4096
+CONTENT = bytes(range(256)) * 40  # 10 240 байт: три куска
+
+
+@pytest.fixture
+def drive(tmp_path):
+    service = FakeDriveService()
+    service.add_folder("root", "root", "none")
+    service.add_file("f1", "report.pdf", "root")
+    service.set_content("f1", CONTENT)
+    governor = RateGovernor(rate=0, max_retries=2, base_delay=0, max_delay=0)
+    scanner = GDriveScanner(service=service, state_file=str(tmp_path / "state.json"), governor=governor)
+    return service, GDriveDownloader(scanner, chunk_size=CHUNK_SIZE)
+
+
+@pytest.fixture
+def file_data():
+    return {'gdrive_id': "f1", 'path': os.path.join("docs", "report.pdf"), 'size_bytes': len(CONTENT),
+            'md5_checksum': hashlib.md5(CONTENT).hexdigest()}
+
+
+def _paths(tmp_path, file_data):
+    destination = tmp_path / "local" / file_data['path']
+    return destination, destination.parent / (destination.name + ".partial")
+
+
+def test_download_in_range_chunks(tmp_path, drive, file_data):
+    service, downloader = drive
+    destination, partial = _paths(tmp_path, file_data)
+
+    assert downloader.download(file_data, str(tmp_path / "local")) == (True, None)
+    assert destination.read_bytes() == CONTENT
+    assert not partial.exists()
+    assert service.call_counts["files.get_media"] == 3
+
+
+def test_resume_from_partial(tmp_path, drive, file_data):
+    service, downloader = drive
+    destination, partial = _paths(tmp_path, file_data)
+    partial.parent.mkdir(parents=True)
+    partial.write_bytes(CONTENT[:CHUNK_SIZE])
+
+    assert downloader.download(file_data, str(tmp_path / "local")) == (True, None)
+    assert destination.read_bytes() == CONTENT
+    # Первый кусок уже был на диске: запрошены только два оставшихся
+    assert service.call_counts["files.get_media"] == 2
+
+
+def test_transient_failure_keeps_partial_for_resume(tmp_path, drive, file_data):
+    service, downloader = drive
+    destination, partial = _paths(tmp_path, file_data)
+    partial.parent.mkdir(parents=True)
+    partial.write_bytes(CONTENT[:CHUNK_SIZE])
+    service.fail_media_next(3)  # первая попытка и оба повтора - 503
+
+    ok, error = downloader.download(file_data, str(tmp_path / "local"))
+    assert not ok and "503" in error
+    assert partial.read_bytes() == CONTENT[:CHUNK_SIZE]
+    assert not destination.exists()
+
+    assert downloader.download(file_data, str(tmp_path / "local")) == (True, None)
+    assert destination.read_bytes() == CONTENT
+
+
+def test_md5_mismatch_discards_partial(tmp_path, drive, file_data):
+    service, downloader = drive
+    destination, partial = _paths(tmp_path, file_data)
+
+    ok, error = downloader.download({**file_data, 'md5_checksum': "0" * 32}, str(tmp_path / "local"))
+    assert not ok and "MD5" in error
+    assert not partial.exists()
+    assert not destination.exists()
+
+
+def test_stale_partial_from_other_version_is_redownloaded(tmp_path, drive, file_data):
+    service, downloader = drive
+    destination, partial = _paths(tmp_path, file_data)
+    partial.parent.mkdir(parents=True)
+    partial.write_bytes(b"x" * CHUNK_SIZE)
+
+    assert downloader.download(file_data, str(tmp_path / "local")) == (True, None)
+    assert destination.read_bytes() == CONTENT
+    # Докачка (2 куска) не сошлась по MD5, затем файл скачан целиком (3 куска)
+    assert service.call_counts["files.get_media"] == 5
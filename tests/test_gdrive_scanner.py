@@ -0,0 +1,84 @@
+# Файл: tests/test_gdrive_scanner.py
+#
+# Описание:
+# Параллельный обход Google Drive и объединенные запросы
+# "'a' in parents or 'b' in parents" дают те же записи (с путями) и ту же
+# карту папок, что и последовательный обход по одной папке.
+
+import os
+
+import pytest
+
+from fake_services import FakeDriveService, build_drive_tree
+from get_gdrive_methadata import GDriveScanner
+from rate_governor import RateGovernor
+
+
+def _drive(max_page_size=None):
+    """Дерево из 40 папок и 300 файлов, плюс Google-документ и файл в корзине."""
+    service = FakeDriveService(max_page_size=max_page_size)
+    generated = build_drive_tree(service, files=300, depth=3, fanout=3)
+    service.add_file("gdoc", "Отчет", "folder5", mimeType="application/vnd.google-apps.document")
+    service.add_file("form", "Анкета", "folder5", mimeType="application/vnd.google-apps.form")
+    service.add_file("trashed", "old.pdf", "folder7", trashed=True)
+    return service, generated
+
+
+def _scan(service, tmp_path, **kwargs):
+    scanner = GDriveScanner(service=service, state_file=str(tmp_path / "state.json"),
+                            governor=RateGovernor(rate=0, base_delay=0, max_delay=0))
+    return scanner, scanner.get_metadata_from_gdrive("root", **kwargs)
+
+
+def _record_queries(service):
+    """Запоминает q каждого вызова files().list."""
+    queries = []
+    files_list = service._files_list
+
+    def recording(q="", **kwargs):
+        queries.append(q)
+        return files_list(q=q, **kwargs)
+    service._files_list = recording
+    return queries
+
+
+def test_sequential_walk_builds_paths(tmp_path):
+    service, generated = _drive()
+    _, records = _scan(service, tmp_path)
+
+    expected = {item["file"]["id"]: item["path"] for item in generated}
+    expected["gdoc"] = os.path.join("dir0", "dir1", "Отчет.docx")  # folder5 = root/dir0/dir1
+    assert {gdrive_id: record["path"] for gdrive_id, record in records.items()} == expected
+    assert service.call_counts["files.list"] == 40  # по запросу на папку, включая корень
+
+
+@pytest.mark.parametrize("max_workers, folders_per_query", [(4, 1), (1, 5), (8, 10), (3, 40)])
+@pytest.mark.parametrize("max_page_size", [None, 7])
+def test_parallel_walk_matches_sequential(tmp_path, max_workers, folders_per_query, max_page_size):
+    service, _ = _drive(max_page_size)
+    sequential_scanner, sequential = _scan(service, tmp_path)
+
+    queries = _record_queries(service)
+    scanner, records = _scan(service, tmp_path, max_workers=max_workers, folders_per_query=folders_per_query)
+
+    assert records == sequential  # те же id, пути и поля записей
+    assert scanner.folders == sequential_scanner.folders
+    if folders_per_query > 1:
+        combined = [q for q in queries if " or " in q]
+        assert combined, "объединенный запрос по нескольким родителям не выполнялся"
+        assert all(q.startswith("(") and q.endswith(") and trashed=false") for q in combined)
+        if max_page_size is None:
+            assert len(queries) < 40  # меньше, чем по запросу на папку
+
+
+def test_combined_query_skips_items_of_unrequested_parents(tmp_path):
+    """Файл с несколькими родителями попадает только под папку из запроса."""
+    service, _ = _drive()
+    service.add_folder("outside", "outside", "elsewhere")
+    service.add_file("shared", "shared.pdf", "folder1")
+    service.update("shared", parents=["outside", "folder1"])
+
+    _, sequential = _scan(service, tmp_path)
+    _, records = _scan(service, tmp_path, max_workers=2, folders_per_query=4)
+
+    assert records["shared"]["path"] == sequential["shared"]["path"] == os.path.join("dir0", "shared.pdf")
@@ -0,0 +1,76 @@
+# Файл: tests/test_local_provider.py
+#
+# Описание:
+# LocalDirectoryProvider не планирует удаления по неполному сканированию:
+# ошибка листинга любой директории и пустой корень при записях в БД
+# прерывают построение плана.
+
+import errno
+import os
+
+import pytest
+
+import source_providers
+from source_providers import LocalDirectoryProvider
+
+
+@pytest.fixture
+def nas(tmp_path):
+    root = tmp_path / "nas"
+    (root / "reports").mkdir(parents=True)
+    (root / "reports" / "q1.pdf").write_bytes(b"q1")
+    (root / "top.docx").write_bytes(b"top")
+    return LocalDirectoryProvider("nas", str(root))
+
+
+def _db_data(provider):
+    metadata = provider.get_metadata()
+    return {gdrive_id: dict(record) for gdrive_id, record in metadata.items()}
+
+
+def test_full_scan_plans_nothing_for_unchanged_tree(nas):
+    assert nas.get_plan(_db_data(nas)) == ([], [], [], [])
+
+
+@pytest.mark.parametrize("error_code", [errno.EACCES, errno.EIO, errno.ESTALE])
+def test_listing_error_aborts_scan(nas, monkeypatch, error_code):
+    db_data = _db_data(nas)
+    real_scandir = os.scandir
+
+    def failing_scandir(path):
+        if os.path.basename(path) == "reports":
+            raise OSError(error_code, os.strerror(error_code), path)
+        return real_scandir(path)
+    monkeypatch.setattr(source_providers.os, "scandir", failing_scandir)
+
+    assert nas.get_metadata() is None
+    assert nas.get_plan(db_data) is None
+
+
+def test_missing_root_aborts_scan(nas, tmp_path):
+    db_data = _db_data(nas)
+    missing = LocalDirectoryProvider("nas", str(tmp_path / "not-mounted"))
+    assert missing.get_plan(db_data) is None
+
+
+def test_empty_root_with_db_records_is_refused(nas, tmp_path):
+    db_data = _db_data(nas)
+    (tmp_path / "empty").mkdir()
+    unmounted = LocalDirectoryProvider("nas", str(tmp_path / "empty"))
+    assert unmounted.get_plan(db_data) is None
+
+
+def test_empty_root_without_db_records_is_empty_plan(tmp_path):
+    (tmp_path / "empty").mkdir()
+    assert LocalDirectoryProvider("nas", str(tmp_path / "empty")).get_plan({}) == ([], [], [], [])
+
+
+def test_pipeline_refuses_empty_root(tmp_path, nas, local_mirror):
+    from sync_pipeline import SyncPipeline
+
+    db_client, _ = local_mirror
+    db_data = _db_data(nas)
+    (tmp_path / "empty").mkdir()
+    pipeline = SyncPipeline(LocalDirectoryProvider("nas", str(tmp_path / "empty")), db_client)
+    assert pipeline.run(db_data) is False
+    assert pipeline.applied["deleted"] == []
@@ -0,0 +1,124 @@
+# Файл: tests/test_rate_governor.py
+#
+# Описание:
+# RateGovernor под троттлингом фейкового Drive: 403 rateLimitExceeded и 429
+# повторяются с паузой, AIMD-лимит параллельности снижается и
+# восстанавливается, число повторов ограничено max_retries.
+
+import pytest
+from googleapiclient.errors import HttpError
+
+import rate_governor
+from fake_services import FakeDriveService, build_drive_tree
+from get_gdrive_methadata import GDriveScanner
+from rate_governor import RateGovernor, RetryableError, classify_response
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Паузы регулятора записываются, а не выдерживаются."""
+    recorded = []
+    monkeypatch.setattr(rate_governor.time, "sleep", recorded.append)
+    return recorded
+
+
+def _governor(**kwargs):
+    params = dict(rate=0, max_concurrency=8, max_retries=3, base_delay=1.0, max_delay=4.0, decrease_interval=0)
+    params.update(kwargs)
+    return RateGovernor(**params)
+
+
+def _failing(errors):
+    """Функция, которая сначала бросает исключения из errors, затем возвращает "ok"."""
+    errors = list(errors)
+
+    def func():
+        if errors:
+            raise errors.pop(0)
+        return "ok"
+    return func
+
+
+def test_classify_drive_responses():
+    body = FakeDriveService._throttle_body(403)
+    assert classify_response(403, body) == "throttled"
+    assert classify_response(429) == "throttled"
+    assert classify_response(503) == "transient"
+    daily = b'{"error": {"errors": [{"reason": "dailyLimitExceeded"}]}}'
+    assert classify_response(403, daily) is None
+    assert classify_response(404) is None
+
+
+def test_scan_recovers_from_injected_throttling(tmp_path, sleeps):
+    service = FakeDriveService()
+    build_drive_tree(service, files=30, depth=2, fanout=3)
+    governor = _governor()
+    scanner = GDriveScanner(service=service, state_file=str(tmp_path / "state.json"), governor=governor)
+    expected = scanner.get_metadata_from_gdrive("root")
+    assert expected is not None and len(expected) == 30
+
+    service.throttle_next(3)  # попеременно 403 rateLimitExceeded и 429
+    metadata = scanner.get_metadata_from_gdrive("root")
+
+    assert metadata == expected
+    assert service.throttled_counts["files.list"] == 3
+    assert governor.stats["throttled"] == 3
+    assert governor.stats["failures"] == 0
+    assert len(sleeps) == 3
+
+
+def test_retry_limit_is_honoured(tmp_path, sleeps):
+    service = FakeDriveService()
+    build_drive_tree(service, files=5, depth=1, fanout=1)
+    governor = _governor(max_retries=2)
+    scanner = GDriveScanner(service=service, state_file=str(tmp_path / "state.json"), governor=governor)
+    service.throttle_next(100)
+
+    with pytest.raises(HttpError):
+        governor.call(lambda: scanner.service.files().list(q="'root' in parents").execute(), "files.list")
+    # Первая попытка и ровно max_retries повторов
+    assert service.call_counts["files.list"] == 3
+    assert governor.stats["retries"] == 2
+    assert governor.stats["failures"] == 1
+    assert len(sleeps) == 2
+
+
+def test_non_retryable_error_is_raised_at_once(sleeps):
+    governor = _governor()
+    with pytest.raises(ValueError):
+        governor.call(_failing([ValueError("bad request")]))
+    assert governor.stats["retries"] == 0
+    assert sleeps == []
+
+
+def test_backoff_is_full_jitter_within_cap(sleeps):
+    governor = _governor(max_retries=5)
+    assert governor.call(_failing([RetryableError("503")] * 5)) == "ok"
+    for attempt, delay in enumerate(sleeps):
+        assert 0 <= delay <= min(4.0, 1.0 * 2 ** attempt)
+
+
+def test_retry_after_is_respected(sleeps):
+    governor = _governor()
+    assert governor.call(_failing([RetryableError("429", throttled=True, retry_after=3.0)])) == "ok"
+    assert sleeps[0] >= 3.0
+
+
+def test_aimd_halves_on_throttling_and_recovers(sleeps):
+    governor = _governor(max_concurrency=8)
+    governor.call(_failing([RetryableError("429", throttled=True)] * 2))
+    # Два отказа подряд: 8 -> 4 -> 2
+    assert governor.concurrency_limit == 2
+    assert governor.stats["min_limit"] == 2
+
+    # Аддитивный рост: +1 за "круг" успешных ответов, не выше max_concurrency
+    for _ in range(100):
+        governor.call(lambda: "ok")
+    assert governor.concurrency_limit == 8
+
+
+def test_decrease_interval_limits_halving(sleeps):
+    governor = _governor(max_concurrency=8, decrease_interval=3600)
+    governor.call(_failing([RetryableError("429", throttled=True)] * 3))
+    # Пачка отказов в пределах decrease_interval снижает лимит один раз
+    assert governor.concurrency_limit == 4
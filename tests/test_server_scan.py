@@ -0,0 +1,30 @@
+# Файл: tests/test_server_scan.py
+#
+# Описание:
+# Сканеры локальной директории этапа B не видят временные файлы
+# незавершенных скачиваний, поэтому сверка не удаляет их как лишние.
+
+import os
+
+import pytest
+
+import get_server_methadata
+
+
+@pytest.fixture
+def local_root(tmp_path):
+    (tmp_path / "docs").mkdir()
+    for name in ("report.pdf", "report.pdf.partial", "table.xlsx.3f2a1b09.partial"):
+        (tmp_path / "docs" / name).write_bytes(b"data")
+    return tmp_path
+
+
+def test_sequential_scan_skips_partial_downloads(local_root):
+    assert sorted(get_server_methadata.get_metadata_from_server(str(local_root))) == [os.path.join("docs", "report.pdf")]
+
+
+def test_fast_scan_skips_partial_downloads(local_root, tmp_path_factory):
+    cache_path = str(tmp_path_factory.mktemp("cache") / "scan.json")
+    for _ in range(2):  # второй проход - из кэша листингов
+        server_files = get_server_methadata.get_metadata_from_server_fast(str(local_root), cache_path=cache_path)
+        assert sorted(server_files) == [os.path.join("docs", "report.pdf")]
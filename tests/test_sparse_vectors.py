@@ -0,0 +1,40 @@
+# Файл: tests/test_sparse_vectors.py
+#
+# Описание:
+# Токенизатор BM25: индексация и запросы используют один и тот же стеммер,
+# а недоступный snowballstemmer - ошибка, а не тихий переход на light.
+
+import pytest
+
+import sparse_vectors
+from sparse_vectors import BM25Encoder, Tokenizer
+
+
+def test_snowball_stems_inflected_words():
+    tokenizer = Tokenizer(["ru", "en"], stemmer="snowball")
+    assert tokenizer.tokenize("отчетность running") == ["отчетн", "run"]
+
+
+def test_identifiers_kept_whole():
+    terms = Tokenizer(["ru", "en"], stemmer="light").tokenize("Договор ДП-2024/117")
+    assert "дп-2024/117" in terms
+    assert "2024" in terms
+
+
+def test_document_and_query_terms_match():
+    encoder = BM25Encoder(Tokenizer(["ru", "en"], stemmer="snowball"))
+    document_indices, _ = encoder.encode_document("Годовая отчетность компании")
+    query_indices, _ = encoder.encode_query("отчетности")
+    assert set(query_indices) <= set(document_indices)
+
+
+def test_missing_snowball_fails_loudly(monkeypatch):
+    monkeypatch.setattr(sparse_vectors, "snowballstemmer", None)
+    with pytest.raises(ImportError):
+        Tokenizer(["ru", "en"], stemmer="snowball")
+    assert Tokenizer(["ru", "en"], stemmer="light").stemmer == "light"
+
+
+def test_unknown_stemmer_rejected():
+    with pytest.raises(ValueError):
+        Tokenizer(["ru"], stemmer="porter")
@@ -0,0 +1,109 @@
+# Файл: tests/test_vector_index.py
+#
+# Описание:
+# Идемпотентность записи в Qdrant (локальный режим qdrant_client ":memory:"):
+# повторная индексация того же файла дает те же UUID5 ID точек и не
+# создает дубликатов. Плюс bulk-режим большой загрузки и проверка max_retries.
+
+import json
+import os
+
+import pytest
+from qdrant_client import QdrantClient
+from qdrant_client.http import models
+
+from embedding_service import EmbeddingService, StubEmbeddingProvider
+from extract_documents import output_path_for
+from qdrant_writer import QdrantWriter, point_id
+from sparse_vectors import SPARSE_VECTOR_NAME, create_bm25_encoder
+from vector_index import VectorIndexer
+
+COLLECTION = "test_documents"
+DIMENSION = 8
+
+
+@pytest.fixture
+def writer():
+    client = QdrantClient(location=":memory:")
+    client.create_collection(
+        collection_name=COLLECTION,
+        vectors_config=models.VectorParams(size=DIMENSION, distance=models.Distance.COSINE),
+        sparse_vectors_config={SPARSE_VECTOR_NAME: models.SparseVectorParams(modifier=models.Modifier.IDF)},
+        optimizers_config=models.OptimizersConfigDiff(indexing_threshold=50000)
+    )
+    return QdrantWriter(client, COLLECTION, batch_size=4, parallel=2)
+
+
+def _write_extracted(output_dir, file_data, pages):
+    """JSONL извлеченного текста: индексатор не запускает извлечение для этой версии."""
+    with open(output_path_for(str(output_dir), file_data['gdrive_id']), "w", encoding="utf-8") as f:
+        f.write(json.dumps({"gdrive_id": file_data['gdrive_id'], "path": file_data['path'],
+                            "version": file_data['version'], "format": "pdf"}, ensure_ascii=False) + "\n")
+        for number, text in enumerate(pages, 1):
+            f.write(json.dumps({"unit": "page", "number": number, "text": text}, ensure_ascii=False) + "\n")
+
+
+def _indexer(tmp_path, writer, **kwargs):
+    output_dir = tmp_path / "processed"
+    output_dir.mkdir(exist_ok=True)
+    embedding_service = EmbeddingService(StubEmbeddingProvider(DIMENSION))
+    return VectorIndexer(writer, embedding_service, str(tmp_path), str(output_dir), create_bm25_encoder(), **kwargs)
+
+
+def _points(writer):
+    records, _ = writer.client.scroll(collection_name=COLLECTION, limit=1000, with_payload=True)
+    return {str(record.id): record.payload for record in records}
+
+
+@pytest.fixture
+def documents(tmp_path, monkeypatch):
+    monkeypatch.setenv("INDEX_GENERATION_PATH", str(tmp_path / "index_generation"))
+    (tmp_path / "processed").mkdir()
+    file_data = {'gdrive_id': "doc1", 'path': os.path.join("Договоры", "ДП-2024.pdf"), 'version': "3",
+                 'gdrive_modified_time': "2026-01-01T00:00:00Z", 'size_bytes': 1}
+    pages = [f"Страница {number}. " + "Договор поставки оборудования и условия оплаты. " * 60 for number in range(1, 4)]
+    _write_extracted(tmp_path / "processed", file_data, pages)
+    return [file_data]
+
+
+def test_reindexing_same_file_keeps_point_ids(tmp_path, writer, documents):
+    indexer = _indexer(tmp_path, writer)
+    indexer.index_files(documents)
+    first = _points(writer)
+    chunk_count = indexer.stats["chunks"]
+    assert chunk_count > 1
+    assert set(first) == {point_id("doc1", index) for index in range(chunk_count)}
+
+    indexer.index_files(documents)
+    second = _points(writer)
+    assert set(second) == set(first)
+    assert writer.client.count(COLLECTION).count == chunk_count
+    # Второй проход ничего не пересчитывает: все чанки совпали по хэшу
+    assert indexer.stats["embedded"] == chunk_count
+    assert indexer.stats["unchanged"] == chunk_count
+
+
+def test_repeated_upsert_after_failure_does_not_duplicate(tmp_path, writer, documents):
+    _indexer(tmp_path, writer).index_files(documents)
+    records, _ = writer.client.scroll(collection_name=COLLECTION, limit=1000, with_vectors=True)
+    points = [models.PointStruct(id=record.id, vector=record.vector, payload=record.payload) for record in records]
+
+    assert writer.upsert_points(points) == len(points)
+    assert writer.client.count(COLLECTION).count == len(points)
+
+
+def test_large_load_goes_through_bulk_mode(tmp_path, writer, documents, capsys):
+    _indexer(tmp_path, writer, bulk_load_min_files=1).index_files(documents)
+    output = capsys.readouterr().out
+    assert "Bulk-режим завершен" in output
+    assert writer.client.count(COLLECTION).count > 0
+
+
+def test_small_load_skips_bulk_mode(tmp_path, writer, documents, capsys):
+    _indexer(tmp_path, writer, bulk_load_min_files=10).index_files(documents)
+    assert "Bulk-режим" not in capsys.readouterr().out
+
+
+def test_writer_requires_at_least_one_attempt(writer):
+    with pytest.raises(ValueError):
+        QdrantWriter(writer.client, COLLECTION, max_retries=0)